@@ -6,6 +6,7 @@ from aiogram.filters import StateFilter, CommandStart, Command
 from aiogram.fsm.context import FSMContext
 from aiogram.types import Message, CallbackQuery, FSInputFile, BufferedInputFile
 from aiogram.fsm.state import default_state
+from aiogram.exceptions import TelegramBadRequest
 
 from app.core.API_Client import APIClient
 from .states import CasherReview
@@ -18,11 +19,16 @@ from .keyboards import (
     get_main_menu_keyboard,
 )
 
-from app.utils.invoice_generator import generate_complex_invoice
+from app.storage import AttachmentStorage, ContentStore, LocalStorage, StorageInputFile
+from app.utils.invoice_cache import InvoiceCache
+from app.utils.invoice_service import InvoiceRenderError, InvoiceRenderService
 import datetime
+import os
+from typing import Optional
 from aiogram.types import Message, CallbackQuery, FSInputFile, BufferedInputFile, InputMediaPhoto
 
 from ..core.enums import PatientStatus, OrderStatusEnum
+from ..utils.concurrency import fan_out
 from ..utils.date_helper import to_jalali
 
 casher_router = Router()
@@ -135,7 +141,9 @@ async def process_date_choice(callback: CallbackQuery, state: FSMContext, api_cl
 # در handlers.py جایگزین تابع process_payment_choice قبلی کنید
 
 @casher_router.callback_query(CasherReview.choosing_payment, F.data.startswith("casher_payment_"))
-async def process_payment_choice(callback: CallbackQuery, state: FSMContext, api_client: APIClient):
+async def process_payment_choice(callback: CallbackQuery, state: FSMContext, api_client: APIClient,
+                                 attachment_storage: Optional[AttachmentStorage] = None,
+                                 content_store: Optional[ContentStore] = None):
     """
     نسخه جدید: نمایش آلبوم تمام رسیدها + دریافت صحیح نام بیمار
     """
@@ -148,63 +156,55 @@ async def process_payment_choice(callback: CallbackQuery, state: FSMContext, api
 
     await callback.answer("⏳ دریافت اطلاعات کامل...")
 
-    # 2. دریافت اطلاعات دقیق پرداخت از API
-    current_payment = await api_client.get_payment_by_id(payment_list_id)
-    if not current_payment:
-        # فال‌بک به حافظه اگر API جواب نداد
-        data = await state.get_data()
-        payments = data.get("pending_payments", [])
-        current_payment = next((p for p in payments if int(p.get("payment_list_id")) == payment_list_id), None)
+    # 2. دریافت همه داده‌های این صفحه (پرداخت، سفارش، بیمار و سابقه پرداخت‌ها) با یک انتظار شبکه
+    # نسخه موجود در state فقط وقتی استفاده می‌شود که API پرداخت را برنگرداند
+    data = await state.get_data()
+    payments = data.get("pending_payments", [])
+    cached_payment = next((p for p in payments if int(p.get("payment_list_id")) == payment_list_id), None)
 
-    if not current_payment:
+    bundle = await api_client.get_payment_review_bundle(payment_list_id, fallback_payment=cached_payment)
+    if not bundle:
         await callback.message.answer("اطلاعات پرداخت یافت نشد.")
         return
 
+    current_payment = bundle["payment"]
     order_id = current_payment.get("order_id")
-    order_info = await api_client.get_order_by_id(order_id)
+    order_info = bundle["order"]
 
-    if not order_info :
+    if not order_info:
         await callback.message.answer("اطلاعات سفارش یافت نشد.")
+        return
 
-    patient_id = order_info.get("patient_id")
-
-    # 3. دریافت اطلاعات بیمار (حل مشکل نام و تلگرام آیدی)
+    # 3. اطلاعات بیمار (حل مشکل نام و تلگرام آیدی)
     patient_name = "ناشناس"
     patient_tg_id = "---"
 
-    if patient_id:
-        # فراخوانی متد جدیدی که اضافه کردیم
-        patient_info = await api_client.get_patient_by_id(patient_id)
-        if patient_info:
-            patient_name = patient_info.get("full_name") or "بدون نام"
-            patient_tg_id = patient_info.get("user_telegram_id") or patient_info.get("telegram_id") or "---"
-
-            # آپدیت کردن آبجکت پرداخت با اطلاعات دقیق برای مراحل بعد (مثل رد کردن)
-            current_payment["full_name"] = patient_name
-            current_payment["telegram_id"] = patient_tg_id
-
-    # 4. دریافت تمام پرداختی‌های این سفارش (برای گالری عکس و تاریخچه)
-    all_payments = []
-    if order_id:
-        all_payments = await api_client.get_all_payments_by_order_id(order_id)
-        # مرتب‌سازی: قدیمی‌ترین اول باشد
-        if all_payments:
-            all_payments.sort(key=lambda x: x.get('created_at', ''), reverse=False)
+    patient_info = bundle["patient"]
+    if patient_info:
+        patient_name = patient_info.get("full_name") or "بدون نام"
+        patient_tg_id = patient_info.get("user_telegram_id") or patient_info.get("telegram_id") or "---"
+
+        # آپدیت کردن آبجکت پرداخت با اطلاعات دقیق برای مراحل بعد (مثل رد کردن)
+        current_payment["full_name"] = patient_name
+        current_payment["telegram_id"] = patient_tg_id
+
+    # 4. تمام پرداختی‌های این سفارش (برای گالری عکس و تاریخچه)
+    all_payments = bundle["payments"]
+    # مرتب‌سازی: قدیمی‌ترین اول باشد
+    all_payments.sort(key=lambda x: x.get('created_at', ''), reverse=False)
 
     # 5. محاسبات مالی
     total_order_price = 0
     paid_approved = 0
 
-    if order_id:
-        order_details = await api_client.get_order_by_id(order_id)
-        if order_details:
-            for item in order_details.get("order_list", []):
-                try:
-                    total_order_price += int(float(item.get("price", 0))) * int(item.get("qty", 1))
-                except:
-                    pass
+    for item in order_info.get("order_list", []):
+        try:
+            total_order_price += int(float(item.get("price", 0))) * int(item.get("qty", 1))
+        except:
+            pass
 
-    # ساخت لیست مدیا (عکس‌ها) و متن تاریخچه
+    # ساخت لیست مدیا (عکس‌ها) و متن تاریخچه؛ رسیدها مستقیماً از storage (کلید یا مسیر قدیمی) آپلود می‌شوند
+    receipt_storage = attachment_storage or LocalStorage()
     media_group = []
     history_text = "\n📋 **سابقه تراکنش‌ها (به ترتیب عکس‌ها):**\n"
 
@@ -243,7 +243,12 @@ async def process_payment_choice(callback: CallbackQuery, state: FSMContext, api
                 try:
                     # کپشن برای هر عکس (فقط در برخی کلاینت‌ها نمایش داده می‌شود، اما بودنش خوب است)
                     caption_part = f"رسید #{counter} - {status_icon} - مبلغ: {p_val:,}"
-                    media_group.append(InputMediaPhoto(media=FSInputFile(p_path), caption=caption_part))
+                    if content_store is not None:
+                        # رسیدهای قدیمی بعد از مهاجرت در objects/ هستند
+                        p_path = await content_store.resolve(p_path)
+                    media_group.append(InputMediaPhoto(
+                        media=StorageInputFile(receipt_storage, p_path), caption=caption_part
+                    ))
 
                     if p_id == payment_list_id:
                         has_current_receipt_photo = True
@@ -256,7 +261,9 @@ async def process_payment_choice(callback: CallbackQuery, state: FSMContext, api
         history_text = "⚠️ سوابق یافت نشد."
         path = current_payment.get("payment_path_file")
         if path:
-            media_group.append(InputMediaPhoto(media=FSInputFile(path), caption="رسید فعلی"))
+            if content_store is not None:
+                path = await content_store.resolve(path)
+            media_group.append(InputMediaPhoto(media=StorageInputFile(receipt_storage, path), caption="رسید فعلی"))
             has_current_receipt_photo = True
 
     # 6. نمایش خروجی
@@ -312,8 +319,68 @@ async def process_payment_choice(callback: CallbackQuery, state: FSMContext, api
 # ==============================================================================
 # 4. تایید پرداخت (و صدور فاکتور)
 # ==============================================================================
+async def _send_invoice(
+        message: Message,
+        invoice_context: dict,
+        filename: str,
+        invoice_service: InvoiceRenderService,
+        invoice_cache: Optional[InvoiceCache],
+        **send_kwargs,
+) -> Message:
+    """
+    فاکتور را می‌فرستد؛ اگر همین فاکتور قبلاً ساخته یا آپلود شده باشد از کش (فایل محلی یا file_id تلگرام) استفاده می‌شود.
+    """
+    if invoice_cache is None:
+        # بدون کش: ساخت فایل موقت، ارسال و حذف آن
+        invoice_path = await invoice_service.render(invoice_context)
+        try:
+            return await message.answer_document(document=FSInputFile(invoice_path, filename=filename), **send_kwargs)
+        finally:
+            try:
+                os.remove(invoice_path)
+            except OSError:
+                pass
+
+    # تا پایان آپلود، فایل کش سنجاق است و فاکتورهای همزمان دیگر آن را از کش بیرون نمی‌کنند
+    async with invoice_cache.checkout(invoice_context, invoice_service.render) as (key, file_id, invoice_path):
+        if file_id:
+            try:
+                return await message.answer_document(document=file_id, **send_kwargs)
+            except TelegramBadRequest as e:
+                logger.warning(f"Cached invoice file_id was rejected, uploading again: {e}")
+                await invoice_cache.forget_file_id(key)
+                key, _, invoice_path = await invoice_cache.get_or_render(invoice_context, invoice_service.render)
+
+        # PDF روی دیسک است و FSInputFile آن را تکه‌تکه آپلود می‌کند (بدون کپی کامل در حافظه)
+        sent = await message.answer_document(document=FSInputFile(invoice_path, filename=filename), **send_kwargs)
+        if sent.document:
+            await invoice_cache.remember_file_id(key, sent.document.file_id)
+        return sent
+
+
+def _invoice_text_fallback(invoice_context: dict) -> str:
+    """خلاصه متنی فاکتور برای وقتی که PDF ساخته نمی‌شود."""
+    lines = [
+        f"✅ پرداخت سفارش #{invoice_context['invoice_number']} تایید شد.",
+        "⚠️ فایل PDF فاکتور ساخته نشد؛ خلاصه فاکتور:",
+        "",
+    ]
+    for item in invoice_context["items"]:
+        lines.append(f"• {item['name']} × {item['count']} = {item['total_price']:,} تومان")
+    lines.append("")
+    lines.append(f"💰 مبلغ کل: {invoice_context['final_total_price']:,} تومان")
+    return "\n".join(lines)
+
+
 @casher_router.callback_query(CasherReview.verifying_payment, F.data.startswith("approve_payment_"))
-async def process_approve_payment(callback: CallbackQuery, state: FSMContext, api_client: APIClient, bot: Bot):
+async def process_approve_payment(
+        callback: CallbackQuery,
+        state: FSMContext,
+        api_client: APIClient,
+        bot: Bot,
+        invoice_service: InvoiceRenderService,
+        invoice_cache: Optional[InvoiceCache] = None,
+):
     # 1. استخراج ID پرداخت
     payment_parts = callback.data.split("_")
     payment_list_id = int(payment_parts[-1])
@@ -324,9 +391,14 @@ async def process_approve_payment(callback: CallbackQuery, state: FSMContext, ap
     patient_tg_id = current_payment.get("telegram_id")
     order_id = current_payment.get("order_id")
 
-    # 2. شناسایی ایمن صندوق‌دار
+    # 2. شناسایی ایمن صندوق‌دار و دریافت همزمان اطلاعات سفارش و بیمار (به هم وابسته نیستند)
     casher_telegram_id = callback.from_user.id
-    casher_profile = await api_client.get_user_details_by_telegram_id(casher_telegram_id)
+    prefetch = await fan_out({
+        "casher_profile": api_client.get_user_details_by_telegram_id(casher_telegram_id),
+        "order": api_client.get_order_by_id(order_id) if order_id else None,
+        "patient": api_client.get_patient_details_by_telegram_id(patient_tg_id) if patient_tg_id else None,
+    })
+    casher_profile = prefetch.get("casher_profile")
 
     casher_db_id = 1
     casher_name = "صندوق‌دار"
@@ -353,19 +425,35 @@ async def process_approve_payment(callback: CallbackQuery, state: FSMContext, ap
     update_result = await api_client.update_payment(payment_list_id, payload)
 
     if update_result:
-        try:
-            # الف) چک کردن وجود Order ID
-            if not order_id:
-                await callback.message.answer("✅ پرداخت تایید شد، اما شماره سفارش یافت نشد.")
-                return
+        # الف) چک کردن وجود Order ID
+        if not order_id:
+            await callback.message.answer("✅ پرداخت تایید شد، اما شماره سفارش یافت نشد.")
+            return
+
+        if patient_tg_id:
+            # به‌روزرسانی وضعیت بیمار و سفارش قبل از صدور فاکتور انجام می‌شود تا خطای صدور PDF
+            # (صف پر، timeout یا خرابی process pool) سفارش را در وضعیت قبلی جا نگذارد؛
+            # این دو مستقل از هم هستند و همزمان ارسال می‌شوند
+            await fan_out({
+                "patient_status": api_client.update_patient_status(
+                    str(current_payment.get("telegram_id")), PatientStatus.PAYMENT_CONFIRMED.value
+                ),
+                "order_status": api_client.update_order(
+                    order_id=order_id,
+                    order_status=OrderStatusEnum.CONFIRM.value
+                ),
+            })
+
+        # ب) اطلاعات سفارش و بیمار قبلاً همزمان دریافت شده‌اند
+        order_data = prefetch.get("order") or {}
+        raw_items = order_data.get("order_list", [])
 
-            # ب) دریافت اطلاعات
-            order_data = await api_client.get_order_by_id(order_id)
+        try:
             if not order_data:
                 raise ValueError(f"Order data not found for ID {order_id}")
 
-            patient_details = await api_client.get_patient_details_by_telegram_id(patient_tg_id)
-
+            patient_details = prefetch.get("patient")
+            # مشاور به سفارش وابسته است، پس بعد از آن دریافت می‌شود
             consultant_name = "ناشناس"
             consultant_id = order_data.get("user_id")
             if consultant_id:
@@ -374,7 +462,6 @@ async def process_approve_payment(callback: CallbackQuery, state: FSMContext, ap
                     consultant_name = c_info.get('full_name', '')
 
             # پ) پردازش اقلام
-            raw_items = order_data.get("order_list", [])
             invoice_items = []
 
             for item in raw_items:
@@ -433,65 +520,70 @@ async def process_approve_payment(callback: CallbackQuery, state: FSMContext, ap
                 "final_total_price": int(float(current_payment.get("payment_value", 0)))
             }
 
-            pdf_buffer = generate_complex_invoice(invoice_context)
-            pdf_file = BufferedInputFile(pdf_buffer.getvalue(), filename=f"Invoice_{order_id}.pdf")
-
-            # حذف پیام لودینگ قبلی (چون عکس/کپشن بود و الان می‌خواهیم فایل جدید بفرستیم)
-            await callback.message.delete()
+            # صدور PDF در process pool (یا استفاده از نسخه کش شده همین فاکتور)؛ در این فاصله ربات به بقیه کاربران پاسخ می‌دهد
+            try:
+                await _send_invoice(
+                    callback.message,
+                    invoice_context,
+                    f"Invoice_{order_id}.pdf",
+                    invoice_service,
+                    invoice_cache,
+                    caption=f"✅ فاکتور سفارش **#{order_id}** صادر شد.",
+                    reply_markup=create_after_action_keyboard(data.get("selected_date"))
+                )
+            except InvoiceRenderError as e:
+                # PDF ساخته نشد (صف پر، timeout یا خرابی process pool)؛ خلاصه متنی فاکتور جای آن ارسال می‌شود
+                logger.error(f"Invoice PDF for order {order_id} could not be rendered: {e}")
+                await callback.message.answer(
+                    _invoice_text_fallback(invoice_context),
+                    parse_mode=None,
+                    reply_markup=create_after_action_keyboard(data.get("selected_date"))
+                )
+            # حذف پیام لودینگ قبلی (چون عکس/کپشن بود و فاکتور به صورت پیام جدید ارسال شد)؛
+            # اگر حذف ممکن نبود (پیام قدیمی یا قبلاً حذف شده) فقط هشدار ثبت می‌شود
+            try:
+                await callback.message.delete()
+            except TelegramBadRequest as e:
+                logger.warning(f"Could not delete the payment review message: {e}")
 
-            await callback.message.answer_document(
-                document=pdf_file,
-                caption=f"✅ فاکتور سفارش **#{order_id}** صادر شد.",
+        except Exception as e:
+            logging.error(f"Invoice generation error: {e}", exc_info=True)
+            await callback.message.answer(
+                f"⚠️ پرداخت تایید و سفارش به مرحله بعد منتقل شد، اما در صدور فاکتور خطایی رخ داد:\n`{e}`",
                 reply_markup=create_after_action_keyboard(data.get("selected_date"))
             )
 
-            if patient_tg_id:
-                try:
-                    await api_client.update_patient_status(str(current_payment.get("telegram_id")),PatientStatus.PAYMENT_CONFIRMED.value)
-                    updated_order = await api_client.update_order(
-                        order_id=order_id,
-                        order_status=OrderStatusEnum.CONFIRM.value)  # وضعیت را به در انتظار پرداخت تغییر می‌دهیم
+        if patient_tg_id:
+            try:
+                await bot.send_message(
+                    patient_tg_id,
+                    "✅ پرداخت شما تایید شد و فاکتور نهایی صادر گردید.\nسفارش شما در نوبت ارسال قرار گرفت."
+                )
+            except Exception:
+                pass
+            try:
+                # ساخت پیام جمع‌بندی
+                how_to_use_text = "💊 **نحوه مصرف داروهای شما:**\n\n"
 
-                except Exception as e:
-                    pass
+                for item in raw_items:
+                    drug_obj = item.get("drug", {})
+                    d_name = drug_obj.get("drug_pname") or "دارو نامشخص"
+                    how_use = drug_obj.get("drug_how_to_use")
 
-                try:
-                    await bot.send_message(
-                        patient_tg_id,
-                        "✅ پرداخت شما تایید شد و فاکتور نهایی صادر گردید.\nسفارش شما در نوبت ارسال قرار گرفت."
-                    )
-                except Exception:
-                    pass
-                try:
-                    # ساخت پیام جمع‌بندی
-                    how_to_use_text = "💊 **نحوه مصرف داروهای شما:**\n\n"
-
-                    for item in raw_items:
-                        drug_obj = item.get("drug", {})
-                        d_name = drug_obj.get("drug_pname") or "دارو نامشخص"
-                        how_use = drug_obj.get("drug_how_to_use")
-
-                        if how_use:
-                            how_to_use_text += f"• **{d_name}:**\n{how_use}\n\n"
-                        else:
-                            how_to_use_text += f"• {d_name}: (اطلاعات نحوه مصرف ثبت نشده است)\n\n"
-
-                    # ارسال به بیمار
-                    await bot.send_message(
-                        patient_tg_id,
-                        how_to_use_text,
-                        parse_mode="Markdown"
-                    )
+                    if how_use:
+                        how_to_use_text += f"• **{d_name}:**\n{how_use}\n\n"
+                    else:
+                        how_to_use_text += f"• {d_name}: (اطلاعات نحوه مصرف ثبت نشده است)\n\n"
 
-                except Exception as e:
-                    logger.error(f"Failed to send drug how-to-use instructions: {e}")
+                # ارسال به بیمار
+                await bot.send_message(
+                    patient_tg_id,
+                    how_to_use_text,
+                    parse_mode="Markdown"
+                )
 
-        except Exception as e:
-            logging.error(f"Invoice generation error: {e}", exc_info=True)
-            await callback.message.answer(
-                f"⚠️ پرداخت تایید شد اما در صدور فاکتور خطایی رخ داد:\n`{e}`",
-                reply_markup=create_after_action_keyboard(data.get("selected_date"))
-            )
+            except Exception as e:
+                logger.error(f"Failed to send drug how-to-use instructions: {e}")
 
     else:
         await callback.message.answer("❌ خطا در ثبت تایید پرداخت در دیتابیس.")
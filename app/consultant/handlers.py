@@ -3,6 +3,7 @@
 import logging
 import os
 from datetime import datetime
+from typing import Optional
 
 
 
@@ -26,6 +27,27 @@ from aiogram import Bot
 from app.core.enums import PatientStatus  # <-- Enum را وارد کنید
 
 from app.core.API_Client import APIClient
+from app.storage import (
+    AttachmentStorage,
+    ContentStore,
+    LocalStorage,
+    download_to_storage,
+    patient_file_key,
+    timestamped_name,
+)
+from app.utils.attachments import (
+    ORIGINAL_CALLBACK_PREFIX,
+    history_caption,
+    release_attachments,
+    remember_received_file,
+    schedule_previews,
+    send_attachment,
+    send_original,
+    send_photo_album,
+)
+from app.utils.background import BackgroundTasks
+from app.utils.file_id_cache import FileIdCache
+from app.utils.image_service import ImageProcessingService
 from .states import ConsultantFlow
 from .keyboards import create_dates_keyboard, create_patients_keyboard, get_next_patient_keyboard, \
     create_prescription_review_keyboard
@@ -45,7 +67,11 @@ logger = logging.getLogger(__name__)
 
 
 # <--- تابع کمکی جدید برای نمایش اطلاعات کامل بیمار --->
-async def show_patient_full_info(message: Message, state: FSMContext, api_client: APIClient, patient_telegram_id: str):
+async def show_patient_full_info(message: Message, state: FSMContext, api_client: APIClient, patient_telegram_id: str,
+                                 *, file_id_cache: Optional[FileIdCache] = None,
+                                 attachment_storage: Optional[AttachmentStorage] = None,
+                                 content_store: Optional[ContentStore] = None,
+                                 image_service: Optional[ImageProcessingService] = None):
     """
     نمایش جزئیات پرونده بیمار و تاریخچه کامل چت (شامل فایل‌ها) برای مشاور
     """
@@ -68,6 +94,10 @@ async def show_patient_full_info(message: Message, state: FSMContext, api_client
     )
     await message.answer(info, parse_mode="Markdown")
 
+    # شناسه تلگرام بیمار؛ دکمه «فایل اصلی» فقط برای عکس‌های همین پرونده ساخته و پذیرفته می‌شود
+    raw_owner_id = str(patient.get("telegram_id") or "")
+    owner_id = int(raw_owner_id) if raw_owner_id.isdigit() else None
+
     # 3. نمایش عکس‌های پروفایل (پزشکی) بیمار
     # نکته: عکس‌های پروفایل معمولاً در زمان ثبت‌نام آپلود شده‌اند
     raw_photos = patient.get("photo_paths", [])
@@ -83,21 +113,16 @@ async def show_patient_full_info(message: Message, state: FSMContext, api_client
             photos_to_show = [raw_photos]
 
     if photos_to_show:
-        media_group = []
-        for p in photos_to_show:
-            path = str(p).strip()
-            if os.path.exists(path):
-                try:
-                    media_group.append(InputMediaPhoto(media=FSInputFile(path)))
-                except Exception as e:
-                    logging.error(f"Error preparing profile photo {path}: {e}")
-
-        if media_group:
-            try:
-                await message.answer_media_group(media=media_group)
-            except Exception as e:
-                await message.answer("⚠️ خطا در نمایش آلبوم عکس‌های بیمار.")
-                logging.error(f"Error sending media group: {e}")
+        try:
+            # عکس‌هایی که قبلاً آپلود شده‌اند فقط با file_id فرستاده می‌شوند
+            await send_photo_album(
+                message.bot, message.chat.id, photos_to_show, file_id_cache=file_id_cache,
+                storage=attachment_storage, content_store=content_store, image_service=image_service,
+                owner_id=owner_id,
+            )
+        except Exception as e:
+            await message.answer("⚠️ خطا در نمایش آلبوم عکس‌های بیمار.")
+            logging.error(f"Error sending media group: {e}")
 
     # 4. دریافت و نمایش تاریخچه چت
     patient_id = patient.get("patient_id")
@@ -144,30 +169,16 @@ async def show_patient_full_info(message: Message, state: FSMContext, api_client
                 for file_path in attachments:
                     file_path = str(file_path).strip()
 
-                    if not os.path.exists(file_path):
-                        await message.answer(f"⚠️ **{sender_title}:** [فایل روی سرور یافت نشد]")
-                        continue
-
                     try:
-                        file_to_send = FSInputFile(file_path)
-                        file_ext = os.path.splitext(file_path)[1].lower()
-
-                        if file_ext in ['.jpg', '.jpeg', '.png', '.webp']:
-                            await message.answer_photo(
-                                photo=file_to_send,
-                                caption=f"📷 تصویر ارسالی {sender_title}"
-                            )
-                        elif file_ext in ['.ogg', '.mp3', '.wav', '.m4a']:
-                            await message.answer_voice(
-                                voice=file_to_send,
-                                caption=f"🎙 ویس ارسالی {sender_title}"
-                            )
-                        else:
-                            # سایر فایل‌ها (PDF و ...)
-                            await message.answer_document(
-                                document=file_to_send,
-                                caption=f"📎 فایل ارسالی {sender_title}"
-                            )
+                        # اگر این پیوست قبلاً آپلود شده باشد فقط file_id آن فرستاده می‌شود
+                        await send_attachment(
+                            message.bot, message.chat.id, file_path, history_caption(file_path, sender_title),
+                            file_id_cache=file_id_cache, storage=attachment_storage,
+                            content_store=content_store, image_service=image_service,
+                            owner_id=owner_id,
+                        )
+                    except FileNotFoundError:
+                        await message.answer(f"⚠️ **{sender_title}:** [فایل روی سرور یافت نشد]")
                     except Exception as e:
                         logging.error(f"Failed to send chat history file {file_path}: {e}")
                         await message.answer(f"❌ خطا در نمایش فایل: {os.path.basename(file_path)}")
@@ -246,7 +257,11 @@ async def process_date_choice(callback: CallbackQuery, state: FSMContext, api_cl
 
 
 @consultant_router.callback_query(ConsultantFlow.choosing_patient, F.data.startswith("consultant_patient_"))
-async def process_patient_choice(callback: CallbackQuery, state: FSMContext, api_client: APIClient):
+async def process_patient_choice(callback: CallbackQuery, state: FSMContext, api_client: APIClient,
+                                 file_id_cache: Optional[FileIdCache] = None,
+                                 attachment_storage: Optional[AttachmentStorage] = None,
+                                 content_store: Optional[ContentStore] = None,
+                                 image_service: Optional[ImageProcessingService] = None):
     await callback.message.delete()  # <--- پیام قبلی با دکمه‌های اینلاین را حذف می‌کنیم
 
     try:
@@ -262,7 +277,9 @@ async def process_patient_choice(callback: CallbackQuery, state: FSMContext, api
     await state.update_data(selected_date=data.get("selected_date"))
 
     # <--- فراخوانی تابع کمکی --->
-    await show_patient_full_info(callback.message, state, api_client, patient_telegram_id)
+    await show_patient_full_info(callback.message, state, api_client, patient_telegram_id, file_id_cache=file_id_cache,
+                                 attachment_storage=attachment_storage, content_store=content_store,
+                                 image_service=image_service)
     await callback.answer()
 
 
@@ -290,7 +307,11 @@ async def handle_start_prescription_from_chat(message: Message, state: FSMContex
 
 # --- هندلر دکمه "بیمار بعدی" (اصلاح شده و ایمن) ---
 @consultant_router.message(ConsultantFlow.in_chat_with_patient, F.text == "👤 بیمار بعدی")
-async def next_patient(message: Message, state: FSMContext, api_client: APIClient):
+async def next_patient(message: Message, state: FSMContext, api_client: APIClient,
+                       file_id_cache: Optional[FileIdCache] = None,
+                       attachment_storage: Optional[AttachmentStorage] = None,
+                       content_store: Optional[ContentStore] = None,
+                       image_service: Optional[ImageProcessingService] = None):
     # ۱. دریافت اطلاعات از State
     data = await state.get_data()
     date = data.get("selected_date")
@@ -324,7 +345,9 @@ async def next_patient(message: Message, state: FSMContext, api_client: APIClien
         # اگر بیمار فعلی دیگر در لیست نیست (مثلا وضعیتش تغییر کرده)، از اول لیست شروع کن
         await message.answer("⚠️ بیمار فعلی در لیست انتظار نیست. انتقال به نفر اول لیست...")
         # نفر اول را نمایش بده
-        await show_patient_full_info(message, state, api_client, ids[0])
+        await show_patient_full_info(message, state, api_client, ids[0], file_id_cache=file_id_cache,
+                                     attachment_storage=attachment_storage, content_store=content_store,
+                                     image_service=image_service)
         return
 
     # ۵. محاسبه نفر بعدی
@@ -338,12 +361,18 @@ async def next_patient(message: Message, state: FSMContext, api_client: APIClien
     # ۷. نمایش بیمار بعدی
     next_patient_id = ids[next_idx]
     await message.answer(f"⬇️ انتقال به بیمار {next_idx + 1} از {len(ids)}...")
-    await show_patient_full_info(message, state, api_client, next_patient_id)
+    await show_patient_full_info(message, state, api_client, next_patient_id, file_id_cache=file_id_cache,
+                                 attachment_storage=attachment_storage, content_store=content_store,
+                                 image_service=image_service)
 
 
 # --- هندلر دکمه "بیمار قبلی" (اصلاح شده و ایمن) ---
 @consultant_router.message(ConsultantFlow.in_chat_with_patient, F.text == "👤 بیمار قبلی")
-async def prev_patient(message: Message, state: FSMContext, api_client: APIClient):
+async def prev_patient(message: Message, state: FSMContext, api_client: APIClient,
+                       file_id_cache: Optional[FileIdCache] = None,
+                       attachment_storage: Optional[AttachmentStorage] = None,
+                       content_store: Optional[ContentStore] = None,
+                       image_service: Optional[ImageProcessingService] = None):
     data = await state.get_data()
     date = data.get("selected_date")
     current_telegram_id = str(data.get("patient_telegram_id"))
@@ -369,7 +398,9 @@ async def prev_patient(message: Message, state: FSMContext, api_client: APIClien
         current_idx = ids.index(current_telegram_id)
     except ValueError:
         await message.answer("⚠️ بیمار در لیست یافت نشد. بازگشت به نفر اول.")
-        await show_patient_full_info(message, state, api_client, ids[0])
+        await show_patient_full_info(message, state, api_client, ids[0], file_id_cache=file_id_cache,
+                                     attachment_storage=attachment_storage, content_store=content_store,
+                                     image_service=image_service)
         return
 
     # محاسبه نفر قبلی
@@ -383,7 +414,9 @@ async def prev_patient(message: Message, state: FSMContext, api_client: APIClien
     # نمایش بیمار قبلی
     prev_patient_id = ids[prev_idx]
     await message.answer(f"⬆️ بازگشت به بیمار {prev_idx + 1} از {len(ids)}...")
-    await show_patient_full_info(message, state, api_client, prev_patient_id)
+    await show_patient_full_info(message, state, api_client, prev_patient_id, file_id_cache=file_id_cache,
+                                 attachment_storage=attachment_storage, content_store=content_store,
+                                 image_service=image_service)
 
 
 # --- هندلر جدید: دکمه بازگشت به لیست تاریخ‌ها ---
@@ -418,8 +451,70 @@ async def return_to_date_list(message: Message, state: FSMContext, api_client: A
 
 # -----------------------------
 # --- مرحله ۴.۳: مدیریت ارسال پیام متنی از مشاور به بیمار ---
+async def archive_consultant_media(
+        bot: Bot,
+        api_client: APIClient,
+        file_id: str,
+        kind: str,
+        *,
+        patient_telegram_id,
+        patient_id: int,
+        consultant_id: int,
+        consultant_chat_id: int,
+        file_id_cache: Optional[FileIdCache] = None,
+        attachment_storage: Optional[AttachmentStorage] = None,
+        content_store: Optional[ContentStore] = None,
+        file_unique_id: Optional[str] = None,
+        message_id: Optional[int] = None,
+        image_service: Optional[ImageProcessingService] = None,
+) -> None:
+    """
+    عکس/ویسی که با file_id برای بیمار فرستاده شده را در storage پرونده بیمار ذخیره و در تاریخچه API ثبت می‌کند.
+    در پس‌زمینه اجرا می‌شود تا مشاور منتظر دانلود فایل نماند.
+    """
+    try:
+        if content_store is not None:
+            # رسانه‌ای که قبلاً ذخیره شده (مثلاً همان عکس برای چند بیمار) دوباره دانلود نمی‌شود
+            key = await content_store.put_telegram_file(
+                bot, file_id, file_unique_id, default_ext=".jpg" if kind == "photo" else ".ogg",
+                chat_id=consultant_chat_id, message_id=message_id,
+            )
+        else:
+            file_info = await bot.get_file(file_id)
+            file_path_on_telegram = file_info.file_path
+
+            file_extension = os.path.splitext(file_path_on_telegram)[1] or (".jpg" if kind == "photo" else ".ogg")
+            key = patient_file_key(patient_telegram_id, timestamped_name(kind, ext=file_extension))
+
+            await download_to_storage(bot, attachment_storage or LocalStorage(), file_path_on_telegram, key)
+        await remember_received_file(file_id_cache, key, file_id, kind)
+    except Exception as e:
+        logging.error(f"Error archiving {kind} for {patient_telegram_id}: {e}")
+        await bot.send_message(consultant_chat_id, "⚠️ رسانه برای بیمار ارسال شد اما ذخیره آن در پرونده ناموفق بود.")
+        return
+
+    success = await api_client.create_message(
+        patient_id=patient_id,
+        user_id=consultant_id,
+        message_content=None,
+        messages_sender=False,
+        attachments=[key]
+    )
+    if not success:
+        # فایل در تاریخچه ثبت نشد؛ ارجاع آن برداشته می‌شود
+        await release_attachments(content_store, [key], chat_id=consultant_chat_id, message_id=message_id)
+        await bot.send_message(consultant_chat_id, "⚠️ رسانه برای بیمار ارسال شد اما ثبت آن در تاریخچه ناموفق بود.")
+        return
+    schedule_previews(image_service, attachment_storage, [key])
+
+
 @consultant_router.message(ConsultantFlow.in_chat_with_patient)
-async def handle_consultant_chat_message(message: Message, state: FSMContext, api_client: APIClient, bot: Bot):
+async def handle_consultant_chat_message(message: Message, state: FSMContext, api_client: APIClient, bot: Bot,
+                                         file_id_cache: Optional[FileIdCache] = None,
+                                         background_tasks: Optional[BackgroundTasks] = None,
+                                         attachment_storage: Optional[AttachmentStorage] = None,
+                                         content_store: Optional[ContentStore] = None,
+                                         image_service: Optional[ImageProcessingService] = None):
     # این هندلر باید بعد از هندلر دکمه‌ها باشد تا اولویت با دکمه‌ها باشد
     data = await state.get_data()
     patient_id = data.get("selected_patient_id")
@@ -430,12 +525,6 @@ async def handle_consultant_chat_message(message: Message, state: FSMContext, ap
 
     consultant_id = response.get("user_id")
 
-    text_content = None
-    attachment_paths = []  # برای ذخیره مسیر فایل‌ها
-
-    user_storage_path = os.path.join("patient_files", str(patient_telegram_id))
-    os.makedirs(user_storage_path, exist_ok=True)
-
     # ===== پیام متنی =====
     if message.text:
         text_content = message.text
@@ -445,87 +534,101 @@ async def handle_consultant_chat_message(message: Message, state: FSMContext, ap
             text=text_content
         )
 
-    # ===== عکس =====
-    elif message.photo:
-        await bot.send_chat_action(chat_id=patient_telegram_id, action="upload_photo")
-
-        photo = message.photo[-1]
-        file_id = photo.file_id
-        try:
-            file_info = await bot.get_file(photo.file_id)
-            file_path_on_telegram = file_info.file_path
-
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            file_extension = os.path.splitext(file_path_on_telegram)[1] or ".jpg"
-            filename = f"photo_{timestamp}{file_extension}"
-            destination_path = os.path.join(user_storage_path, filename)
-
-            await bot.download_file(file_path_on_telegram, destination=destination_path)
-            absolute_path = os.path.abspath(destination_path)
-            attachment_paths.append(absolute_path)
+        # --- ساخت و ارسال پیام در API ---
+        success = await api_client.create_message(
+            patient_id=patient_id,
+            user_id=consultant_id,
+            message_content=text_content,
+            messages_sender=False,
+            attachments=[]
+        )
 
-            # 2. خواندن از دیسک و ارسال به بیمار (بدون استفاده از file_id)
+        if success:
+            confirm_text = "✅ پیام (یا رسانه) شما ارسال شد."
+            await message.answer(confirm_text)
+        else:
+            await message.answer("❌ خطا در ارسال پیام. لطفاً بعداً امتحان کنید.")
+        return
 
-            photo_from_disk = FSInputFile(absolute_path)
+    # ===== عکس / ویس =====
+    # همان file_id پیام مشاور مستقیماً برای بیمار فرستاده می‌شود (بدون دانلود و آپلود دوباره)؛
+    # ذخیره فایل در پرونده بیمار و ثبت در API در پس‌زمینه انجام می‌شود
+    try:
+        if message.photo:
+            kind = "photo"
+            file_id = message.photo[-1].file_id
+            file_unique_id = message.photo[-1].file_unique_id
             await bot.send_photo(
                 chat_id=patient_telegram_id,
-                photo=photo_from_disk,
+                photo=file_id,
                 caption=message.caption if message.caption else "📷 پیام تصویری از مشاور"
             )
-
-
-        except Exception as e:
-            logging.error(f"Error downloading photo for {patient_telegram_id}: {e}")
-
-    # ===== ویس =====
-    elif message.voice:
-        voice = message.voice
-        file_id = voice.file_id
-
-        try:
-            file_info = await bot.get_file(voice.file_id)
-            file_path_on_telegram = file_info.file_path
-
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            file_extension = os.path.splitext(file_path_on_telegram)[1] or ".ogg"
-            filename = f"voice_{timestamp}{file_extension}"
-            destination_path = os.path.join(user_storage_path, filename)
-
-            await bot.download_file(file_path_on_telegram, destination=destination_path)
-            absolute_path = os.path.abspath(destination_path)
-            attachment_paths.append(absolute_path)
-
-            voice_from_disk = FSInputFile(absolute_path)
+        elif message.voice:
+            kind = "voice"
+            file_id = message.voice.file_id
+            file_unique_id = message.voice.file_unique_id
             await bot.send_voice(
                 chat_id=patient_telegram_id,
-                voice=voice_from_disk,
+                voice=file_id,
                 caption="🎙 پیام صوتی از مشاور"
             )
-        except Exception as e:
-            logging.error(f"Error downloading voice for {patient_telegram_id}: {e}")
-
-    else:
-        await message.answer("فقط ارسال متن، عکس یا ویس پشتیبانی می‌شود.")
+        else:
+            await message.answer("فقط ارسال متن، عکس یا ویس پشتیبانی می‌شود.")
+            return
+    except Exception as e:
+        logging.error(f"Error relaying media to {patient_telegram_id}: {e}")
+        await message.answer("❌ خطا در ارسال پیام. لطفاً بعداً امتحان کنید.")
         return
 
-    # --- ساخت و ارسال پیام در API ---
-    success = await api_client.create_message(
+    await message.answer("✅ پیام (یا رسانه) شما ارسال شد.")
+
+    archive = archive_consultant_media(
+        bot, api_client, file_id, kind,
+        patient_telegram_id=patient_telegram_id,
         patient_id=patient_id,
-        user_id=consultant_id,
-        message_content=text_content,
-        messages_sender=False,
-        attachments=attachment_paths  # می‌تونه []
+        consultant_id=consultant_id,
+        consultant_chat_id=message.chat.id,
+        file_id_cache=file_id_cache,
+        attachment_storage=attachment_storage,
+        content_store=content_store,
+        file_unique_id=file_unique_id,
+        message_id=message.message_id,
+        image_service=image_service,
     )
-
-    if success:
-        confirm_text = "✅ پیام (یا رسانه) شما ارسال شد."
-        await message.answer(confirm_text)
+    if background_tasks is not None:
+        background_tasks.spawn(archive, name=f"archive-{kind}-{patient_telegram_id}")
     else:
-        await message.answer("❌ خطا در ارسال پیام. لطفاً بعداً امتحان کنید.")
+        await archive
 # -----------------------------
 
 
 
+# --- دکمه «فایل اصلی» زیر عکس‌های پرونده و تاریخچه ---
+@consultant_router.callback_query(F.data.startswith(ORIGINAL_CALLBACK_PREFIX))
+async def process_original_request(callback: CallbackQuery, state: FSMContext, bot: Bot,
+                                   file_id_cache: Optional[FileIdCache] = None,
+                                   attachment_storage: Optional[AttachmentStorage] = None,
+                                   content_store: Optional[ContentStore] = None):
+    # فقط فایل‌های پرونده بیماری که الان باز است فرستاده می‌شوند
+    patient_telegram_id = str((await state.get_data()).get("patient_telegram_id") or "")
+    if not patient_telegram_id.isdigit():
+        await callback.answer("⚠️ ابتدا پرونده بیمار را باز کنید.", show_alert=True)
+        return
+
+    await callback.answer("⏳ در حال ارسال فایل اصلی...")
+    try:
+        sent = await send_original(
+            bot, callback.message.chat.id, callback.data.removeprefix(ORIGINAL_CALLBACK_PREFIX),
+            owner_id=int(patient_telegram_id),
+            file_id_cache=file_id_cache, storage=attachment_storage, content_store=content_store,
+        )
+        if sent is None:
+            await callback.message.answer("⚠️ فایل اصلی یافت نشد.")
+    except Exception as e:
+        logging.error(f"Error sending original file: {e}", exc_info=True)
+        await callback.message.answer("❌ خطا در ارسال فایل اصلی.")
+
+
 # --- مرحله ۵: انتخاب نوع بیماری و نمایش داروها ---
 @consultant_router.callback_query(ConsultantFlow.choosing_disease_type, F.data.startswith("disease_type_"))
 async def process_disease_type_choice(callback: CallbackQuery, state: FSMContext, api_client: APIClient):
@@ -937,7 +1040,11 @@ async def handle_confirm_drugs(callback: CallbackQuery, state: FSMContext, api_c
 
 
 @consultant_router.callback_query(F.data == "next_patient")
-async def handle_next_patient(callback: CallbackQuery, state: FSMContext, api_client: APIClient):
+async def handle_next_patient(callback: CallbackQuery, state: FSMContext, api_client: APIClient,
+                              file_id_cache: Optional[FileIdCache] = None,
+                              attachment_storage: Optional[AttachmentStorage] = None,
+                              content_store: Optional[ContentStore] = None,
+                              image_service: Optional[ImageProcessingService] = None):
     """
     این هندلر وقتی اجرا می‌شود که مشاور نسخه را ثبت کرده و روی دکمه 'بیمار بعدی' در پیام موفقیت کلیک می‌کند.
     چون State پاک شده، باید دوباره از سرور بپرسیم که نوبت کیست.
@@ -982,7 +1089,9 @@ async def handle_next_patient(callback: CallbackQuery, state: FSMContext, api_cl
 
     # ۶. نمایش اطلاعات بیمار
     # از همان تابع مشترکی که ساختیم استفاده می‌کنیم تا ظاهر یکسان باشد
-    await show_patient_full_info(callback.message, state, api_client, patient_telegram_id)
+    await show_patient_full_info(callback.message, state, api_client, patient_telegram_id, file_id_cache=file_id_cache,
+                                 attachment_storage=attachment_storage, content_store=content_store,
+                                 image_service=image_service)
 
     # پاک کردن پیام لودینگ قبلی
     try:
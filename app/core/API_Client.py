@@ -3,15 +3,52 @@ import aiohttp
 import asyncio
 
 import asyncio
+import base64
+import copy
+import json
 import logging
 import os
+import time
 from http.client import responses
 from typing import Optional, Union, List, Dict,Any
 
 import httpx
 from httpx import AsyncClient, HTTPStatusError
+from httpx._client import UseClientDefault
 
+from app.core.cache import AsyncTTLCache
+from app.core.cms_cache import BotMessageCache
+from app.core.http_pool import MeteredTransport, build_http_client
+from app.core.resilience import APIError, CircuitBreaker, CircuitOpenError, backoff_delay
 from app.core.setting import settings
+from app.utils.concurrency import fan_out
+
+
+# پاسخ‌هایی که برای GET ارزش دوباره ارسال دارند (مشکل موقت پراکسی/بک‌اند)
+RETRYABLE_STATUSES = {502, 503, 504}
+# فاصله بررسی دوباره اندپوینت review-bundle بعد از اینکه بک‌اند آن را نداشت
+REVIEW_BUNDLE_RETRY_SECONDS = 600
+
+
+class _BearerAuth(httpx.Auth):
+    """
+    توکن JWT را به هر درخواست اضافه می‌کند. اگر پاسخ 401 باشد، یک بار توکن تازه گرفته و درخواست
+    دوباره ارسال می‌شود. درخواست‌های همزمانی که 401 می‌گیرند همگی منتظر همان یک لاگین می‌مانند.
+    """
+
+    def __init__(self, api_client: "APIClient"):
+        self._api_client = api_client
+
+    async def async_auth_flow(self, request: httpx.Request):
+        token = await self._api_client.login_check()
+        request.headers["Authorization"] = f"Bearer {token}"
+        response = yield request
+
+        if response.status_code == 401:
+            logging.warning(f"Got 401 for {request.method} {request.url.path}; refreshing token and retrying once.")
+            token = await self._api_client._refresh_token(stale_token=token)
+            request.headers["Authorization"] = f"Bearer {token}"
+            yield request
 
 
 class APIClient:
@@ -22,18 +59,59 @@ class APIClient:
 
     def __init__(self, base_url: str):
         self._base_url = base_url
-        self._client = AsyncClient()
+        # کلاینت با استخر اتصال، keep-alive و timeoutهای قابل تنظیم از Settings
+        self._client = build_http_client()
         self._token: Optional[str] = None
+        # زمان انقضای توکن فعلی (epoch ثانیه)
+        self._token_expires_at: float = 0.0
+        self._token_lifetime: float = 0.0
         self._lock = asyncio.Lock()
-
-        self._content_cache: Dict[str, str] = {}
+        self._renewal_task: Optional[asyncio.Task] = None
+        # همه درخواست‌ها (به جز لاگین) از این auth عبور می‌کنند تا 401 به صورت خودکار مدیریت شود
+        self._client.auth = _BearerAuth(self)
+
+        # کش متن‌های CMS؛ با start_content_cache همه پیام‌ها یک‌جا بارگذاری و دوره‌ای تازه می‌شوند
+        self._content_cache = BotMessageCache(
+            bulk_loader=self._fetch_all_bot_messages,
+            key_loader=self._fetch_bot_message,
+            ttl=settings.CMS_CACHE_TTL_SECONDS,
+            negative_ttl=settings.CMS_NEGATIVE_TTL_SECONDS,
+            maxsize=settings.CMS_CACHE_MAX_SIZE,
+        )
+        # کش کاتالوگ (انواع بیماری و داروها) که در هر مرحله نسخه‌نویسی مشاور خوانده می‌شود
+        self._catalog_cache = AsyncTTLCache(
+            ttl=settings.CATALOG_CACHE_TTL_SECONDS,
+            stale_ttl=settings.CATALOG_CACHE_STALE_SECONDS,
+            maxsize=settings.CATALOG_CACHE_MAX_SIZE,
+            name="catalog",
+        )
+        # GETهای در جریان برای ادغام درخواست‌های همزمان یکسان
+        self._inflight_gets: Dict[tuple, asyncio.Task] = {}
+        self._get_requests = 0
+        self._coalesced_gets = 0
+        # اگر بک‌اند اندپوینت review-bundle نداشت، تا این زمان دوباره امتحانش نمی‌کنیم
+        self._review_bundle_unsupported_until: float = 0.0
+        self._breaker = CircuitBreaker(
+            failure_threshold=settings.API_CIRCUIT_FAILURE_THRESHOLD,
+            recovery_timeout=settings.API_CIRCUIT_RECOVERY_SECONDS,
+        )
 
 
         # خواندن اطلاعات از settings
         self._username = settings.API_USERNAME
         self._password = settings.API_PASSWORD.get_secret_value()
         if not self._base_url.startswith(("http://", "https://")):
-            self.base_url = f"http://{self._base_url}"
+            self._base_url = f"http://{self._base_url}"
+
+    def get_pool_metrics(self) -> Dict[str, Any]:
+        """
+        آمار استخر اتصال: اتصال‌های در حال استفاده، درخواست‌های منتظر اتصال و نسبت استفاده مجدد.
+        """
+        transport = getattr(self._client, "_transport", None)
+        if isinstance(transport, MeteredTransport):
+            return transport.metrics()
+        return {}
+
     async def _login(self) -> None:
         """
         با استفاده از نام کاربری و رمز عبور سیستم، لاگین کرده و توکن JWT را دریافت می‌کند.
@@ -49,7 +127,8 @@ class APIClient:
             # --- تغییر کلیدی اینجاست ---
             response = await self._client.post(
                 f"{self._base_url}/login/access-token",
-                json=login_data  # استفاده از 'json' برای ارسال application/json
+                json=login_data,  # استفاده از 'json' برای ارسال application/json
+                auth=None,  # درخواست لاگین خودش توکن ندارد
             )
             # --------------------------
 
@@ -62,7 +141,13 @@ class APIClient:
                 logging.error("Login successful, but no access token found in response.")
                 raise ValueError("Access token not in response")
 
-            logging.info("Successfully logged in and got the token.")
+            self._token_expires_at = self._read_token_expiry(self._token)
+            self._token_lifetime = max(self._token_expires_at - time.time(), 0.0)
+            logging.info(
+                f"Successfully logged in and got the token "
+                f"(expires in {int(self._token_expires_at - time.time())}s)."
+            )
+            self._ensure_renewal_task()
 
         except HTTPStatusError as e:
             error_details = ""
@@ -76,55 +161,255 @@ class APIClient:
             logging.error(f"An unexpected error occurred during login: {e}")
             raise
 
+    @staticmethod
+    def _read_token_expiry(token: str) -> float:
+        """
+        زمان انقضا را از claim `exp` توکن JWT می‌خواند (بدون بررسی امضا).
+        اگر قابل خواندن نبود، از ACCESS_TOKEN_EXPIRE_MINUTES استفاده می‌شود.
+        """
+        try:
+            payload = token.split(".")[1]
+            payload += "=" * (-len(payload) % 4)
+            exp = json.loads(base64.urlsafe_b64decode(payload)).get("exp")
+            if exp:
+                return float(exp)
+        except Exception:
+            pass
+        return time.time() + settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60
+
+    def _token_is_valid(self) -> bool:
+        return bool(self._token) and time.time() < self._token_expires_at
+
+    async def _refresh_token(self, stale_token: Optional[str] = None) -> str:
+        """
+        توکن را تازه می‌کند. اگر در این فاصله درخواست دیگری توکن را عوض کرده باشد، دوباره لاگین نمی‌کند
+        و همان توکن جدید را برمی‌گرداند؛ پس چند 401 همزمان فقط به یک لاگین ختم می‌شوند.
+        """
+        async with self._lock:
+            if self._token and self._token != stale_token:
+                return self._token
+            await self._login()
+            return self._token
+
+    def _refresh_margin(self) -> float:
+        # برای توکن‌های خیلی کوتاه‌عمر، حاشیه حداکثر نصف عمر توکن است
+        return min(settings.TOKEN_REFRESH_MARGIN_SECONDS, self._token_lifetime / 2)
+
+    def _ensure_renewal_task(self) -> None:
+        if self._renewal_task is None or self._renewal_task.done():
+            self._renewal_task = asyncio.create_task(self._renewal_loop(), name="api-token-renewal")
+
+    async def _renewal_loop(self) -> None:
+        """
+        کمی قبل از انقضای توکن (TOKEN_REFRESH_MARGIN_SECONDS) در پس‌زمینه توکن جدید می‌گیرد
+        تا درخواست‌های کاربران هیچ‌وقت با توکن منقضی ارسال نشوند.
+        """
+        while True:
+            renew_at = self._token_expires_at - self._refresh_margin()
+            await asyncio.sleep(max(renew_at - time.time(), 1.0))
+            if time.time() < self._token_expires_at - self._refresh_margin():
+                continue
+            try:
+                logging.info("Access token is about to expire. Renewing in background...")
+                async with self._lock:
+                    await self._login()
+            except Exception as e:
+                logging.error(f"Background token renewal failed, retrying in 30s: {e}")
+                await asyncio.sleep(30)
+
     async def login_check(self):
         """
-        بررسی می‌کند که آیا توکن وجود دارد یا خیر. اگر وجود نداشت، لاگین می‌کند.
+        بررسی می‌کند که آیا توکن معتبر وجود دارد یا خیر. اگر وجود نداشت یا منقضی شده بود، لاگین می‌کند.
+
+        مسیر سریع: اگر توکن معتبر است بدون گرفتن قفل برگردانده می‌شود. خواندن دو فیلد بدون await در بین
+        در asyncio اتمیک است، پس قفل فقط برای لاگین/تمدید لازم است و درخواست‌های همزمان پشت آن صف نمی‌کشند
+        (حتی وقتی تمدید پس‌زمینه در حال اجراست، چون توکن قبلی هنوز معتبر است).
         """
+        token = self._token
+        if token and time.time() < self._token_expires_at:
+            return token
+
         async with self._lock:
-            if not self._token:
-                logging.warning("Token is missing. Attempting to log in...")
+            if not self._token_is_valid():
+                logging.warning("Token is missing or expired. Attempting to log in...")
                 await self._login()
         return self._token
 
+    # ---------------- unified request pipeline ----------------
+
+    async def _request(
+            self,
+            method: str,
+            path: str,
+            *,
+            endpoint: str,
+            params: Optional[Dict[str, Any]] = None,
+            json: Any = None,
+    ) -> Any:
+        """
+        تمام درخواست‌های APIClient از این متد عبور می‌کنند و بدنه JSON پاسخ (یا None برای پاسخ خالی) برگردانده می‌شود.
+
+        - توکن و تمدید آن روی 401 توسط _BearerAuth انجام می‌شود.
+        - فقط GETها در صورت خطای شبکه/timeout یا 502/503/504 با backoff نمایی و jitter دوباره ارسال می‌شوند.
+        - timeout هر متد از API_ENDPOINT_TIMEOUTS (با کلید نام متد = endpoint) خوانده می‌شود.
+        - وقتی بک‌اند پشت سر هم خطا بدهد، circuit breaker درخواست‌ها را بدون انتظار رد می‌کند.
+
+        - GETهای یکسانی که همزمان در جریان هستند (مثلاً دو مشاور روی یک تاریخ یا دابل‌کلیک کاربر) فقط یک
+          درخواست HTTP می‌سازند و هر کدام یک کپی مستقل از نتیجه آن را می‌گیرند (single-flight).
+
+        در هر خطا APIError (یا CircuitOpenError) پرتاب می‌شود؛ متدهای عمومی آن را به مقدار برگشتی خودشان تبدیل می‌کنند.
+        """
+        if method != "GET":
+            return await self._send(method, path, endpoint=endpoint, params=params, json=json)
+
+        self._get_requests += 1
+        key = (path, tuple(sorted((params or {}).items())))
+        task = self._inflight_gets.get(key)
+        if task is not None:
+            self._coalesced_gets += 1
+        else:
+            task = asyncio.create_task(self._send(method, path, endpoint=endpoint, params=params))
+            self._inflight_gets[key] = task
+            task.add_done_callback(lambda t: self._inflight_done(key, t))
+        result = await asyncio.shield(task)
+        # هندلرها گاهی نتیجه را تغییر می‌دهند (مثلاً sort)؛ هر فراخواننده، از جمله همانی که درخواست را فرستاده،
+        # نسخه مستقل خودش را می‌گیرد و نتیجه مشترک task دست‌نخورده می‌ماند
+        return copy.deepcopy(result)
+
+    def _inflight_done(self, key: tuple, task: asyncio.Task) -> None:
+        self._inflight_gets.pop(key, None)
+        # اگر فراخواننده اصلی لغو شده و منتظر دیگری نبوده، خطا را "دیده‌شده" علامت می‌زنیم تا هشدار asyncio ندهد
+        if not task.cancelled():
+            task.exception()
+
+    def get_coalescing_stats(self) -> Dict[str, int]:
+        """تعداد کل GETها و تعدادی که با یک درخواست همزمان یکسان ادغام شدند (بدون ارسال HTTP جدید)."""
+        return {
+            "get_requests": self._get_requests,
+            "coalesced": self._coalesced_gets,
+            "in_flight": len(self._inflight_gets),
+        }
+
+    async def _send(
+            self,
+            method: str,
+            path: str,
+            *,
+            endpoint: str,
+            params: Optional[Dict[str, Any]] = None,
+            json: Any = None,
+    ) -> Any:
+        """ارسال واقعی درخواست با retry و circuit breaker (فقط از طریق _request صدا زده می‌شود)."""
+        url = f"{self._base_url}{path}"
+        attempts = 1 + (max(0, settings.API_RETRY_ATTEMPTS) if method == "GET" else 0)
+        timeout = self._endpoint_timeout(endpoint)
+
+        for attempt in range(attempts):
+            if not self._breaker.allow_request():
+                raise CircuitOpenError(method, path)
+            probing = self._breaker.state == CircuitBreaker.HALF_OPEN
+
+            try:
+                response = await self._client.request(method, url, params=params, json=json, timeout=timeout)
+            except httpx.HTTPStatusError as e:
+                # خطای لاگین داخل _BearerAuth
+                if e.response.status_code >= 500:
+                    self._breaker.record_failure()
+                else:
+                    self._breaker.record_success()
+                raise APIError(method, path, e.response.status_code, "login failed") from e
+            except ValueError as e:
+                # لاگین موفق ولی بدون access_token
+                self._breaker.record_failure()
+                raise APIError(method, path, None, f"login failed: {e}") from e
+            except httpx.TransportError as e:
+                self._breaker.record_failure()
+                if not self._can_retry(attempt, attempts):
+                    raise APIError(method, path, None, repr(e)) from e
+                logging.warning(f"{method} {path} failed ({e!r}); retrying (attempt {attempt + 2}/{attempts}).")
+                await asyncio.sleep(backoff_delay(attempt, settings.API_RETRY_BACKOFF_BASE, settings.API_RETRY_BACKOFF_MAX))
+                continue
+            except httpx.HTTPError as e:
+                # بقیه خطاهای httpx (مثلاً DecodingError یا TooManyRedirects) تکرار نمی‌شوند
+                self._breaker.record_failure()
+                raise APIError(method, path, None, repr(e)) from e
+            except BaseException:
+                # لغو درخواست (مثلاً timeout فراخواننده) نتیجه‌ای درباره سلامت بک‌اند ندارد،
+                # ولی اگر این درخواست آزمایشی half_open بود باید جایش برای درخواست بعدی آزاد شود
+                if probing:
+                    self._breaker.release_probe()
+                raise
+
+            if response.status_code >= 500:
+                self._breaker.record_failure()
+                if response.status_code in RETRYABLE_STATUSES and self._can_retry(attempt, attempts):
+                    logging.warning(
+                        f"{method} {path} returned {response.status_code}; "
+                        f"retrying (attempt {attempt + 2}/{attempts})."
+                    )
+                    await asyncio.sleep(backoff_delay(attempt, settings.API_RETRY_BACKOFF_BASE, settings.API_RETRY_BACKOFF_MAX))
+                    continue
+            else:
+                self._breaker.record_success()
+
+            if response.is_error:
+                try:
+                    detail = response.json()
+                except ValueError:
+                    detail = response.text
+                raise APIError(method, path, response.status_code, detail)
+
+            if not response.content:
+                return None
+            try:
+                return response.json()
+            except ValueError as e:
+                raise APIError(method, path, response.status_code, "invalid JSON in response") from e
+
+        # فقط در صورتی که حلقه با continue تمام شود (عملاً رخ نمی‌دهد)
+        raise APIError(method, path, None, "retries exhausted")
+
+    def _can_retry(self, attempt: int, attempts: int) -> bool:
+        # اگر همین خطا مدار را باز کرده باشد، منتظر ماندن برای تلاش بعدی بی‌فایده است
+        return attempt + 1 < attempts and self._breaker.state != CircuitBreaker.OPEN
+
+    @staticmethod
+    def _endpoint_timeout(endpoint: str) -> Union[httpx.Timeout, UseClientDefault]:
+        value = settings.API_ENDPOINT_TIMEOUTS.get(endpoint)
+        if value is None:
+            # None در httpx یعنی «بدون هیچ timeout»؛ برای متدهای بدون تنظیم خاص timeout خود کلاینت اعمال می‌شود
+            return httpx.USE_CLIENT_DEFAULT
+        return httpx.Timeout(value, connect=settings.API_CONNECT_TIMEOUT, pool=settings.API_POOL_TIMEOUT)
+
+    def get_circuit_state(self) -> str:
+        return self._breaker.state
+
+    # ---------------------------------------------------------
+
     async def get_user_role(self, telegram_id: int) -> str:
         """
         نقش کاربر را بر اساس شناسه تلگرام از API دریافت می‌کند.
         اگر کاربر پیدا نشد (404)، نقش پیش‌فرض "Patient" را برمی‌گرداند.
+        بقیه خطاها (5xx، timeout، مدار باز) APIError پرتاب می‌کنند تا با «کاربر وجود ندارد» اشتباه گرفته نشوند.
         """
         try:
-            token = await self.login_check()
-            headers = {"Authorization": f"Bearer {token}"}
-
-            url = f"{self._base_url}/user/role-by-telegram-id/{telegram_id}"
-            response = await self._client.get(url, headers=headers)
-
-            response.raise_for_status()
-
-            user_data = response.json()
-            role_name = user_data.get("role_name")
-            logging.info(role_name)
+            user_data = await self._request(
+                "GET", f"/user/role-by-telegram-id/{telegram_id}", endpoint="get_user_role"
+            )
+        except APIError as e:
+            if not e.is_not_found:
+                logging.error(f"Error getting user role for {telegram_id}: {e}")
+                raise
+            logging.info(f"User with telegram_id {telegram_id} not found. Assigning 'Patient' role.")
+            return "Patient"
 
-            if role_name:
-                logging.info(f"Role for telegram_id {telegram_id} is '{role_name}'.")
-                return role_name
-            elif role_name is None:
-                logging.warning(f"User with telegram_id {telegram_id} found, but has no role name.")
-                return "Patient"
-            else:
-                logging.warning(f"User with telegram_id {telegram_id} found, but has no role name.")
-                return "Patient"
+        role_name = (user_data or {}).get("role_name")
+        if role_name:
+            logging.info(f"Role for telegram_id {telegram_id} is '{role_name}'.")
+            return role_name
 
-        except HTTPStatusError as e:
-            if e.response.status_code == 404:
-                logging.info(f"User with telegram_id {telegram_id} not found. Assigning 'Patient' role.")
-                return "Patient"
-            else:
-                logging.error(
-                    f"HTTP error getting user role for {telegram_id}: {e.response.status_code} - {e.response.text}")
-                return "Patient"
-        except Exception as e:
-            logging.error(f"Unexpected error getting user role for {telegram_id}: {e}")
-            return "Patient"
+        logging.warning(f"User with telegram_id {telegram_id} found, but has no role name.")
+        return "Patient"
 
     async def create_patient_profile(self, patient_data: dict) -> Optional[Union[int, str]]:
         """
@@ -137,122 +422,63 @@ class APIClient:
             The patient_id (int, str, or UUID) if creation was successful.
             None if any error occurred.
         """
+        logging.info(f"Sending new patient profile to API for telegram_id: {patient_data.get('user_telegram_id')}")
         try:
-            token = await self.login_check()
-            if not token:
-                logging.error("Authentication failed. Cannot create patient profile.")
-                return None  # اگر توکن دریافت نشد، ادامه نده
-
-            headers = {"Authorization": f"Bearer {token}"}
-            url = f"{self._base_url}/patient/"
-
-            logging.info(f"Sending new patient profile to API for telegram_id: {patient_data.get('user_telegram_id')}")
-
-            # ارسال درخواست به API
-            response = await self._client.post(url, headers=headers, json=patient_data)
-
-            # بررسی دقیق کد وضعیت؛ فقط 201 به معنای موفقیت است
-            if response.status_code == 201:
-                # 1. پاسخ را به فرمت JSON تبدیل می‌کنیم
-                response_data = response.json()
-
-                # 2. مقدار 'patient_id' را از دیکشنری JSON استخراج می‌کنیم
-                patient_id = response_data.get("patient_id")
-
-                if patient_id:
-                    logging.info(f"Successfully created patient profile with ID: {patient_id}")
-                    # 3. به جای True، مقدار استخراج شده را برمی‌گردانیم
-                    return patient_id
-                else:
-                    # اگر کد 201 بود اما patient_id در پاسخ وجود نداشت، این یک خطای غیرمنتظره در API است
-                    logging.error(
-                        f"API returned 201 Created but 'patient_id' is missing in the response. Response: {response.text}")
-                    return None
-
-            # برای سایر کدها، خطا را لاگ می‌گیریم و None برمی‌گردانیم
-            logging.error(
-                f"Failed to create patient profile. Status: {response.status_code}, Response: {response.text}")
-
-            # این خط برای دیباگ کردن بسیار مفید است. اگر API خطایی مثل 400 یا 500 برگرداند،
-            # این خط یک استثنا (Exception) ایجاد می‌کند که در بلوک except گرفته می‌شود.
-            response.raise_for_status()
-            return None  # این خط در عمل اجرا نمی‌شود چون خط بالا استثنا ایجاد می‌کند، اما برای خوانایی خوب است
-
-        except httpx.HTTPStatusError as e:
-            # این خطا زمانی رخ می‌دهد که response.raise_for_status() فراخوانی شود و کد وضعیت 4xx یا 5xx باشد
-            logging.error(f"HTTP error creating patient profile: {e.response.status_code} - {e.response.text}")
-            return None
-        except httpx.RequestError as e:
-            # این خطا برای مشکلات شبکه مثل عدم اتصال به سرور است
-            logging.error(f"A network error occurred while creating patient profile: {e}")
-            return None
-        except Exception as e:
-            # گرفتن هر خطای پیش‌بینی نشده دیگر
-            logging.error(f"An unexpected error occurred while creating patient profile: {e}", exc_info=True)
+            response_data = await self._request("POST", "/patient/", endpoint="create_patient_profile", json=patient_data)
+        except APIError as e:
+            logging.error(f"Failed to create patient profile: {e}")
             return None
 
-    # ^^^^^^ پایان متد جدید ^^^^^^
-
+        patient_id = (response_data or {}).get("patient_id")
+        if not patient_id:
+            # اگر درخواست موفق بود اما patient_id در پاسخ وجود نداشت، این یک خطای غیرمنتظره در API است
+            logging.error(f"API created the patient but 'patient_id' is missing in the response: {response_data}")
+            return None
 
+        logging.info(f"Successfully created patient profile with ID: {patient_id}")
+        return patient_id
 
     # -------------------------------------------------------
 
     async def get_waiting_for_consultation_dates(self) -> list[str] | None:
         """Fetches dates with unassigned patients."""
+        logging.info("Fetching unassigned patient dates from API.")
         try:
-            token = await self.login_check()
-            headers = {"Authorization": f"Bearer {token}"}
-            url = f"{self._base_url}/patient/waiting-for-consultation-dates/"
-            logging.info(url)
-
-            logging.info("Fetching unassigned patient dates from API.")
-            response = await self._client.get(url, headers=headers)
-            response.raise_for_status()
-
-            dates = response.json()  # API باید لیستی از رشته‌های تاریخ را برگرداند
-            dates_list = dates.get("dates", [])
-
-            logging.info(f"Found {len(dates_list)} unassigned dates.")
-            return dates_list
-        except Exception as e:
+            dates = await self._request(
+                "GET", "/patient/waiting-for-consultation-dates/", endpoint="get_waiting_for_consultation_dates"
+            )
+        except APIError as e:
             logging.error(f"Error fetching unassigned dates: {e}")
             return None
 
+        # API باید لیستی از رشته‌های تاریخ را برگرداند
+        dates_list = (dates or {}).get("dates", [])
+        logging.info(f"Found {len(dates_list)} unassigned dates.")
+        return dates_list
+
     async def get_waiting_for_consultation_patients_by_date(self, date: str) -> list[dict] | None:
         """Fetches patients for a specific unassigned date."""
+        logging.info(f"Fetching patients for date: {date}")
         try:
-            token = await self.login_check()
-            headers = {"Authorization": f"Bearer {token}"}
-            url = f"{self._base_url}/patient/awaiting-for-consultation-by-date/{date}"
-
-            logging.info(f"Fetching patients for date: {date}")
-            response = await self._client.get(url, headers=headers)
-            response.raise_for_status()
-
-            patients = response.json()  # API باید لیستی از دیکشنری‌های بیمار را برگرداند
-            patients_list = patients.get("patients", [])
-
-            logging.info(f"Found {len(patients_list)} patients for date {date}.")
-            return patients_list
-        except Exception as e:
+            patients = await self._request(
+                "GET",
+                f"/patient/awaiting-for-consultation-by-date/{date}",
+                endpoint="get_waiting_for_consultation_patients_by_date",
+            )
+        except APIError as e:
             logging.error(f"Error fetching patients for date {date}: {e}")
             return None
 
+        patients_list = (patients or {}).get("patients", [])
+        logging.info(f"Found {len(patients_list)} patients for date {date}.")
+        return patients_list
+
     async def get_patient_details_by_telegram_id(self, telegram_id: str) -> dict | None:
-        """Fetches full details of a single patient by their database ID."""
+        """Fetches full details of a single patient by their telegram ID."""
+        logging.info(f"Fetching details for telegram_id: {telegram_id}")
         try:
-            token = await self.login_check()
-            headers = {"Authorization": f"Bearer {token}"}
-            url = f"{self._base_url}/patient/{telegram_id}"
-
-            logging.info(f"Fetching details for telegram_id: {telegram_id}")
-            response = await self._client.get(url, headers=headers)
-            response.raise_for_status()
-
-            patient_details = response.json()
-            logging.info(f"Successfully fetched details for telegram_id: {telegram_id}")
-            return patient_details
-        except Exception as e:
+            return await self._request("GET", f"/patient/{telegram_id}", endpoint="get_patient_details_by_telegram_id")
+        except APIError as e:
             logging.error(f"Error fetching patient details for telegram_id {telegram_id}: {e}")
             return None
 
@@ -261,84 +487,72 @@ class APIClient:
         دریافت مشخصات کامل بیمار با استفاده از شناسه عددی (ID)
         """
         try:
-            token = await self.login_check()
-            headers = {"Authorization": f"Bearer {token}"}
-            # فرض بر این است که اندپوینت خواندن با ID به صورت زیر است
-            # اگر اندپوینت شما فرق دارد (مثلاً /patient/read/{id}) اینجا را اصلاح کنید
-            url = f"{self._base_url}/patient/by-id/{patient_id}"
-
-            # نکته: اگر اندپوینت read-by-id ندارید، می‌توانید از اندپوینت ادمین استفاده کنید
-            # یا اگر اندپوینت /patient/{id} دارید تست کنید.
-
-            response = await self._client.get(url, headers=headers)
-
-            if response.status_code == 200:
-                return response.json()
-            else:
-                logging.warning(f"Failed to fetch patient by ID {patient_id}. Status: {response.status_code}")
-                return None
-        except Exception as e:
-            logging.error(f"Error fetching patient {patient_id}: {e}")
+            return await self._request("GET", f"/patient/by-id/{patient_id}", endpoint="get_patient_by_id")
+        except APIError as e:
+            logging.warning(f"Failed to fetch patient by ID {patient_id}: {e}")
             return None
 
     # -----------------------------------------------------
 
     async def get_user_details_by_telegram_id(self, telegram_id: int) -> dict | None:
-        """Fetches full details of a single patient by their database ID."""
+        """Fetches full details of a single user by their telegram ID."""
+        logging.info(f"Fetching details for telegram_id: {telegram_id}")
         try:
-            token = await self.login_check()
-            headers = {"Authorization": f"Bearer {token}"}
-            url = f"{self._base_url}/user/read-by-telegram-id/{telegram_id}"
-
-            logging.info(f"Fetching details for telegram_id: {telegram_id}")
-            response = await self._client.get(url, headers=headers)
-            response.raise_for_status()
-
-            patient_details = response.json()
-            logging.info(f"Successfully fetched details for telegram_id: {telegram_id}")
-            return patient_details
-        except Exception as e:
+            return await self._request(
+                "GET", f"/user/read-by-telegram-id/{telegram_id}", endpoint="get_user_details_by_telegram_id"
+            )
+        except APIError as e:
             logging.error(f"Error fetching user details for telegram_id {telegram_id}: {e}")
             return None
 
-
     # ---------------------------------------------------
 
     async def get_all_disease_types(self) -> list[dict] | None:
-        """Fetches all available disease types from the API."""
-        try:
-            token = await self.login_check()
-            headers = {"Authorization": f"Bearer {token}"}
-            url = f"{self._base_url}/disease/"
+        """Returns all available disease types (cached, see CATALOG_CACHE_*)."""
+        return await self._catalog_cache.get_or_load("disease_types", self._fetch_all_disease_types)
 
-            logging.info("Fetching all disease types from API.")
-            response = await self._client.get(url, headers=headers)
-            response.raise_for_status()
+    async def get_drugs_by_disease_type(self, disease_type_id: int) -> list[dict] | None:
+        """Returns drugs for a specific disease type ID (cached, see CATALOG_CACHE_*)."""
+        return await self._catalog_cache.get_or_load(
+            ("drugs", disease_type_id),
+            lambda: self._fetch_drugs_by_disease_type(disease_type_id),
+        )
 
-            disease_types = response.json()
-            logging.info(f"Found {len(disease_types)} disease types.")
-            return disease_types
-        except Exception as e:
-            logging.error(f"Error fetching disease types: {e}")
-            return None
+    def invalidate_catalog_cache(self, disease_type_id: Optional[int] = None) -> None:
+        """
+        کش کاتالوگ را پاک می‌کند. بدون آرگومان کل کاتالوگ، با disease_type_id فقط داروهای همان دسته.
+        بعد از تغییر بیماری‌ها یا داروها در پنل ادمین فراخوانی شود.
+        """
+        if disease_type_id is None:
+            self._catalog_cache.invalidate()
+        else:
+            self._catalog_cache.invalidate(("drugs", disease_type_id))
+        logging.info(f"Catalog cache invalidated ({'all' if disease_type_id is None else disease_type_id}).")
 
-    async def get_drugs_by_disease_type(self, disease_type_id: int) -> list[dict] | None:
-        """Fetches drugs for a specific disease type ID."""
+    async def _fetch_all_disease_types(self) -> list[dict] | None:
+        logging.info("Fetching all disease types from API.")
         try:
-            token = await self.login_check()
-            headers = {"Authorization": f"Bearer {token}"}
-            url = f"{self._base_url}/drug/read-drug-by-type/{disease_type_id}"
+            disease_types = await self._request("GET", "/disease/", endpoint="get_all_disease_types")
+        except APIError as e:
+            logging.error(f"Error fetching disease types: {e}")
+            return None
 
-            logging.info(f"Fetching drugs for disease_type_id: {disease_type_id}")
-            response = await self._client.get(url, headers=headers)
-            response.raise_for_status()
+        logging.info(f"Found {len(disease_types or [])} disease types.")
+        return disease_types
 
-            drugs = response.json()
-            logging.info(f"Found {len(drugs)} drugs for disease type {disease_type_id}.")
-            return drugs
-        except Exception as e:
+    async def _fetch_drugs_by_disease_type(self, disease_type_id: int) -> list[dict] | None:
+        logging.info(f"Fetching drugs for disease_type_id: {disease_type_id}")
+        try:
+            drugs = await self._request(
+                "GET", f"/drug/read-drug-by-type/{disease_type_id}", endpoint="get_drugs_by_disease_type"
+            )
+        except APIError as e:
             logging.error(f"Error fetching drugs for disease type {disease_type_id}: {e}")
             return None
+
+        logging.info(f"Found {len(drugs or [])} drugs for disease type {disease_type_id}.")
+        return drugs
+
     # ---------------- create message --------------------------------
     async def create_message(
             self,
@@ -347,7 +561,7 @@ class APIClient:
             message_content: Optional[str] = None,
             messages_sender: Optional[bool] = True,
             attachments: Optional[List[str]] = None
-    ) -> Optional[bytes] | None:
+    ) -> bool:
         """
         یک پیام/تیکت جدید در سیستم ایجاد می‌کند. (نسخه کامل و انعطاف‌پذیر)
 
@@ -364,171 +578,99 @@ class APIClient:
             attachments (Optional[List[str]]): لیستی از مسیرهای فایل‌های پیوست.
 
         Returns:
-            Optional[Dict]: دیکشنری حاوی اطلاعات پیام ایجاد شده در صورت موفقیت، در غیر این صورت None.
-        """
-        try:
-            token = await self.login_check()
-            if not token:
-                logging.error("Authentication failed. Cannot create message.")
-                return None
-
-            headers = {"Authorization": f"Bearer {token}"}
-            url = f"{self._base_url}/message/"
-
-            # ساختار payload دقیقاً مطابق با اسکیمای FastAPI/Swagger
-            payload = {
-                "patient_id": patient_id,
-                "user_id": user_id,  # می‌تواند None باشد
-                "messages": message_content ,  # می‌تواند None باشد
-                "messages_sender": messages_sender,
-                "messages_seen": False,  # پیام جدید همیشه خوانده نشده است
-                "attachment_path": attachments if attachments else None  # اگر None بود، لیست خالی ارسال شود
-            }
-
-            logging.info(f"Sending request to create message with payload: {payload}")
-
-            response = await self._client.post(url, headers=headers, json=payload)
-
-            if response.status_code == 201:  # 201 Created
-                created_message = response.json()
-                logging.info(f"Successfully created message with ID: {created_message.get('messages_id')}")
-                return True
-            else:
-                # اگر کد وضعیت خطا بود، آن را لاگ و مدیریت کن
-                logging.error(f"Failed to create message. Status: {response.status_code}, Response: {response.text}")
-                response.raise_for_status()  # این خط جزئیات بیشتری از خطا را نمایش می‌دهد
-                return False
+            bool: True در صورت موفقیت، در غیر این صورت False.
+        """
+        # ساختار payload دقیقاً مطابق با اسکیمای FastAPI/Swagger
+        payload = {
+            "patient_id": patient_id,
+            "user_id": user_id,  # می‌تواند None باشد
+            "messages": message_content,  # می‌تواند None باشد
+            "messages_sender": messages_sender,
+            "messages_seen": False,  # پیام جدید همیشه خوانده نشده است
+            "attachment_path": attachments if attachments else None
+        }
+        logging.info(f"Sending request to create message with payload: {payload}")
 
-        except httpx.HTTPStatusError as e:
-            logging.error(f"HTTP status error while creating message for patient {patient_id}: {e}")
-            return False
-        except Exception as e:
-            logging.error(f"An unexpected error occurred while creating message for patient {patient_id}: {e}",
-                          exc_info=True)
+        try:
+            created_message = await self._request("POST", "/message/", endpoint="create_message", json=payload)
+        except APIError as e:
+            logging.error(f"Failed to create message for patient {patient_id}: {e}")
             return False
 
+        logging.info(f"Successfully created message with ID: {(created_message or {}).get('messages_id')}")
+        return True
+
     # ---------------------------------------------------------------------------------------------------------
-    async def create_order(self, patient_id: int, user_id: int, drug_items: list[dict]) -> dict:
+    async def create_order(self, patient_id: int, user_id: int, drug_items: list[dict]) -> dict | None:
         """
         Calls the backend API to create a new order with its items.
         """
+        # Payload بر اساس اسکیمای OrderCreate در بک‌اند
+        # همانطور که بحث شد، order_status را اینجا ارسال نمی‌کنیم.
+        payload = {
+            "patient_id": patient_id,
+            "user_id": user_id,
+            "items": drug_items  # نام فیلد در بک‌اند items شد (قبلاً drug_ids بود)
+        }
+        logging.info(f"Sending request to create order with payload: {payload}")
+
         try:
-            token = await self.login_check()
-            if not token:
-                logging.error("Authentication failed. Cannot create order.")
-                return None
+            created_order = await self._request("POST", "/order/", endpoint="create_order", json=payload)
+        except APIError as e:
+            logging.error(f"Failed to create order: {e}")
+            return None
 
-            headers = {"Authorization": f"Bearer {token}"}
-            # این آدرس باید با آدرسی که در api.py بک‌اند ثبت کرده‌اید مطابقت داشته باشد
-            # معمولاً /api/v1/orders/ است.
-            url = f"{self._base_url}/order/"
-
-            # Payload بر اساس اسکیمای OrderCreate در بک‌اند
-            # همانطور که بحث شد، order_status را اینجا ارسال نمی‌کنیم.
-            payload = {
-                "patient_id": patient_id,
-                "user_id": user_id,
-                "items": drug_items  # نام فیلد در بک‌اند items شد (قبلاً drug_ids بود)
-            }
-
-            logging.info(f"Sending request to create order with payload: {payload}")
-            response = await self._client.post(url, headers=headers, json=payload)
-
-            # FastAPI در صورت موفقیت کد 200 یا 201 را برمی‌گرداند.
-            if response.status_code in [200, 201]:
-                created_order = response.json()
-                logging.info(f"Successfully created order with ID: {created_order.get('order_id')}")
-                return created_order
-            else:
-                logging.error(f"Failed to create order. Status: {response.status_code}, Response: {response.text}")
-                response.raise_for_status()  # برای نمایش خطای دقیق‌تر در لاگ‌ها
-                return None
+        logging.info(f"Successfully created order with ID: {(created_order or {}).get('order_id')}")
+        return created_order
 
-        except httpx.HTTPStatusError as e:
-            logging.error(f"HTTP status error while creating order: {e}")
-            return None
-        except Exception as e:
-            logging.error(f"An unexpected error occurred while creating order: {e}", exc_info=True)
-            return None
     # --------------------------------------------------------------------------------------
 
     async def update_patient_status(self, patient_id: str, new_status: str) -> bool:
         """
         Updates only the status of a specific patient.
         """
-        payload = {"patient_status": new_status}
-        try:
-            # از متد update_patient موجود استفاده می‌کنیم
-            return await self.update_patient(patient_id, payload)
-        except Exception as e:
-            logging.error(f"Failed to update patient {patient_id} status to {new_status}: {e}")
-            return False
+        # از متد update_patient موجود استفاده می‌کنیم
+        return await self.update_patient(patient_id, {"patient_status": new_status})
 
     async def update_patient(self, patient_telegram_id: str, patient_data: Dict[str, Any]) -> bool:
         """
         Updates a patient's data. Can be used for full updates or partial ones (like status).
         """
         try:
-            token = await self.login_check()
-            if not token:
-                logging.error("Authentication failed. Cannot update patient.")
-
-                return False
-
-            headers = {"Authorization": f"Bearer {token}"}
-            url = f"{self._base_url}/patient/{patient_telegram_id}"  # مطمئن شوید پیشوند /api/v1 یا معادل آن در base_url هست
-
-            response = await  self._client.patch(url, headers=headers, json=patient_data)
-            response.raise_for_status()
-            logging.info(f"Successfully updated patient {patient_telegram_id} with data: {patient_data}")
-            return True
-        except Exception as e:
+            await self._request("PATCH", f"/patient/{patient_telegram_id}", endpoint="update_patient", json=patient_data)
+        except APIError as e:
             logging.error(f"Error updating patient {patient_telegram_id}: {e}")
             return False
 
-    # ------------------------------------------------------------------
+        logging.info(f"Successfully updated patient {patient_telegram_id} with data: {patient_data}")
+        return True
 
+    # ------------------------------------------------------------------
 
-    # ***********
     async def get_orders_by_status(self, patient_id: int, status: str) -> List[dict] | None:
         """
         سفارشات یک بیمار را بر اساس وضعیت آنها از API دریافت می‌کند.
-        e.g., GET /api/v1/orders/?patient_id=123&status=created
+        e.g., GET /order/get-order-by-status-by-patient-id/?patient_id=123&order_status=created
         """
-        try:
-            token = await self.login_check()
-            headers = {"Authorization": f"Bearer {token}"}
-
-            query_params = {
-                "patient_id": patient_id,
-                "order_status": status
-            }
-
-            url = f"{self._base_url}/order/get-order-by-status-by-patient-id/"  # مسیر اصلی endpoint
-            logging.info(f"Fetching orders for patient {patient_id} with status '{status}'")
-
-            response = await self._client.get(url, headers=headers, params=query_params)
-
-            if response.status_code == 404:  # اگر endpoint پیدا نشد (بعید است)
-                logging.warning(f"Orders endpoint not found.")
-                return None
-
-            response.raise_for_status()
-
-            orders = response.json()
-            if not orders:
-                logging.info(f"No orders with status '{status}' found for patient {patient_id}.")
-                return []  # بازگرداندن لیست خالی اگر سفارشی یافت نشد
-
-            return orders
+        query_params = {
+            "patient_id": patient_id,
+            "order_status": status
+        }
+        logging.info(f"Fetching orders for patient {patient_id} with status '{status}'")
 
-        except httpx.HTTPStatusError as e:
-            logging.error(f"HTTP error fetching orders for patient {patient_id}: {e.response.status_code}")
-            return None
-        except Exception as e:
-            logging.error(f"Unexpected error fetching orders for patient {patient_id}: {e}")
+        try:
+            orders = await self._request(
+                "GET", "/order/get-order-by-status-by-patient-id/", endpoint="get_orders_by_status", params=query_params
+            )
+        except APIError as e:
+            logging.error(f"Error fetching orders for patient {patient_id}: {e}")
             return None
 
+        if not orders:
+            logging.info(f"No orders with status '{status}' found for patient {patient_id}.")
+            return []  # بازگرداندن لیست خالی اگر سفارشی یافت نشد
+        return orders
+
     async def update_order(
             self,
             order_id: int,
@@ -550,18 +692,11 @@ class APIClient:
             Optional[Dict[str, Any]]: دیکشنری حاوی اطلاعات سفارش آپدیت شده در صورت موفقیت،
                                      در غیر این صورت None.
         """
-        url = f"{self._base_url}/order/{order_id}"  # توجه: مسیر را به /order/{order_id} تغییر دادم
-        token = await self.login_check()
-        headers = {"Authorization": f"Bearer {token}"}
-        # 1. ساخت Payload به صورت دینامیک
         # فقط فیلدهایی که مقدار دارند (None نیستند) به payload اضافه می‌شوند.
         payload = {}
         if order_status is not None:
             payload["order_status"] = order_status
-
         if order_items is not None:
-            # این بخش اطمینان حاصل می‌کند که ساختار لیست درست است.
-            # نیازی به استفاده از OrderItemUpdate در اینجا نیست، چون aiohttp دیکشنری را به JSON تبدیل می‌کند.
             payload["order_items"] = order_items
 
         # اگر هیچ داده‌ای برای آپدیت وجود نداشت، درخواست را ارسال نکن.
@@ -569,79 +704,50 @@ class APIClient:
             logging.warning(f"update_order called for order {order_id} with no data to update.")
             return None
 
-        logging.info(f"Sending PATCH request to {url} with payload: {payload}")
-
-        # 2. ارسال درخواست PATCH
+        logging.info(f"Sending PATCH request for order {order_id} with payload: {payload}")
         try:
-            response = await self._client.patch(url,json=payload, headers=headers)
-            response_data = response.json()
-            if response.status_code == 200:
-                logging.info(f"Order {order_id} updated successfully. Response: {response_data}")
-                return response_data
-            else:
-                logging.error(
-                    f"Failed to update order {order_id}. "
-                    f"Status: {response.status_code}, Response: {response_data}"
-                )
-                return None
-        except Exception as e:
-            logging.exception(f"An exception occurred while trying to update order {order_id}: {e}")
+            response_data = await self._request("PATCH", f"/order/{order_id}", endpoint="update_order", json=payload)
+        except APIError as e:
+            logging.error(f"Failed to update order {order_id}: {e}")
             return None
-    # ----------------------------------------------------------
 
+        logging.info(f"Order {order_id} updated successfully. Response: {response_data}")
+        return response_data
 
+    # ----------------------------------------------------------
 
     async def create_payment(self, payment_data: dict) -> Optional[dict]:
         """
         یک رکورد پرداخت جدید برای یک سفارش ایجاد می‌کند.
         """
-        url = f"{self._base_url}/payment/"  # فرض می‌کنیم چنین اندپوینتی دارید
-        token = await self.login_check()
-        headers = {"Authorization": f"Bearer {token}"}
         logging.info(f"Sending POST request to create a new payment with data: {payment_data}")
         try:
-
-            response = await self._client.post(url, json=payment_data, headers=headers)
-            if response.status_code == 201:  # معمولا برای ساخت 201 برمی‌گردد
-                response_data = response.json()
-                logging.info(f"Payment created successfully: {response_data}")
-                return response_data
-            else:
-                logging.error(
-                    f"Failed to create payment. Status: {response.status_code}, Response: {response.json()}")
-                return None
-        except Exception as e:
-            logging.exception(f"An exception occurred while creating payment: {e}")
+            response_data = await self._request("POST", "/payment/", endpoint="create_payment", json=payment_data)
+        except APIError as e:
+            logging.error(f"Failed to create payment: {e}")
             return None
 
-
+        logging.info(f"Payment created successfully: {response_data}")
+        return response_data
 
     # -----------------------------------------------------------------------------
 
     async def get_pending_payment_dates(self) -> Optional[list[str]]:
         """Fetches dates with 'NOT_SEEN' payments."""
-        # فرض می‌کنیم پاسخ API به شکل {"dates": [...]} است
         try:
-            token = await self.login_check()
-            headers = {"Authorization": f"Bearer {token}"}
-            url = f"{self._base_url}/payment/not-seen/"
-            # مسیر اندپوینت خود را جایگزین کنید
-            response = await self._client.get(url, headers=headers)
-            return response.json()
-        except Exception as e:
+            return await self._request("GET", "/payment/not-seen/", endpoint="get_pending_payment_dates")
+        except APIError as e:
             logging.error(f"Error fetching pending payment dates: {e}")
             return None
 
     async def get_pending_payments_by_date(self, date_str: str) -> Optional[list[dict]]:
         """Fetches pending payments for a date using the DatePaymentListRead schema."""
         try:
-            token = await self.login_check()
-            headers = {"Authorization": f"Bearer {token}"}
-            url = f"{self._base_url}/payment/not-seen/by-date/{date_str}"
-            # مسیر اندپوینت خود را جایگزین کنید
-            response = await self._client.get(url, headers=headers)
-            return response.json()  # API باید مستقیما لیست را برگرداند
-        except Exception as e:
+            # API باید مستقیما لیست را برگرداند
+            return await self._request(
+                "GET", f"/payment/not-seen/by-date/{date_str}", endpoint="get_pending_payments_by_date"
+            )
+        except APIError as e:
             logging.error(f"Error fetching pending payments for date {date_str}: {e}")
             return None
 
@@ -650,71 +756,115 @@ class APIClient:
         Updates a payment record using PATCH.
         Used for approving or rejecting a payment.
         """
+        logging.info(f"Sending PATCH for payment {payment_id} with payload: {payload}")
         try:
-            token = await self.login_check()
-            headers = {"Authorization": f"Bearer {token}"}
-            url = f"{self._base_url}/payment/{payment_id}"
-
-            logging.info(f"Sending PATCH to {url} with payload: {payload}")  # لاگ کردن دیتای ارسالی
-
-            response = await self._client.patch(url, headers=headers, json=payload)
-
-            # اگر کد وضعیت 400 تا 500 باشد، اینجا خطا پرتاب می‌شود و متن آن را می‌خوانیم
-            response.raise_for_status()
-
-            return response.json()
-
-        except httpx.HTTPStatusError as e:
-            # === این بخش دلیل دقیق ارور 422 را چاپ می‌کند ===
-            logging.error(f"HTTP Error {e.response.status_code} for payment {payment_id}.")
-            logging.error(f"Server Response: {e.response.text}")
-            return None
-
-        except Exception as e:
-            logging.error(f"Unexpected error updating payment {payment_id}: {e}", exc_info=True)
+            return await self._request("PATCH", f"/payment/{payment_id}", endpoint="update_payment", json=payload)
+        except APIError as e:
+            # detail خطا (مثلاً دلیل دقیق 422) در پیام APIError هست
+            logging.error(f"Error updating payment {payment_id}: {e}")
             return None
 
-    # در فایل API_Client.py اضافه کنید
-
     async def get_payment_by_id(self, payment_id: int) -> dict | None:
         """
         دریافت جزئیات کامل یک پرداخت خاص با استفاده از شناسه آن.
         """
         try:
-            token = await self.login_check()
-            headers = {"Authorization": f"Bearer {token}"}
-            url = f"{self._base_url}/payment/{payment_id}"
+            return await self._request("GET", f"/payment/{payment_id}", endpoint="get_payment_by_id")
+        except APIError as e:
+            logging.warning(f"Failed to fetch payment {payment_id}: {e}")
+            return None
 
-            response = await self._client.get(url, headers=headers)
+    async def get_payment_review_bundle(self, payment_id: int, fallback_payment: Optional[dict] = None) -> dict | None:
+        """
+        همه داده‌های صفحه بررسی رسید صندوق‌دار را یک‌جا برمی‌گرداند:
+            {"payment": dict, "order": dict | None, "patient": dict | None, "payments": list[dict]}
 
-            if response.status_code == 200:
-                return response.json()
-            else:
-                logging.warning(f"Failed to fetch payment {payment_id}. Status: {response.status_code}")
-                return None
-        except Exception as e:
-            logging.error(f"Error fetching payment {payment_id}: {e}")
+        اگر بک‌اند اندپوینت GET /payment/review-bundle/{id} را داشته باشد، همه با یک درخواست گرفته می‌شوند.
+        در غیر این صورت درخواست‌های جداگانه همزمان ارسال می‌شوند و هر منبع فقط یک بار خوانده می‌شود
+        (سفارش برای اطلاعات بیمار و هم برای محاسبه مبلغ کل استفاده می‌شود).
+        fallback_payment (مثلاً نسخه موجود در state) وقتی استفاده می‌شود که خود پرداخت از API خوانده نشود؛
+        order_id و patient_id آن اجازه می‌دهند پرداخت، سفارش، بیمار و سابقه پرداخت‌ها همه همزمان خوانده شوند.
+        اگر پرداخت پیدا نشود None برگردانده می‌شود.
+        """
+        if time.monotonic() >= self._review_bundle_unsupported_until:
+            try:
+                bundle = await self._request(
+                    "GET", f"/payment/review-bundle/{payment_id}", endpoint="get_payment_review_bundle"
+                )
+                if bundle and bundle.get("payment"):
+                    bundle["payments"] = bundle.get("payments") or []
+                    return bundle
+            except APIError as e:
+                # 405 یا 404 عمومی FastAPI (بدون detail اختصاصی) یعنی این اندپوینت وجود ندارد
+                if e.status_code == 405 or (e.is_not_found and e.detail == {"detail": "Not Found"}):
+                    logging.info("Payment review bundle endpoint is not available; using concurrent calls.")
+                    self._review_bundle_unsupported_until = time.monotonic() + REVIEW_BUNDLE_RETRY_SECONDS
+                else:
+                    logging.warning(f"Payment review bundle failed, falling back to separate calls: {e}")
+
+        # با نسخه state شناسه‌های سفارش و بیمار از قبل معلوم‌اند، پس همه منابع در یک رفت‌وبرگشت خوانده می‌شوند
+        known_order_id = (fallback_payment or {}).get("order_id")
+        known_patient_id = (fallback_payment or {}).get("patient_id")
+        if known_order_id:
+            result = await fan_out({
+                "payment": self.get_payment_by_id(payment_id),
+                "order": self.get_order_by_id(known_order_id),
+                "patient": self.get_patient_by_id(known_patient_id) if known_patient_id else None,
+                "payments": self.get_all_payments_by_order_id(known_order_id),
+            })
+            payment = result.get("payment") or fallback_payment
+            if str(payment.get("order_id")) == str(known_order_id):
+                order = result.get("order")
+                patient = result.get("patient")
+                patient_id = (order or {}).get("patient_id")
+                if patient_id and patient_id != known_patient_id:
+                    # نسخه state شناسه بیمار نداشت (یا قدیمی بود)؛ فقط در این حالت یک درخواست دیگر لازم است
+                    patient = await self.get_patient_by_id(patient_id)
+                return {
+                    "payment": payment,
+                    "order": order,
+                    "patient": patient,
+                    "payments": result.get("payments") or [],
+                }
+            # سفارش پرداخت در API با نسخه state فرق دارد؛ داده‌ها از روی نسخه API دوباره خوانده می‌شوند
+        else:
+            payment = await self.get_payment_by_id(payment_id) or fallback_payment
+
+        if not payment:
             return None
+        order_id = payment.get("order_id")
+        if not order_id:
+            return {"payment": payment, "order": None, "patient": None, "payments": []}
+
+        async def order_with_patient():
+            order = await self.get_order_by_id(order_id)
+            patient_id = (order or {}).get("patient_id")
+            patient = await self.get_patient_by_id(patient_id) if patient_id else None
+            return order, patient
+
+        result = await fan_out({
+            "order": order_with_patient(),
+            "payments": self.get_all_payments_by_order_id(order_id),
+        })
+        order, patient = result.get("order", (None, None))
+        return {
+            "payment": payment,
+            "order": order,
+            "patient": patient,
+            "payments": result.get("payments") or [],
+        }
 
     async def get_all_payments_by_order_id(self, order_id: int) -> list[dict]:
         """
         تمام پرداختی‌های (رسیدهای) مرتبط با یک سفارش خاص را دریافت می‌کند.
         شامل: تایید شده، رد شده و در انتظار بررسی.
         """
+        logging.info(f"Fetching payment history for order {order_id}")
         try:
-            token = await self.login_check()
-            headers = {"Authorization": f"Bearer {token}"}
-            # فرض بر این است که چنین اندپوینتی در بک‌اند دارید یا می‌توانید بسازید
-            # اگر ندارید، باید از همان اندپوینتی که لیست کل پرداخت‌ها را فیلتر می‌کند استفاده کنید
-            url = f"{self._base_url}/payment/by-order/{order_id}"
-
-            logging.info(f"Fetching payment history for order {order_id}")
-            response = await self._client.get(url, headers=headers)
-
-            if response.status_code == 200:
-                return response.json()
-            return []
-        except Exception as e:
+            return await self._request(
+                "GET", f"/payment/by-order/{order_id}", endpoint="get_all_payments_by_order_id"
+            ) or []
+        except APIError as e:
             logging.error(f"Error fetching payments for order {order_id}: {e}")
             return []
 
@@ -723,77 +873,46 @@ class APIClient:
         تاریخچه چت بین مشاور و بیمار را از سرور دریافت می‌کند.
         پاسخ باید شامل لیست پیام‌ها باشد.
         """
-        token = await self.login_check()
-        headers = {"Authorization": f"Bearer {token}"}
-        url = f"{self._base_url}/message/history/{patient_id}"
-
         try:
-            response = await self._client.get(url, headers=headers)
-            if response.status_code == 200 or response.status_code == 200:
-                # ✅ await برای json ضروری است
-                data = response.json()
-                # بررسی نوع داده – بک‌اند گاهی ممکن است dict برگرداند
-                if isinstance(data, list):
-                    return data
-                elif isinstance(data, dict):
-                    return [data]
-                else:
-                    logging.error(f"Unexpected data type from /message/history/: {type(data)}")
-                    return []
-            else:
-                text = response.text
-                logging.error(
-                    f"Error response {response.status_code if hasattr(response, 'status_code') else response.status_code}: {text}")
-                return []
-        except Exception as e:
-            logging.error(f"Error fetching messages: {e}", exc_info=True)
+            data = await self._request(
+                "GET", f"/message/history/{patient_id}", endpoint="read_messages_history_by_patient_id"
+            )
+        except APIError as e:
+            logging.error(f"Error fetching messages: {e}")
             return []
 
-    # app/core/services/api_client.py
+        # بررسی نوع داده – بک‌اند گاهی ممکن است dict برگرداند
+        if isinstance(data, list):
+            return data
+        if isinstance(data, dict):
+            return [data]
+        logging.error(f"Unexpected data type from /message/history/: {type(data)}")
+        return []
 
     async def get_order_items(self, order_id: int) -> list[dict]:
         """
         دریافت لیست اقلام یک سفارش خاص.
         """
         try:
-            token = await self.login_check()
-            headers = {"Authorization": f"Bearer {token}"}
-            # فرض بر این است که اندپوینتی برای گرفتن جزئیات سفارش دارید
-            # اگر ندارید، باید بر اساس ساختار دیتابیس خودتان پیاده‌سازی کنید
-            url = f"{self._base_url}/order/{order_id}"
-
-            response = await self._client.get(url, headers=headers)
-            if response.status_code == 200:
-                data = response.json()
-                # فرض می‌کنیم خروجی شامل لیستی به نام items یا drugs است
-                return data.get("items", [])
-            return []
-        except Exception as e:
+            data = await self._request("GET", f"/order/{order_id}", endpoint="get_order_items")
+        except APIError as e:
             logging.error(f"Error fetching order items: {e}")
             return []
+        # فرض می‌کنیم خروجی شامل لیستی به نام items است
+        return (data or {}).get("items", [])
 
     async def get_order_by_id(self, order_id: int) -> dict | None:
         """
         دریافت جزئیات کامل یک سفارش با استفاده از ID
         """
+        logging.info(f"Fetching order details for ID: {order_id}")
         try:
-            token = await self.login_check()
-            headers = {"Authorization": f"Bearer {token}"}
-            # طبق روت‌های شما در full_project_code، روت سفارش /order است
-            url = f"{self._base_url}/order/{order_id}"
-
-            logging.info(f"Fetching order details for ID: {order_id}")
-            response = await self._client.get(url, headers=headers)
-
-            # اگر 404 بدهد یعنی پیدا نشده
-            if response.status_code == 404:
+            return await self._request("GET", f"/order/{order_id}", endpoint="get_order_by_id")
+        except APIError as e:
+            if e.is_not_found:
                 logging.warning(f"Order {order_id} not found.")
-                return None
-
-            response.raise_for_status()
-            return response.json()
-        except Exception as e:
-            logging.error(f"Error fetching order {order_id}: {e}")
+            else:
+                logging.error(f"Error fetching order {order_id}: {e}")
             return None
 
     async def get_drug_details_by_id(self, drug_id: int) -> dict | None:
@@ -801,39 +920,20 @@ class APIClient:
         دریافت مشخصات یک دارو (نام، قیمت و...) با استفاده از ID
         """
         try:
-            token = await self.login_check()
-            headers = {"Authorization": f"Bearer {token}"}
-            # طبق روت‌های شما، روت دارو /drug است
-            url = f"{self._base_url}/drug/{drug_id}"
-
-            # logging.info(f"Fetching drug details for ID: {drug_id}") # لاگ زیاد نشود کامنت کردم
-            response = await self._client.get(url, headers=headers)
-
-            if response.status_code == 404:
-                return None
-
-            response.raise_for_status()
-            return response.json()
-        except Exception as e:
-            logging.error(f"Error fetching drug {drug_id}: {e}")
+            return await self._request("GET", f"/drug/{drug_id}", endpoint="get_drug_details_by_id")
+        except APIError as e:
+            if not e.is_not_found:
+                logging.error(f"Error fetching drug {drug_id}: {e}")
             return None
 
     async def get_user_details_by_id(self, user_id: int) -> dict | None:
         """
         دریافت مشخصات کاربر (مشاور/پزشک) با استفاده از ID دیتابیس
-        (متد قبلی شما با telegram_id کار می‌کرد، این با id کار می‌کند)
+        (متد get_user_details_by_telegram_id با telegram_id کار می‌کند، این با id کار می‌کند)
         """
         try:
-            token = await self.login_check()
-            headers = {"Authorization": f"Bearer {token}"}
-            # فرض بر این است که روت user امکان خواندن با ID را دارد (مثلا /user/{id})
-            # اگر روت خاصی دارید مثل /user/read/{id} آدرس را تغییر دهید
-            url = f"{self._base_url}/user/{user_id}"
-
-            response = await self._client.get(url, headers=headers)
-            response.raise_for_status()
-            return response.json()
-        except Exception as e:
+            return await self._request("GET", f"/user/{user_id}", endpoint="get_user_details_by_id")
+        except APIError as e:
             logging.error(f"Error fetching user {user_id}: {e}")
             return None
 
@@ -844,53 +944,57 @@ class APIClient:
         متن پیام را بر اساس کلید (key) از سیستم دریافت می‌کند.
 
         الگوریتم:
-        1. ابتدا کش (حافظه رم) بررسی می‌شود.
-        2. اگر نبود، به API درخواست می‌زند.
-        3. پاسخ API را در کش ذخیره می‌کند تا دفعات بعد سریع‌تر باشد.
+        1. متن از کش حافظه (که در شروع ربات یک‌جا بارگذاری شده) برگردانده می‌شود.
+        2. اگر کلید در آن نبود (یا بارگذاری یک‌جا ممکن نبود)، همان کلید از API خوانده و کش می‌شود (404 هم برای مدت کوتاهی کش می‌شود).
+        3. در صورت نبود متن یا خطا، متن پیش‌فرض برگردانده می‌شود.
         """
-        # 1. بررسی کش
-        if key in self._content_cache:
-            return self._content_cache[key]
+        return await self._content_cache.get(key, default)
 
+    async def _fetch_all_bot_messages(self) -> Optional[Dict[str, str]]:
         try:
-            # اطمینان از وجود توکن (هرچند روت ممکن است پابلیک باشد، ارسال توکن استانداردتر است)
-            token = await self.login_check()
-            headers = {"Authorization": f"Bearer {token}"} if token else {}
-
-            # آدرس اندپوینت جدیدی که ساختیم
-            url = f"{self._base_url}/bot-message/key/{key}"
-
-            # 2. درخواست به سرور
-            response = await self._client.get(url, headers=headers)
+            items = await self._request("GET", "/bot-message/", endpoint="get_all_bot_messages")
+        except APIError as e:
+            if e.status_code in (404, 405):
+                logging.warning("CMS: Bulk endpoint /bot-message/ is not available; falling back to per-key lookups.")
+                return None
+            raise
 
-            if response.status_code == 200:
-                data = response.json()
-                # طبق اسکیمای BotMessageRead، فیلد متن پیام message_text است
-                text = data.get("message_text")
+        messages = {}
+        for item in items or []:
+            # طبق اسکیمای BotMessageRead، فیلد متن پیام message_text است
+            key = item.get("message_key") or item.get("key")
+            if key:
+                messages[key] = item.get("message_text")
+        return messages
 
-                if text:
-                    # 3. ذخیره در کش
-                    self._content_cache[key] = text
-                    return text
-                else:
-                    return default
+    async def _fetch_bot_message(self, key: str) -> Optional[str]:
+        try:
+            data = await self._request("GET", f"/bot-message/key/{key}", endpoint="get_bot_message")
+        except APIError as e:
+            if e.is_not_found:
+                return None
+            raise
+        return (data or {}).get("message_text") or None
 
-            elif response.status_code == 404:
-                logging.warning(f"CMS: Message key '{key}' not found in DB. Using default text.")
-                return default
-            else:
-                logging.error(f"CMS: Error fetching '{key}'. Status: {response.status_code}")
-                return default
+    async def start_content_cache(self) -> None:
+        """
+        همه متن‌های CMS را یک‌جا بارگذاری می‌کند و تازه‌سازی دوره‌ای (CMS_CACHE_TTL_SECONDS) را شروع می‌کند.
+        یک بار در شروع ربات فراخوانی می‌شود.
+        """
+        await self._content_cache.start()
 
-        except Exception as e:
-            logging.error(f"CMS: Unexpected error fetching '{key}': {e}")
-            return default
+    async def refresh_content_cache(self) -> bool:
+        """
+        متن‌ها را همین الان دوباره از سرور می‌خواند، بدون اینکه کش خالی شود.
+        وقتی ادمین متنی را تغییر داده و نمی‌خواهیم تا تازه‌سازی بعدی صبر کنیم.
+        """
+        return await self._content_cache.refresh()
 
     def clear_content_cache(self):
         """
         پاک کردن حافظه موقت پیام‌ها.
-        این متد زمانی کاربرد دارد که ادمین متنی را تغییر داده و می‌خواهد
-        ربات بدون ریستارت شدن، متن جدید را بگیرد.
+        بعد از آن هر کلید در اولین استفاده دوباره از API خوانده می‌شود
+        (یا در تازه‌سازی دوره‌ای بعدی همه یک‌جا بارگذاری می‌شوند).
         """
         self._content_cache.clear()
         logging.info("CMS: Bot content cache cleared successfully.")
@@ -899,4 +1003,15 @@ class APIClient:
         """
         کلاینت HTTP را به درستی می‌بندد.
         """
+        if self._renewal_task is not None:
+            self._renewal_task.cancel()
+            try:
+                await self._renewal_task
+            except asyncio.CancelledError:
+                pass
+            self._renewal_task = None
+        await self._catalog_cache.close()
+        await self._content_cache.close()
+        logging.info(f"API connection pool metrics: {self.get_pool_metrics()}")
+        logging.info(f"API request coalescing: {self.get_coalescing_stats()}")
         await self._client.aclose()
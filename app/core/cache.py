@@ -0,0 +1,106 @@
+# app/core/cache.py
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Set, Tuple
+
+Loader = Callable[[], Awaitable[Any]]
+
+
+class AsyncTTLCache:
+    """
+    کش read-through برای داده‌هایی که کم تغییر می‌کنند (مثل کاتالوگ بیماری‌ها و داروها).
+
+    - fresh  (سن < ttl): مقدار از حافظه برگردانده می‌شود.
+    - stale  (ttl <= سن < ttl + stale_ttl): مقدار قدیمی فوراً برگردانده می‌شود و همزمان در پس‌زمینه
+      تازه می‌شود (stale-while-revalidate)؛ کاربر منتظر بک‌اند نمی‌ماند.
+    - expired یا نبود: مقدار از loader خوانده می‌شود. درخواست‌های همزمان برای یک کلید فقط یک بار loader را اجرا می‌کنند.
+
+    اندازه کش محدود است و قدیمی‌ترین کلید استفاده‌نشده (LRU) حذف می‌شود.
+    اگر loader مقدار None برگرداند (خطای API) چیزی کش نمی‌شود و مقدار stale قبلی (در صورت وجود) حفظ می‌شود.
+    مقادیر برگشتی بین همه فراخوانی‌ها مشترک‌اند و نباید تغییر داده شوند.
+    """
+
+    def __init__(self, ttl: float, stale_ttl: float = 0.0, maxsize: int = 256, name: str = "cache"):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.maxsize = max(1, maxsize)
+        self.name = name
+        self._entries: "OrderedDict[Hashable, Tuple[Any, float]]" = OrderedDict()
+        self._pending: Dict[Hashable, asyncio.Task] = {}
+        self._background: Set[asyncio.Task] = set()
+        # با هر invalidate زیاد می‌شود تا نتیجه loaderهای در جریان، داده حذف‌شده را برنگرداند
+        self._generation = 0
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+
+    async def get_or_load(self, key: Hashable, loader: Loader) -> Any:
+        entry = self._entries.get(key)
+        if entry is not None:
+            value, fetched_at = entry
+            age = time.monotonic() - fetched_at
+            if age < self.ttl:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return value
+            if age < self.ttl + self.stale_ttl:
+                self.stale_hits += 1
+                self._entries.move_to_end(key)
+                self._refresh_in_background(key, loader)
+                return value
+
+        self.misses += 1
+        return await asyncio.shield(self._load(key, loader))
+
+    def _load(self, key: Hashable, loader: Loader) -> asyncio.Task:
+        task = self._pending.get(key)
+        if task is None:
+            task = asyncio.create_task(self._run_loader(key, loader, self._generation))
+            self._pending[key] = task
+            task.add_done_callback(lambda _: self._pending.pop(key, None))
+        return task
+
+    async def _run_loader(self, key: Hashable, loader: Loader, generation: int) -> Any:
+        value = await loader()
+        if value is not None and generation == self._generation:
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return value
+
+    def _refresh_in_background(self, key: Hashable, loader: Loader) -> None:
+        if key in self._pending:
+            return
+        task = self._load(key, loader)
+        self._background.add(task)
+        task.add_done_callback(self._background_done)
+
+    def _background_done(self, task: asyncio.Task) -> None:
+        self._background.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logging.warning(f"{self.name}: background refresh failed: {task.exception()}")
+
+    def invalidate(self, key: Optional[Hashable] = None) -> None:
+        """یک کلید یا (بدون آرگومان) کل کش را حذف می‌کند."""
+        self._generation += 1
+        if key is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+        }
+
+    async def close(self) -> None:
+        for task in list(self._background):
+            task.cancel()
+        await asyncio.gather(*self._background, return_exceptions=True)
@@ -0,0 +1,128 @@
+# app/core/cms_cache.py
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional
+
+# بارگذاری همه پیام‌ها: {key: text} یا None اگر اندپوینت در دسترس نبود
+BulkLoader = Callable[[], Awaitable[Optional[Dict[str, str]]]]
+# بارگذاری یک پیام: متن، یا None اگر کلید وجود ندارد (404)؛ سایر خطاها exception هستند
+KeyLoader = Callable[[str], Awaitable[Optional[str]]]
+
+
+class BotMessageCache:
+    """
+    کش متن‌های CMS ربات (bot-message).
+
+    - در شروع، همه پیام‌ها با یک درخواست (bulk) بارگذاری می‌شوند و هر ttl ثانیه در پس‌زمینه دوباره خوانده می‌شوند.
+      پس در مسیر هندلرها هیچ درخواست HTTP ارسال نمی‌شود.
+    - کلیدی که در snapshot نیست (بعد از آخرین بارگذاری اضافه شده، پاسخ bulk ناقص بوده یا bulk در دسترس نیست)
+      جداگانه خوانده می‌شود. 404 برای negative_ttl ثانیه به خاطر سپرده می‌شود تا برای یک کلید ناموجود
+      پشت سر هم درخواست نزنیم.
+    - تعداد کلیدها محدود به maxsize است (LRU).
+    """
+
+    def __init__(
+            self,
+            bulk_loader: BulkLoader,
+            key_loader: KeyLoader,
+            ttl: float = 300.0,
+            negative_ttl: float = 60.0,
+            maxsize: int = 1000,
+    ):
+        self._bulk_loader = bulk_loader
+        self._key_loader = key_loader
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.maxsize = max(1, maxsize)
+        self._texts: "OrderedDict[str, str]" = OrderedDict()
+        self._missing: Dict[str, float] = {}
+        self._pending: Dict[str, asyncio.Task] = {}
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    async def get(self, key: str, default: str = "") -> str:
+        text = self._texts.get(key)
+        if text is not None:
+            self._texts.move_to_end(key)
+            return text
+
+        missing_until = self._missing.get(key)
+        if missing_until is not None:
+            if time.monotonic() < missing_until:
+                return default
+            del self._missing[key]
+
+        task = self._pending.get(key)
+        if task is None:
+            task = asyncio.create_task(self._load_key(key))
+            self._pending[key] = task
+            task.add_done_callback(lambda _: self._pending.pop(key, None))
+        try:
+            text = await asyncio.shield(task)
+        except Exception as e:
+            logging.error(f"CMS: Error fetching '{key}': {e}")
+            return default
+        return text if text else default
+
+    async def _load_key(self, key: str) -> Optional[str]:
+        text = await self._key_loader(key)
+        if text is None:
+            logging.warning(f"CMS: Message key '{key}' not found in DB. Using default text.")
+            self._missing[key] = time.monotonic() + self.negative_ttl
+            return None
+        self._store(key, text)
+        return text
+
+    def _store(self, key: str, text: str) -> None:
+        self._texts[key] = text
+        self._texts.move_to_end(key)
+        while len(self._texts) > self.maxsize:
+            self._texts.popitem(last=False)
+
+    async def refresh(self) -> bool:
+        """همه پیام‌ها را یک‌جا دوباره بارگذاری می‌کند. در صورت شکست، داده‌های فعلی حفظ می‌شوند."""
+        try:
+            messages = await self._bulk_loader()
+        except Exception as e:
+            logging.error(f"CMS: Bulk refresh failed: {e}")
+            return False
+        if messages is None:
+            # بدون اندپوینت bulk: متن‌های تکی را رها می‌کنیم تا بعد از هر ttl دوباره از API خوانده شوند
+            self._texts.clear()
+            return False
+
+        texts: "OrderedDict[str, str]" = OrderedDict()
+        for key, text in list(messages.items())[: self.maxsize]:
+            if text:
+                texts[key] = text
+        self._texts = texts
+        # کلیدهای ناموجود دوباره امتحان می‌شوند؛ ممکن است در همین فاصله در CMS اضافه شده باشند
+        self._missing.clear()
+        logging.info(f"CMS: Loaded {len(texts)} bot messages.")
+        return True
+
+    async def _refresh_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.ttl)
+            await self.refresh()
+
+    async def start(self) -> None:
+        """بارگذاری اولیه و شروع تازه‌سازی دوره‌ای در پس‌زمینه."""
+        await self.refresh()
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._refresh_loop(), name="cms-cache-refresh")
+
+    def clear(self) -> None:
+        self._texts.clear()
+        self._missing.clear()
+
+    async def close(self) -> None:
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            try:
+                await self._refresh_task
+            except asyncio.CancelledError:
+                pass
+            self._refresh_task = None
@@ -0,0 +1,381 @@
+# app/core/fsm_storage.py
+
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from typing import Any, Dict, Mapping, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from app.core.setting import settings
+
+
+# =============================================================================
+# 1. سریال‌سازی فشرده داده‌های FSM
+# =============================================================================
+# JSON معمولی کلیدهای عددی دیکشنری را به رشته تبدیل می‌کند؛ در حالی که مثلاً prescription_cart مشاور
+# به شکل {drug_id(int): qty} است و هندلرها با کلید int به آن دسترسی دارند.
+# به همین دلیل انواعی که JSON حفظ نمی‌کند با یک تگ کوچک ذخیره می‌شوند.
+
+_TAG = "__t"
+_PLAIN_PREFIX = b"j"
+_ZLIB_PREFIX = b"z"
+# داده‌های کوچک‌تر از این اندازه فشرده نمی‌شوند (هزینه zlib بیشتر از سودش است)
+COMPRESS_THRESHOLD = 512
+
+
+def _pack(obj: Any) -> Any:
+    if isinstance(obj, dict):
+        if all(isinstance(k, str) for k in obj) and _TAG not in obj:
+            return {k: _pack(v) for k, v in obj.items()}
+        return {_TAG: "d", "i": [[_pack(k), _pack(v)] for k, v in obj.items()]}
+    if isinstance(obj, list):
+        return [_pack(v) for v in obj]
+    if isinstance(obj, tuple):
+        return {_TAG: "t", "i": [_pack(v) for v in obj]}
+    if isinstance(obj, (set, frozenset)):
+        return {_TAG: "s", "i": [_pack(v) for v in obj]}
+    if isinstance(obj, Decimal):
+        return {_TAG: "m", "v": str(obj)}
+    return obj
+
+
+def _unpack(obj: Any) -> Any:
+    if isinstance(obj, list):
+        return [_unpack(v) for v in obj]
+    if isinstance(obj, dict):
+        tag = obj.get(_TAG)
+        if tag == "d":
+            return {_unpack(k): _unpack(v) for k, v in obj["i"]}
+        if tag == "t":
+            return tuple(_unpack(v) for v in obj["i"])
+        if tag == "s":
+            return {_unpack(v) for v in obj["i"]}
+        if tag == "m":
+            return Decimal(obj["v"])
+        return {k: _unpack(v) for k, v in obj.items()}
+    return obj
+
+
+def encode_state_data(data: Mapping[str, Any]) -> bytes:
+    """داده FSM را به بایت‌های فشرده تبدیل می‌کند (JSON بدون فاصله و در صورت نیاز zlib)."""
+    raw = json.dumps(_pack(dict(data)), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    if len(raw) >= COMPRESS_THRESHOLD:
+        return _ZLIB_PREFIX + zlib.compress(raw, 6)
+    return _PLAIN_PREFIX + raw
+
+
+def decode_state_data(blob: Optional[bytes]) -> Dict[str, Any]:
+    """عکس encode_state_data."""
+    if not blob:
+        return {}
+    prefix, payload = blob[:1], blob[1:]
+    if prefix == _ZLIB_PREFIX:
+        payload = zlib.decompress(payload)
+    return _unpack(json.loads(payload.decode("utf-8")))
+
+
+# =============================================================================
+# 2. پایه مشترک: نوشتن دسته‌ای (write-behind)
+# =============================================================================
+
+# فاصله تلاش دوباره بعد از خطای نوشتن دسته (ثانیه)
+FLUSH_RETRY_SECONDS = 1.0
+
+
+class BatchedStorage(BaseStorage):
+    """
+    پایه استوریج‌های پایدار با نوشتن دسته‌ای.
+
+    تغییرات state و data ابتدا در حافظه جمع می‌شوند و هر `flush_interval` ثانیه (یا وقتی تعداد
+    کلیدهای تغییرکرده به `batch_size` رسید) در یک تراکنش/پایپ‌لاین به بک‌اند نوشته می‌شوند.
+    خواندن‌ها همیشه ابتدا از همین صف انجام می‌شوند، پس هندلرهای همین پروسه هیچ‌وقت داده کهنه نمی‌بینند.
+    اگر flush_interval صفر باشد، هر تغییر بلافاصله نوشته می‌شود.
+    اگر نوشتن یک دسته خطا بدهد، دسته (بدون بازنویسی تغییرات جدیدتر) به صف برمی‌گردد و بعد از
+    FLUSH_RETRY_SECONDS دوباره نوشته می‌شود.
+
+    صف فقط در حافظه همین پروسه است: پروسه دیگری که از همان فایل/Redis می‌خواند تا flush بعدی state قدیمی را
+    می‌بیند. پس نوشتن دسته‌ای فقط برای اجرای تک‌پروسه امن است؛ با چند پروسه FSM_SHARED_BACKEND را روشن کنید
+    تا flush_interval صفر شود.
+    """
+
+    def __init__(
+            self,
+            key_builder: Optional[KeyBuilder] = None,
+            flush_interval: float = 0.05,
+            batch_size: int = 100,
+    ):
+        self._key_builder = key_builder or DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        self._flush_interval = flush_interval
+        self._batch_size = batch_size
+
+        # {storage_key: {"state": str | None, "data": bytes | None}}
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        # دسته‌ای که در حال نوشتن است؛ تا پایان نوشتن هنوز منبع معتبر خواندن است
+        self._flushing: Dict[str, Dict[str, Any]] = {}
+        self._flush_lock = asyncio.Lock()
+        self._flush_task: Optional[asyncio.Task] = None
+        self._closing = False
+
+    # --- متدهایی که هر بک‌اند باید پیاده‌سازی کند ---
+    async def _read_field(self, key: str, field: str) -> Any:
+        raise NotImplementedError
+
+    async def _write_batch(self, batch: Dict[str, Dict[str, Any]]) -> None:
+        raise NotImplementedError
+
+    async def _close_backend(self) -> None:
+        pass
+
+    # --- BaseStorage ---
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        value = state.state if isinstance(state, State) else state
+        await self._enqueue(self._key_builder.build(key), "state", value)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return await self._get_field(self._key_builder.build(key), "state")
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        if not isinstance(data, dict):
+            msg = f"Data must be a dict or dict-like object, got {type(data).__name__}"
+            raise TypeError(msg)
+        blob = encode_state_data(data) if data else None
+        await self._enqueue(self._key_builder.build(key), "data", blob)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        blob = await self._get_field(self._key_builder.build(key), "data")
+        return decode_state_data(blob)
+
+    async def close(self) -> None:
+        self._closing = True
+        if self._flush_task and not self._flush_task.done():
+            self._flush_task.cancel()
+        await self.flush()
+        if self._pending:
+            logging.error(f"FSM storage: {len(self._pending)} keys could not be written before shutdown.")
+        await self._close_backend()
+
+    # --- صف نوشتن ---
+    async def _get_field(self, key: str, field: str) -> Any:
+        for layer in (self._pending, self._flushing):
+            record = layer.get(key)
+            if record is not None and field in record:
+                return record[field]
+        return await self._read_field(key, field)
+
+    async def _enqueue(self, key: str, field: str, value: Any) -> None:
+        self._pending.setdefault(key, {})[field] = value
+
+        if self._flush_interval <= 0 or len(self._pending) >= self._batch_size:
+            await self.flush()
+        else:
+            self._schedule_flush(self._flush_interval)
+
+    def _schedule_flush(self, delay: float) -> None:
+        # خود task زمان‌بندی‌شده هم می‌تواند (بعد از خطا) flush بعدی را زمان‌بندی کند
+        task = self._flush_task
+        if task is None or task.done() or task is asyncio.current_task():
+            self._flush_task = asyncio.create_task(self._flush_later(delay))
+
+    async def _flush_later(self, delay: float) -> None:
+        await asyncio.sleep(delay)
+        await self.flush()
+
+    async def flush(self) -> None:
+        """تمام تغییرات در صف را در یک دسته به بک‌اند می‌نویسد."""
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            batch, self._pending = self._pending, {}
+            self._flushing = batch
+            try:
+                await self._write_batch(batch)
+            except Exception as e:
+                logging.error(f"FSM storage: failed to write {len(batch)} keys, will retry: {e}")
+                # برگرداندن به صف بدون بازنویسی تغییرات جدیدتر
+                for key, record in batch.items():
+                    merged = dict(record)
+                    merged.update(self._pending.get(key, {}))
+                    self._pending[key] = merged
+                if not self._closing:
+                    self._schedule_flush(max(self._flush_interval, FLUSH_RETRY_SECONDS))
+            finally:
+                self._flushing = {}
+
+
+# =============================================================================
+# 3. بک‌اند SQLite (فایل محلی)
+# =============================================================================
+
+class SQLiteStorage(BatchedStorage):
+    """
+    استوریج FSM روی یک فایل SQLite.
+    برای اجرای یک (یا چند) پروسه روی یک سرور کافی است و با ری‌استارت ربات، جلسات از بین نمی‌روند.
+    تمام عملیات دیتابیس در یک ترد جداگانه اجرا می‌شوند تا event loop بلاک نشود.
+    """
+
+    def __init__(self, path: str, **kwargs: Any):
+        super().__init__(**kwargs)
+        self._path = path
+        # یک ترد اختصاصی؛ sqlite3 روی یک اتصال باید سریالی استفاده شود
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fsm-sqlite")
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self._path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS fsm ("
+                " key TEXT PRIMARY KEY,"
+                " state TEXT,"
+                " data BLOB,"
+                " updated_at REAL NOT NULL)"
+            )
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    def _read_sync(self, key: str, field: str) -> Any:
+        row = self._connect().execute(f"SELECT {field} FROM fsm WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    async def _read_field(self, key: str, field: str) -> Any:
+        return await self._run(self._read_sync, key, field)
+
+    def _write_sync(self, batch: Dict[str, Dict[str, Any]]) -> None:
+        conn = self._connect()
+        now = time.time()
+        state_rows = [(k, r["state"], now) for k, r in batch.items() if "state" in r]
+        data_rows = [(k, r["data"], now) for k, r in batch.items() if "data" in r]
+        with conn:
+            if state_rows:
+                conn.executemany(
+                    "INSERT INTO fsm (key, state, updated_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at",
+                    state_rows,
+                )
+            if data_rows:
+                conn.executemany(
+                    "INSERT INTO fsm (key, data, updated_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+                    data_rows,
+                )
+            # ردیف‌هایی که کاملاً خالی شده‌اند (state.clear()) نیازی به نگهداری ندارند
+            conn.executemany(
+                "DELETE FROM fsm WHERE key = ? AND state IS NULL AND data IS NULL",
+                [(k,) for k in batch],
+            )
+
+    async def _write_batch(self, batch: Dict[str, Dict[str, Any]]) -> None:
+        await self._run(self._write_sync, batch)
+
+    def _close_sync(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    async def _close_backend(self) -> None:
+        await self._run(self._close_sync)
+        self._executor.shutdown(wait=True)
+
+
+# =============================================================================
+# 4. بک‌اند سازگار با پروتکل Redis
+# =============================================================================
+
+class BatchedRedisStorage(BatchedStorage):
+    """
+    استوریج FSM روی Redis (یا هر سرور سازگار با پروتکل آن).
+    هر کلید FSM یک hash با فیلدهای state و data است و هر دسته با یک pipeline ارسال می‌شود.
+    با این بک‌اند می‌توان چند پروسه ربات را همزمان اجرا کرد (در آن صورت FSM_SHARED_BACKEND=True).
+
+    کلاینت می‌تواند هر شیء سازگار با `redis.asyncio.Redis` باشد؛ برای اجرای محلی بدون سرور
+    از `fakeredis` (با آدرس fakeredis://) استفاده می‌شود.
+    """
+
+    def __init__(self, redis: Any, state_ttl: Optional[int] = None, **kwargs: Any):
+        super().__init__(**kwargs)
+        self._redis = redis
+        self._state_ttl = state_ttl
+
+    @classmethod
+    def from_url(cls, url: str, **kwargs: Any) -> "BatchedRedisStorage":
+        if url.startswith("fakeredis://"):
+            try:
+                from fakeredis import FakeAsyncRedis
+            except ImportError as e:
+                raise RuntimeError("FSM_REDIS_URL=fakeredis:// requires the 'fakeredis' package.") from e
+            return cls(FakeAsyncRedis(), **kwargs)
+
+        try:
+            from redis.asyncio import Redis
+        except ImportError as e:
+            raise RuntimeError("FSM_STORAGE=redis requires the 'redis' package.") from e
+        return cls(Redis.from_url(url), **kwargs)
+
+    async def _read_field(self, key: str, field: str) -> Any:
+        value = await self._redis.hget(key, field)
+        if field == "state" and isinstance(value, bytes):
+            return value.decode("utf-8")
+        return value
+
+    async def _write_batch(self, batch: Dict[str, Dict[str, Any]]) -> None:
+        pipe = self._redis.pipeline(transaction=False)
+        for key, record in batch.items():
+            for field, value in record.items():
+                if value is None:
+                    pipe.hdel(key, field)
+                else:
+                    pipe.hset(key, field, value)
+            if self._state_ttl:
+                pipe.expire(key, self._state_ttl)
+        await pipe.execute()
+
+    async def _close_backend(self) -> None:
+        await self._redis.aclose()
+
+
+# =============================================================================
+# 5. انتخاب استوریج بر اساس تنظیمات
+# =============================================================================
+
+def build_fsm_storage() -> BaseStorage:
+    """استوریج FSM را بر اساس `settings.FSM_STORAGE` می‌سازد."""
+    backend = settings.FSM_STORAGE
+    batch_options = {
+        "flush_interval": settings.FSM_FLUSH_INTERVAL,
+        "batch_size": settings.FSM_FLUSH_BATCH_SIZE,
+    }
+
+    if settings.FSM_SHARED_BACKEND:
+        # چند پروسه از یک بک‌اند می‌خوانند؛ صف نوشتن محلی باعث دیدن state کهنه در پروسه‌های دیگر می‌شود
+        batch_options["flush_interval"] = 0
+
+    if backend == "memory":
+        storage = MemoryStorage()
+    elif backend == "sqlite":
+        storage = SQLiteStorage(settings.FSM_SQLITE_PATH, **batch_options)
+    elif backend == "redis":
+        storage = BatchedRedisStorage.from_url(
+            settings.FSM_REDIS_URL,
+            state_ttl=settings.FSM_STATE_TTL_SECONDS,
+            **batch_options,
+        )
+    else:
+        raise ValueError(f"Unknown FSM storage backend: {backend!r}")
+
+    logging.info(f"FSM storage backend: {backend}")
+    return storage
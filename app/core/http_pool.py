@@ -0,0 +1,97 @@
+# app/core/http_pool.py
+
+import importlib.util
+import logging
+from typing import Any, Dict, Optional
+
+import httpx
+
+from app.core.setting import settings
+
+
+class MeteredTransport(httpx.AsyncBaseTransport):
+    """
+    یک لایه نازک روی AsyncHTTPTransport که آمار استخر اتصال را جمع می‌کند.
+
+    تعداد کل درخواست‌ها و تعداد اتصال‌های TCP جدید (از طریق trace افزونه httpcore) شمرده می‌شود؛
+    نسبت استفاده مجدد از اتصال = 1 - (اتصال جدید / کل درخواست‌ها).
+    وضعیت لحظه‌ای (اتصال‌های در حال استفاده و درخواست‌های منتظر اتصال) مستقیماً از استخر httpcore خوانده می‌شود.
+    """
+
+    def __init__(self, **transport_kwargs: Any):
+        self._transport = httpx.AsyncHTTPTransport(**transport_kwargs)
+        self.requests_total = 0
+        self.connections_opened = 0
+        self.pool_timeouts = 0
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.requests_total += 1
+        parent_trace = request.extensions.get("trace")
+
+        async def trace(event_name: str, info: Dict[str, Any]) -> None:
+            if event_name == "connection.connect_tcp.complete":
+                self.connections_opened += 1
+            if parent_trace is not None:
+                await parent_trace(event_name, info)
+
+        request.extensions["trace"] = trace
+        try:
+            return await self._transport.handle_async_request(request)
+        except httpx.PoolTimeout:
+            self.pool_timeouts += 1
+            raise
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+    def metrics(self) -> Dict[str, Any]:
+        pool = getattr(self._transport, "_pool", None)
+        connections = list(getattr(pool, "connections", []) or [])
+        pool_requests = list(getattr(pool, "_requests", []) or [])
+
+        idle = sum(1 for c in connections if c.is_idle())
+        waiting = sum(1 for r in pool_requests if r.is_queued())
+        reused = max(0, self.requests_total - self.connections_opened)
+
+        return {
+            "connections_open": len(connections),
+            "connections_in_use": len(connections) - idle,
+            "connections_idle": idle,
+            "requests_waiting": waiting,
+            "requests_total": self.requests_total,
+            "connections_opened": self.connections_opened,
+            "reuse_ratio": round(reused / self.requests_total, 4) if self.requests_total else 0.0,
+            "pool_timeouts": self.pool_timeouts,
+        }
+
+
+def _http2_available() -> bool:
+    return importlib.util.find_spec("h2") is not None
+
+
+def build_http_client(transport: Optional[httpx.AsyncBaseTransport] = None) -> httpx.AsyncClient:
+    """
+    کلاینت httpx را با محدودیت‌های استخر، keep-alive و timeoutهای تعریف‌شده در Settings می‌سازد.
+    اگر API_HTTP2 فعال باشد ولی پکیج h2 نصب نباشد، با هشدار به HTTP/1.1 برمی‌گردد.
+    """
+    http2 = settings.API_HTTP2
+    if http2 and not _http2_available():
+        logging.warning("API_HTTP2 is enabled but the 'h2' package is not installed; falling back to HTTP/1.1.")
+        http2 = False
+
+    limits = httpx.Limits(
+        max_connections=settings.API_POOL_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.API_POOL_MAX_KEEPALIVE,
+        keepalive_expiry=settings.API_KEEPALIVE_EXPIRY,
+    )
+    timeout = httpx.Timeout(
+        connect=settings.API_CONNECT_TIMEOUT,
+        read=settings.API_READ_TIMEOUT,
+        write=settings.API_WRITE_TIMEOUT,
+        pool=settings.API_POOL_TIMEOUT,
+    )
+
+    if transport is None:
+        transport = MeteredTransport(limits=limits, http2=http2)
+
+    return httpx.AsyncClient(transport=transport, timeout=timeout)
@@ -0,0 +1,99 @@
+# app/core/resilience.py
+
+import logging
+import random
+import time
+from typing import Any, Optional
+
+
+class APIError(Exception):
+    """
+    خطای یکسان برای همه درخواست‌های APIClient.
+    status_code برای خطاهای شبکه/timeout برابر None است.
+    """
+
+    def __init__(self, method: str, path: str, status_code: Optional[int] = None, detail: Any = None):
+        self.method = method
+        self.path = path
+        self.status_code = status_code
+        self.detail = detail
+        status = status_code if status_code is not None else "network error"
+        super().__init__(f"{method} {path} -> {status}: {detail}")
+
+    @property
+    def is_not_found(self) -> bool:
+        return self.status_code == 404
+
+
+class CircuitOpenError(APIError):
+    """وقتی مدار باز است درخواست اصلاً ارسال نمی‌شود و این خطا فوراً برگردانده می‌شود."""
+
+    def __init__(self, method: str, path: str):
+        super().__init__(method, path, None, "circuit open")
+        self.args = (f"{method} {path}: circuit open, backend marked unavailable",)
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker ساده برای بک‌اند.
+
+    closed    : درخواست‌ها عادی ارسال می‌شوند؛ بعد از failure_threshold خطای پشت سر هم مدار باز می‌شود.
+    open      : تا recovery_timeout ثانیه همه درخواست‌ها بدون انتظار رد می‌شوند.
+    half_open : بعد از آن فقط یک درخواست آزمایشی ارسال می‌شود؛ موفقیت مدار را می‌بندد و شکست دوباره بازش می‌کند.
+
+    فقط خطاهای شبکه، timeout و پاسخ‌های 5xx شکست حساب می‌شوند؛ 4xx یعنی بک‌اند سالم است.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, recovery_timeout: float = 30.0):
+        self.failure_threshold = max(1, failure_threshold)
+        self.recovery_timeout = recovery_timeout
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+    def allow_request(self) -> bool:
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN:
+            if time.monotonic() - self._opened_at < self.recovery_timeout:
+                return False
+            self.state = self.HALF_OPEN
+            self._probe_in_flight = False
+        # half_open: فقط یک درخواست آزمایشی
+        if self._probe_in_flight:
+            return False
+        self._probe_in_flight = True
+        return True
+
+    def release_probe(self) -> None:
+        """درخواست آزمایشی بدون نتیجه تمام شد (مثلاً لغو شد)؛ مدار half_open می‌ماند و درخواست بعدی آزمایش می‌شود."""
+        self._probe_in_flight = False
+
+    def record_success(self) -> None:
+        if self.state != self.CLOSED:
+            logging.info("Circuit breaker closed; backend is reachable again.")
+        self.state = self.CLOSED
+        self._failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                logging.error(
+                    f"Circuit breaker opened after {self._failures} consecutive failures; "
+                    f"failing fast for {self.recovery_timeout}s."
+                )
+            self.state = self.OPEN
+            self._opened_at = time.monotonic()
+            self._probe_in_flight = False
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """تأخیر exponential backoff با full jitter: عددی تصادفی بین 0 و min(cap, base * 2^attempt)."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
@@ -0,0 +1,88 @@
+# app/core/role_resolver.py
+
+import asyncio
+import logging
+from typing import Dict, Optional
+
+from cachetools import LRUCache, TTLCache
+
+from app.core.API_Client import APIClient
+from app.core.resilience import APIError
+
+# نقش کاربری که نقش او هنوز هیچ‌وقت با موفقیت خوانده نشده و API در دسترس نیست (کش نمی‌شود)
+DEFAULT_ROLE = "Patient"
+
+
+class RoleResolver:
+    """
+    لایه تشخیص نقش کاربران با کش محدود و دارای TTL.
+
+    نقش هر telegram_id فقط یک بار از API خوانده می‌شود و تا پایان TTL از حافظه برگردانده می‌شود.
+    درخواست‌های همزمان برای یک کاربر (مثلاً دابل‌کلیک) فقط یک درخواست HTTP می‌سازند.
+    فقط جواب واقعی API (نقش کاربر یا 404 → Patient) کش می‌شود؛ اگر API خطا بدهد (5xx، timeout، مدار باز)
+    آخرین نقش شناخته شده کاربر (یا DEFAULT_ROLE) برگردانده می‌شود بدون اینکه در کش بماند.
+    نقش‌ها در پنل بک‌اند تغییر می‌کنند؛ RoleMiddleware با هر /start کش آن کاربر را invalidate می‌کند.
+    """
+
+    def __init__(self, api_client: APIClient, ttl: float = 300.0, maxsize: int = 10_000):
+        self._api_client = api_client
+        self._cache: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl)
+        # آخرین نقش خوانده شده هر کاربر، بعد از انقضای TTL هم برای زمان قطعی API نگه داشته می‌شود
+        self._last_known: LRUCache = LRUCache(maxsize=maxsize)
+        self._pending: Dict[int, asyncio.Future] = {}
+
+    async def get_role(self, telegram_id: int) -> str:
+        """نقش کاربر را از کش یا در صورت نبود، از API برمی‌گرداند."""
+        role = self._cache.get(telegram_id)
+        if role is not None:
+            return role
+
+        # اگر همین الان یک درخواست برای این کاربر در جریان است، منتظر همان می‌مانیم
+        pending = self._pending.get(telegram_id)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending[telegram_id] = future
+        try:
+            try:
+                role = await self._api_client.get_user_role(telegram_id=telegram_id)
+            except APIError as e:
+                role = self._fallback_role(telegram_id, e)
+            else:
+                self._cache[telegram_id] = role
+                self._last_known[telegram_id] = role
+            future.set_result(role)
+            return role
+        except BaseException as e:
+            future.set_exception(e)
+            # جلوگیری از هشدار "exception was never retrieved" وقتی منتظر دیگری وجود ندارد
+            future.exception()
+            raise
+        finally:
+            self._pending.pop(telegram_id, None)
+
+    def _fallback_role(self, telegram_id: int, error: APIError) -> str:
+        role = self._last_known.get(telegram_id)
+        if role is not None:
+            logging.warning(f"Role lookup for {telegram_id} failed ({error}); using last known role '{role}'.")
+            return role
+        logging.warning(f"Role lookup for {telegram_id} failed ({error}); using '{DEFAULT_ROLE}' without caching it.")
+        return DEFAULT_ROLE
+
+    def peek(self, telegram_id: int) -> Optional[str]:
+        """نقش کش‌شده را بدون ارسال درخواست برمی‌گرداند (یا None)."""
+        return self._cache.get(telegram_id)
+
+    def invalidate(self, telegram_id: int) -> None:
+        """
+        نقش یک کاربر را از کش حذف می‌کند تا آپدیت بعدی دوباره از API خوانده شود.
+        RoleMiddleware آن را با هر /start صدا می‌زند (مثلاً بعد از ارتقای بیمار به مشاور در پنل).
+        """
+        self._cache.pop(telegram_id, None)
+        logging.info(f"Role cache invalidated for telegram_id {telegram_id}.")
+
+    def clear(self) -> None:
+        """کل کش نقش‌ها را پاک می‌کند."""
+        self._cache.clear()
+        logging.info("Role cache cleared.")
@@ -0,0 +1,52 @@
+# app/core/role_router.py
+
+import logging
+from typing import Any, Dict
+
+from aiogram import Dispatcher, Router
+from aiogram.dispatcher.event.bases import UNHANDLED
+from aiogram.types import TelegramObject
+
+from app.filters.role_filter import RoleFilter
+
+
+class RoleRouter(Router):
+    """
+    روتری که آپدیت را مستقیماً به روتر نقش کاربر می‌فرستد.
+
+    به جای اینکه aiogram روترهای بیمار، مشاور و صندوق‌دار را یکی‌یکی امتحان کند و فیلتر هر کدام را
+    اجرا کند، این روتر از `user_role` (که RoleMiddleware در داده‌های آپدیت گذاشته) استفاده می‌کند و
+    فقط روتر همان نقش را اجرا می‌کند. روترهای دیگر اصلاً بررسی نمی‌شوند.
+    """
+
+    def __init__(self, routes: Dict[str, Router], name: str | None = None):
+        super().__init__(name=name or "role_dispatch")
+        self._routes = dict(routes)
+        # روترها را به عنوان زیرروتر ثبت می‌کنیم تا update typeها و رویدادهای startup/shutdown درست کار کنند
+        self.include_routers(*self._routes.values())
+
+    async def propagate_event(self, update_type: str, event: TelegramObject, **kwargs: Any) -> Any:
+        router = self._routes.get(kwargs.get("user_role"))
+        if router is None:
+            return UNHANDLED
+        return await router.propagate_event(update_type=update_type, event=event, **kwargs)
+
+
+def register_role_routers(dp: Dispatcher, routes: Dict[str, Router], mode: str = "direct") -> None:
+    """
+    روترهای نقش‌ها را روی Dispatcher ثبت می‌کند.
+
+    mode="direct": یک RoleRouter که بر اساس نقش، مستقیم به روتر مربوطه می‌رود (نیازمند RoleMiddleware).
+    mode="filters": روش قبلی؛ هر روتر RoleFilter خودش را دارد و به ترتیب بررسی می‌شود.
+    """
+    if mode == "direct":
+        dp.include_router(RoleRouter(routes))
+    elif mode == "filters":
+        for role, router in routes.items():
+            router.message.filter(RoleFilter(allowed_roles=[role]))
+            router.callback_query.filter(RoleFilter(allowed_roles=[role]))
+            dp.include_router(router)
+    else:
+        raise ValueError(f"Unknown role dispatch mode: {mode!r}")
+
+    logging.info(f"Role routers registered in '{mode}' mode: {', '.join(routes)}")
@@ -1,5 +1,7 @@
 # app/core/settings.py
 
+from typing import Dict, Literal, Optional
+
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from pydantic import SecretStr
 
@@ -25,6 +27,136 @@ class Settings(BaseSettings):
     API_USERNAME: str
     API_PASSWORD: SecretStr
     ACCESS_TOKEN_EXPIRE_MINUTES: int
+    # توکن این مدت (ثانیه) قبل از انقضا در پس‌زمینه تمدید می‌شود
+    TOKEN_REFRESH_MARGIN_SECONDS: float = 60.0
+
+    # --- API Connection Pool ---
+    # حداکثر اتصال همزمان به بک‌اند و تعداد اتصال‌های بیکاری که برای استفاده مجدد باز می‌مانند
+    API_POOL_MAX_CONNECTIONS: int = 100
+    API_POOL_MAX_KEEPALIVE: int = 20
+    API_KEEPALIVE_EXPIRY: float = 30.0
+    # timeout هر مرحله به ثانیه؛ API_POOL_TIMEOUT زمان انتظار برای گرفتن اتصال آزاد از استخر است
+    API_CONNECT_TIMEOUT: float = 5.0
+    API_READ_TIMEOUT: float = 15.0
+    API_WRITE_TIMEOUT: float = 15.0
+    API_POOL_TIMEOUT: float = 5.0
+    # نیازمند نصب پکیج h2 (pip install httpx[http2])
+    API_HTTP2: bool = False
+
+    # --- API Resilience ---
+    # فقط درخواست‌های GET (idempotent) در صورت خطای شبکه یا 502/503/504 دوباره ارسال می‌شوند
+    API_RETRY_ATTEMPTS: int = 2
+    API_RETRY_BACKOFF_BASE: float = 0.2
+    API_RETRY_BACKOFF_MAX: float = 2.0
+    # timeout خواندن/نوشتن برای هر متد APIClient به صورت جداگانه، مثلا: {"create_order": 30, "get_user_role": 3}
+    API_ENDPOINT_TIMEOUTS: Dict[str, float] = {}
+    # بعد از این تعداد خطای پشت سر هم، تا API_CIRCUIT_RECOVERY_SECONDS همه درخواست‌ها فوراً رد می‌شوند
+    API_CIRCUIT_FAILURE_THRESHOLD: int = 5
+    API_CIRCUIT_RECOVERY_SECONDS: float = 30.0
+
+    # --- Catalog Cache (disease types / drugs) ---
+    # بعد از TTL مقدار قدیمی تا STALE ثانیه دیگر فوراً برگردانده و در پس‌زمینه تازه می‌شود
+    CATALOG_CACHE_TTL_SECONDS: float = 600.0
+    CATALOG_CACHE_STALE_SECONDS: float = 3600.0
+    CATALOG_CACHE_MAX_SIZE: int = 256
+
+    # --- CMS (bot messages) Cache ---
+    # همه متن‌ها در شروع ربات یک‌جا خوانده و هر CMS_CACHE_TTL_SECONDS در پس‌زمینه تازه می‌شوند
+    CMS_CACHE_TTL_SECONDS: float = 300.0
+    # کلیدی که 404 داده برای این مدت دوباره درخواست نمی‌شود
+    CMS_NEGATIVE_TTL_SECONDS: float = 60.0
+    CMS_CACHE_MAX_SIZE: int = 1000
+
+    # --- Role Resolution Cache ---
+    # نقش هر کاربر برای این مدت (ثانیه) در حافظه نگه داشته می‌شود تا برای هر آپدیت به API درخواست نزنیم
+    # با /start نقش کاربر فوراً دوباره خوانده می‌شود
+    ROLE_CACHE_TTL_SECONDS: float = 60.0
+    ROLE_CACHE_MAX_SIZE: int = 10_000
+
+    # --- Role Dispatch ---
+    # "direct": هر آپدیت مستقیماً به روتر نقش کاربر می‌رود
+    # "filters": روش قدیمی؛ همه روترها به ترتیب با RoleFilter بررسی می‌شوند
+    ROLE_DISPATCH_MODE: Literal["direct", "filters"] = "direct"
+
+    # --- FSM Storage ---
+    # "memory": پیش‌فرض aiogram (با ری‌استارت پاک می‌شود)
+    # "sqlite": فایل محلی، برای یک سرور
+    # "redis": مشترک بین چند پروسه/سرور (برای اجرای محلی بدون سرور: FSM_REDIS_URL=fakeredis://)
+    FSM_STORAGE: Literal["memory", "sqlite", "redis"] = "memory"
+    FSM_SQLITE_PATH: str = "fsm_storage.db"
+    FSM_REDIS_URL: str = "redis://localhost:6379/0"
+    FSM_STATE_TTL_SECONDS: Optional[int] = None
+    # تغییرات هر چند میلی‌ثانیه یک بار به صورت دسته‌ای نوشته می‌شوند (0 = نوشتن فوری)
+    FSM_FLUSH_INTERVAL: float = 0.05
+    FSM_FLUSH_BATCH_SIZE: int = 100
+    # صف نوشتن دسته‌ای فقط در حافظه یک پروسه است؛ اگر چند پروسه/سرور از یک بک‌اند استفاده می‌کنند True شود
+    # تا هر تغییر فوراً نوشته شود و پروسه‌های دیگر state کهنه نخوانند
+    FSM_SHARED_BACKEND: bool = False
+
+    # --- Invoice Rendering ---
+    # تعداد پروسه‌های صدور PDF، حداکثر فاکتور همزمان در صف و حداکثر زمان صدور هر فاکتور (ثانیه)
+    INVOICE_POOL_WORKERS: int = 2
+    INVOICE_MAX_PENDING: int = 8
+    INVOICE_RENDER_TIMEOUT: float = 30.0
+    # فاکتورهای صادر شده (و file_id تلگرام آن‌ها) بر اساس هش محتوا کش می‌شوند
+    INVOICE_CACHE_DIR: str = "invoice_cache"
+    INVOICE_CACHE_MAX_MB: int = 200
+    INVOICE_CACHE_MAX_ENTRIES: int = 5000
+
+    # --- Attachment file_id Cache ---
+    # file_id تلگرام هر پیوست بعد از اولین آپلود ذخیره می‌شود تا تاریخچه چت دوباره آپلود نشود
+    FILE_ID_CACHE_PATH: str = "file_ids.db"
+    FILE_ID_CACHE_MEMORY_SIZE: int = 10000
+
+    # --- Telegram File Downloads ---
+    # حداکثر دانلود همزمان (مثلاً عکس‌های ثبت‌نام) و حداکثر زمان دانلود هر فایل (ثانیه)
+    DOWNLOAD_CONCURRENCY: int = 4
+    DOWNLOAD_TIMEOUT_SECONDS: float = 30.0
+
+    # --- Attachment Storage ---
+    # "local": دیسک همین سرور (زیر STORAGE_LOCAL_ROOT، همان پوشه patient_files قبلی)
+    # "s3": هر object store سازگار با S3 مثل MinIO (برای اجرای محلی بدون سرور: S3_ENDPOINT_URL=memory://)
+    STORAGE_BACKEND: Literal["local", "s3"] = "local"
+    STORAGE_LOCAL_ROOT: str = "."
+    STORAGE_CHUNK_SIZE: int = 64 * 1024
+    S3_ENDPOINT_URL: str = "memory://"
+    S3_BUCKET: Optional[str] = None
+    S3_ACCESS_KEY: Optional[SecretStr] = None
+    S3_SECRET_KEY: Optional[SecretStr] = None
+    S3_REGION: str = "us-east-1"
+    # هر فایل یکتا (بر اساس file_unique_id تلگرام و هش محتوا) فقط یک بار دانلود و ذخیره می‌شود
+    ATTACHMENT_DEDUP: bool = True
+    # ایندکس SQLite محلی است (حتی با "s3")؛ همه نمونه‌های ربات روی یک storage باید روی همین سرور و با همین فایل اجرا شوند
+    ATTACHMENT_INDEX_PATH: str = "attachments.db"
+
+    # --- Image Previews ---
+    # از هر عکس ذخیره شده یک نسخه کم‌حجم (preview) و یک بندانگشتی (thumb) در process pool ساخته می‌شود؛
+    # تاریخچه‌ها preview را می‌فرستند و فایل اصلی با دکمه «فایل اصلی» (نیازمند Pillow و ATTACHMENT_DEDUP)
+    IMAGE_PREVIEWS: bool = True
+    IMAGE_POOL_WORKERS: int = 2
+    IMAGE_MAX_PENDING: int = 16
+    IMAGE_PROCESS_TIMEOUT: float = 30.0
+    # بیشترین ضلع preview و thumb به پیکسل، کیفیت JPEG و حداکثر حجم عکسی که پردازش می‌شود
+    IMAGE_PREVIEW_SIZE: int = 1280
+    IMAGE_THUMB_SIZE: int = 320
+    IMAGE_JPEG_QUALITY: int = 80
+    IMAGE_MAX_SOURCE_MB: int = 20
+
+    # --- Run Mode / Webhook ---
+    # "polling": دریافت آپدیت‌ها با getUpdates (پیش‌فرض)
+    # "webhook": سرور aiohttp محلی آپدیت‌ها را دریافت می‌کند
+    BOT_RUN_MODE: Literal["polling", "webhook"] = "polling"
+    # آدرس عمومی (مثلا https://bot.example.com)؛ اگر خالی باشد وب‌هوک روی تلگرام ثبت نمی‌شود (مثلا پشت پراکسی که خودتان تنظیم کرده‌اید)
+    WEBHOOK_BASE_URL: Optional[str] = None
+    WEBHOOK_PATH: str = "/webhook"
+    WEBHOOK_SECRET: Optional[SecretStr] = None
+    WEBAPP_HOST: str = "0.0.0.0"
+    WEBAPP_PORT: int = 8080
+    # تعداد workerهای پردازش آپدیت و ظرفیت کل صف‌ها
+    UPDATE_WORKERS: int = 16
+    UPDATE_QUEUE_SIZE: int = 1000
+    # حداکثر زمان (ثانیه) برای تمام شدن آپدیت‌های در صف هنگام خاموش شدن
+    SHUTDOWN_DRAIN_TIMEOUT: float = 30.0
 
 
 
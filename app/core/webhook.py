@@ -0,0 +1,201 @@
+# app/core/webhook.py
+
+import asyncio
+import logging
+import signal
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Set
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class UpdateWorkerPool:
+    """
+    پردازش همزمان آپدیت‌ها با ترتیب ثابت برای هر چت.
+
+    هر چت (یا کاربر) صف FIFO خودش را دارد که یک task آن را به ترتیب پردازش می‌کند، پس ترتیب پیام‌های
+    یک کاربر و حالت FSM او حفظ می‌شود. چت‌های مختلف مستقل از هم اجرا می‌شوند و حداکثر `workers` هندلر
+    همزمان در حال اجرا هستند؛ یک هندلر کند (مثل صدور PDF صندوق‌دار) فقط همان چت را نگه می‌دارد.
+    حداکثر queue_size آپدیت (در همه چت‌ها) در صف یا در حال پردازش است؛ بیشتر از آن رد می‌شود تا تلگرام بعداً دوباره بفرستد.
+    """
+
+    def __init__(self, dp: Dispatcher, bot: Bot, workers: int = 16, queue_size: int = 1000, **kwargs: Any):
+        self._dp = dp
+        self._bot = bot
+        self._kwargs = kwargs
+        self._workers_count = max(1, workers)
+        self._queue_size = max(1, queue_size)
+        self._semaphore = asyncio.Semaphore(self._workers_count)
+        self._chats: Dict[int, Deque[Update]] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self._pending = 0
+        self.accepting = False
+
+    @staticmethod
+    def _shard_key(update: Update) -> int:
+        event = update.event
+        chat = getattr(event, "chat", None) or getattr(getattr(event, "message", None), "chat", None)
+        if chat is not None:
+            return chat.id
+        user = getattr(event, "from_user", None)
+        if user is not None:
+            return user.id
+        return update.update_id
+
+    def start(self) -> None:
+        self.accepting = True
+        logging.info(f"Update worker pool started with {self._workers_count} concurrent handlers.")
+
+    def submit(self, update: Update) -> bool:
+        """آپدیت را به صف چت خودش اضافه می‌کند. اگر ظرفیت پر باشد یا در حال خاموش شدن باشیم False برمی‌گرداند."""
+        if not self.accepting:
+            return False
+        if self._pending >= self._queue_size:
+            logging.warning(f"Update queue is full, rejecting update {update.update_id}.")
+            return False
+        key = self._shard_key(update)
+        self._pending += 1
+        queue = self._chats.get(key)
+        if queue is not None:
+            # task این چت در حال اجراست و بعد از آپدیت فعلی به این یکی می‌رسد
+            queue.append(update)
+            return True
+        self._chats[key] = deque([update])
+        task = asyncio.create_task(self._run_chat(key), name=f"update-chat-{key}")
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return True
+
+    async def _run_chat(self, key: int) -> None:
+        queue = self._chats[key]
+        try:
+            while queue:
+                update = queue.popleft()
+                try:
+                    async with self._semaphore:
+                        await self._dp.feed_update(self._bot, update, **self._kwargs)
+                except Exception as e:
+                    logging.error(f"Error while processing update {update.update_id}: {e}", exc_info=True)
+                finally:
+                    self._pending -= 1
+        finally:
+            # بین خالی شدن صف و حذف آن await نیست، پس آپدیت تازه یا به همین صف می‌رسد یا task جدید می‌سازد
+            self._pending -= len(queue)
+            del self._chats[key]
+
+    async def drain(self, timeout: float) -> None:
+        """پذیرش آپدیت جدید را متوقف می‌کند، منتظر تمام شدن صف‌ها می‌ماند و بقیه را لغو می‌کند."""
+        self.accepting = False
+        logging.info(f"Draining update worker pool ({self._pending} queued updates)...")
+        if not self._tasks:
+            return
+        _, pending = await asyncio.wait(set(self._tasks), timeout=timeout)
+        if pending:
+            logging.warning(f"Drain timed out after {timeout}s; remaining updates are dropped.")
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+
+class WebhookServer:
+    """
+    سرور aiohttp که آپدیت‌های تلگرام را از طریق وب‌هوک دریافت و به UpdateWorkerPool می‌سپارد.
+    پاسخ HTTP بلافاصله بعد از قرار گرفتن آپدیت در صف برگردانده می‌شود.
+    """
+
+    def __init__(
+            self,
+            dp: Dispatcher,
+            bot: Bot,
+            *,
+            path: str = "/webhook",
+            secret: Optional[str] = None,
+            host: str = "0.0.0.0",
+            port: int = 8080,
+            workers: int = 16,
+            queue_size: int = 1000,
+            drain_timeout: float = 30.0,
+    ):
+        self._dp = dp
+        self._bot = bot
+        self._path = path
+        self._secret = secret
+        self._host = host
+        self._port = port
+        self._drain_timeout = drain_timeout
+        self.pool = UpdateWorkerPool(dp, bot, workers=workers, queue_size=queue_size)
+        self._runner: Optional[web.AppRunner] = None
+
+    def build_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post(self._path, self._handle_update)
+        return app
+
+    async def _handle_update(self, request: web.Request) -> web.Response:
+        if self._secret and request.headers.get(SECRET_HEADER) != self._secret:
+            return web.Response(status=401)
+
+        try:
+            update = Update.model_validate(await request.json(), context={"bot": self._bot})
+        except Exception as e:
+            logging.warning(f"Invalid update payload received on webhook: {e}")
+            return web.Response(status=400)
+
+        # 503 باعث می‌شود تلگرام همین آپدیت را کمی بعد دوباره ارسال کند
+        if not self.pool.submit(update):
+            return web.Response(status=503)
+        return web.Response()
+
+    async def start(self) -> None:
+        await self._dp.emit_startup(bot=self._bot, dispatcher=self._dp, bots=[self._bot], **self._dp.workflow_data)
+        self.pool.start()
+
+        self._runner = web.AppRunner(self.build_app())
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self._host, self._port)
+        await site.start()
+        logging.info(f"Webhook server listening on {self._host}:{self._port}{self._path}")
+
+    async def stop(self) -> None:
+        """خاموشی تدریجی: اول سرور HTTP، بعد تخلیه صف‌ها و در آخر رویداد shutdown دیسپچر."""
+        self.pool.accepting = False
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+        await self.pool.drain(self._drain_timeout)
+        await self._dp.emit_shutdown(bot=self._bot, dispatcher=self._dp, bots=[self._bot], **self._dp.workflow_data)
+        logging.info("Webhook server stopped.")
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot, *, base_url: Optional[str] = None, **options: Any) -> None:
+    """
+    ربات را در حالت وب‌هوک اجرا می‌کند و تا دریافت SIGINT/SIGTERM منتظر می‌ماند.
+    اگر base_url داده شود، آدرس وب‌هوک روی تلگرام هم ثبت می‌شود.
+    """
+    server = WebhookServer(dp, bot, **options)
+    stop_event = asyncio.Event()
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except (NotImplementedError, RuntimeError):
+            # روی ویندوز پشتیبانی نمی‌شود؛ در آن صورت KeyboardInterrupt همان کار را می‌کند
+            pass
+
+    await server.start()
+    try:
+        if base_url:
+            await bot.set_webhook(
+                url=f"{base_url.rstrip('/')}{server._path}",
+                secret_token=server._secret,
+                allowed_updates=dp.resolve_used_update_types(),
+            )
+            logging.info("Webhook registered on Telegram.")
+        await stop_event.wait()
+    finally:
+        await server.stop()
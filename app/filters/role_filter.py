@@ -1,15 +1,20 @@
 # File: app/filters/role_filter.py
 
-from typing import Union
+from typing import Optional, Union
 from aiogram.filters import BaseFilter
 from aiogram.types import Message, CallbackQuery
 from app.core.API_Client import APIClient
+from app.core.resilience import APIError
+from app.core.role_resolver import RoleResolver
 
 
 class RoleFilter(BaseFilter):
     """
     فیلتری برای بررسی نقش کاربر از طریق API.
     این فیلتر هم برای Message و هم برای CallbackQuery کار می‌کند.
+
+    اگر RoleMiddleware نقش را از قبل در `user_role` گذاشته باشد، هیچ درخواستی به API ارسال نمی‌شود
+    و همه روترها از همان نقش استفاده می‌کنند.
     """
 
     def __init__(self, allowed_roles: list[str]):
@@ -18,7 +23,9 @@ class RoleFilter(BaseFilter):
     async def __call__(
             self,
             update: Union[Message, CallbackQuery],
-            api_client: APIClient
+            api_client: APIClient,
+            user_role: Optional[str] = None,
+            role_resolver: Optional[RoleResolver] = None,
     ) -> bool:
         # از هر نوع آپدیتی که باشد (پیام یا کلیک)، آبجکت user را می‌گیریم
         user = update.from_user
@@ -27,8 +34,16 @@ class RoleFilter(BaseFilter):
         if not user:
             return False
 
-        # از کلاینت API که به dispatcher پاس داده شده استفاده می‌کنیم
-        user_role = await api_client.get_user_role(telegram_id=user.id)
+        # نقشی که در همین آپدیت تشخیص داده شده اولویت دارد، بعد کش مشترک و در آخر خود API
+        if user_role is None:
+            if role_resolver is not None:
+                user_role = await role_resolver.get_role(user.id)
+            else:
+                try:
+                    user_role = await api_client.get_user_role(telegram_id=user.id)
+                except APIError:
+                    # نقش معلوم نیست؛ هیچ روتری این آپدیت را نمی‌گیرد
+                    return False
 
         # بررسی می‌کنیم آیا نقش کاربر در لیست نقش‌های مجاز این روتر هست یا نه
         if user_role in self.allowed_roles:
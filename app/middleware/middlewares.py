@@ -1,9 +1,11 @@
 # app/middlewares.py
 from typing import Any, Awaitable, Callable, Dict
 from aiogram import BaseMiddleware
-from aiogram.types import Message
+from aiogram.types import Message, TelegramObject, Update, User
 from cachetools import TTLCache
 
+from app.core.role_resolver import RoleResolver
+
 
 class ThrottlingMiddleware(BaseMiddleware):
     def __init__(self, limit: float = 0.5):
@@ -28,3 +30,31 @@ class ThrottlingMiddleware(BaseMiddleware):
 
         # ادامه پردازش پیام
         return await handler(event, data)
+
+
+class RoleMiddleware(BaseMiddleware):
+    """
+    نقش کاربر را برای هر آپدیت فقط یک بار تشخیص می‌دهد و با کلید `user_role`
+    در اختیار تمام فیلترها و هندلرهای روترها قرار می‌دهد.
+    این میدل‌ور باید به صورت outer روی `dp.update` ثبت شود.
+    با /start نقش کاربر دوباره از API خوانده می‌شود تا تغییر نقش در پنل بدون صبر برای TTL اعمال شود.
+    """
+
+    def __init__(self, role_resolver: RoleResolver):
+        self.role_resolver = role_resolver
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: Dict[str, Any],
+    ) -> Any:
+        # UserContextMiddleware خود aiogram کاربر آپدیت را از قبل استخراج کرده است
+        user: User | None = data.get("event_from_user")
+        if user:
+            message = event.message if isinstance(event, Update) else None
+            if message is not None and message.text and message.text.startswith("/start"):
+                self.role_resolver.invalidate(user.id)
+            data["user_role"] = await self.role_resolver.get_role(user.id)
+
+        return await handler(event, data)
@@ -2,6 +2,7 @@
 
 import os
 import logging
+import time
 from datetime import datetime
 from decimal import Decimal
 from typing import Optional
@@ -29,6 +30,26 @@ from app.patient.keyboards import (
 )
 from app.core.API_Client import APIClient
 from app.core.enums import PatientStatus, OrderStatusEnum
+from app.storage import (
+    AttachmentStorage,
+    ContentStore,
+    LocalStorage,
+    download_to_storage,
+    patient_file_key,
+    timestamped_name,
+)
+from app.utils.attachments import (
+    ORIGINAL_CALLBACK_PREFIX,
+    history_caption,
+    release_attachments,
+    remember_received_file,
+    schedule_previews,
+    send_attachment,
+    send_original,
+)
+from app.utils.downloads import TelegramDownloader
+from app.utils.file_id_cache import FileIdCache
+from app.utils.image_service import ImageProcessingService
 
 # ساخت روتر
 patient_router = Router(name="patient")
@@ -38,14 +59,27 @@ async def save_telegram_file(
     bot: Bot,
     file_id: str,
     telegram_id: int,
-    purpose: str = "file"
+    purpose: str = "file",
+    *,
+    storage: Optional[AttachmentStorage] = None,
+    content_store: Optional[ContentStore] = None,
+    file_unique_id: Optional[str] = None,
+    message: Optional[Message] = None,
 ) -> Optional[str]:
     """
-    یک فایل (عکس/ویس) را از تلگرام دانلود و ذخیره می‌کند.
+    یک فایل (عکس/ویس) را از تلگرام دانلود و در storage ذخیره می‌کند و کلید ذخیره‌سازی آن را برمی‌گرداند.
+    با content_store فایل تکراری (همان file_unique_id یا همان محتوا) دوباره دانلود و ذخیره نمی‌شود
+    و پیام (message) در ایندکس پیام‌ها به فایل نگاشت می‌شود.
     """
     try:
-        user_storage_path = os.path.join("patient_files", str(telegram_id))
-        os.makedirs(user_storage_path, exist_ok=True)
+        if content_store is not None:
+            key = await content_store.put_telegram_file(
+                bot, file_id, file_unique_id, default_ext=".jpg" if purpose.startswith("photo") else ".ogg",
+                chat_id=message.chat.id if message else None,
+                message_id=message.message_id if message else None,
+            )
+            logger.info(f"File saved for user {telegram_id} at: {key}")
+            return key
 
         file_info = await bot.get_file(file_id)
         file_path_on_telegram = file_info.file_path
@@ -55,15 +89,12 @@ async def save_telegram_file(
         if not ext:
             ext = ".jpg" if purpose.startswith("photo") else ".ogg"
 
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"{telegram_id}_{timestamp}_{purpose}{ext}"
-        destination_path = os.path.join(user_storage_path, filename)
+        key = patient_file_key(telegram_id, timestamped_name(telegram_id, purpose, ext=ext))
 
-        await bot.download_file(file_path_on_telegram, destination=destination_path)
+        await download_to_storage(bot, storage or LocalStorage(), file_path_on_telegram, key)
 
-        absolute_path = os.path.abspath(destination_path)
-        logger.info(f"File saved for user {telegram_id} at: {absolute_path}")
-        return absolute_path
+        logger.info(f"File saved for user {telegram_id} at: {key}")
+        return key
 
     except Exception as e:
         logger.error(f"Error downloading file {file_id}: {e}")
@@ -73,7 +104,12 @@ async def save_telegram_photo(
     bot: Bot,
     file_id: str,
     telegram_id: int,
-    purpose: str = "photo"
+    purpose: str = "photo",
+    *,
+    storage: Optional[AttachmentStorage] = None,
+    content_store: Optional[ContentStore] = None,
+    file_unique_id: Optional[str] = None,
+    message: Optional[Message] = None,
 ) -> Optional[str]:
     """
     یک فایل را از تلگرام دانلود و در مسیر استاندارد پروژه ذخیره می‌کند.
@@ -83,28 +119,34 @@ async def save_telegram_photo(
         file_id (str): شناسه فایل در تلگرام.
         telegram_id (int): شناسه تلگرام کاربر برای ساخت پوشه.
         purpose (str): هدفی برای نام‌گذاری فایل (مثلا 'illness', 'receipt').
+        storage (AttachmentStorage): بک‌اند ذخیره‌سازی (پیش‌فرض: دیسک محلی).
+        content_store (ContentStore): اگر داده شود، فایل بدون تکرار در objects/<hash> ذخیره می‌شود.
+        file_unique_id (str): شناسه یکتای فایل در تلگرام؛ اگر قبلاً دیده شده باشد فایل دانلود نمی‌شود.
+        message (Message): پیامی که فایل با آن رسیده، برای ایندکس پیام‌ها.
 
     Returns:
-        Optional[str]: مسیر مطلق فایل ذخیره شده یا None در صورت خطا.
+        Optional[str]: کلید ذخیره‌سازی فایل (مثل patient_files/<id>/<name>) یا None در صورت خطا.
     """
     try:
-        user_storage_path = os.path.join("patient_files", str(telegram_id))
-        os.makedirs(user_storage_path, exist_ok=True)
+        if content_store is not None:
+            key = await content_store.put_telegram_file(
+                bot, file_id, file_unique_id, default_ext=".jpg",
+                chat_id=message.chat.id if message else None,
+                message_id=message.message_id if message else None,
+            )
+            logger.info(f"File saved for user {telegram_id} at: {key}")
+            return key
 
         file_info = await bot.get_file(file_id)
         file_path_on_telegram = file_info.file_path
 
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         file_extension = os.path.splitext(file_path_on_telegram)[1] or ".jpg"
-        filename = f"{telegram_id}_{timestamp}_{purpose}{file_extension}"
-
-        destination_path = os.path.join(user_storage_path, filename)
+        key = patient_file_key(telegram_id, timestamped_name(telegram_id, purpose, ext=file_extension))
 
-        await bot.download_file(file_path_on_telegram, destination=destination_path)
+        await download_to_storage(bot, storage or LocalStorage(), file_path_on_telegram, key)
 
-        absolute_path = os.path.abspath(destination_path)
-        logger.info(f"File saved for user {telegram_id} at: {absolute_path}")
-        return absolute_path
+        logger.info(f"File saved for user {telegram_id} at: {key}")
+        return key
 
     except Exception as e:
         logger.error(f"Could not download file {file_id} for user {telegram_id}. Purpose: {purpose}. Error: {e}")
@@ -118,7 +160,11 @@ async def save_telegram_photo(
 
 @patient_router.message(CommandStart())
 @patient_router.message(StateFilter(default_state),F.text)
-async def main_patient_handler(message: Message, state: FSMContext, api_client: APIClient, bot: Bot):
+async def main_patient_handler(message: Message, state: FSMContext, api_client: APIClient, bot: Bot,
+                               file_id_cache: Optional[FileIdCache] = None,
+                               attachment_storage: Optional[AttachmentStorage] = None,
+                               content_store: Optional[ContentStore] = None,
+                               image_service: Optional[ImageProcessingService] = None):
     """
     این هندلر نقطه ورود اصلی برای تمام پیام‌های بیمار است.
     ۱. وضعیت فعلی FSM را بررسی می‌کند. اگر در حال انجام فرآیندی باشد، اجازه نمی‌دهد خارج شود.
@@ -145,7 +191,11 @@ async def main_patient_handler(message: Message, state: FSMContext, api_client:
     # وضعیت ۲: بیمار منتظر مشاوره است
     if patient_profile.get("patient_status") == PatientStatus.AWAITING_CONSULTATION.value:
         patient_id = patient_profile.get("patient_id")
-        return await handle_awaiting_consultation(message,state,api_client,patient_id,bot)
+        return await handle_awaiting_consultation(
+            message, state, api_client, patient_id, bot,
+            file_id_cache=file_id_cache, attachment_storage=attachment_storage,
+            content_store=content_store, image_service=image_service,
+        )
 
     # وضعیت ۳: پیش‌فاکتور برای بیمار صادر شده و منتظر تایید اوست
     if patient_profile.get("patient_status") == PatientStatus.AWAITING_INVOICE_APPROVAL.value:
@@ -192,7 +242,10 @@ async def handle_new_or_incomplete_profile(message: Message, state: FSMContext,a
 
 
 async def handle_awaiting_consultation(message: Message, state: FSMContext, api_client: APIClient, patient_id: int,
-                                       bot: Bot):
+                                       bot: Bot, *, file_id_cache: Optional[FileIdCache] = None,
+                                       attachment_storage: Optional[AttachmentStorage] = None,
+                                       content_store: Optional[ContentStore] = None,
+                                       image_service: Optional[ImageProcessingService] = None):
     """ورود به محیط چت با مشاور و نمایش تاریخچه کامل"""
 
     # ذخیره patient_id برای استفاده در پیام‌های بعدی
@@ -242,34 +295,16 @@ async def handle_awaiting_consultation(message: Message, state: FSMContext, api_
                     # پاکسازی مسیر (گاهی اوقات کاراکترهای اضافی دارد)
                     file_path = str(file_path).strip()
 
-                    if not os.path.exists(file_path):
-                        await message.answer(f"⚠️ **{sender_title}:** [فایل یافت نشد]\n")
-                        continue
-
                     try:
-                        # آماده‌سازی فایل برای ارسال از روی دیسک
-                        file_to_send = FSInputFile(file_path)
-                        file_ext = os.path.splitext(file_path)[1].lower()
-
-                        if file_ext in ['.jpg', '.jpeg', '.png', '.webp']:
-                            await bot.send_photo(
-                                chat_id=message.chat.id,
-                                photo=file_to_send,
-                                caption=f"📷 تصویر ارسالی {sender_title}"
-                            )
-                        elif file_ext in ['.ogg', '.mp3', '.wav', '.m4a']:
-                            await bot.send_voice(
-                                chat_id=message.chat.id,
-                                voice=file_to_send,
-                                caption=f"🎙 ویس ارسالی {sender_title}"
-                            )
-                        else:
-                            # سایر فایل‌ها به صورت داکیومنت
-                            await bot.send_document(
-                                chat_id=message.chat.id,
-                                document=file_to_send,
-                                caption=f"📎 فایل ارسالی {sender_title}"
-                            )
+                        # پیوست‌هایی که قبلاً آپلود شده‌اند فقط با file_id فرستاده می‌شوند (بدون آپلود دوباره)
+                        await send_attachment(
+                            bot, message.chat.id, file_path, history_caption(file_path, sender_title),
+                            file_id_cache=file_id_cache, storage=attachment_storage,
+                            content_store=content_store, image_service=image_service,
+                            owner_id=message.chat.id,
+                        )
+                    except FileNotFoundError:
+                        await message.answer(f"⚠️ **{sender_title}:** [فایل یافت نشد]\n")
                     except Exception as e:
                         logging.error(f"Error sending history file {file_path}: {e}")
                         await message.answer(f"❌ خطا در نمایش فایل: {os.path.basename(file_path)}")
@@ -569,10 +604,39 @@ async def ask_for_another_photo(callback: CallbackQuery, state: FSMContext):
     await callback.answer()
 
 
+def registration_progress(progress_message: Message, total: int, min_interval: float = 1.0):
+    """
+    پیشرفت دانلود عکس‌ها را در همان یک پیام «در حال پردازش» نشان می‌دهد.
+    ویرایش پیام حداکثر هر min_interval ثانیه یک بار انجام می‌شود تا به محدودیت تلگرام نخوریم.
+    """
+    last_edit = 0.0
+
+    async def on_progress(done: int, count: int) -> None:
+        nonlocal last_edit
+        now = time.monotonic()
+        if done < count and now - last_edit < min_interval:
+            return
+        last_edit = now
+        try:
+            await progress_message.edit_text(
+                f"⏳ در حال ذخیره عکس‌های شما ({done} از {total})... لطفاً کمی صبر کنید."
+            )
+        except TelegramBadRequest:
+            # متن تغییری نکرده یا پیام دیگر قابل ویرایش نیست
+            pass
+
+    return on_progress
+
+
 # (اینجا تمام هندلرهای FSM ثبت‌نام از process_full_name تا finish_registration قرار می‌گیرند)
 # من فقط هندلر پایانی را برای اختصار اینجا می‌آورم:
 @patient_router.callback_query( StateFilter( PatientRegistration.confirm_photo_upload,PatientRegistration.waiting_for_photos), F.data == "finish_registration")
-async def finish_registration(callback: CallbackQuery, state: FSMContext, bot: Bot, api_client: APIClient):
+async def finish_registration(callback: CallbackQuery, state: FSMContext, bot: Bot, api_client: APIClient,
+                              file_id_cache: Optional[FileIdCache] = None,
+                              downloader: Optional[TelegramDownloader] = None,
+                              attachment_storage: Optional[AttachmentStorage] = None,
+                              content_store: Optional[ContentStore] = None,
+                              image_service: Optional[ImageProcessingService] = None):
     # ... (کد دانلود عکس‌ها و آماده‌سازی داده‌ها دقیقاً مثل قبل)
     await callback.message.edit_text("⏳ در حال پردازش و ذخیره اطلاعات شما... لطفاً کمی صبر کنید.")
 
@@ -582,31 +646,28 @@ async def finish_registration(callback: CallbackQuery, state: FSMContext, bot: B
 
 
     saved_photo_paths = []
+    failed_photos = 0
 
-    # بخش دانلود و ذخیره عکس‌ها
+    # بخش دانلود و ذخیره عکس‌ها (همزمان، با سقف همزمانی و timeout برای هر عکس)
     photo_file_ids = user_data.get("photos", [])
     if photo_file_ids:
-        user_storage_path = os.path.join("patient_files", str(telegram_id))
-        os.makedirs(user_storage_path, exist_ok=True)
-
-        for i, file_id in enumerate(photo_file_ids):
-            try:
-                file_info = await bot.get_file(file_id)
-                file_path_on_telegram = file_info.file_path
-
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                file_extension = os.path.splitext(file_path_on_telegram)[1] or ".jpg"
-                filename = f"{telegram_id}_{timestamp}_{i + 1}{file_extension}"
-
-                destination_path = os.path.join(user_storage_path, filename)
-
-                await bot.download_file(file_path_on_telegram, destination=destination_path)
-
-                absolute_path = os.path.abspath(destination_path)
-                saved_photo_paths.append(absolute_path)
-
-            except Exception as e:
-                logging.error(f"Could not download file {file_id} for user {telegram_id}. Error: {e}")
+        def key_for(index: int, file_extension: str) -> str:
+            return patient_file_key(telegram_id, timestamped_name(telegram_id, index, ext=file_extension or ".jpg"))
+
+        report = await (downloader or TelegramDownloader()).download_many(
+            bot,
+            attachment_storage or LocalStorage(),
+            photo_file_ids,
+            key_for,
+            on_progress=registration_progress(callback.message, len(photo_file_ids)),
+            content_store=content_store,
+        )
+        for result in report.saved:
+            await remember_received_file(file_id_cache, result.key, result.file_id, "photo")
+        saved_photo_paths = report.saved_keys
+        failed_photos = len(report.failed)
+        if failed_photos:
+            logging.error(f"{failed_photos} of {len(photo_file_ids)} photos could not be downloaded for user {telegram_id}.")
 
     # بخش آماده‌سازی و ارسال داده‌ها به API
     # نام فیلدها باید دقیقاً با PatientCreate schema در بک‌اند مطابقت داشته باشد
@@ -637,30 +698,47 @@ async def finish_registration(callback: CallbackQuery, state: FSMContext, bot: B
     else:
         logging.info(f"Creation failed (likely exists). Attempting to UPDATE profile for {telegram_id}...")
 
+        # عکس‌های پرونده قبلی با عکس‌های جدید جایگزین می‌شوند؛ بعد از به‌روزرسانی ارجاعشان برداشته می‌شود
+        previous_profile = (
+            await api_client.get_patient_details_by_telegram_id(str(telegram_id)) if content_store is not None else None
+        )
+
         # متد update_patient را صدا می‌زنیم
         is_updated = await api_client.update_patient(str(telegram_id), final_data_to_send)
 
         if is_updated:
             logging.info(f"Patient profile updated successfully for {telegram_id}.")
             success = True
+            previous_photos = (previous_profile or {}).get("photo_paths")
+            if isinstance(previous_photos, list):
+                await release_attachments(content_store, previous_photos)
         else:
             logging.error("Both Creation and Update failed.")
 
     if success:
+        # preview عکس‌ها در پس‌زمینه ساخته می‌شود تا مشاور تاریخچه را با عکس‌های کم‌حجم ببیند
+        schedule_previews(image_service, attachment_storage, saved_photo_paths)
 
         await api_client.update_patient_status(telegram_id, PatientStatus.AWAITING_CONSULTATION)
         logging.info(f"Initial system change status successfully for patient_id: {new_patient_id}")
 
         # آماده‌سازی پیام برای نمایش به کاربر در تلگرام
+        # اگر بعضی عکس‌ها دانلود نشدند، بیمار در همان پیام پایانی مطلع می‌شود
+        failed_note = (
+            f"⚠️ {failed_photos} عکس دریافت نشد؛ می‌توانید آن‌ها را در گفتگو با مشاور دوباره بفرستید.\n\n"
+            if failed_photos else ""
+        )
         response_text = (
             f"✅ {full_name} عزیز، فرآیند ثبت‌نام شما با موفقیت به پایان رسید.\n\n"
             "پرونده شما در سیستم ذخیره شد و یک تیکت پشتیبانی برای شما ایجاد گردید.\n\n"
             f"<b>تعداد عکس‌های ذخیره شده:</b> {len(saved_photo_paths)}\n\n"
+            f"{failed_note}"
             "کارشناسان ما به زودی پرونده شما را بررسی کرده و از طریق همین ربات به شما پاسخ خواهند داد."
         )
     else:
         # ثبت پروفایل با خطا مواجه شد
         logging.error(f"Failed to create patient profile for telegram_id: {telegram_id}. API returned None.")
+        await release_attachments(content_store, saved_photo_paths)
         response_text = (
             "❌ متاسفانه در هنگام ذخیره اطلاعات شما در سرور مشکلی پیش آمد.\n\n"
             "ممکن است شما قبلاً یک پرونده با این شماره تلگرام ثبت کرده باشید. "
@@ -777,7 +855,11 @@ async def process_consultation_text(message: Message, state: FSMContext, api_cli
 
 # --- هندلر دریافت مدیا (عکس/ویس) در چت ---
 @patient_router.message(PatientConsultation.chatting, F.photo | F.voice)
-async def process_consultation_media(message: Message, state: FSMContext, bot: Bot, api_client: APIClient):
+async def process_consultation_media(message: Message, state: FSMContext, bot: Bot, api_client: APIClient,
+                                     file_id_cache: Optional[FileIdCache] = None,
+                                     attachment_storage: Optional[AttachmentStorage] = None,
+                                     content_store: Optional[ContentStore] = None,
+                                     image_service: Optional[ImageProcessingService] = None):
     data = await state.get_data()
     patient_id = data.get("chat_patient_id")
 
@@ -789,18 +871,28 @@ async def process_consultation_media(message: Message, state: FSMContext, bot: B
 
     try:
         file_id = None
+        file_unique_id = None
         purpose = "chat_file"
 
         if message.photo:
             file_id = message.photo[-1].file_id
+            file_unique_id = message.photo[-1].file_unique_id
             purpose = "chat_photo"
         elif message.voice:
             file_id = message.voice.file_id
+            file_unique_id = message.voice.file_unique_id
             purpose = "chat_voice"
 
         # ذخیره فایل
         telegram_id = message.from_user.id
-        saved_path = await save_telegram_file(bot, file_id, telegram_id, purpose=purpose)
+        saved_path = await save_telegram_file(
+            bot, file_id, telegram_id, purpose=purpose, storage=attachment_storage,
+            content_store=content_store, file_unique_id=file_unique_id, message=message,
+        )
+
+        if saved_path:
+            # file_id همین پیام برای نمایش بعدی تاریخچه کافی است؛ فایل دوباره آپلود نمی‌شود
+            await remember_received_file(file_id_cache, saved_path, file_id, "photo" if message.photo else "voice")
 
         if saved_path:
             # ارسال به API
@@ -808,12 +900,17 @@ async def process_consultation_media(message: Message, state: FSMContext, bot: B
                 patient_id=patient_id,
                 message_content=f"ارسال {('عکس' if message.photo else 'ویس')}",
                 messages_sender=True,
-                attachments=[saved_path]  # ارسال لیست مسیر فایل
+                attachments=[saved_path]  # ارسال لیست کلید فایل در storage
             )
 
             if success:
+                schedule_previews(image_service, attachment_storage, [saved_path])
                 await msg.edit_text("✅ فایل برای مشاور ارسال شد.")
             else:
+                # فایل در هیچ پیامی ثبت نشد؛ ارجاع آن برداشته می‌شود
+                await release_attachments(
+                    content_store, [saved_path], chat_id=message.chat.id, message_id=message.message_id
+                )
                 await msg.edit_text("❌ خطا در ثبت فایل در سیستم.")
         else:
             await msg.edit_text("❌ خطا در دانلود فایل.")
@@ -823,6 +920,27 @@ async def process_consultation_media(message: Message, state: FSMContext, bot: B
         await msg.edit_text("خطای سیستمی.")
 
 
+# --- دکمه «فایل اصلی» زیر عکس‌های تاریخچه ---
+@patient_router.callback_query(F.data.startswith(ORIGINAL_CALLBACK_PREFIX))
+async def process_original_request(callback: CallbackQuery, bot: Bot,
+                                   file_id_cache: Optional[FileIdCache] = None,
+                                   attachment_storage: Optional[AttachmentStorage] = None,
+                                   content_store: Optional[ContentStore] = None):
+    await callback.answer("⏳ در حال ارسال فایل اصلی...")
+    try:
+        sent = await send_original(
+            bot, callback.message.chat.id, callback.data.removeprefix(ORIGINAL_CALLBACK_PREFIX),
+            # بیمار فقط فایل‌های پرونده خودش را می‌گیرد
+            owner_id=callback.from_user.id,
+            file_id_cache=file_id_cache, storage=attachment_storage, content_store=content_store,
+        )
+        if sent is None:
+            await callback.message.answer("⚠️ فایل اصلی یافت نشد.")
+    except Exception as e:
+        logger.error(f"Error sending original file: {e}", exc_info=True)
+        await callback.message.answer("❌ خطا در ارسال فایل اصلی.")
+
+
 # =============================================================================
 # 4. هندلرهای فرآیند ویرایش فاکتور (FSM: EditingInvoice)
 # این بخش جدید است و از کدی که قبلاً پیشنهاد دادم استفاده می‌کند.
@@ -1273,7 +1391,9 @@ async def process_address(message: Message, state: FSMContext,bot:Bot, api_clien
 # =============================================================================
 
 @patient_router.message(PatientPaymentInfo.waiting_for_receipt_photo, F.photo)
-async def process_receipt_photo(message: Message, state: FSMContext, bot: Bot):
+async def process_receipt_photo(message: Message, state: FSMContext, bot: Bot,
+                                attachment_storage: Optional[AttachmentStorage] = None,
+                                content_store: Optional[ContentStore] = None):
 
     if not message.photo:
         await message.answer("❌ لطفاً عکس رسید پرداخت را ارسال کنید. فقط فایل تصویر قابل قبول است.")
@@ -1291,7 +1411,11 @@ async def process_receipt_photo(message: Message, state: FSMContext, bot: Bot):
             bot=bot,
             file_id=photo_file_id,
             telegram_id=telegram_id,
-            purpose="receipt"
+            purpose="receipt",
+            storage=attachment_storage,
+            content_store=content_store,
+            file_unique_id=message.photo[-1].file_unique_id,
+            message=message,
         )
 
         if not saved_path:
@@ -1313,7 +1437,8 @@ async def process_receipt_photo(message: Message, state: FSMContext, bot: Bot):
 
 
 @patient_router.message(PatientPaymentInfo.waiting_for_tracking_code)
-async def process_payment_tracking_code(message: Message, state: FSMContext, api_client: APIClient):
+async def process_payment_tracking_code(message: Message, state: FSMContext, api_client: APIClient,
+                                        content_store: Optional[ContentStore] = None):
     await state.update_data(tracking_code=message.text)
     data = await state.get_data()
     receipt_path = data.get("receipt_photo_path")
@@ -1337,6 +1462,8 @@ async def process_payment_tracking_code(message: Message, state: FSMContext, api
             "پس از تایید پرداخت توسط بخش مالی، سفارش شما ارسال خواهد شد."
         )
     else:
+        # رسید در هیچ پرداختی ثبت نشد و با پاک شدن state دیگر به آن ارجاعی نیست
+        await release_attachments(content_store, [receipt_path])
         await message.answer("❌ خطایی در ثبت اطلاعات پرداخت رخ داد. لطفاً با پشتیبانی تماس بگیرید.")
 
     await state.clear()
@@ -0,0 +1,35 @@
+from .base import (
+    IMAGE_DERIVATIVES,
+    PATIENT_FILES_PREFIX,
+    AttachmentStorage,
+    ObjectNotFoundError,
+    StorageError,
+    derivative_key,
+    is_legacy_path,
+    patient_file_key,
+    timestamped_name,
+)
+from .content import OBJECTS_PREFIX, ContentStore
+from .factory import build_attachment_storage
+from .local import LocalStorage
+from .s3 import S3Storage
+from .telegram import StorageInputFile, download_to_storage
+
+__all__ = [
+    "IMAGE_DERIVATIVES",
+    "OBJECTS_PREFIX",
+    "PATIENT_FILES_PREFIX",
+    "AttachmentStorage",
+    "ContentStore",
+    "LocalStorage",
+    "ObjectNotFoundError",
+    "S3Storage",
+    "StorageError",
+    "StorageInputFile",
+    "build_attachment_storage",
+    "derivative_key",
+    "download_to_storage",
+    "is_legacy_path",
+    "patient_file_key",
+    "timestamped_name",
+]
@@ -0,0 +1,146 @@
+# app/storage/base.py
+import os
+import posixpath
+import uuid
+from datetime import datetime
+from abc import ABC, abstractmethod
+from typing import AsyncIterable, AsyncIterator, Optional
+
+import aiofiles
+import aiofiles.os
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+# همه پیوست‌های بیماران زیر این پیشوند ذخیره می‌شوند (در بک‌اند محلی همان پوشه قبلی patient_files است)
+PATIENT_FILES_PREFIX = "patient_files"
+
+# نسخه‌های کوچک‌شده هر عکس (ImageProcessingService) کنار خود فایل ذخیره می‌شوند
+IMAGE_DERIVATIVES = ("preview", "thumb")
+
+
+class StorageError(Exception):
+    """خطای بک‌اند ذخیره‌سازی (دیسک یا object store)."""
+
+
+class ObjectNotFoundError(StorageError, FileNotFoundError):
+    """فایل/آبجکت با این کلید وجود ندارد."""
+
+
+def patient_file_key(telegram_id, filename: str) -> str:
+    """کلید ذخیره‌سازی یک پیوست بیمار، مثل patient_files/123456/123456_20240101_120000_receipt.jpg"""
+    return normalize_key(f"{PATIENT_FILES_PREFIX}/{telegram_id}/{filename}")
+
+
+def timestamped_name(*parts, ext: str = "") -> str:
+    """
+    نام فایل جدید در چیدمان patient_files (وقتی ATTACHMENT_DEDUP خاموش است)، مثل 123_receipt_20240101_120000_1a2b3c4d.jpg
+    بخش تصادفی انتهای نام مانع برخورد دو آپلود در یک ثانیه می‌شود.
+    """
+    stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    return "_".join([*(str(part) for part in parts), stamp, uuid.uuid4().hex[:8]]) + ext
+
+
+def derivative_key(key: str, kind: str) -> str:
+    """کلید نسخه کوچک‌شده یک عکس، مثل objects/ab/cd/<hash>.preview.jpg برای objects/ab/cd/<hash>.jpg"""
+    return f"{posixpath.splitext(normalize_key(key))[0]}.{kind}.jpg"
+
+
+def normalize_key(key: str) -> str:
+    """کلیدها همیشه مسیر نسبی با / هستند و نمی‌توانند با .. از ریشه ذخیره‌سازی خارج شوند."""
+    key = str(key).strip().replace("\\", "/").lstrip("/")
+    normalized = posixpath.normpath(key)
+    if not key or normalized in (".", "..") or normalized.startswith("../"):
+        raise StorageError(f"Invalid storage key: {key!r}")
+    return normalized
+
+
+def is_legacy_path(ref: str) -> bool:
+    """
+    نسخه‌های قبلی ربات مسیر مطلق فایل روی دیسک همان سرور را در بک‌اند ذخیره می‌کردند.
+    این مراجع همچنان از دیسک محلی خوانده می‌شوند، مستقل از بک‌اند فعلی.
+    """
+    return os.path.isabs(str(ref).strip())
+
+
+class AttachmentStorage(ABC):
+    """
+    لایه ذخیره‌سازی پیوست‌ها (عکس، ویس، رسید).
+
+    هندلرها فقط «کلید» (مثلاً patient_files/<telegram_id>/<name>) را نگه می‌دارند و در API ذخیره می‌کنند؛
+    اینکه فایل روی دیسک محلی است یا در یک object store سازگار با S3، فقط به بک‌اند مربوط است.
+    خواندن و نوشتن async و تکه‌تکه (streaming) است تا نه حلقه رویداد بلاک شود و نه کل فایل در حافظه بیاید.
+    """
+
+    def __init__(self, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        self.chunk_size = chunk_size
+
+    # --- متدهایی که هر بک‌اند پیاده‌سازی می‌کند ---
+
+    @abstractmethod
+    async def _write_stream(self, key: str, chunks: AsyncIterable[bytes]) -> int:
+        """chunks را در key می‌نویسد و تعداد بایت‌ها را برمی‌گرداند."""
+
+    @abstractmethod
+    def _read_stream(self, key: str) -> AsyncIterator[bytes]:
+        """محتوای key را تکه‌تکه برمی‌گرداند؛ اگر وجود نداشته باشد ObjectNotFoundError."""
+
+    @abstractmethod
+    async def _exists(self, key: str) -> bool:
+        ...
+
+    @abstractmethod
+    async def _delete(self, key: str) -> None:
+        ...
+
+    async def close(self) -> None:
+        pass
+
+    # --- API عمومی ---
+
+    async def write_stream(self, key: str, chunks: AsyncIterable[bytes]) -> int:
+        return await self._write_stream(normalize_key(key), chunks)
+
+    async def write_bytes(self, key: str, data: bytes) -> int:
+        async def one_chunk():
+            yield data
+        return await self.write_stream(key, one_chunk())
+
+    async def read_stream(self, ref: str) -> AsyncIterator[bytes]:
+        if is_legacy_path(ref):
+            async for chunk in _read_local_file(str(ref).strip(), self.chunk_size):
+                yield chunk
+            return
+        async for chunk in self._read_stream(normalize_key(ref)):
+            yield chunk
+
+    async def read_bytes(self, ref: str) -> bytes:
+        return b"".join([chunk async for chunk in self.read_stream(ref)])
+
+    async def exists(self, ref: str) -> bool:
+        if is_legacy_path(ref):
+            return await aiofiles.os.path.exists(str(ref).strip())
+        return await self._exists(normalize_key(ref))
+
+    async def delete(self, ref: str) -> None:
+        if is_legacy_path(ref):
+            try:
+                await aiofiles.os.remove(str(ref).strip())
+            except FileNotFoundError:
+                pass
+            return
+        await self._delete(normalize_key(ref))
+
+    def local_path(self, ref: str) -> Optional[str]:
+        """اگر فایل روی دیسک همین سرور باشد مسیر آن، وگرنه None."""
+        if is_legacy_path(ref):
+            return str(ref).strip()
+        return None
+
+
+async def _read_local_file(path: str, chunk_size: int) -> AsyncIterator[bytes]:
+    try:
+        async with aiofiles.open(path, "rb") as f:
+            while chunk := await f.read(chunk_size):
+                yield chunk
+    except FileNotFoundError as e:
+        raise ObjectNotFoundError(path) from e
@@ -0,0 +1,485 @@
+# app/storage/content.py
+import asyncio
+import hashlib
+import logging
+import os
+import posixpath
+import sqlite3
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import AsyncIterable, Dict, List, Optional, Tuple
+
+from aiogram import Bot
+
+from .base import IMAGE_DERIVATIVES, AttachmentStorage, derivative_key, normalize_key
+from .telegram import telegram_file_chunks
+
+# همه فایل‌های یکتا زیر این پیشوند و با نام هش محتوا ذخیره می‌شوند: objects/ab/cd/<sha256><ext>
+OBJECTS_PREFIX = "objects"
+# دو سطح پوشه از ابتدای هش (256 × 256 پوشه) تا هیچ پوشه‌ای با رشد تعداد بیماران بیش از حد بزرگ نشود
+FANOUT_LEVELS = 2
+
+
+class ContentStore:
+    """
+    ذخیره‌سازی بدون تکرار پیوست‌ها روی یک AttachmentStorage.
+
+    - هر محتوای یکتا فقط یک بار با کلید objects/ab/cd/<sha256><ext> ذخیره می‌شود (پوشه‌بندی با ابتدای هش).
+    - file_unique_id تلگرام (که برای یک فایل بین همه ربات‌ها و پیام‌ها ثابت است) به هش محتوا نگاشت می‌شود؛
+      فایل تکراری (ارسال دوباره رسید، آلبوم فوروارد شده، تلاش مجدد) اصلاً دانلود نمی‌شود.
+    - هر بار که پیام/رکوردی به یک فایل ارجاع می‌دهد refcount آن زیاد می‌شود و release() آن را کم می‌کند؛
+      فایلی که دیگر ارجاعی ندارد (همراه preview/thumb آن) از storage حذف می‌شود. پیام تلگرامی که فایل با آن رسیده در message_files
+      ثبت می‌شود، پس پردازش دوباره همان پیام ارجاع اضافه‌ای نمی‌سازد.
+    - مسیرها/کلیدهای قدیمی (که در API ثبت شده‌اند و قابل تغییر نیستند) بعد از مهاجرت با resolve() به کلید جدید می‌رسند.
+    - وجود فایل‌های ایندکس شده از روی ایندکس جواب داده می‌شود، بدون stat روی دیسک یا HEAD روی S3.
+    - بیماری که عکس در پرونده‌اش نمایش داده شده در blob_owners ثبت می‌شود؛ فایل اصلی فقط برای همان پرونده فرستاده می‌شود.
+    - درخواست‌های همزمان برای یک فایل فقط یک بار دانلود و نوشته می‌شوند.
+    - ایندکس در SQLite (یک ترد اختصاصی + WAL) نگه داشته می‌شود، مثل FileIdCache.
+      این ایندکس فقط روی همین سرور است (حتی وقتی فایل‌ها در S3 هستند)، پس همه نمونه‌های ربات که از یک storage
+      استفاده می‌کنند باید روی یک سرور با یک ATTACHMENT_INDEX_PATH اجرا شوند؛ دو ایندکس جدا refcountهای
+      یکدیگر را نمی‌بینند و release() ممکن است فایلی را که ایندکس دیگر به آن ارجاع دارد حذف کند.
+    """
+
+    def __init__(self, storage: AttachmentStorage, index_path: str, spool_max_size: int = 4 * 1024 * 1024):
+        self.storage = storage
+        self.spool_max_size = spool_max_size
+        self._index_path = index_path
+        # یک ترد اختصاصی؛ sqlite3 روی یک اتصال باید سریالی استفاده شود
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="content-store")
+        self._conn: Optional[sqlite3.Connection] = None
+        self._locks: Dict[str, Tuple[asyncio.Lock, int]] = {}
+        self.message_hits = 0
+        self.unique_id_hits = 0
+        self.content_hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+
+    @staticmethod
+    def key_for(content_hash: str, ext: str = "") -> str:
+        shards = [content_hash[i * 2:i * 2 + 2] for i in range(FANOUT_LEVELS)]
+        return normalize_key("/".join([OBJECTS_PREFIX, *shards, f"{content_hash}{ext.lower()}"]))
+
+    # --- ایندکس SQLite ---
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self._index_path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS blobs ("
+                " hash TEXT PRIMARY KEY,"
+                " key TEXT NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " refcount INTEGER NOT NULL,"
+                " created_at REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS telegram_files ("
+                " file_unique_id TEXT PRIMARY KEY,"
+                " hash TEXT NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS message_files ("
+                " chat_id INTEGER NOT NULL,"
+                " message_id INTEGER NOT NULL,"
+                " hash TEXT NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " PRIMARY KEY (chat_id, message_id, hash))"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS legacy_refs ("
+                " ref TEXT PRIMARY KEY,"
+                " hash TEXT NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS blob_owners ("
+                " hash TEXT NOT NULL,"
+                " owner_id INTEGER NOT NULL,"
+                " PRIMARY KEY (hash, owner_id))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS telegram_files_hash ON telegram_files (hash)")
+            conn.execute("CREATE INDEX IF NOT EXISTS message_files_hash ON message_files (hash)")
+            conn.execute("CREATE INDEX IF NOT EXISTS legacy_refs_hash ON legacy_refs (hash)")
+            conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS blobs_key ON blobs (key)")
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    def _blob_by_unique_id_sync(self, file_unique_id: str) -> Optional[Tuple[str, str, int]]:
+        return self._connect().execute(
+            "SELECT b.hash, b.key, b.size FROM telegram_files t JOIN blobs b ON b.hash = t.hash "
+            "WHERE t.file_unique_id = ?",
+            (file_unique_id,),
+        ).fetchone()
+
+    def _blob_by_hash_sync(self, content_hash: str) -> Optional[Tuple[str, str, int]]:
+        return self._connect().execute(
+            "SELECT hash, key, size FROM blobs WHERE hash = ?", (content_hash,)
+        ).fetchone()
+
+    def _hash_for_key_sync(self, key: str) -> Optional[str]:
+        row = self._connect().execute("SELECT hash FROM blobs WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _add_reference_sync(
+            self, content_hash: str, key: str, size: int, message: Optional[Tuple[int, int]] = None
+    ) -> None:
+        with self._connect() as conn:
+            if message is not None:
+                linked = conn.execute(
+                    "INSERT OR IGNORE INTO message_files (chat_id, message_id, hash, created_at) VALUES (?, ?, ?, ?)",
+                    (message[0], message[1], content_hash, time.time()),
+                ).rowcount
+                exists = conn.execute("SELECT 1 FROM blobs WHERE hash = ?", (content_hash,)).fetchone()
+                if not linked and exists:
+                    # همین پیام قبلاً پردازش شده؛ ارجاع تازه‌ای نیست
+                    return
+            conn.execute(
+                "INSERT INTO blobs (hash, key, size, refcount, created_at) VALUES (?, ?, ?, 1, ?) "
+                "ON CONFLICT(hash) DO UPDATE SET refcount = refcount + 1",
+                (content_hash, key, size, time.time()),
+            )
+
+    def _link_unique_id_sync(self, file_unique_id: str, content_hash: str) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO telegram_files (file_unique_id, hash) VALUES (?, ?) "
+                "ON CONFLICT(file_unique_id) DO UPDATE SET hash = excluded.hash",
+                (file_unique_id, content_hash),
+            )
+
+    def _release_sync(self, key: str, message: Optional[Tuple[int, int]] = None) -> Optional[str]:
+        """refcount را کم می‌کند؛ اگر به صفر برسد رکورد حذف و کلید برای پاک شدن از storage برگردانده می‌شود."""
+        with self._connect() as conn:
+            row = conn.execute("SELECT hash, refcount FROM blobs WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            content_hash, refcount = row
+            if message is not None:
+                # اگر همان پیام دوباره پردازش شود باید دوباره ارجاع حساب شود
+                conn.execute(
+                    "DELETE FROM message_files WHERE chat_id = ? AND message_id = ? AND hash = ?",
+                    (message[0], message[1], content_hash),
+                )
+            if refcount > 1:
+                conn.execute("UPDATE blobs SET refcount = refcount - 1 WHERE hash = ?", (content_hash,))
+                return None
+            for table in ("blobs", "telegram_files", "message_files", "legacy_refs", "blob_owners"):
+                conn.execute(f"DELETE FROM {table} WHERE hash = ?", (content_hash,))
+            return key
+
+    def _resolve_sync(self, ref: str) -> Optional[str]:
+        row = self._connect().execute(
+            "SELECT b.key FROM legacy_refs l JOIN blobs b ON b.hash = l.hash WHERE l.ref = ?", (ref,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def _is_indexed_sync(self, key: str) -> bool:
+        return self._connect().execute("SELECT 1 FROM blobs WHERE key = ?", (key,)).fetchone() is not None
+
+    def _files_for_message_sync(self, chat_id: int, message_id: int) -> List[str]:
+        rows = self._connect().execute(
+            "SELECT b.key FROM message_files m JOIN blobs b ON b.hash = m.hash "
+            "WHERE m.chat_id = ? AND m.message_id = ? ORDER BY m.created_at",
+            (chat_id, message_id),
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def _link_owner_sync(self, hashes: List[str], owner_id: int) -> None:
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO blob_owners (hash, owner_id) VALUES (?, ?)",
+                [(content_hash, owner_id) for content_hash in hashes],
+            )
+
+    def _is_owner_sync(self, content_hash: str, owner_id: int) -> bool:
+        return self._connect().execute(
+            "SELECT 1 FROM blob_owners WHERE hash = ? AND owner_id = ?", (content_hash, owner_id)
+        ).fetchone() is not None
+
+    def _add_legacy_refs_sync(self, refs: List[str], content_hash: str) -> None:
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT INTO legacy_refs (ref, hash) VALUES (?, ?) ON CONFLICT(ref) DO UPDATE SET hash = excluded.hash",
+                [(ref, content_hash) for ref in refs],
+            )
+
+    def _move_blob_sync(self, content_hash: str, new_key: str) -> None:
+        with self._connect() as conn:
+            conn.execute("UPDATE blobs SET key = ? WHERE hash = ?", (new_key, content_hash))
+
+    def _totals_sync(self) -> Tuple[int, int, int]:
+        row = self._connect().execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(refcount), 0) FROM blobs"
+        ).fetchone()
+        return row[0], row[1], row[2]
+
+    # --- قفل برای هر فایل ---
+
+    @asynccontextmanager
+    async def _locked(self, name: str):
+        lock, users = self._locks.get(name, (asyncio.Lock(), 0))
+        self._locks[name] = (lock, users + 1)
+        try:
+            async with lock:
+                yield
+        finally:
+            lock, users = self._locks[name]
+            if users <= 1:
+                del self._locks[name]
+            else:
+                self._locks[name] = (lock, users - 1)
+
+    # --- API عمومی ---
+
+    async def _acquire_existing(
+            self, blob: Optional[Tuple[str, str, int]], message: Optional[Tuple[int, int]] = None
+    ) -> Optional[str]:
+        """اگر فایل قبلاً ذخیره شده و هنوز در storage هست، یک ارجاع به آن اضافه و کلیدش را برمی‌گرداند."""
+        if blob is None:
+            return None
+        content_hash, key, size = blob
+        if not await self.storage.exists(key):
+            logging.warning(f"Indexed attachment {key} is missing from storage; storing it again.")
+            return None
+        await self._run(self._add_reference_sync, content_hash, key, size, message)
+        self.bytes_saved += size
+        return key
+
+    @staticmethod
+    def _message(chat_id: Optional[int], message_id: Optional[int]) -> Optional[Tuple[int, int]]:
+        return (int(chat_id), int(message_id)) if chat_id is not None and message_id is not None else None
+
+    async def put_stream(
+            self,
+            chunks: AsyncIterable[bytes],
+            ext: str = "",
+            chat_id: Optional[int] = None,
+            message_id: Optional[int] = None,
+    ) -> str:
+        """
+        محتوا را ذخیره (یا اگر قبلاً ذخیره شده فقط ارجاع آن را اضافه) می‌کند و کلید objects/ab/cd/<hash><ext> را برمی‌گرداند.
+        """
+        return (await self._put_stream(chunks, ext, self._message(chat_id, message_id)))[1]
+
+    async def _put_stream(
+            self, chunks: AsyncIterable[bytes], ext: str, message: Optional[Tuple[int, int]] = None
+    ) -> Tuple[str, str]:
+        # هش فقط بعد از خواندن کل محتوا معلوم است؛ محتوا تا آن موقع در spool (حافظه، بعد دیسک موقت) می‌ماند
+        with tempfile.SpooledTemporaryFile(max_size=self.spool_max_size) as spool:
+            digest = hashlib.sha256()
+            size = 0
+            async for chunk in chunks:
+                digest.update(chunk)
+                spool.write(chunk)
+                size += len(chunk)
+            content_hash = digest.hexdigest()
+
+            async with self._locked(f"hash:{content_hash}"):
+                blob = await self._run(self._blob_by_hash_sync, content_hash)
+                if blob is not None:
+                    key = await self._acquire_existing(blob, message)
+                    if key is not None:
+                        self.content_hits += 1
+                        return content_hash, key
+                    # رکورد هست ولی فایل از storage پاک شده؛ در همان کلید دوباره نوشته می‌شود
+                    key = blob[1]
+                else:
+                    key = self.key_for(content_hash, ext)
+                spool.seek(0)
+
+                async def spooled():
+                    while data := spool.read(self.storage.chunk_size):
+                        yield data
+
+                await self.storage.write_stream(key, spooled())
+                await self._run(self._add_reference_sync, content_hash, key, size, message)
+                self.misses += 1
+                return content_hash, key
+
+    async def put_telegram_file(
+            self,
+            bot: Bot,
+            file_id: str,
+            file_unique_id: Optional[str] = None,
+            default_ext: str = "",
+            timeout: float = 30,
+            chat_id: Optional[int] = None,
+            message_id: Optional[int] = None,
+    ) -> str:
+        """
+        فایل تلگرام را بدون تکرار ذخیره می‌کند و کلید آن را برمی‌گرداند.
+        اگر file_unique_id از قبل شناخته شده باشد، نه get_file صدا زده می‌شود و نه فایلی دانلود می‌شود.
+        chat_id/message_id پیامی که فایل با آن رسیده در ایندکس پیام‌ها ثبت می‌شود؛ اگر همان پیام قبلاً ذخیره
+        شده باشد کلید قبلی بدون هیچ درخواستی به تلگرام برگردانده می‌شود.
+        """
+        message = self._message(chat_id, message_id)
+        if message is not None:
+            # همین پیام قبلاً ذخیره شده (مثلاً آپدیتی که تلگرام دوباره فرستاده)؛ نه دانلود لازم است نه ارجاع تازه
+            stored = await self.files_for_message(*message)
+            if stored:
+                self.message_hits += 1
+                return stored[0]
+        if file_unique_id:
+            async with self._locked(f"unique:{file_unique_id}"):
+                key = await self._acquire_existing(
+                    await self._run(self._blob_by_unique_id_sync, file_unique_id), message
+                )
+            if key is not None:
+                self.unique_id_hits += 1
+                return key
+
+        file_info = await bot.get_file(file_id)
+        file_unique_id = file_info.file_unique_id or file_unique_id
+        async with self._locked(f"unique:{file_unique_id}"):
+            key = await self._acquire_existing(await self._run(self._blob_by_unique_id_sync, file_unique_id), message)
+            if key is not None:
+                self.unique_id_hits += 1
+                return key
+
+            ext = os.path.splitext(file_info.file_path or "")[1] or default_ext
+            chunks = telegram_file_chunks(bot, file_info.file_path, self.storage.chunk_size, timeout)
+            try:
+                content_hash, key = await self._put_stream(chunks, ext, message)
+            finally:
+                await chunks.aclose()
+            if file_unique_id:
+                await self._run(self._link_unique_id_sync, file_unique_id, content_hash)
+            return key
+
+    async def resolve(self, ref: str) -> str:
+        """
+        مرجع ثبت شده در API (کلید یا مسیر مطلق قدیمی) را به کلید فعلی فایل تبدیل می‌کند.
+        مراجعی که مهاجرت نکرده‌اند همان‌طور برگردانده می‌شوند.
+        """
+        ref = str(ref).strip()
+        try:
+            return await self._run(self._resolve_sync, ref) or ref
+        except sqlite3.Error as e:
+            logging.error(f"Content store lookup failed for {ref}: {e}")
+            return ref
+
+    async def exists(self, ref: str) -> bool:
+        """وجود فایل؛ برای فایل‌های ایندکس شده بدون دسترسی به storage (stat یا HEAD)."""
+        key = await self.resolve(ref)
+        if key.startswith(f"{OBJECTS_PREFIX}/") and await self._run(self._is_indexed_sync, key):
+            return True
+        return await self.storage.exists(key)
+
+    async def blob_for(self, ref: str) -> Optional[Tuple[str, str]]:
+        """(هش، کلید فعلی) فایل ایندکس شده‌ای که این مرجع به آن می‌رسد، یا None."""
+        key = await self.resolve(ref)
+        try:
+            content_hash = await self._run(self._hash_for_key_sync, key)
+        except sqlite3.Error as e:
+            logging.error(f"Content store lookup failed for {ref}: {e}")
+            return None
+        return (content_hash, key) if content_hash else None
+
+    async def key_for_hash(self, content_hash: str) -> Optional[str]:
+        """کلید فایل با این هش محتوا، یا None اگر ایندکس نشده است."""
+        blob = await self._run(self._blob_by_hash_sync, content_hash)
+        return blob[1] if blob else None
+
+    async def files_for_message(self, chat_id: int, message_id: int) -> List[str]:
+        """کلید فایل‌هایی که با این پیام تلگرام ذخیره شده‌اند."""
+        return await self._run(self._files_for_message_sync, int(chat_id), int(message_id))
+
+    async def link_owner(self, hashes: List[str], owner_id: int) -> None:
+        """این فایل‌ها در پرونده بیمار owner_id (شناسه تلگرام) نمایش داده شده‌اند و او و مشاورش می‌توانند فایل اصلی را بگیرند."""
+        if hashes:
+            await self._run(self._link_owner_sync, list(hashes), int(owner_id))
+
+    async def is_owner(self, content_hash: str, owner_id: int) -> bool:
+        return await self._run(self._is_owner_sync, content_hash, int(owner_id))
+
+    async def release(self, key: str, chat_id: Optional[int] = None, message_id: Optional[int] = None) -> None:
+        """
+        یک ارجاع به فایل را برمی‌دارد؛ فایل بدون ارجاع از storage حذف می‌شود.
+        chat_id/message_id پیامی که این ارجاع را ساخته بود از ایندکس پیام‌ها هم حذف می‌شود.
+        """
+        key = normalize_key(await self.resolve(key))
+        content_hash = await self._run(self._hash_for_key_sync, key)
+        if content_hash is None:
+            return
+        # با همان قفل put_stream تا فایلی که همزمان دوباره ذخیره می‌شود پاک نشود
+        async with self._locked(f"hash:{content_hash}"):
+            orphan = await self._run(self._release_sync, key, self._message(chat_id, message_id))
+            if orphan is not None:
+                await self.storage.delete(orphan)
+                for kind in IMAGE_DERIVATIVES:
+                    await self.storage.delete(derivative_key(orphan, kind))
+
+    # --- مهاجرت فایل‌های قدیمی (python -m app.storage.migrate) ---
+
+    def _blob_keys_sync(self) -> List[Tuple[str, str]]:
+        return self._connect().execute("SELECT hash, key FROM blobs").fetchall()
+
+    async def blob_keys(self) -> List[str]:
+        """کلید همه فایل‌های ایندکس شده (برای ابزارهای نگهداری مثل ساخت preview عکس‌های قدیمی)."""
+        return [key for _, key in await self._run(self._blob_keys_sync)]
+
+    async def adopt_legacy(self, chunks: AsyncIterable[bytes], ext: str, refs: List[str]) -> str:
+        """
+        یک فایل قدیمی را وارد ذخیره‌سازی محتوایی می‌کند و مراجع قدیمی آن (کلید/مسیر مطلق ثبت شده در API)
+        را به فایل جدید نگاشت می‌کند تا تاریخچه‌ها همچنان پیدا شوند.
+        """
+        content_hash, key = await self._put_stream(chunks, ext)
+        await self._run(self._add_legacy_refs_sync, [str(ref).strip() for ref in refs], content_hash)
+        return key
+
+    async def reshard(self) -> int:
+        """فایل‌هایی که هنوز در چیدمان قبلی (objects/<hash>) هستند را به objects/ab/cd/<hash> منتقل می‌کند."""
+        moved = 0
+        for content_hash, old_key in await self._run(self._blob_keys_sync):
+            new_key = self.key_for(content_hash, posixpath.splitext(old_key)[1])
+            if new_key == old_key:
+                continue
+            async with self._locked(f"hash:{content_hash}"):
+                if not await self.storage.exists(new_key):
+                    await self.storage.write_stream(new_key, self.storage.read_stream(old_key))
+                await self._run(self._move_blob_sync, content_hash, new_key)
+                await self._run(self._add_legacy_refs_sync, [old_key], content_hash)
+                await self.storage.delete(old_key)
+                for kind in IMAGE_DERIVATIVES:
+                    old_derivative = derivative_key(old_key, kind)
+                    if await self.storage.exists(old_derivative):
+                        await self.storage.write_stream(
+                            derivative_key(new_key, kind), self.storage.read_stream(old_derivative)
+                        )
+                        await self.storage.delete(old_derivative)
+            moved += 1
+        return moved
+
+    async def stats(self) -> dict:
+        blobs, stored_bytes, references = await self._run(self._totals_sync)
+        return {
+            "blobs": blobs,
+            "stored_bytes": stored_bytes,
+            "references": references,
+            "message_hits": self.message_hits,
+            "unique_id_hits": self.unique_id_hits,
+            "content_hits": self.content_hits,
+            "misses": self.misses,
+            "bytes_saved": self.bytes_saved,
+        }
+
+    def _close_sync(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    async def close(self) -> None:
+        try:
+            logging.info(f"Content store closed: {await self.stats()}")
+        except sqlite3.Error:
+            pass
+        await self._run(self._close_sync)
+        self._executor.shutdown(wait=True)
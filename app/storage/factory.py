@@ -0,0 +1,41 @@
+# app/storage/factory.py
+import logging
+
+from app.core.setting import settings
+
+from .base import AttachmentStorage
+from .local import LocalStorage
+from .s3 import S3Storage
+
+
+def build_attachment_storage() -> AttachmentStorage:
+    """بک‌اند ذخیره‌سازی پیوست‌ها را بر اساس `settings.STORAGE_BACKEND` می‌سازد."""
+    backend = settings.STORAGE_BACKEND
+
+    if backend == "local":
+        storage = LocalStorage(settings.STORAGE_LOCAL_ROOT, chunk_size=settings.STORAGE_CHUNK_SIZE)
+    elif backend == "s3":
+        if not settings.S3_BUCKET:
+            raise ValueError("STORAGE_BACKEND=s3 requires S3_BUCKET.")
+        access_key = settings.S3_ACCESS_KEY.get_secret_value() if settings.S3_ACCESS_KEY else ""
+        secret_key = settings.S3_SECRET_KEY.get_secret_value() if settings.S3_SECRET_KEY else ""
+        endpoint_url, transport = settings.S3_ENDPOINT_URL, None
+        if endpoint_url.startswith("memory://"):
+            # شبیه‌ساز داخل پروسه؛ محتوا با ری‌استارت پاک می‌شود (فقط برای توسعه و تست)
+            from .fake_s3 import FakeS3
+            transport = FakeS3(access_key, secret_key, region=settings.S3_REGION).transport()
+            endpoint_url = "http://fake-s3"
+        storage = S3Storage(
+            endpoint_url,
+            settings.S3_BUCKET,
+            access_key,
+            secret_key,
+            region=settings.S3_REGION,
+            transport=transport,
+            chunk_size=settings.STORAGE_CHUNK_SIZE,
+        )
+    else:
+        raise ValueError(f"Unknown attachment storage backend: {backend!r}")
+
+    logging.info(f"Attachment storage backend: {backend}")
+    return storage
@@ -0,0 +1,74 @@
+# app/storage/fake_s3.py
+import re
+from typing import Dict, Optional
+from urllib.parse import unquote
+
+import httpx
+
+from .s3 import sign_v4
+
+_AUTH_RE = re.compile(r"Credential=(?P<access>[^/]+)/[^,]+, SignedHeaders=(?P<signed>[^,]+), Signature=(?P<sig>[0-9a-f]+)")
+
+
+class FakeS3:
+    """
+    شبیه‌ساز درون‌پروسه‌ای S3 برای تست و توسعه محلی (S3_ENDPOINT_URL=memory://)، مشابه fakeredis برای FSM.
+    به عنوان handler برای httpx.MockTransport استفاده می‌شود:
+
+        fake = FakeS3(access_key, secret_key)
+        storage = S3Storage("http://fake-s3", "bucket", access_key, secret_key, transport=fake.transport())
+
+    PUT / GET / HEAD / DELETE روی آدرس path-style پشتیبانی می‌شوند و امضای SigV4 هر درخواست بررسی می‌شود.
+    """
+
+    def __init__(self, access_key: str, secret_key: str, region: str = "us-east-1"):
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.region = region
+        self.objects: Dict[str, Dict[str, bytes]] = {}
+
+    def transport(self) -> httpx.MockTransport:
+        return httpx.MockTransport(self.handle)
+
+    def _authorized(self, request: httpx.Request) -> bool:
+        match = _AUTH_RE.search(request.headers.get("authorization", ""))
+        if not match or match.group("access") != self.access_key:
+            return False
+        signed_headers = {
+            name: request.headers.get(name, "")
+            for name in match.group("signed").split(";") if name != "host"
+        }
+        expected = sign_v4(
+            request.method, request.url.netloc.decode("ascii"), request.url.raw_path.decode("ascii").split("?")[0],
+            request.url.query.decode("ascii"), signed_headers, self.access_key, self.secret_key, self.region,
+        )
+        return expected.endswith(f"Signature={match.group('sig')}")
+
+    def _split(self, request: httpx.Request) -> Optional[tuple]:
+        parts = unquote(request.url.path).lstrip("/").split("/", 1)
+        if len(parts) != 2 or not parts[1]:
+            return None
+        return parts[0], parts[1]
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        if not self._authorized(request):
+            return httpx.Response(403, text="SignatureDoesNotMatch")
+        target = self._split(request)
+        if target is None:
+            return httpx.Response(400, text="InvalidRequest")
+        bucket, key = target
+        objects = self.objects.setdefault(bucket, {})
+
+        if request.method == "PUT":
+            objects[key] = await request.aread()
+            return httpx.Response(200)
+        if request.method == "DELETE":
+            objects.pop(key, None)
+            return httpx.Response(204)
+        if key not in objects:
+            return httpx.Response(404, text="NoSuchKey")
+        if request.method == "HEAD":
+            return httpx.Response(200, headers={"content-length": str(len(objects[key]))})
+        if request.method == "GET":
+            return httpx.Response(200, content=objects[key])
+        return httpx.Response(405)
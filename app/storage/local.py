@@ -0,0 +1,60 @@
+# app/storage/local.py
+import os
+import uuid
+from typing import AsyncIterable, AsyncIterator, Optional
+
+import aiofiles
+import aiofiles.os
+
+from .base import DEFAULT_CHUNK_SIZE, AttachmentStorage, _read_local_file, is_legacy_path, normalize_key
+
+
+class LocalStorage(AttachmentStorage):
+    """
+    بک‌اند دیسک محلی. کلید patient_files/123/a.jpg در <root>/patient_files/123/a.jpg ذخیره می‌شود
+    (با root پیش‌فرض "." همان مسیرهای قبلی ربات).
+    همه عملیات دیسک با aiofiles در ترد جداگانه انجام می‌شوند و نوشتن اتمیک است (فایل موقت + replace).
+    """
+
+    def __init__(self, root: str = ".", chunk_size: int = DEFAULT_CHUNK_SIZE):
+        super().__init__(chunk_size=chunk_size)
+        self.root = os.path.abspath(root)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, *key.split("/"))
+
+    async def _write_stream(self, key: str, chunks: AsyncIterable[bytes]) -> int:
+        path = self._path(key)
+        await aiofiles.os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.part"
+        written = 0
+        try:
+            async with aiofiles.open(tmp_path, "wb") as f:
+                async for chunk in chunks:
+                    await f.write(chunk)
+                    written += len(chunk)
+            await aiofiles.os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                await aiofiles.os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+        return written
+
+    def _read_stream(self, key: str) -> AsyncIterator[bytes]:
+        return _read_local_file(self._path(key), self.chunk_size)
+
+    async def _exists(self, key: str) -> bool:
+        return await aiofiles.os.path.exists(self._path(key))
+
+    async def _delete(self, key: str) -> None:
+        try:
+            await aiofiles.os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def local_path(self, ref: str) -> Optional[str]:
+        if is_legacy_path(ref):
+            return str(ref).strip()
+        return self._path(normalize_key(ref))
@@ -0,0 +1,142 @@
+# app/storage/migrate.py
+"""
+انتقال فایل‌های قدیمی به ذخیره‌سازی محتوایی (objects/ab/cd/<sha256><ext>).
+
+    python -m app.storage.migrate            # انتقال patient_files/ و objects/<hash> قدیمی
+    python -m app.storage.migrate --dry-run  # فقط گزارش: تعداد فایل‌ها، حجم و بزرگ‌ترین پوشه‌ها
+    python -m app.storage.migrate --keep     # کپی بدون حذف فایل‌های قدیمی
+    python -m app.storage.migrate --previews # ساخت preview/thumb برای عکس‌هایی که هنوز ندارند (نیازمند Pillow)
+
+مسیرهای ثبت شده در API (کلید patient_files/... یا مسیر مطلق قدیمی) تغییر نمی‌کنند؛
+هر دو شکل در ایندکس به فایل جدید نگاشت می‌شوند و تاریخچه‌ها همچنان پیدا می‌شوند.
+ربات باید هنگام اجرای این ابزار خاموش باشد.
+"""
+import argparse
+import asyncio
+import logging
+import os
+from collections import Counter
+from typing import Iterator, Tuple
+
+from app.core.setting import settings
+
+from app.utils.attachments import attachment_kind
+from app.utils.image_service import ImageProcessingService
+
+from .base import PATIENT_FILES_PREFIX, AttachmentStorage
+from .content import ContentStore
+from .factory import build_attachment_storage
+
+
+def iter_legacy_files(root: str) -> Iterator[Tuple[str, str]]:
+    """(کلید، مسیر مطلق) همه فایل‌های patient_files زیر root؛ فایل‌های نیمه‌کاره (.part) رد می‌شوند."""
+    base = os.path.join(os.path.abspath(root), PATIENT_FILES_PREFIX)
+    for directory, _, filenames in os.walk(base):
+        for filename in sorted(filenames):
+            if filename.endswith(".part"):
+                continue
+            path = os.path.join(directory, filename)
+            relative = os.path.relpath(path, os.path.abspath(root)).replace(os.sep, "/")
+            yield relative, path
+
+
+def _remove_empty_dirs(root: str) -> None:
+    base = os.path.join(os.path.abspath(root), PATIENT_FILES_PREFIX)
+    for directory, _, _ in sorted(os.walk(base), key=lambda item: len(item[0]), reverse=True):
+        if directory != base and not os.listdir(directory):
+            os.rmdir(directory)
+
+
+def report(root: str) -> None:
+    files, total_bytes, per_dir = 0, 0, Counter()
+    for key, path in iter_legacy_files(root):
+        files += 1
+        total_bytes += os.path.getsize(path)
+        per_dir[key.rsplit("/", 1)[0]] += 1
+    print(f"{files} files, {total_bytes / 1024 / 1024:.1f} MB in {len(per_dir)} directories")
+    for directory, count in per_dir.most_common(10):
+        print(f"  {count:6d}  {directory}")
+
+
+async def migrate(storage: AttachmentStorage, store: ContentStore, root: str, keep: bool = False) -> dict:
+    stats = {"files": 0, "bytes": 0, "failed": 0}
+    for key, path in iter_legacy_files(root):
+        try:
+            size = os.path.getsize(path)
+            # هم کلید نسبی (نسخه جدید) و هم مسیر مطلق (نسخه‌های قدیمی) ممکن است در API ثبت شده باشد
+            new_key = await store.adopt_legacy(
+                storage.read_stream(path), os.path.splitext(path)[1], [key, path]
+            )
+            if not keep:
+                os.remove(path)
+            stats["files"] += 1
+            stats["bytes"] += size
+            logging.debug(f"{key} -> {new_key}")
+        except Exception as e:
+            stats["failed"] += 1
+            logging.error(f"Could not migrate {path}: {e}")
+        if stats["files"] and stats["files"] % 500 == 0:
+            logging.info(f"Migrated {stats['files']} files...")
+
+    if not keep:
+        _remove_empty_dirs(root)
+    stats["resharded"] = await store.reshard()
+    return stats
+
+
+async def build_previews(storage: AttachmentStorage, store: ContentStore) -> dict:
+    """preview و thumb همه عکس‌های ایندکس شده را می‌سازد (عکس‌هایی که preview دارند رد می‌شوند)."""
+    image_service = ImageProcessingService(
+        workers=settings.IMAGE_POOL_WORKERS,
+        max_pending=settings.IMAGE_MAX_PENDING,
+        timeout=settings.IMAGE_PROCESS_TIMEOUT,
+        preview_size=settings.IMAGE_PREVIEW_SIZE,
+        thumb_size=settings.IMAGE_THUMB_SIZE,
+        quality=settings.IMAGE_JPEG_QUALITY,
+        max_source_bytes=settings.IMAGE_MAX_SOURCE_MB * 1024 * 1024,
+    )
+    await image_service.start()
+    try:
+        photos = [key for key in await store.blob_keys() if attachment_kind(key) == "photo"]
+        for start in range(0, len(photos), image_service.max_pending):
+            batch = photos[start:start + image_service.max_pending]
+            results = await asyncio.gather(
+                *(image_service.process(storage, key) for key in batch), return_exceptions=True
+            )
+            for key, result in zip(batch, results):
+                if isinstance(result, Exception):
+                    logging.warning(f"Could not build previews for {key}: {result}")
+        return image_service.stats()
+    finally:
+        await image_service.shutdown()
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--root", default=settings.STORAGE_LOCAL_ROOT, help="folder that contains patient_files/")
+    parser.add_argument("--index", default=settings.ATTACHMENT_INDEX_PATH, help="content store index (SQLite)")
+    parser.add_argument("--dry-run", action="store_true", help="only report what would be migrated")
+    parser.add_argument("--keep", action="store_true", help="copy files without deleting the originals")
+    parser.add_argument("--previews", action="store_true", help="also build previews/thumbnails for stored photos")
+    args = parser.parse_args()
+
+    if args.dry_run:
+        report(args.root)
+        return
+
+    storage = build_attachment_storage()
+    store = ContentStore(storage, args.index)
+    try:
+        stats = await migrate(storage, store, args.root, keep=args.keep)
+        if args.previews:
+            stats["previews"] = await build_previews(storage, store)
+        stats.update(await store.stats())
+        logging.info(f"Migration finished: {stats}")
+    finally:
+        await store.close()
+        await storage.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    asyncio.run(main())
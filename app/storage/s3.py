@@ -0,0 +1,165 @@
+# app/storage/s3.py
+import datetime
+import hashlib
+import hmac
+import mimetypes
+import tempfile
+from typing import AsyncIterable, AsyncIterator, Dict, Optional
+from urllib.parse import quote
+
+import httpx
+
+from .base import DEFAULT_CHUNK_SIZE, AttachmentStorage, ObjectNotFoundError, StorageError
+
+# بدنه درخواست امضا نمی‌شود تا آپلود بتواند stream شود (به جای هش کردن کل فایل قبل از ارسال)
+UNSIGNED_PAYLOAD = "UNSIGNED-PAYLOAD"
+
+
+def _hmac(key: bytes, msg: str) -> bytes:
+    return hmac.new(key, msg.encode("utf-8"), hashlib.sha256).digest()
+
+
+def sign_v4(
+        method: str,
+        host: str,
+        canonical_uri: str,
+        canonical_query: str,
+        headers: Dict[str, str],
+        access_key: str,
+        secret_key: str,
+        region: str,
+        service: str = "s3",
+) -> str:
+    """
+    مقدار هدر Authorization طبق AWS Signature Version 4.
+    headers باید x-amz-date و x-amz-content-sha256 را داشته باشد؛ host همیشه امضا می‌شود.
+    """
+    signed = {k.lower(): " ".join(str(v).strip().split()) for k, v in headers.items()}
+    signed["host"] = host
+    signed_names = sorted(signed)
+    canonical_headers = "".join(f"{name}:{signed[name]}\n" for name in signed_names)
+    signed_headers = ";".join(signed_names)
+
+    amz_date = signed["x-amz-date"]
+    canonical_request = "\n".join([
+        method, canonical_uri, canonical_query, canonical_headers, signed_headers, signed["x-amz-content-sha256"],
+    ])
+    scope = f"{amz_date[:8]}/{region}/{service}/aws4_request"
+    string_to_sign = "\n".join([
+        "AWS4-HMAC-SHA256", amz_date, scope, hashlib.sha256(canonical_request.encode("utf-8")).hexdigest(),
+    ])
+
+    signing_key = _hmac(f"AWS4{secret_key}".encode("utf-8"), amz_date[:8])
+    signing_key = _hmac(signing_key, region)
+    signing_key = _hmac(signing_key, service)
+    signing_key = _hmac(signing_key, "aws4_request")
+    signature = hmac.new(signing_key, string_to_sign.encode("utf-8"), hashlib.sha256).hexdigest()
+    return f"AWS4-HMAC-SHA256 Credential={access_key}/{scope}, SignedHeaders={signed_headers}, Signature={signature}"
+
+
+class S3Storage(AttachmentStorage):
+    """
+    بک‌اند سازگار با S3 (AWS S3، MinIO، Ceph و ...) با آدرس‌دهی path-style: <endpoint>/<bucket>/<key>.
+
+    - درخواست‌ها با httpx و امضای SigV4 (UNSIGNED-PAYLOAD) ارسال می‌شوند؛ نیازی به boto3 نیست.
+    - دانلود تکه‌تکه از پاسخ HTTP خوانده می‌شود.
+    - S3 برای PUT به Content-Length نیاز دارد، پس آپلود ابتدا در یک SpooledTemporaryFile جمع می‌شود
+      (تا spool_max_size در حافظه، بیشتر از آن روی دیسک موقت) و سپس تکه‌تکه ارسال می‌شود.
+    - transport برای تست با FakeS3 داخل همین پروسه قابل تعویض است.
+    """
+
+    def __init__(
+            self,
+            endpoint_url: str,
+            bucket: str,
+            access_key: str,
+            secret_key: str,
+            region: str = "us-east-1",
+            transport: Optional[httpx.AsyncBaseTransport] = None,
+            chunk_size: int = DEFAULT_CHUNK_SIZE,
+            spool_max_size: int = 4 * 1024 * 1024,
+            timeout: float = 30.0,
+    ):
+        super().__init__(chunk_size=chunk_size)
+        self.bucket = bucket
+        self.region = region
+        self.spool_max_size = spool_max_size
+        self._access_key = access_key
+        self._secret_key = secret_key
+        self._client = httpx.AsyncClient(base_url=endpoint_url, transport=transport, timeout=timeout)
+        self._host = self._client.base_url.netloc.decode("ascii")
+
+    def _object_path(self, key: str) -> str:
+        return quote(f"/{self.bucket}/{key}", safe="/")
+
+    def _build_request(self, method: str, key: str, headers: Optional[Dict[str, str]] = None,
+                       content=None) -> httpx.Request:
+        path = self._object_path(key)
+        amz_headers = {
+            "x-amz-date": datetime.datetime.now(datetime.timezone.utc).strftime("%Y%m%dT%H%M%SZ"),
+            "x-amz-content-sha256": UNSIGNED_PAYLOAD,
+        }
+        authorization = sign_v4(
+            method, self._host, path, "", amz_headers, self._access_key, self._secret_key, self.region,
+        )
+        all_headers = {**(headers or {}), **amz_headers, "authorization": authorization}
+        return self._client.build_request(method, path, headers=all_headers, content=content)
+
+    async def _send(self, request: httpx.Request, stream: bool = False) -> httpx.Response:
+        try:
+            return await self._client.send(request, stream=stream)
+        except httpx.HTTPError as e:
+            raise StorageError(f"S3 {request.method} {request.url.path} failed: {e!r}") from e
+
+    @staticmethod
+    def _raise_for_status(response: httpx.Response, key: str) -> None:
+        if response.status_code == 404:
+            raise ObjectNotFoundError(key)
+        if response.status_code >= 400:
+            raise StorageError(f"S3 {response.request.method} {key} returned {response.status_code}")
+
+    async def _write_stream(self, key: str, chunks: AsyncIterable[bytes]) -> int:
+        with tempfile.SpooledTemporaryFile(max_size=self.spool_max_size) as spool:
+            size = 0
+            async for chunk in chunks:
+                spool.write(chunk)
+                size += len(chunk)
+            spool.seek(0)
+
+            async def body():
+                while data := spool.read(self.chunk_size):
+                    yield data
+
+            content_type = mimetypes.guess_type(key)[0] or "application/octet-stream"
+            request = self._build_request(
+                "PUT", key, headers={"content-length": str(size), "content-type": content_type}, content=body(),
+            )
+            response = await self._send(request)
+            self._raise_for_status(response, key)
+        return size
+
+    async def _read_stream(self, key: str) -> AsyncIterator[bytes]:
+        response = await self._send(self._build_request("GET", key), stream=True)
+        try:
+            if response.status_code >= 400:
+                await response.aread()
+                self._raise_for_status(response, key)
+            async for chunk in response.aiter_bytes(self.chunk_size):
+                yield chunk
+        finally:
+            await response.aclose()
+
+    async def _exists(self, key: str) -> bool:
+        response = await self._send(self._build_request("HEAD", key))
+        if response.status_code == 404:
+            return False
+        self._raise_for_status(response, key)
+        return True
+
+    async def _delete(self, key: str) -> None:
+        response = await self._send(self._build_request("DELETE", key))
+        if response.status_code != 404:
+            self._raise_for_status(response, key)
+
+    async def close(self) -> None:
+        await self._client.aclose()
@@ -0,0 +1,55 @@
+# app/storage/telegram.py
+import posixpath
+from typing import AsyncGenerator, AsyncIterator, Optional
+
+from aiogram import Bot
+from aiogram.types import InputFile
+
+from .base import AttachmentStorage, _read_local_file
+
+
+class StorageInputFile(InputFile):
+    """
+    InputFile آیوگرام که محتوا را مستقیم از بک‌اند ذخیره‌سازی stream می‌کند (جایگزین FSInputFile برای کلیدها).
+    """
+
+    def __init__(self, storage: AttachmentStorage, ref: str, filename: Optional[str] = None):
+        ref = str(ref).strip()
+        super().__init__(filename=filename or posixpath.basename(ref.replace("\\", "/")), chunk_size=storage.chunk_size)
+        self.storage = storage
+        self.ref = ref
+
+    async def read(self, bot: Bot) -> AsyncGenerator[bytes, None]:
+        async for chunk in self.storage.read_stream(self.ref):
+            yield chunk
+
+
+def telegram_file_chunks(
+        bot: Bot, file_path_on_telegram: str, chunk_size: int, timeout: float = 30
+) -> AsyncIterator[bytes]:
+    """محتوای یک فایل تلگرام به صورت تکه‌تکه؛ همان منطق Bot.download_file (سرور محلی Bot API یا دانلود HTTP)."""
+    if bot.session.api.is_local:
+        return _read_local_file(bot.session.api.wrap_local_file.to_local(file_path_on_telegram), chunk_size)
+    return bot.session.stream_content(
+        url=bot.session.api.file_url(bot.token, file_path_on_telegram),
+        timeout=timeout,
+        chunk_size=chunk_size,
+        raise_for_status=True,
+    )
+
+
+async def download_to_storage(
+        bot: Bot,
+        storage: AttachmentStorage,
+        file_path_on_telegram: str,
+        key: str,
+        timeout: float = 30,
+) -> int:
+    """
+    فایل تلگرام را تکه‌تکه مستقیماً در storage می‌نویسد (بدون فایل واسط روی دیسک) و تعداد بایت‌ها را برمی‌گرداند.
+    """
+    chunks = telegram_file_chunks(bot, file_path_on_telegram, storage.chunk_size, timeout)
+    try:
+        return await storage.write_stream(key, chunks)
+    finally:
+        await chunks.aclose()
@@ -0,0 +1,372 @@
+# app/utils/attachments.py
+import base64
+import binascii
+import logging
+import os
+from typing import Iterable, List, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup, InputMediaPhoto, Message
+
+from app.storage import AttachmentStorage, ContentStore, LocalStorage, StorageInputFile, derivative_key
+from app.utils.file_id_cache import FileIdCache
+from app.utils.image_service import ImageProcessingService
+
+PHOTO_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+VOICE_EXTENSIONS = ('.ogg', '.mp3', '.wav', '.m4a')
+
+# دکمه «فایل اصلی» زیر عکس‌های تاریخچه؛ شناسه فایل همان هش محتوا (base64، تا در ۶۴ بایت callback_data جا شود)
+ORIGINAL_CALLBACK_PREFIX = "original:"
+
+
+def attachment_kind(file_path: str) -> str:
+    """نوع ارسال پیوست بر اساس پسوند: photo، voice یا document."""
+    file_ext = os.path.splitext(str(file_path))[1].lower()
+    if file_ext in PHOTO_EXTENSIONS:
+        return "photo"
+    if file_ext in VOICE_EXTENSIONS:
+        return "voice"
+    return "document"
+
+
+def history_caption(file_path: str, sender_title: str) -> str:
+    """کپشن پیوست در نمایش تاریخچه چت (مشترک بین بیمار و مشاور)."""
+    kind = attachment_kind(file_path)
+    if kind == "photo":
+        return f"📷 تصویر ارسالی {sender_title}"
+    if kind == "voice":
+        return f"🎙 ویس ارسالی {sender_title}"
+    return f"📎 فایل ارسالی {sender_title}"
+
+
+def sent_file_id(sent: Message, kind: str) -> Optional[str]:
+    """file_id فایلی که تلگرام برای پیام ارسال شده ثبت کرده (اگر از همان نوع باشد)."""
+    if kind == "photo" and sent.photo:
+        return sent.photo[-1].file_id
+    if kind == "voice" and sent.voice:
+        return sent.voice.file_id
+    if kind == "document" and sent.document:
+        return sent.document.file_id
+    return None
+
+
+async def remember_received_file(
+        file_id_cache: Optional[FileIdCache], file_path: str, file_id: str, kind: str
+) -> None:
+    """
+    file_id پیامی که کاربر فرستاده را برای فایل ذخیره شده آن ثبت می‌کند تا حتی اولین نمایش تاریخچه هم بدون آپلود باشد.
+    فقط وقتی ثبت می‌شود که نوع ارسال فایل (از روی پسوند) با نوع پیام یکی باشد؛ مثلاً ویس با پسوند .oga
+    در تاریخچه به صورت سند فرستاده می‌شود و file_id ویس برای آن قابل استفاده نیست.
+    """
+    if file_id_cache is not None and file_id and attachment_kind(file_path) == kind:
+        await file_id_cache.set(file_path, file_id, kind)
+
+
+def blob_id(content_hash: str) -> str:
+    """شناسه کوتاه فایل در callback_data (هش sha256 به صورت base64 بدون padding، ۴۳ کاراکتر)."""
+    return base64.urlsafe_b64encode(bytes.fromhex(content_hash)).rstrip(b"=").decode()
+
+
+def hash_from_blob_id(value: str) -> Optional[str]:
+    try:
+        raw = base64.urlsafe_b64decode(value + "=" * (-len(value) % 4))
+    except (binascii.Error, ValueError):
+        return None
+    return raw.hex() if len(raw) == 32 else None
+
+
+def original_keyboard(originals: List[Tuple[int, str]]) -> InlineKeyboardMarkup:
+    """
+    دکمه دریافت فایل اصلی برای (شماره عکس، هش محتوا)ها؛ برای یک عکس تنها «فایل اصلی»،
+    برای آلبوم (که دکمه نمی‌پذیرد) یک دکمه شماره‌دار برای هر عکس در یک پیام جدا.
+    """
+    if len(originals) == 1:
+        labels = ["🖼 فایل اصلی"]
+    else:
+        labels = [f"🖼 {number}" for number, _ in originals]
+    buttons = [
+        InlineKeyboardButton(text=label, callback_data=f"{ORIGINAL_CALLBACK_PREFIX}{blob_id(content_hash)}")
+        for label, (_, content_hash) in zip(labels, originals)
+    ]
+    return InlineKeyboardMarkup(inline_keyboard=[buttons[i:i + 5] for i in range(0, len(buttons), 5)])
+
+
+def schedule_previews(
+        image_service: Optional[ImageProcessingService],
+        storage: Optional[AttachmentStorage],
+        keys: Iterable[str],
+) -> None:
+    """برای عکس‌های تازه ذخیره شده preview و thumb در پس‌زمینه ساخته می‌شود (پاسخ به کاربر منتظر نمی‌ماند)."""
+    if image_service is None:
+        return
+    for key in keys:
+        if key and attachment_kind(key) == "photo":
+            image_service.schedule(storage or LocalStorage(), key)
+
+
+async def release_attachments(
+        content_store: Optional[ContentStore],
+        keys: Iterable[Optional[str]],
+        *,
+        chat_id: Optional[int] = None,
+        message_id: Optional[int] = None,
+) -> None:
+    """
+    ارجاع فایل‌هایی که دیگر در هیچ رکورد API نیستند (ثبت ناموفق یا جایگزین شده) برداشته می‌شود؛
+    فایلی که ارجاع دیگری ندارد همراه preview/thumb آن از storage حذف می‌شود.
+    """
+    if content_store is None:
+        return
+    for key in keys:
+        if not key:
+            continue
+        try:
+            await content_store.release(str(key), chat_id=chat_id, message_id=message_id)
+        except Exception as e:
+            logging.error(f"Could not release attachment {key}: {e}")
+
+
+async def _send(bot: Bot, kind: str, chat_id, media, caption: Optional[str],
+                reply_markup: Optional[InlineKeyboardMarkup] = None) -> Message:
+    if kind == "photo":
+        return await bot.send_photo(chat_id=chat_id, photo=media, caption=caption, reply_markup=reply_markup)
+    if kind == "voice":
+        return await bot.send_voice(chat_id=chat_id, voice=media, caption=caption, reply_markup=reply_markup)
+    return await bot.send_document(chat_id=chat_id, document=media, caption=caption, reply_markup=reply_markup)
+
+
+async def _send_cached(
+        bot: Bot, file_id_cache: Optional[FileIdCache], cache_key: str, kind: str, chat_id,
+        caption: Optional[str], reply_markup: Optional[InlineKeyboardMarkup] = None,
+) -> Optional[Message]:
+    """اگر file_id این کلید در کش باشد فقط file_id فرستاده می‌شود؛ file_id رد شده از کش حذف می‌شود."""
+    if file_id_cache is None:
+        return None
+    file_id = await file_id_cache.get(cache_key, kind)
+    if not file_id:
+        return None
+    try:
+        return await _send(bot, kind, chat_id, file_id, caption, reply_markup)
+    except TelegramBadRequest as e:
+        logging.warning(f"Cached file_id for {cache_key} was rejected, uploading again: {e}")
+        await file_id_cache.forget(cache_key)
+        return None
+
+
+async def _locate(
+        file_path: str, storage: AttachmentStorage, content_store: Optional[ContentStore]
+) -> Optional[str]:
+    """کلیدی که فایل الان با آن در storage است (مراجع مهاجرت کرده از ایندکس پیدا می‌شوند)، یا None اگر وجود ندارد."""
+    if content_store is None:
+        return file_path if await storage.exists(file_path) else None
+    source = await content_store.resolve(file_path)
+    return source if await content_store.exists(source) else None
+
+
+async def _indexed_photo(
+        file_path: str,
+        content_store: Optional[ContentStore],
+        image_service: Optional[ImageProcessingService],
+        owner_id: Optional[int],
+) -> Optional[Tuple[str, str]]:
+    """
+    (هش، کلید) عکسی که می‌تواند با preview و دکمه «فایل اصلی» فرستاده شود؛ فقط برای فایل‌های ایندکس شده
+    و وقتی بیمار صاحب پرونده معلوم است (دکمه فقط برای همان پرونده کار می‌کند).
+    """
+    if image_service is None or not image_service.enabled or content_store is None or owner_id is None:
+        return None
+    if attachment_kind(file_path) != "photo":
+        return None
+    return await content_store.blob_for(file_path)
+
+
+def _cache_keys(file_path: str, blob: Optional[Tuple[str, str]]) -> List[str]:
+    # file_id خود فایل (مثلاً عکسی که کاربر فرستاده) و بعد file_id نسخه preview؛ هر دو بدون آپلود فرستاده می‌شوند
+    return [file_path, derivative_key(blob[1], "preview")] if blob else [file_path]
+
+
+async def _upload_source(
+        file_path: str,
+        blob: Optional[Tuple[str, str]],
+        storage: AttachmentStorage,
+        content_store: Optional[ContentStore],
+        image_service: Optional[ImageProcessingService],
+) -> Tuple[str, Optional[str]]:
+    """(کلید کش، کلید storage) فایلی که آپلود می‌شود: preview اگر ساخته شده باشد، وگرنه خود فایل (یا None)."""
+    if blob is not None:
+        key = blob[1]
+        preview_key = derivative_key(key, "preview")
+        if await storage.exists(preview_key):
+            return preview_key, preview_key
+        # عکس قدیمی که هنوز preview ندارد: این بار خود فایل فرستاده و preview برای دفعه بعد ساخته می‌شود
+        image_service.schedule(storage, key)
+        return file_path, key
+    return file_path, await _locate(file_path, storage, content_store)
+
+
+async def send_attachment(
+        bot: Bot,
+        chat_id,
+        file_path: str,
+        caption: Optional[str] = None,
+        *,
+        file_id_cache: Optional[FileIdCache] = None,
+        storage: Optional[AttachmentStorage] = None,
+        content_store: Optional[ContentStore] = None,
+        image_service: Optional[ImageProcessingService] = None,
+        owner_id: Optional[int] = None,
+) -> Message:
+    """
+    یک پیوست ذخیره شده (کلید storage یا مسیر مطلق قدیمی) را می‌فرستد.
+
+    اگر file_id این فایل قبلاً ذخیره شده باشد فقط file_id فرستاده می‌شود (بدون آپلود و بدون خواندن storage)؛
+    در غیر این صورت فایل مستقیماً از storage آپلود و file_id آن برای دفعات بعد ذخیره می‌شود.
+    اگر فایل نه در کش باشد و نه در storage، FileNotFoundError پرتاب می‌شود.
+    با content_store مراجع قدیمیِ مهاجرت کرده به کلید جدید می‌رسند و وجود فایل از روی ایندکس بررسی می‌شود.
+    با image_service عکس‌های ایندکس شده به جای اندازه اصلی با preview و دکمه «فایل اصلی» فرستاده می‌شوند؛
+    owner_id شناسه تلگرام بیماری است که پیوست در پرونده اوست و فایل اصلی فقط در همان پرونده قابل دریافت است.
+    """
+    file_path = str(file_path).strip()
+    kind = attachment_kind(file_path)
+    storage = storage or LocalStorage()
+    blob = await _indexed_photo(file_path, content_store, image_service, owner_id)
+    reply_markup = None
+    if blob:
+        await content_store.link_owner([blob[0]], owner_id)
+        reply_markup = original_keyboard([(1, blob[0])])
+
+    for cache_key in _cache_keys(file_path, blob):
+        sent = await _send_cached(bot, file_id_cache, cache_key, kind, chat_id, caption, reply_markup)
+        if sent is not None:
+            return sent
+
+    cache_key, source = await _upload_source(file_path, blob, storage, content_store, image_service)
+    if source is None:
+        raise FileNotFoundError(file_path)
+
+    media = StorageInputFile(storage, source, filename=os.path.basename(cache_key.replace("\\", "/")))
+    sent = await _send(bot, kind, chat_id, media, caption, reply_markup)
+    if file_id_cache is not None:
+        file_id = sent_file_id(sent, kind)
+        if file_id:
+            await file_id_cache.set(cache_key, file_id, kind)
+    return sent
+
+
+async def send_photo_album(
+        bot: Bot,
+        chat_id,
+        file_paths: List[str],
+        *,
+        file_id_cache: Optional[FileIdCache] = None,
+        storage: Optional[AttachmentStorage] = None,
+        content_store: Optional[ContentStore] = None,
+        image_service: Optional[ImageProcessingService] = None,
+        owner_id: Optional[int] = None,
+) -> List[Message]:
+    """
+    چند عکس را به صورت آلبوم (media group) می‌فرستد؛ عکس‌هایی که file_id دارند دوباره آپلود نمی‌شوند.
+    فایل‌هایی که نه file_id دارند و نه در storage هستند نادیده گرفته می‌شوند.
+    با image_service عکس‌های ایندکس شده با preview فرستاده می‌شوند و دکمه‌های «فایل اصلی» در یک پیام بعد از آلبوم می‌آیند.
+    """
+    storage = storage or LocalStorage()
+    paths = [str(p).strip() for p in file_paths]
+    blobs = [await _indexed_photo(path, content_store, image_service, owner_id) for path in paths]
+    if any(blobs):
+        await content_store.link_owner([blob[0] for blob in blobs if blob], owner_id)
+    cached = {}
+    if file_id_cache is not None:
+        for path, blob in zip(paths, blobs):
+            for cache_key in _cache_keys(path, blob):
+                file_id = await file_id_cache.get(cache_key, "photo")
+                if file_id:
+                    cached[path] = (cache_key, file_id)
+                    break
+
+    async def build_album(use_cache: bool):
+        album, media = [], []
+        for path, blob in zip(paths, blobs):
+            if use_cache and path in cached:
+                cache_key, file_id = cached[path]
+                media.append(InputMediaPhoto(media=file_id))
+            else:
+                cache_key, source = await _upload_source(path, blob, storage, content_store, image_service)
+                if source is None:
+                    continue
+                media.append(InputMediaPhoto(media=StorageInputFile(storage, source)))
+            album.append((path, cache_key, blob[0] if blob else None))
+        return album, media
+
+    album, media = await build_album(use_cache=True)
+    if not media:
+        return []
+
+    try:
+        sent = await bot.send_media_group(chat_id=chat_id, media=media)
+    except TelegramBadRequest as e:
+        if not cached:
+            raise
+        logging.warning(f"Cached album file_ids were rejected, uploading again: {e}")
+        for cache_key, _ in cached.values():
+            await file_id_cache.forget(cache_key)
+        cached.clear()
+        album, media = await build_album(use_cache=False)
+        if not media:
+            return []
+        sent = await bot.send_media_group(chat_id=chat_id, media=media)
+
+    if file_id_cache is not None:
+        for (path, cache_key, _), message in zip(album, sent):
+            file_id = sent_file_id(message, "photo")
+            if path not in cached and file_id:
+                await file_id_cache.set(cache_key, file_id, "photo")
+
+    originals = [(number, content_hash) for number, (_, _, content_hash) in enumerate(album, 1) if content_hash]
+    if originals:
+        await bot.send_message(
+            chat_id=chat_id,
+            text="🖼 برای دریافت فایل اصلی هر تصویر:",
+            reply_markup=original_keyboard(originals),
+        )
+    return sent
+
+
+async def send_original(
+        bot: Bot,
+        chat_id,
+        value: str,
+        *,
+        owner_id: Optional[int],
+        file_id_cache: Optional[FileIdCache] = None,
+        storage: Optional[AttachmentStorage] = None,
+        content_store: Optional[ContentStore] = None,
+) -> Optional[Message]:
+    """
+    فایل اصلی عکسی که با preview نمایش داده شده را با کیفیت کامل (به صورت سند، با thumb) می‌فرستد.
+    value بخش بعد از ORIGINAL_CALLBACK_PREFIX در callback_data است؛ فایل فقط وقتی فرستاده می‌شود که در پرونده
+    بیمار owner_id نمایش داده شده باشد. اگر فایل پیدا نشود یا متعلق به این پرونده نباشد None برمی‌گرداند.
+    """
+    content_hash = hash_from_blob_id(value)
+    if content_hash is None or content_store is None or owner_id is None:
+        return None
+    if not await content_store.is_owner(content_hash, owner_id):
+        logging.warning(f"Original file request for {content_hash} outside the record of {owner_id} was refused.")
+        return None
+    key = await content_store.key_for_hash(content_hash)
+    if key is None:
+        return None
+
+    # file_id سند جدا از file_id عکس همین فایل کش می‌شود
+    cache_key = f"{ORIGINAL_CALLBACK_PREFIX}{key}"
+    sent = await _send_cached(bot, file_id_cache, cache_key, "document", chat_id, None)
+    if sent is not None:
+        return sent
+
+    storage = storage or LocalStorage()
+    thumb_key = derivative_key(key, "thumb")
+    thumbnail = StorageInputFile(storage, thumb_key) if await storage.exists(thumb_key) else None
+    sent = await bot.send_document(chat_id=chat_id, document=StorageInputFile(storage, key), thumbnail=thumbnail)
+    if file_id_cache is not None and sent.document:
+        await file_id_cache.set(cache_key, sent.document.file_id, "document")
+    return sent
@@ -0,0 +1,47 @@
+# app/utils/background.py
+import asyncio
+import logging
+from typing import Awaitable, Optional, Set
+
+
+class BackgroundTasks:
+    """
+    کارهایی که پاسخ کاربر نباید منتظرشان بماند (مثلاً آرشیو فایل‌ها و ثبت پیام در API) اینجا اجرا می‌شوند.
+
+    - یک ارجاع به هر task نگه داشته می‌شود تا GC آن را وسط کار از بین نبرد.
+    - خطای هر task لاگ می‌شود و روی بقیه اثری ندارد.
+    - drain() هنگام خاموش شدن ربات منتظر کارهای باقیمانده می‌ماند (حداکثر timeout ثانیه).
+    """
+
+    def __init__(self):
+        self._tasks: Set[asyncio.Task] = set()
+
+    def spawn(self, coro: Awaitable, name: Optional[str] = None) -> asyncio.Task:
+        task = asyncio.ensure_future(coro)
+        if name:
+            task.set_name(name)
+        self._tasks.add(task)
+        task.add_done_callback(self._done)
+        return task
+
+    def _done(self, task: asyncio.Task) -> None:
+        self._tasks.discard(task)
+        if task.cancelled():
+            return
+        error = task.exception()
+        if error is not None:
+            logging.error(f"Background task '{task.get_name()}' failed: {error!r}", exc_info=error)
+
+    def __len__(self) -> int:
+        return len(self._tasks)
+
+    async def drain(self, timeout: float = 30.0) -> None:
+        if not self._tasks:
+            return
+        logging.info(f"Waiting for {len(self._tasks)} background tasks to finish...")
+        done, pending = await asyncio.wait(set(self._tasks), timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+            logging.warning(f"{len(pending)} background tasks were cancelled at shutdown.")
@@ -0,0 +1,77 @@
+# app/utils/concurrency.py
+import asyncio
+import logging
+from typing import Any, Awaitable, Dict, Optional
+
+
+class FanOutResult:
+    """
+    نتیجه fan_out: مقدار هر فراخوانی موفق در values و خطای هر فراخوانی ناموفق در errors (بر اساس نام).
+    """
+
+    def __init__(self, values: Dict[str, Any], errors: Dict[str, BaseException]):
+        self.values = values
+        self.errors = errors
+
+    def get(self, name: str, default: Any = None) -> Any:
+        """مقدار یک فراخوانی؛ اگر خطا داده یا اجرا نشده باشد default برگردانده می‌شود."""
+        return self.values.get(name, default)
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+
+async def fan_out(calls: Dict[str, Optional[Awaitable[Any]]], timeout: Optional[float] = None) -> FanOutResult:
+    """
+    چند فراخوانی مستقل (مثلاً متدهای APIClient) را همزمان اجرا می‌کند و منتظر همه می‌ماند.
+
+    - خطای یک فراخوانی روی بقیه اثری ندارد و فقط در result.errors ثبت می‌شود.
+    - فراخوانی‌هایی که مقدارشان None است (مثلاً وقتی شناسه‌ای وجود ندارد) نادیده گرفته می‌شوند.
+    - اگر timeout تمام شود، فراخوانی‌های ناتمام لغو و با TimeoutError در errors ثبت می‌شوند.
+    - اگر خود هندلر لغو شود، همه فراخوانی‌های فرزند هم لغو می‌شوند (هیچ task رها نمی‌شود).
+
+    مثال:
+        result = await fan_out({
+            "order": api_client.get_order_by_id(order_id),
+            "patient": api_client.get_patient_details_by_telegram_id(tg_id),
+        })
+        order = result.get("order")
+    """
+    tasks = {
+        name: asyncio.ensure_future(call)
+        for name, call in calls.items()
+        if call is not None
+    }
+    if not tasks:
+        return FanOutResult({}, {})
+
+    try:
+        done, pending = await asyncio.wait(tasks.values(), timeout=timeout)
+    except BaseException:
+        for task in tasks.values():
+            task.cancel()
+        await asyncio.gather(*tasks.values(), return_exceptions=True)
+        raise
+
+    for task in pending:
+        task.cancel()
+    if pending:
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    values: Dict[str, Any] = {}
+    errors: Dict[str, BaseException] = {}
+    for name, task in tasks.items():
+        if task in pending:
+            errors[name] = asyncio.TimeoutError(f"'{name}' did not finish within {timeout}s")
+        elif task.cancelled():
+            errors[name] = asyncio.CancelledError(f"'{name}' was cancelled")
+        elif task.exception() is not None:
+            errors[name] = task.exception()
+        else:
+            values[name] = task.result()
+
+    for name, error in errors.items():
+        logging.error(f"fan_out: call '{name}' failed: {error!r}")
+
+    return FanOutResult(values, errors)
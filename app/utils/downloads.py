@@ -0,0 +1,116 @@
+# app/utils/downloads.py
+import asyncio
+import logging
+import os
+from typing import Awaitable, Callable, List, Optional
+
+from aiogram import Bot
+
+from app.storage import AttachmentStorage, ContentStore, download_to_storage
+
+# (شماره فایل از 1، پسوند فایل در تلگرام مثل ".jpg") -> کلید ذخیره‌سازی
+KeyFor = Callable[[int, str], str]
+ProgressCallback = Callable[[int, int], Awaitable[None]]
+
+
+class DownloadResult:
+    def __init__(self, index: int, file_id: str, key: Optional[str] = None, error: Optional[BaseException] = None):
+        self.index = index
+        self.file_id = file_id
+        self.key = key
+        self.error = error
+
+    @property
+    def ok(self) -> bool:
+        return self.key is not None
+
+
+class DownloadReport:
+    """نتیجه دانلود گروهی؛ ترتیب results همان ترتیب file_idهای ورودی است."""
+
+    def __init__(self, results: List[DownloadResult]):
+        self.results = results
+
+    @property
+    def saved(self) -> List[DownloadResult]:
+        return [r for r in self.results if r.ok]
+
+    @property
+    def saved_keys(self) -> List[str]:
+        return [r.key for r in self.results if r.ok]
+
+    @property
+    def failed(self) -> List[DownloadResult]:
+        return [r for r in self.results if not r.ok]
+
+    @property
+    def ok(self) -> bool:
+        return not self.failed
+
+
+class TelegramDownloader:
+    """
+    دانلود همزمان چند فایل از تلگرام (get_file + دانلود stream در AttachmentStorage) با سقف همزمانی و timeout برای هر فایل.
+
+    - حداکثر concurrency فایل همزمان دانلود می‌شوند.
+    - اگر دانلود یک فایل بیشتر از timeout ثانیه طول بکشد یا خطا بدهد، فقط همان فایل ناموفق ثبت می‌شود
+      (نوشتن در storage اتمیک است، پس فایل نیمه‌کاره باقی نمی‌ماند) و بقیه ادامه پیدا می‌کنند.
+    - بعد از تمام شدن هر فایل (موفق یا ناموفق) on_progress(done, total) صدا زده می‌شود.
+    - با content_store فایل‌ها بدون تکرار در objects/<hash> ذخیره می‌شوند و key_for استفاده نمی‌شود؛
+      فایل تکراری (مثلاً یک عکس که دو بار در آلبوم آمده) فقط یک بار دانلود می‌شود.
+    """
+
+    def __init__(self, concurrency: int = 4, timeout: float = 30.0):
+        self.concurrency = max(1, concurrency)
+        self.timeout = timeout
+
+    async def _download_one(
+            self, bot: Bot, storage: AttachmentStorage, index: int, file_id: str, key_for: KeyFor,
+            content_store: Optional[ContentStore] = None,
+    ) -> DownloadResult:
+        try:
+            async with asyncio.timeout(self.timeout):
+                if content_store is not None:
+                    key = await content_store.put_telegram_file(bot, file_id, default_ext=".jpg", timeout=self.timeout)
+                    return DownloadResult(index, file_id, key)
+
+                file_info = await bot.get_file(file_id)
+                file_path_on_telegram = file_info.file_path
+                file_extension = os.path.splitext(file_path_on_telegram)[1]
+                key = key_for(index, file_extension)
+                await download_to_storage(bot, storage, file_path_on_telegram, key, timeout=self.timeout)
+            return DownloadResult(index, file_id, key)
+        except Exception as e:
+            if isinstance(e, TimeoutError):
+                e = TimeoutError(f"download took longer than {self.timeout}s")
+            logging.error(f"Could not download file {file_id}: {e!r}")
+            return DownloadResult(index, file_id, error=e)
+
+    async def download_many(
+            self,
+            bot: Bot,
+            storage: AttachmentStorage,
+            file_ids: List[str],
+            key_for: KeyFor,
+            on_progress: Optional[ProgressCallback] = None,
+            content_store: Optional[ContentStore] = None,
+    ) -> DownloadReport:
+        total = len(file_ids)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        done = 0
+
+        async def run(index: int, file_id: str) -> DownloadResult:
+            nonlocal done
+            async with semaphore:
+                result = await self._download_one(bot, storage, index, file_id, key_for, content_store)
+            done += 1
+            if on_progress is not None:
+                try:
+                    await on_progress(done, total)
+                except Exception as e:
+                    # خطای نمایش پیشرفت نباید دانلودها را متوقف کند
+                    logging.warning(f"Download progress callback failed: {e}")
+            return result
+
+        results = await asyncio.gather(*(run(i, file_id) for i, file_id in enumerate(file_ids, 1)))
+        return DownloadReport(list(results))
@@ -0,0 +1,136 @@
+# app/utils/file_id_cache.py
+import asyncio
+import logging
+import sqlite3
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
+
+class FileIdCache:
+    """
+    نگاشت ماندگار «فایل محلی پیوست → file_id تلگرام».
+
+    بعد از اولین آپلود هر پیوست (عکس، ویس، سند)، file_id و نوع ارسال آن ذخیره می‌شود تا دفعات بعد
+    (باز کردن دوباره تاریخچه چت) فقط file_id فرستاده شود و فایل دوباره آپلود نشود.
+
+    - رکوردها در SQLite نگه داشته می‌شوند تا با ری‌استارت ربات از بین نروند.
+    - پرکاربردترین رکوردها در یک LRU داخل حافظه هستند؛ بیشتر lookupها به دیسک نمی‌رسند.
+    - نوع (photo/voice/document) هم ذخیره می‌شود، چون file_id یک عکس فقط با send_photo قابل ارسال است.
+    """
+
+    def __init__(self, path: str, memory_size: int = 10000):
+        self._path = path
+        self._memory_size = memory_size
+        self._memory: "OrderedDict[str, Tuple[str, str]]" = OrderedDict()
+        # یک ترد اختصاصی؛ sqlite3 روی یک اتصال باید سریالی استفاده شود
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="file-id-cache")
+        self._conn: Optional[sqlite3.Connection] = None
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key_for(file_path: str) -> str:
+        # کلیدهای storage مستقل از پوشه کاری هستند و مسیرهای مطلق قدیمی همان‌طور که در API ثبت شده‌اند می‌مانند
+        return str(file_path).strip()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self._path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS file_ids ("
+                " path TEXT PRIMARY KEY,"
+                " file_id TEXT NOT NULL,"
+                " kind TEXT NOT NULL,"
+                " updated_at REAL NOT NULL)"
+            )
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    def _remember_in_memory(self, key: str, value: Tuple[str, str]) -> None:
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self._memory_size:
+            self._memory.popitem(last=False)
+
+    def _read_sync(self, key: str) -> Optional[Tuple[str, str]]:
+        row = self._connect().execute("SELECT file_id, kind FROM file_ids WHERE path = ?", (key,)).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def _write_sync(self, key: str, file_id: str, kind: str) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO file_ids (path, file_id, kind, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(path) DO UPDATE SET file_id = excluded.file_id, kind = excluded.kind, "
+                "updated_at = excluded.updated_at",
+                (key, file_id, kind, time.time()),
+            )
+
+    def _delete_sync(self, key: str) -> None:
+        with self._connect() as conn:
+            conn.execute("DELETE FROM file_ids WHERE path = ?", (key,))
+
+    async def get(self, file_path: str, kind: str) -> Optional[str]:
+        """file_id ذخیره شده برای این فایل، اگر با همین نوع ارسال شده باشد."""
+        key = self.key_for(file_path)
+        value = self._memory.get(key)
+        if value is None:
+            try:
+                value = await self._run(self._read_sync, key)
+            except sqlite3.Error as e:
+                logging.error(f"file_id cache read failed for {key}: {e}")
+                value = None
+            if value is not None:
+                self._remember_in_memory(key, value)
+        else:
+            self._memory.move_to_end(key)
+
+        if value is None or value[1] != kind:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value[0]
+
+    async def set(self, file_path: str, file_id: str, kind: str) -> None:
+        key = self.key_for(file_path)
+        self._remember_in_memory(key, (file_id, kind))
+        try:
+            await self._run(self._write_sync, key, file_id, kind)
+        except sqlite3.Error as e:
+            logging.error(f"file_id cache write failed for {key}: {e}")
+
+    async def forget(self, file_path: str) -> None:
+        """وقتی تلگرام یک file_id ذخیره شده را نپذیرد."""
+        key = self.key_for(file_path)
+        self._memory.pop(key, None)
+        try:
+            await self._run(self._delete_sync, key)
+        except sqlite3.Error as e:
+            logging.error(f"file_id cache delete failed for {key}: {e}")
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "in_memory": len(self._memory),
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+
+    def _close_sync(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    async def close(self) -> None:
+        await self._run(self._close_sync)
+        self._executor.shutdown(wait=True)
+        logging.info(f"file_id cache closed: {self.stats()}")
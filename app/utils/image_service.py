@@ -0,0 +1,189 @@
+# app/utils/image_service.py
+import asyncio
+import io
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional, Set, Tuple
+
+from cachetools import TTLCache
+
+from app.storage import AttachmentStorage, derivative_key
+from app.utils.background import BackgroundTasks
+
+
+class ImageProcessingError(Exception):
+    """ساخت preview/thumb ناموفق بود (timeout، عکس خراب یا خطای Pillow)."""
+
+
+def _encode_jpeg(image, size: int, quality: int) -> bytes:
+    from PIL import Image
+
+    resized = image.copy()
+    resized.thumbnail((size, size), Image.LANCZOS)
+    buffer = io.BytesIO()
+    resized.save(buffer, "JPEG", quality=quality, optimize=True, progressive=True)
+    return buffer.getvalue()
+
+
+def _make_derivatives(data: bytes, preview_size: int, thumb_size: int, quality: int) -> Tuple[bytes, bytes]:
+    # داخل پروسه worker اجرا می‌شود؛ ایمپورت اینجاست تا پروسه اصلی برای ساخت pool به Pillow نیاز نداشته باشد
+    from PIL import Image, ImageOps
+
+    with Image.open(io.BytesIO(data)) as image:
+        # JPEG مستقیماً با مقیاس کوچک‌تر decode می‌شود (سریع‌تر و با حافظه کمتر)
+        image.draft("RGB", (preview_size, preview_size))
+        image = ImageOps.exif_transpose(image)
+        if image.mode in ("RGBA", "LA", "P"):
+            # پس‌زمینه سفید برای عکس‌های شفاف (JPEG کانال آلفا ندارد)
+            image = image.convert("RGBA")
+            background = Image.new("RGB", image.size, "white")
+            background.paste(image, mask=image.getchannel("A"))
+            image = background
+        elif image.mode != "RGB":
+            image = image.convert("RGB")
+        preview = _encode_jpeg(image, preview_size, quality)
+        thumb = _encode_jpeg(image, thumb_size, quality)
+    return preview, thumb
+
+
+def _warm_up() -> bool:
+    # Pillow یک بار در هر worker بارگذاری می‌شود، نه در اولین عکس
+    import PIL.Image  # noqa: F401
+    import PIL.JpegImagePlugin  # noqa: F401
+    return True
+
+
+class ImageProcessingService:
+    """
+    ساخت نسخه کم‌حجم (preview) و بندانگشتی (thumb) عکس‌های ذخیره شده در یک process pool،
+    تا decode و resize با Pillow حلقه رویداد ربات را قفل نکند.
+
+    - preview و thumb کنار فایل اصلی با derivative_key نوشته می‌شوند (objects/ab/cd/<hash>.preview.jpg)؛
+      تاریخچه‌ها preview را می‌فرستند و thumb برای ارسال فایل اصلی به صورت سند استفاده می‌شود.
+    - schedule(storage, key) کار را در پس‌زمینه شروع می‌کند و پاسخ به کاربر منتظر آن نمی‌ماند؛
+      process(storage, key) همان کار را await می‌کند. عکسی که preview دارد دوباره پردازش نمی‌شود.
+    - حداکثر max_pending عکس همزمان در صف/در حال پردازش هستند و هر کدام حداکثر timeout ثانیه.
+    - اگر Pillow نصب نباشد start() سرویس را غیرفعال می‌کند و عکس‌ها مثل قبل با اندازه اصلی فرستاده می‌شوند.
+    """
+
+    def __init__(self, workers: int = 2, max_pending: int = 16, timeout: float = 30.0,
+                 preview_size: int = 1280, thumb_size: int = 320, quality: int = 80,
+                 max_source_bytes: int = 20 * 1024 * 1024,
+                 failure_retry_seconds: float = 3600.0, max_failed_keys: int = 10000):
+        self.workers = max(1, workers)
+        self.max_pending = max(1, max_pending)
+        self.timeout = timeout
+        self.preview_size = preview_size
+        self.thumb_size = thumb_size
+        self.quality = quality
+        self.max_source_bytes = max_source_bytes
+        self.enabled = True
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._background = BackgroundTasks()
+        self._scheduled: Set[str] = set()
+        # عکس‌هایی که پردازششان ناموفق بوده با هر نمایش تاریخچه دوباره امتحان نمی‌شوند؛
+        # بعد از failure_retry_seconds (یا وقتی جای قدیمی‌ترها برای خطاهای تازه لازم شود) دوباره امتحان می‌شوند
+        self._failed_keys: TTLCache = TTLCache(maxsize=max(1, max_failed_keys), ttl=failure_retry_seconds)
+        self.processed = 0
+        self.failed = 0
+        self.bytes_saved = 0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._executor
+
+    async def start(self) -> None:
+        """workerها را از قبل بالا می‌آورد؛ اگر Pillow نصب نباشد سرویس غیرفعال می‌شود."""
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        try:
+            await asyncio.gather(*(loop.run_in_executor(executor, _warm_up) for _ in range(self.workers)))
+        except ImportError:
+            logging.warning("Pillow is not installed; image previews are disabled (pip install Pillow).")
+            self.enabled = False
+            await self.shutdown()
+            return
+        logging.info(f"Image processing pool started with {self.workers} workers.")
+
+    async def process(self, storage: AttachmentStorage, key: str) -> bool:
+        """
+        preview و thumb یک عکس را می‌سازد و کنار آن ذخیره می‌کند.
+        True اگر هر دو نسخه (الان یا از قبل) موجود باشند؛ False اگر سرویس غیرفعال یا عکس بیش از حد بزرگ باشد.
+        """
+        if not self.enabled:
+            return False
+        preview_key, thumb_key = derivative_key(key, "preview"), derivative_key(key, "thumb")
+        if await storage.exists(preview_key):
+            return True
+
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_pending)
+        loop = asyncio.get_running_loop()
+        try:
+            async with asyncio.timeout(self.timeout):
+                async with self._semaphore:
+                    data = await storage.read_bytes(key)
+                    if len(data) > self.max_source_bytes:
+                        logging.info(f"Skipping previews for {key}: {len(data)} bytes is over the limit.")
+                        return False
+                    preview, thumb = await loop.run_in_executor(
+                        self._get_executor(), _make_derivatives,
+                        data, self.preview_size, self.thumb_size, self.quality,
+                    )
+        except TimeoutError as e:
+            self.failed += 1
+            raise ImageProcessingError(f"Image processing timed out after {self.timeout}s for {key}") from e
+        except BrokenProcessPool as e:
+            logging.error("Image processing pool is broken; it will be recreated on the next request.")
+            self._executor = None
+            self.failed += 1
+            raise ImageProcessingError("Image processing worker crashed") from e
+        except (OSError, ValueError) as e:
+            # عکس خراب یا فرمتی که Pillow نمی‌شناسد (UnidentifiedImageError زیرکلاس OSError است)
+            self.failed += 1
+            raise ImageProcessingError(f"Could not process image {key}: {e}") from e
+
+        # thumb اول نوشته می‌شود تا وجود preview یعنی هر دو نسخه آماده‌اند
+        await storage.write_bytes(thumb_key, thumb)
+        await storage.write_bytes(preview_key, preview)
+        self.processed += 1
+        self.bytes_saved += max(0, len(data) - len(preview))
+        return True
+
+    async def _process_in_background(self, storage: AttachmentStorage, key: str) -> None:
+        try:
+            await self.process(storage, key)
+        except ImageProcessingError as e:
+            self._failed_keys[key] = True
+            logging.warning(f"{e}; the original will be sent instead of a preview.")
+        finally:
+            self._scheduled.discard(key)
+
+    def schedule(self, storage: AttachmentStorage, key: str) -> None:
+        """ساخت preview/thumb در پس‌زمینه؛ درخواست تکراری برای عکسی که در صف است یا اخیراً ناموفق بوده نادیده گرفته می‌شود."""
+        if not self.enabled or key in self._scheduled or key in self._failed_keys:
+            return
+        self._scheduled.add(key)
+        self._background.spawn(self._process_in_background(storage, key), name=f"preview-{key}")
+
+    def stats(self) -> dict:
+        return {
+            "processed": self.processed,
+            "failed": self.failed,
+            "pending": len(self._background),
+            "bytes_saved": self.bytes_saved,
+        }
+
+    async def shutdown(self, timeout: float = 30.0) -> None:
+        await self._background.drain(timeout=timeout)
+        if self._executor is not None:
+            executor, self._executor = self._executor, None
+            await asyncio.to_thread(executor.shutdown, wait=True, cancel_futures=True)
+            logging.info(f"Image processing pool stopped: {self.stats()}")
@@ -0,0 +1,228 @@
+# app/utils/invoice_cache.py
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+import uuid
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, Dict, Optional, Tuple
+
+INDEX_FILE = "index.json"
+
+
+class InvoiceCache:
+    """
+    کش فاکتورهای صادر شده، با کلید هش محتوای invoice_context.
+
+    - هر فاکتور یک بار ساخته و به صورت <key>.pdf در directory نگه داشته می‌شود.
+    - مجموع حجم فایل‌ها حداکثر max_bytes است؛ فایل‌هایی که دیرتر از همه استفاده شده‌اند اول حذف می‌شوند (LRU).
+    - file_id تلگرام بعد از اولین آپلود ذخیره می‌شود تا ارسال‌های بعدی بدون آپلود دوباره انجام شوند؛
+      file_id حتی بعد از حذف فایل محلی نگه داشته می‌شود (حداکثر max_entries رکورد).
+    - ایندکس در index.json ذخیره می‌شود تا کش بعد از ری‌استارت هم معتبر بماند.
+    - فایلی که با checkout گرفته شده تا پایان ارسال سنجاق می‌شود و در این فاصله حذف نمی‌شود.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 200 * 1024 * 1024, max_entries: int = 5000):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._entries: Dict[str, dict] = {}
+        # قفل و تعداد منتظرهای هر کلید، تا درخواست‌های همزمان یک فاکتور فقط یک بار آن را بسازند
+        self._key_locks: Dict[str, Tuple[asyncio.Lock, int]] = {}
+        # تعداد ارسال‌های در جریان هر کلید؛ فایل این کلیدها در _evict حذف نمی‌شود
+        self._pins: Dict[str, int] = {}
+        self._save_lock = asyncio.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key_for(context: dict) -> str:
+        """هش پایدار محتوای فاکتور؛ ترتیب کلیدها روی نتیجه اثری ندارد."""
+        canonical = json.dumps(context, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.pdf")
+
+    def staging_path(self, key: str) -> str:
+        """مسیر موقت داخل همان پوشه کش، تا انتقال نهایی با os.replace اتمیک باشد."""
+        return os.path.join(self.directory, f".{key}.{uuid.uuid4().hex}.tmp")
+
+    # --- ایندکس ---
+
+    def _load_index(self) -> Dict[str, dict]:
+        os.makedirs(self.directory, exist_ok=True)
+        index_path = os.path.join(self.directory, INDEX_FILE)
+        try:
+            with open(index_path, encoding="utf-8") as f:
+                entries = json.load(f)
+        except FileNotFoundError:
+            entries = {}
+        except (OSError, ValueError) as e:
+            logging.warning(f"Invoice cache index is unreadable, starting empty: {e}")
+            entries = {}
+
+        # رکورد فایل‌هایی که دستی پاک شده‌اند اصلاح و فایل‌های موقت نیمه‌کاره حذف می‌شوند
+        for key, entry in entries.items():
+            if entry.get("size") and not os.path.exists(self._path(key)):
+                entry["size"] = 0
+        for name in os.listdir(self.directory):
+            if name.endswith(".tmp"):
+                os.remove(os.path.join(self.directory, name))
+        return {key: entry for key, entry in entries.items() if entry.get("size") or entry.get("file_id")}
+
+    def _write_index(self, entries: Dict[str, dict]) -> None:
+        index_path = os.path.join(self.directory, INDEX_FILE)
+        tmp_path = f"{index_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entries, f)
+        os.replace(tmp_path, index_path)
+
+    async def _save(self) -> None:
+        async with self._save_lock:
+            snapshot = {key: dict(entry) for key, entry in self._entries.items()}
+            try:
+                await asyncio.to_thread(self._write_index, snapshot)
+            except OSError as e:
+                logging.error(f"Could not write invoice cache index: {e}")
+
+    async def start(self) -> None:
+        self._entries = await asyncio.to_thread(self._load_index)
+        logging.info(f"Invoice cache loaded: {len(self._entries)} entries, {self.total_bytes()} bytes.")
+
+    # --- خواندن و نوشتن ---
+
+    def total_bytes(self) -> int:
+        return sum(entry.get("size", 0) for entry in self._entries.values())
+
+    def lookup(self, key: str) -> Tuple[Optional[str], Optional[str]]:
+        """(file_id, path) فاکتور کش شده؛ هر کدام که موجود نباشد None است."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None, None
+        entry["last_used"] = time.time()
+        path = self._path(key) if entry.get("size") else None
+        return entry.get("file_id"), path
+
+    async def add(self, key: str, staging_path: str) -> str:
+        """فایل ساخته شده را وارد کش می‌کند و در صورت نیاز قدیمی‌ترین فایل‌ها را حذف می‌کند."""
+        path = self._path(key)
+        os.replace(staging_path, path)
+        entry = self._entries.setdefault(key, {})
+        entry["size"] = os.path.getsize(path)
+        entry["last_used"] = time.time()
+        self._evict(keep=key)
+        await self._save()
+        return path
+
+    async def remember_file_id(self, key: str, file_id: str) -> None:
+        entry = self._entries.setdefault(key, {"size": 0})
+        entry["file_id"] = file_id
+        entry["last_used"] = time.time()
+        await self._save()
+
+    async def forget_file_id(self, key: str) -> None:
+        """وقتی تلگرام file_id را نپذیرد (مثلاً فایل در سرور تلگرام منقضی شده باشد)."""
+        entry = self._entries.get(key)
+        if entry and entry.pop("file_id", None) is not None:
+            if not entry.get("size"):
+                del self._entries[key]
+            await self._save()
+
+    def _evict(self, keep: str) -> None:
+        by_age = sorted(
+            (k for k in self._entries if k != keep and k not in self._pins),
+            key=lambda k: self._entries[k].get("last_used", 0),
+        )
+        total = self.total_bytes()
+        for key in by_age:
+            if total <= self.max_bytes:
+                break
+            entry = self._entries[key]
+            if not entry.get("size"):
+                continue
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+            total -= entry["size"]
+            entry["size"] = 0
+            if not entry.get("file_id"):
+                del self._entries[key]
+
+        # محدودیت تعداد رکوردها (رکوردهای فقط file_id هم حافظه و ایندکس را بزرگ می‌کنند)
+        overflow = len(self._entries) - self.max_entries
+        for key in by_age:
+            if overflow <= 0:
+                break
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                continue
+            if entry.get("size"):
+                try:
+                    os.remove(self._path(key))
+                except FileNotFoundError:
+                    pass
+            overflow -= 1
+
+    async def get_or_render(
+        self, context: dict, render: Callable[[dict, str], Awaitable[str]]
+    ) -> Tuple[str, Optional[str], Optional[str]]:
+        """
+        (key, file_id, path) فاکتور را برمی‌گرداند و فقط در صورت نبود هیچ کدام render(context, staging_path) را صدا می‌زند.
+        درخواست‌های همزمان برای یک فاکتور فقط یک بار آن را می‌سازند.
+        """
+        key = self.key_for(context)
+        lock, users = self._key_locks.get(key, (asyncio.Lock(), 0))
+        self._key_locks[key] = (lock, users + 1)
+        try:
+            async with lock:
+                file_id, path = self.lookup(key)
+                if file_id or path:
+                    self.hits += 1
+                    return key, file_id, path
+
+                self.misses += 1
+                staging = self.staging_path(key)
+                try:
+                    await render(context, staging)
+                except BaseException:
+                    if os.path.exists(staging):
+                        os.remove(staging)
+                    raise
+                return key, None, await self.add(key, staging)
+        finally:
+            lock, users = self._key_locks[key]
+            if users <= 1:
+                del self._key_locks[key]
+            else:
+                self._key_locks[key] = (lock, users - 1)
+
+    @asynccontextmanager
+    async def checkout(
+        self, context: dict, render: Callable[[dict, str], Awaitable[str]]
+    ) -> AsyncIterator[Tuple[str, Optional[str], Optional[str]]]:
+        """
+        مثل get_or_render، ولی فایل فاکتور تا پایان بلوک async with سنجاق می‌شود؛
+        پس اگر فاکتور دیگری در این فاصله ساخته شود و کش پر باشد، فایلی که در حال ارسال است حذف نمی‌شود.
+        """
+        key = self.key_for(context)
+        self._pins[key] = self._pins.get(key, 0) + 1
+        try:
+            yield await self.get_or_render(context, render)
+        finally:
+            if self._pins[key] <= 1:
+                del self._pins[key]
+            else:
+                self._pins[key] -= 1
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "bytes": self.total_bytes(),
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
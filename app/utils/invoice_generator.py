@@ -4,15 +4,13 @@ import os
 import io
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import A4
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image, PageBreak
+from reportlab.lib.styles import ParagraphStyle
 from reportlab.lib.units import cm
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
 
-# کتابخانه‌های مورد نیاز برای متن فارسی
-import arabic_reshaper
-from bidi.algorithm import get_display
+from app.utils.text_shaping import shape_persian
 
 # --- 1. ثبت فونت فارسی ---
 # پیدا کردن مسیر دقیق فایل فونت نسبت به محل اجرای فایل
@@ -29,19 +27,107 @@ except Exception as e:
 
 # --- 2. تابع کمکی برای اصلاح متن فارسی ---
 def farsi(text):
-    if not text or not isinstance(text, str):
-        return str(text)
-    # 1. تغییر شکل حروف (چسباندن حروف به هم)
-    reshaped_text = arabic_reshaper.reshape(text)
-    # 2. اصلاح جهت (راست به چپ)
-    bidi_text = get_display(reshaped_text)
-    return bidi_text
-
-
-def generate_complex_invoice(data: dict) -> io.BytesIO:
-    buffer = io.BytesIO()
+    # شکل‌دهی و bidi در text_shaping انجام و برای رشته‌های تکراری کش می‌شود
+    return shape_persian(text)
+
+
+# --- 3. قالب ثابت فاکتور ---
+# همه چیزهایی که بین فاکتورها یکسان است (استایل‌ها، TableStyleها، عرض ستون‌ها و برچسب‌های ثابت
+# فارسی که reshape و bidi شده‌اند) یک بار هنگام import ساخته می‌شوند.
+# برای هر فاکتور فقط مقادیر متغیر (شماره، تاریخ، خریدار، اقلام) پر می‌شوند.
+
+FARSI_NORMAL_STYLE = ParagraphStyle(name='FarsiNormal', fontName=PERSIAN_FONT, fontSize=10, leading=14, alignment=2)  # Right
+
+LABELS = {
+    "title": farsi("فاکتور فروش"),
+    "pharmacy": farsi("داروخانه دکتر فاضل"),
+    "buyer_section": farsi("مشخصات خریدار"),
+    "seller_section": farsi("مشخصات فروشنده"),
+    "grand_total": farsi("جمع کل"),
+    "carried_forward": farsi("نقل از صفحه قبل"),
+    "carry_to_next": farsi("جمع این صفحه (نقل به صفحه بعد)"),
+}
+
+# هدرهای جدول اقلام (به ترتیب از چپ به راست: قیمت کل، واحد، تعداد، نام، ردیف)
+ITEM_TABLE_HEADERS = [
+    farsi("قیمت کل (ریال)"),
+    farsi("قیمت واحد (ریال)"),
+    farsi("تعداد"),
+    farsi("نام کالا/خدمات"),
+    farsi("ردیف"),
+]
+
+HEADER_COL_WIDTHS = [9 * cm, 9 * cm]
+INFO_COL_WIDTHS = [9.5 * cm, 9.5 * cm]
+ITEM_COL_WIDTHS = [4 * cm, 4 * cm, 2 * cm, 8 * cm, 1 * cm]
+
+HEADER_TABLE_STYLE = TableStyle([
+    ('FONTNAME', (0, 0), (-1, -1), PERSIAN_FONT),
+    ('TEXTCOLOR', (0, 0), (-1, -1), colors.darkblue),
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+    ('SIZE', (0, 0), (1, 0), 16),  # عنوان بزرگتر
+    ('BOTTOMPADDING', (0, 0), (-1, -1), 10),
+    ('LINEBELOW', (0, 1), (-1, 1), 1, colors.black),
+])
+
+INFO_TABLE_STYLE = TableStyle([
+    ('FONTNAME', (0, 0), (-1, -1), PERSIAN_FONT),
+    ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+    ('BACKGROUND', (0, 0), (1, 0), colors.lightgrey),
+    ('ALIGN', (0, 0), (-1, -1), 'RIGHT'),  # راست چین کردن سلول‌ها
+    ('PADDING', (0, 0), (-1, -1), 6),
+])
+
+ITEM_TABLE_STYLE = TableStyle([
+    ('FONTNAME', (0, 0), (-1, -1), PERSIAN_FONT),
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+    ('GRID', (0, 0), (-1, -1), 1, colors.black),
+    ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),  # هدر جدول
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),
+    ('FONTSIZE', (0, 0), (-1, -1), 10),
+    ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
+    ('TOPPADDING', (0, 0), (-1, -1), 8),
+    # رنگی کردن ردیف جمع کل (آخرین ردیف)
+    ('BACKGROUND', (0, -1), (-1, -1), colors.whitesmoke),
+    ('FONTSIZE', (0, -1), (-1, -1), 12),
+])
+
+# ردیف "نقل از صفحه قبل" (ردیف دوم، بعد از هدر) در صفحات ادامه فاکتور
+CONTINUED_ITEM_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 1), (-1, 1), colors.whitesmoke),
+], parent=ITEM_TABLE_STYLE)
+
+# تعداد ردیف اقلام در هر صفحه (صفحه اول به خاطر هدر و مشخصات خریدار جای کمتری دارد)
+FIRST_PAGE_ITEM_ROWS = 16
+NEXT_PAGE_ITEM_ROWS = 22
+
+SMALL_SPACER_HEIGHT = 0.5 * cm
+LARGE_SPACER_HEIGHT = 1 * cm
+
+
+def _paginate_items(items: list) -> list:
+    """اقلام را به تکه‌های هر صفحه تقسیم می‌کند (حداقل یک تکه، حتی برای فاکتور بدون قلم)."""
+    pages = [items[:FIRST_PAGE_ITEM_ROWS]]
+    for start in range(FIRST_PAGE_ITEM_ROWS, len(items), NEXT_PAGE_ITEM_ROWS):
+        pages.append(items[start:start + NEXT_PAGE_ITEM_ROWS])
+    return pages
+
+
+def generate_complex_invoice(data: dict, output=None):
+    """
+    فاکتور PDF را می‌سازد.
+
+    output می‌تواند مسیر فایل یا یک شیء فایل باشد تا PDF مستقیماً روی دیسک نوشته شود؛
+    اگر داده نشود یک io.BytesIO ساخته و برگردانده می‌شود (رفتار قبلی).
+    سفارش‌های بزرگ در چند صفحه چاپ می‌شوند: هدر جدول در هر صفحه تکرار می‌شود و جمع هر صفحه
+    به صفحه بعد نقل می‌شود.
+    """
+    if output is None:
+        output = io.BytesIO()
     doc = SimpleDocTemplate(
-        buffer,
+        output,
         pagesize=A4,
         rightMargin=1 * cm, leftMargin=1 * cm,
         topMargin=1 * cm, bottomMargin=1 * cm,
@@ -49,124 +135,78 @@ def generate_complex_invoice(data: dict) -> io.BytesIO:
     )
 
     elements = []
-    styles = getSampleStyleSheet()
-
-    # تعریف استایل‌های اختصاصی با فونت فارسی
-    styles.add(ParagraphStyle(name='FarsiTitle', fontName=PERSIAN_FONT, fontSize=16, leading=20, alignment=1))  # Center
-    styles.add(ParagraphStyle(name='FarsiNormal', fontName=PERSIAN_FONT, fontSize=10, leading=14, alignment=2))  # Right
-    styles.add(ParagraphStyle(name='FarsiBold', fontName=PERSIAN_FONT, fontSize=12, leading=15, alignment=2))  # Right
 
     # --- هدر فاکتور ---
     header_data = [
-        [farsi("فاکتور فروش"), farsi("داروخانه دکتر فاضل")],
+        [LABELS["title"], LABELS["pharmacy"]],
         [farsi(f"شماره: {data.get('invoice_number')}"), farsi(f"تاریخ: {data.get('invoice_date')}")]
     ]
-
-    header_table = Table(header_data, colWidths=[9 * cm, 9 * cm])
-    header_table.setStyle(TableStyle([
-        ('FONTNAME', (0, 0), (-1, -1), PERSIAN_FONT),
-        ('TEXTCOLOR', (0, 0), (-1, -1), colors.darkblue),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ('SIZE', (0, 0), (1, 0), 16),  # عنوان بزرگتر
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 10),
-        ('LINEBELOW', (0, 1), (-1, 1), 1, colors.black),
-    ]))
+    header_table = Table(header_data, colWidths=HEADER_COL_WIDTHS)
+    header_table.setStyle(HEADER_TABLE_STYLE)
     elements.append(header_table)
-    elements.append(Spacer(1, 0.5 * cm))
+    elements.append(Spacer(1, SMALL_SPACER_HEIGHT))
 
     # --- اطلاعات خریدار و فروشنده ---
-    # نکته: تمام متون ثابت هم باید داخل تابع farsi() بروند
     buyer = data.get("buyer_info", {})
+    seller = data['seller_info']
 
     info_data = [
-        [farsi("مشخصات خریدار"), farsi("مشخصات فروشنده")],
-        [farsi(f"نام: {buyer.get('name')}"), farsi(f"نام: {data['seller_info']['name']}")],
-        [farsi(f"تلفن: {buyer.get('phone')}"), farsi(f"تلفن: {data['seller_info']['phone']}")],
-        [farsi(f"آدرس: {buyer.get('address')}"), farsi(f"آدرس: {data['seller_info']['address']}")]
+        [LABELS["buyer_section"], LABELS["seller_section"]],
+        [farsi(f"نام: {buyer.get('name')}"), farsi(f"نام: {seller['name']}")],
+        [farsi(f"تلفن: {buyer.get('phone')}"), farsi(f"تلفن: {seller['phone']}")],
+        [farsi(f"آدرس: {buyer.get('address')}"), farsi(f"آدرس: {seller['address']}")]
     ]
-
-    info_table = Table(info_data, colWidths=[9.5 * cm, 9.5 * cm])
-    info_table.setStyle(TableStyle([
-        ('FONTNAME', (0, 0), (-1, -1), PERSIAN_FONT),
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-        ('BACKGROUND', (0, 0), (1, 0), colors.lightgrey),
-        ('ALIGN', (0, 0), (-1, -1), 'RIGHT'),  # راست چین کردن سلول‌ها
-        ('PADDING', (0, 0), (-1, -1), 6),
-    ]))
+    info_table = Table(info_data, colWidths=INFO_COL_WIDTHS)
+    info_table.setStyle(INFO_TABLE_STYLE)
     elements.append(info_table)
-    elements.append(Spacer(1, 1 * cm))
-
-    # --- جدول اقلام سفارش ---
-    # هدرهای جدول
-    table_headers = [
-        farsi("قیمت کل (ریال)"),
-        farsi("قیمت واحد (ریال)"),
-        farsi("تعداد"),
-        farsi("نام کالا/خدمات"),
-        farsi("ردیف")
-    ]
-
-    table_data = [table_headers]
+    elements.append(Spacer(1, LARGE_SPACER_HEIGHT))
 
-    # پر کردن ردیف‌ها
-    items = data.get("items", [])
+    # --- جدول اقلام سفارش (صفحه به صفحه) ---
+    pages = _paginate_items(data.get("items", []))
+    row_number = 0
+    running_price = 0
     total_quantity = 0
 
-    for idx, item in enumerate(items, 1):
-        row = [
-            f"{item['total_price']:,}",  # قیمت کل
-            f"{item['unit_price']:,}",  # قیمت واحد
-            str(item['count']),  # تعداد
-            farsi(item['name']),  # نام کالا (فارسی)
-            str(idx)  # ردیف
-        ]
-        table_data.append(row)
-        total_quantity += int(item['count'])
-
-    # ردیف جمع کل
-    final_price = data.get("final_total_price", 0)
-    table_data.append([
-        f"{final_price:,}",
-        "",
-        str(total_quantity),
-        farsi("جمع کل"),
-        ""
-    ])
-
-    # تنظیمات جدول اقلام
-    # عرض ستون‌ها (به ترتیب از چپ به راست: قیمت کل، واحد، تعداد، نام، ردیف)
-    col_widths = [4 * cm, 4 * cm, 2 * cm, 8 * cm, 1 * cm]
-
-    invoice_table = Table(table_data, colWidths=col_widths)
-
-    # استایل‌دهی جدول
-    style_cmds = [
-        ('FONTNAME', (0, 0), (-1, -1), PERSIAN_FONT),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),  # هدر جدول
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
-        ('TOPPADDING', (0, 0), (-1, -1), 8),
-    ]
-
-    # رنگی کردن ردیف جمع کل (آخرین ردیف)
-    style_cmds.append(('BACKGROUND', (0, -1), (-1, -1), colors.whitesmoke))
-    style_cmds.append(('FONTSIZE', (0, -1), (-1, -1), 12))
-
-    invoice_table.setStyle(TableStyle(style_cmds))
-    elements.append(invoice_table)
+    for page_index, page_items in enumerate(pages):
+        is_last_page = page_index == len(pages) - 1
+        table_data = [ITEM_TABLE_HEADERS]
+        if page_index > 0:
+            table_data.append([f"{running_price:,}", "", str(total_quantity), LABELS["carried_forward"], ""])
+
+        for item in page_items:
+            row_number += 1
+            table_data.append([
+                f"{item['total_price']:,}",  # قیمت کل
+                f"{item['unit_price']:,}",  # قیمت واحد
+                str(item['count']),  # تعداد
+                farsi(item['name']),  # نام کالا (فارسی)
+                str(row_number)  # ردیف
+            ])
+            running_price += int(item['total_price'])
+            total_quantity += int(item['count'])
+
+        if is_last_page:
+            # ردیف جمع کل
+            final_price = data.get("final_total_price", 0)
+            table_data.append([f"{final_price:,}", "", str(total_quantity), LABELS["grand_total"], ""])
+        else:
+            table_data.append([f"{running_price:,}", "", str(total_quantity), LABELS["carry_to_next"], ""])
+
+        # repeatRows: اگر یک صفحه باز هم جا نشد، ReportLab هدر را در ادامه جدول تکرار می‌کند
+        invoice_table = Table(table_data, colWidths=ITEM_COL_WIDTHS, repeatRows=1)
+        invoice_table.setStyle(CONTINUED_ITEM_TABLE_STYLE if page_index > 0 else ITEM_TABLE_STYLE)
+        elements.append(invoice_table)
+        if not is_last_page:
+            elements.append(PageBreak())
 
     # --- فوتر و توضیحات ---
-    elements.append(Spacer(1, 1 * cm))
-    elements.append(Paragraph(farsi(f"مسئول پذیرش: {data.get('cashier_name', '---')}"), styles['FarsiNormal']))
+    elements.append(Spacer(1, LARGE_SPACER_HEIGHT))
+    elements.append(Paragraph(farsi(f"مسئول پذیرش: {data.get('cashier_name', '---')}"), FARSI_NORMAL_STYLE))
     if data.get('consultant_name'):
-        elements.append(Paragraph(farsi(f"پزشک مشاور: {data.get('consultant_name')}"), styles['FarsiNormal']))
+        elements.append(Paragraph(farsi(f"پزشک مشاور: {data.get('consultant_name')}"), FARSI_NORMAL_STYLE))
 
     # ساخت فایل
     doc.build(elements)
-    buffer.seek(0)
-    return buffer
+    if isinstance(output, io.BytesIO):
+        output.seek(0)
+    return output
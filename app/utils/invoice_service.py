@@ -0,0 +1,131 @@
+# app/utils/invoice_service.py
+import asyncio
+import logging
+import multiprocessing
+import os
+import tempfile
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+
+class InvoiceRenderError(Exception):
+    """صدور فاکتور ناموفق بود (timeout، صف پر یا خطای ReportLab)."""
+
+
+def _render_invoice(context: dict, path: str) -> str:
+    # داخل پروسه worker اجرا می‌شود؛ ایمپورت اینجاست تا پروسه اصلی برای ساخت pool به ReportLab نیاز نداشته باشد
+    from app.utils.invoice_generator import generate_complex_invoice
+    # PDF مستقیماً روی دیسک نوشته می‌شود؛ بایت‌های آن نه در حافظه کپی می‌شوند و نه بین پروسه‌ها pickle
+    try:
+        generate_complex_invoice(context, path)
+    except BaseException:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+    return path
+
+
+def _remove_output(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _warm_up() -> bool:
+    # فونت، ReportLab و arabic_reshaper یک بار در هر worker بارگذاری می‌شوند، نه در اولین فاکتور
+    import app.utils.invoice_generator  # noqa: F401
+    return True
+
+
+class InvoiceRenderService:
+    """
+    سرویس صدور PDF فاکتور در یک process pool، تا ReportLab و arabic_reshaper حلقه رویداد ربات را قفل نکنند.
+
+    - render(context, path=None) یک API async است و مسیر فایل PDF ساخته شده را برمی‌گرداند
+      (اگر path داده نشود، یک فایل جدید در output_dir که فراخواننده مسئول حذف آن است).
+    - حداکثر max_pending فاکتور همزمان در صف/در حال صدور هستند؛ بقیه منتظر می‌مانند (back-pressure).
+      جایگاه هر فاکتور تا پایان واقعی کار worker آزاد نمی‌شود، پس کارهای timeout شده هم در این سقف حساب می‌شوند.
+    - اگر صدور (به همراه انتظار در صف) بیشتر از timeout طول بکشد InvoiceRenderError پرتاب می‌شود؛
+      کار هنوز شروع نشده لغو و فایل نیمه‌کاره (یا فایلی که worker بعداً تمام می‌کند) حذف می‌شود.
+    - از context "spawn" استفاده می‌شود تا workerها وضعیت حلقه رویداد و اتصال‌های پروسه اصلی را به ارث نبرند.
+    """
+
+    def __init__(self, workers: int = 2, max_pending: int = 8, timeout: float = 30.0,
+                 output_dir: Optional[str] = None):
+        self.workers = max(1, workers)
+        self.max_pending = max(1, max_pending)
+        self.timeout = timeout
+        self.output_dir = output_dir or os.path.join(tempfile.gettempdir(), "fazel_invoices")
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._executor
+
+    async def start(self) -> None:
+        """workerها را از قبل بالا می‌آورد تا اولین فاکتور منتظر راه‌اندازی پروسه نماند."""
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        os.makedirs(self.output_dir, exist_ok=True)
+        await asyncio.gather(*(loop.run_in_executor(executor, _warm_up) for _ in range(self.workers)))
+        logging.info(f"Invoice render pool started with {self.workers} workers.")
+
+    async def render(self, context: dict, path: Optional[str] = None) -> str:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_pending)
+
+        if path is None:
+            os.makedirs(self.output_dir, exist_ok=True)
+            path = os.path.join(self.output_dir, f"invoice_{context.get('invoice_number', 'x')}_{uuid.uuid4().hex}.pdf")
+        loop = asyncio.get_running_loop()
+        future = None
+        try:
+            async with asyncio.timeout(self.timeout):
+                await self._semaphore.acquire()
+                try:
+                    future = self._get_executor().submit(_render_invoice, context, path)
+                except BaseException:
+                    self._semaphore.release()
+                    raise
+                # کار در حال اجرا در worker قابل لغو نیست؛ جایگاهش تا پایان واقعی آن اشغال می‌ماند
+                future.add_done_callback(lambda _: self._release_threadsafe(loop))
+                return await asyncio.wrap_future(future)
+        except TimeoutError as e:
+            self._discard_output(future, path)
+            raise InvoiceRenderError(f"Invoice rendering timed out after {self.timeout}s") from e
+        except asyncio.CancelledError:
+            self._discard_output(future, path)
+            raise
+        except BrokenProcessPool as e:
+            logging.error("Invoice render pool is broken; it will be recreated on the next request.")
+            self._executor = None
+            raise InvoiceRenderError("Invoice render worker crashed") from e
+
+    def _release_threadsafe(self, loop: asyncio.AbstractEventLoop) -> None:
+        # callback آینده‌های executor در thread مدیریت pool اجرا می‌شود
+        try:
+            loop.call_soon_threadsafe(self._semaphore.release)
+        except RuntimeError:
+            # حلقه رویداد بسته شده (خاموشی)؛ دیگر کسی منتظر جایگاه نیست
+            pass
+
+    @staticmethod
+    def _discard_output(future, path: str) -> None:
+        """خروجی فاکتوری که فراخواننده دیگر منتظرش نیست حذف می‌شود؛ اگر worker هنوز می‌نویسد، بعد از پایان کارش."""
+        _remove_output(path)
+        if future is not None and not future.done():
+            future.add_done_callback(lambda _: _remove_output(path))
+
+    async def shutdown(self) -> None:
+        if self._executor is not None:
+            executor, self._executor = self._executor, None
+            await asyncio.to_thread(executor.shutdown, wait=True, cancel_futures=True)
+            logging.info("Invoice render pool stopped.")
@@ -0,0 +1,43 @@
+# app/utils/text_shaping.py
+from functools import lru_cache
+
+# کتابخانه‌های مورد نیاز برای متن فارسی
+import arabic_reshaper
+from bidi.algorithm import get_display
+
+# حداکثر تعداد رشته‌های شکل‌دهی شده که در حافظه نگه داشته می‌شوند (LRU)
+SHAPING_CACHE_SIZE = 4096
+
+
+@lru_cache(maxsize=SHAPING_CACHE_SIZE)
+def _shape(text: str) -> str:
+    # 1. تغییر شکل حروف (چسباندن حروف به هم)
+    reshaped_text = arabic_reshaper.reshape(text)
+    # 2. اصلاح جهت (راست به چپ)
+    return get_display(reshaped_text)
+
+
+def shape_persian(text) -> str:
+    """
+    متن فارسی را برای رسم در PDF/تصویر آماده می‌کند (reshape + bidi).
+    نتیجه برای رشته‌های تکراری (نام داروها، برچسب‌ها، اطلاعات فروشنده) از کش LRU برگردانده می‌شود.
+    """
+    if not text or not isinstance(text, str):
+        return str(text)
+    return _shape(text)
+
+
+def shaping_cache_stats() -> dict:
+    info = _shape.cache_info()
+    lookups = info.hits + info.misses
+    return {
+        "hits": info.hits,
+        "misses": info.misses,
+        "size": info.currsize,
+        "maxsize": info.maxsize,
+        "hit_ratio": round(info.hits / lookups, 3) if lookups else 0.0,
+    }
+
+
+def clear_shaping_cache() -> None:
+    _shape.cache_clear()
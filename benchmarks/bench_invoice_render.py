@@ -0,0 +1,92 @@
+# benchmarks/bench_invoice_render.py
+"""
+بنچمارک صدور همزمان N فاکتور PDF و اثر آن روی حلقه رویداد.
+
+دو حالت مقایسه می‌شوند:
+  inline : روش قبلی؛ generate_complex_invoice مستقیماً داخل coroutine هندلر اجرا می‌شود.
+  pool   : InvoiceRenderService (process pool با back-pressure).
+
+یک heartbeat هر 10 میلی‌ثانیه بیدار می‌شود. تأخیر آن نسبت به زمان مورد انتظار همان زمانی است
+که حلقه رویداد قفل بوده و هیچ کاربر دیگری پاسخ نگرفته (stall).
+
+اجرا:
+    python -m benchmarks.bench_invoice_render --invoices 40 --items 15 --workers 4
+"""
+
+import argparse
+import asyncio
+import os
+import time
+
+from app.utils.invoice_generator import generate_complex_invoice
+from app.utils.invoice_service import InvoiceRenderService
+from benchmarks.invoice_samples import sample_invoice_context
+
+HEARTBEAT_INTERVAL = 0.01
+
+
+async def heartbeat(stop: asyncio.Event, lags: list) -> None:
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        expected = loop.time() + HEARTBEAT_INTERVAL
+        await asyncio.sleep(HEARTBEAT_INTERVAL)
+        lags.append(max(0.0, loop.time() - expected))
+
+
+async def render_inline(context: dict) -> int:
+    return len(generate_complex_invoice(context).getvalue())
+
+
+def pooled(service: InvoiceRenderService):
+    async def render(context: dict) -> int:
+        path = await service.render(context)
+        size = os.path.getsize(path)
+        os.remove(path)
+        return size
+    return render
+
+
+async def run_case(name: str, render, contexts: list) -> None:
+    stop = asyncio.Event()
+    lags: list = []
+    beat = asyncio.create_task(heartbeat(stop, lags))
+    await asyncio.sleep(HEARTBEAT_INTERVAL * 2)
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(render(ctx) for ctx in contexts))
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    await beat
+    total_bytes = sum(results)
+    print(
+        f"{name:<7} {elapsed:>8.2f} {len(contexts) / elapsed:>12.1f} "
+        f"{max(lags) * 1000:>12.1f} {sum(lags) * 1000:>14.1f} {total_bytes / len(results) / 1024:>9.1f}"
+    )
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--invoices", type=int, default=40)
+    parser.add_argument("--items", type=int, default=15, help="items per invoice")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--max-pending", type=int, default=16)
+    args = parser.parse_args()
+
+    contexts = [sample_invoice_context(args.items, seed=i) for i in range(args.invoices)]
+    service = InvoiceRenderService(workers=args.workers, max_pending=args.max_pending, timeout=120)
+    await service.start()
+
+    print(f"invoices: {args.invoices}, items/invoice: {args.items}, pool workers: {args.workers}\n")
+    header = f"{'mode':<7} {'total s':>8} {'invoices/s':>12} {'max stall ms':>12} {'total stall ms':>14} {'avg KiB':>9}"
+    print(header)
+    print("-" * len(header))
+    try:
+        await run_case("inline", render_inline, contexts)
+        await run_case("pool", pooled(service), contexts)
+    finally:
+        await service.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
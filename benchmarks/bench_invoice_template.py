@@ -0,0 +1,168 @@
+# benchmarks/bench_invoice_template.py
+"""
+بنچمارک هزینه صدور یک فاکتور: قالب ثابت (استایل‌ها و برچسب‌های از قبل ساخته شده) در برابر روش قبلی.
+
+  legacy   : کپی نسخه قبلی generate_complex_invoice که getSampleStyleSheet، ParagraphStyleها،
+             TableStyleها و reshape برچسب‌های ثابت را در هر فراخوانی از نو می‌سازد.
+  template : generate_complex_invoice فعلی که فقط فیلدهای متغیر را پر می‌کند.
+
+هر دو حالت روی یک پروسه و به صورت ترتیبی اجرا می‌شوند (بدون process pool) تا فقط هزینه CPU هر فاکتور دیده شود.
+
+اجرا:
+    python -m benchmarks.bench_invoice_template --invoices 200 --items 10
+"""
+
+import argparse
+import io
+import statistics
+import time
+
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.units import cm
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+
+from app.utils.invoice_generator import PERSIAN_FONT, farsi, generate_complex_invoice
+from benchmarks.invoice_samples import sample_invoice_context
+
+
+def legacy_generate_invoice(data: dict) -> io.BytesIO:
+    # کپی بدون تغییر پیاده‌سازی قبلی (ساخت همه چیز در هر فراخوانی)
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(
+        buffer,
+        pagesize=A4,
+        rightMargin=1 * cm, leftMargin=1 * cm,
+        topMargin=1 * cm, bottomMargin=1 * cm,
+        title=f"Invoice_{data.get('invoice_number')}"
+    )
+
+    elements = []
+    styles = getSampleStyleSheet()
+    styles.add(ParagraphStyle(name='FarsiTitle', fontName=PERSIAN_FONT, fontSize=16, leading=20, alignment=1))
+    styles.add(ParagraphStyle(name='FarsiNormal', fontName=PERSIAN_FONT, fontSize=10, leading=14, alignment=2))
+    styles.add(ParagraphStyle(name='FarsiBold', fontName=PERSIAN_FONT, fontSize=12, leading=15, alignment=2))
+
+    header_data = [
+        [farsi("فاکتور فروش"), farsi("داروخانه دکتر فاضل")],
+        [farsi(f"شماره: {data.get('invoice_number')}"), farsi(f"تاریخ: {data.get('invoice_date')}")]
+    ]
+    header_table = Table(header_data, colWidths=[9 * cm, 9 * cm])
+    header_table.setStyle(TableStyle([
+        ('FONTNAME', (0, 0), (-1, -1), PERSIAN_FONT),
+        ('TEXTCOLOR', (0, 0), (-1, -1), colors.darkblue),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+        ('SIZE', (0, 0), (1, 0), 16),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 10),
+        ('LINEBELOW', (0, 1), (-1, 1), 1, colors.black),
+    ]))
+    elements.append(header_table)
+    elements.append(Spacer(1, 0.5 * cm))
+
+    buyer = data.get("buyer_info", {})
+    info_data = [
+        [farsi("مشخصات خریدار"), farsi("مشخصات فروشنده")],
+        [farsi(f"نام: {buyer.get('name')}"), farsi(f"نام: {data['seller_info']['name']}")],
+        [farsi(f"تلفن: {buyer.get('phone')}"), farsi(f"تلفن: {data['seller_info']['phone']}")],
+        [farsi(f"آدرس: {buyer.get('address')}"), farsi(f"آدرس: {data['seller_info']['address']}")]
+    ]
+    info_table = Table(info_data, colWidths=[9.5 * cm, 9.5 * cm])
+    info_table.setStyle(TableStyle([
+        ('FONTNAME', (0, 0), (-1, -1), PERSIAN_FONT),
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+        ('BACKGROUND', (0, 0), (1, 0), colors.lightgrey),
+        ('ALIGN', (0, 0), (-1, -1), 'RIGHT'),
+        ('PADDING', (0, 0), (-1, -1), 6),
+    ]))
+    elements.append(info_table)
+    elements.append(Spacer(1, 1 * cm))
+
+    table_data = [[
+        farsi("قیمت کل (ریال)"),
+        farsi("قیمت واحد (ریال)"),
+        farsi("تعداد"),
+        farsi("نام کالا/خدمات"),
+        farsi("ردیف")
+    ]]
+    total_quantity = 0
+    for idx, item in enumerate(data.get("items", []), 1):
+        table_data.append([
+            f"{item['total_price']:,}",
+            f"{item['unit_price']:,}",
+            str(item['count']),
+            farsi(item['name']),
+            str(idx)
+        ])
+        total_quantity += int(item['count'])
+
+    final_price = data.get("final_total_price", 0)
+    table_data.append([f"{final_price:,}", "", str(total_quantity), farsi("جمع کل"), ""])
+
+    invoice_table = Table(table_data, colWidths=[4 * cm, 4 * cm, 2 * cm, 8 * cm, 1 * cm])
+    style_cmds = [
+        ('FONTNAME', (0, 0), (-1, -1), PERSIAN_FONT),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black),
+        ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),
+        ('FONTSIZE', (0, 0), (-1, -1), 10),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
+        ('TOPPADDING', (0, 0), (-1, -1), 8),
+    ]
+    style_cmds.append(('BACKGROUND', (0, -1), (-1, -1), colors.whitesmoke))
+    style_cmds.append(('FONTSIZE', (0, -1), (-1, -1), 12))
+    invoice_table.setStyle(TableStyle(style_cmds))
+    elements.append(invoice_table)
+
+    elements.append(Spacer(1, 1 * cm))
+    elements.append(Paragraph(farsi(f"مسئول پذیرش: {data.get('cashier_name', '---')}"), styles['FarsiNormal']))
+    if data.get('consultant_name'):
+        elements.append(Paragraph(farsi(f"پزشک مشاور: {data.get('consultant_name')}"), styles['FarsiNormal']))
+
+    doc.build(elements)
+    buffer.seek(0)
+    return buffer
+
+
+def run_case(name: str, render, contexts: list) -> float:
+    timings = []
+    total_bytes = 0
+    for ctx in contexts:
+        started = time.perf_counter()
+        total_bytes += len(render(ctx).getvalue())
+        timings.append(time.perf_counter() - started)
+
+    timings.sort()
+    p50 = statistics.median(timings) * 1000
+    p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))] * 1000
+    mean = statistics.fmean(timings) * 1000
+    print(f"{name:<9} {mean:>9.2f} {p50:>9.2f} {p99:>9.2f} {total_bytes / len(contexts) / 1024:>9.1f}")
+    return mean
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--invoices", type=int, default=200)
+    parser.add_argument("--items", type=int, default=10, help="items per invoice")
+    parser.add_argument("--warmup", type=int, default=10)
+    args = parser.parse_args()
+
+    contexts = [sample_invoice_context(args.items, seed=i) for i in range(args.invoices)]
+    for ctx in contexts[:args.warmup]:
+        legacy_generate_invoice(ctx)
+        generate_complex_invoice(ctx)
+
+    print(f"invoices: {args.invoices}, items/invoice: {args.items}\n")
+    header = f"{'mode':<9} {'mean ms':>9} {'p50 ms':>9} {'p99 ms':>9} {'avg KiB':>9}"
+    print(header)
+    print("-" * len(header))
+    legacy_mean = run_case("legacy", legacy_generate_invoice, contexts)
+    template_mean = run_case("template", generate_complex_invoice, contexts)
+    print(f"\nper-invoice cost reduced by {(1 - template_mean / legacy_mean) * 100:.1f}%")
+
+
+if __name__ == "__main__":
+    main()
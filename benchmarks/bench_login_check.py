@@ -0,0 +1,148 @@
+# benchmarks/bench_login_check.py
+"""
+میکروبنچمارک رقابت روی قفل توکن در APIClient.login_check.
+
+تعداد زیادی get_user_role همزمان به یک سرور محلی aiohttp (stub بک‌اند) ارسال می‌شود و زمان انتظار
+داخل login_check و زمان کل اندازه‌گیری می‌شود. دو پیاده‌سازی مقایسه می‌شوند:
+  locked : روش قبلی؛ هر فراخوانی قفل را می‌گیرد حتی وقتی توکن معتبر است.
+  fast   : مسیر سریع بدون قفل؛ قفل فقط هنگام لاگین/تمدید گرفته می‌شود.
+
+و دو سناریو:
+  warm    : توکن معتبر از قبل موجود است.
+  renewal : همزمان با رسیدن درخواست‌ها، تمدید پس‌زمینه توکن (با لاگین کند) قفل را نگه داشته است.
+
+ستون‌های wait فقط زمان داخل login_check را نشان می‌دهند. زمان کل بیشتر به صف استخر اتصال httpx
+(API_POOL_MAX_CONNECTIONS) وابسته است. در نسخه locked، قفل خودش جلوی ورود همزمان درخواست‌ها به آن صف را می‌گیرد.
+
+اجرا:
+    python -m benchmarks.bench_login_check --calls 10000 --login-latency-ms 200
+"""
+
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import time
+
+# تنظیمات حداقلی برای اینکه app.core.setting بدون فایل .env هم ایمپورت شود
+os.environ.setdefault("BOT_TOKEN", "42:BENCHMARK")
+os.environ.setdefault("API_BASE_URL", "http://127.0.0.1:9")
+os.environ.setdefault("API_USERNAME", "bench")
+os.environ.setdefault("API_PASSWORD", "bench")
+os.environ.setdefault("ACCESS_TOKEN_EXPIRE_MINUTES", "60")
+
+import logging  # noqa: E402
+
+from aiohttp import web  # noqa: E402
+
+from app.core.API_Client import APIClient  # noqa: E402
+
+
+class TimedAPIClient(APIClient):
+    """زمان صرف‌شده داخل login_check را برای هر فراخوانی ثبت می‌کند."""
+
+    def __init__(self, base_url: str):
+        super().__init__(base_url)
+        self.login_check_waits = []
+
+    async def login_check(self):
+        started = time.perf_counter()
+        token = await super().login_check()
+        self.login_check_waits.append(time.perf_counter() - started)
+        return token
+
+
+class LockedAPIClient(TimedAPIClient):
+    """پیاده‌سازی قبلی login_check: قفل در هر فراخوانی گرفته می‌شود."""
+
+    async def login_check(self):
+        started = time.perf_counter()
+        async with self._lock:
+            if not self._token_is_valid():
+                await self._login()
+        self.login_check_waits.append(time.perf_counter() - started)
+        return self._token
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def start_stub_server(port: int, login_latency: float) -> web.AppRunner:
+    async def login(request: web.Request) -> web.Response:
+        await asyncio.sleep(login_latency)
+        return web.json_response({"access_token": f"token-{time.monotonic_ns()}"})
+
+    async def role(request: web.Request) -> web.Response:
+        return web.json_response({"role_name": "Patient"})
+
+    app = web.Application()
+    app.router.add_post("/login/access-token", login)
+    app.router.add_get("/user/role-by-telegram-id/{telegram_id}", role)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    return runner
+
+
+async def run_case(client_cls, base_url: str, calls: int, scenario: str) -> dict:
+    client = client_cls(base_url)
+    try:
+        await client.login_check()
+        client.login_check_waits.clear()
+
+        if scenario == "renewal":
+            # شبیه‌سازی تمدید پس‌زمینه: قفل در طول یک لاگین کند نگه داشته می‌شود
+            asyncio.create_task(client._refresh_token(stale_token=client._token))
+            await asyncio.sleep(0)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client.get_user_role(i) for i in range(calls)))
+        elapsed = time.perf_counter() - started
+    finally:
+        await client.close()
+
+    waits = sorted(client.login_check_waits)
+    return {
+        "total_s": elapsed,
+        "mean_wait_us": statistics.fmean(waits) * 1e6,
+        "p99_wait_us": waits[int(len(waits) * 0.99) - 1] * 1e6,
+        "max_wait_us": waits[-1] * 1e6,
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=10_000)
+    parser.add_argument("--login-latency-ms", type=float, default=200.0)
+    args = parser.parse_args()
+
+    # لاگ هر درخواست در این حجم خود اندازه‌گیری را خراب می‌کند
+    logging.disable(logging.CRITICAL)
+
+    port = free_port()
+    runner = await start_stub_server(port, args.login_latency_ms / 1000)
+    base_url = f"http://127.0.0.1:{port}"
+
+    print(f"concurrent get_user_role calls: {args.calls}, login latency: {args.login_latency_ms} ms\n")
+    header = f"{'impl':<7} {'scenario':<8} {'total s':>8} {'mean wait µs':>13} {'p99 wait µs':>12} {'max wait µs':>12}"
+    print(header)
+    print("-" * len(header))
+    try:
+        for scenario in ("warm", "renewal"):
+            for name, client_cls in (("locked", LockedAPIClient), ("fast", TimedAPIClient)):
+                result = await run_case(client_cls, base_url, args.calls, scenario)
+                print(
+                    f"{name:<7} {scenario:<8} {result['total_s']:>8.2f} {result['mean_wait_us']:>13.1f} "
+                    f"{result['p99_wait_us']:>12.1f} {result['max_wait_us']:>12.1f}"
+                )
+            print()
+    finally:
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
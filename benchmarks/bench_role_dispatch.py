@@ -0,0 +1,139 @@
+# benchmarks/bench_role_dispatch.py
+"""
+بنچمارک هزینه dispatch هر آپدیت برای هر نقش، با یک APIClient شبیه‌سازی‌شده.
+
+سه حالت مقایسه می‌شوند:
+  legacy   : روش قبلی؛ هر روتر RoleFilter خودش را دارد و هر فیلتر یک بار get_user_role صدا می‌زند.
+  filters  : RoleMiddleware نقش را یک بار تشخیص می‌دهد و RoleFilterها از همان استفاده می‌کنند.
+  direct   : RoleMiddleware + RoleRouter؛ آپدیت مستقیماً به روتر نقش کاربر می‌رود.
+
+اجرا:
+    python -m benchmarks.bench_role_dispatch --updates 2000 --latency-ms 2
+"""
+
+import argparse
+import asyncio
+import datetime
+import os
+import statistics
+import time
+
+# تنظیمات حداقلی برای اینکه app.core.setting بدون فایل .env هم ایمپورت شود
+os.environ.setdefault("BOT_TOKEN", "42:BENCHMARK")
+os.environ.setdefault("API_BASE_URL", "http://127.0.0.1:9")
+os.environ.setdefault("API_USERNAME", "bench")
+os.environ.setdefault("API_PASSWORD", "bench")
+os.environ.setdefault("ACCESS_TOKEN_EXPIRE_MINUTES", "60")
+
+from aiogram import Bot, Dispatcher, Router  # noqa: E402
+from aiogram.types import Chat, Message, Update, User  # noqa: E402
+
+from app.core.role_resolver import RoleResolver  # noqa: E402
+from app.core.role_router import register_role_routers  # noqa: E402
+from app.middleware.middlewares import RoleMiddleware  # noqa: E402
+
+ROLES = ["Patient", "Consultant", "Casher"]
+# شناسه کاربران نمونه برای هر نقش
+ROLE_USERS = {"Patient": 1001, "Consultant": 2002, "Casher": 3003}
+
+
+class StubAPIClient:
+    """جایگزین APIClient که فقط get_user_role را با تأخیر شبکه شبیه‌سازی می‌کند."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls = 0
+        self._roles = {uid: role for role, uid in ROLE_USERS.items()}
+
+    async def get_user_role(self, telegram_id: int) -> str:
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        return self._roles.get(telegram_id % 10_000, "Patient")
+
+
+def build_dispatcher(mode: str, api_client: StubAPIClient) -> Dispatcher:
+    routes = {}
+    for role in ROLES:
+        router = Router(name=role)
+
+        @router.message()
+        async def _handler(message: Message) -> None:
+            return None
+
+        routes[role] = router
+
+    if mode == "legacy":
+        dp = Dispatcher(api_client=api_client)
+        register_role_routers(dp, routes, mode="filters")
+        return dp
+
+    resolver = RoleResolver(api_client, ttl=300, maxsize=10_000)
+    dp = Dispatcher(api_client=api_client, role_resolver=resolver)
+    dp.update.outer_middleware(RoleMiddleware(resolver))
+    register_role_routers(dp, routes, mode="direct" if mode == "direct" else "filters")
+    return dp
+
+
+def make_update(update_id: int, user_id: int) -> Update:
+    return Update(
+        update_id=update_id,
+        message=Message(
+            message_id=update_id,
+            date=datetime.datetime.now(),
+            chat=Chat(id=user_id, type="private"),
+            from_user=User(id=user_id, is_bot=False, first_name="bench"),
+            text="hello",
+        ),
+    )
+
+
+async def run_case(mode: str, role: str, updates: int, latency: float, cold: bool) -> dict:
+    api_client = StubAPIClient(latency)
+    dp = build_dispatcher(mode, api_client)
+    bot = Bot("42:BENCHMARK")
+    base_user = ROLE_USERS[role]
+
+    durations = []
+    try:
+        for i in range(updates):
+            # در حالت cold هر آپدیت از یک کاربر جدید (با همان نقش) است و کش کمکی نمی‌کند
+            user_id = base_user + (i + 1) * 10_000 if cold else base_user
+            update = make_update(i, user_id)
+            started = time.perf_counter()
+            await dp.feed_update(bot, update)
+            durations.append(time.perf_counter() - started)
+    finally:
+        await bot.session.close()
+
+    return {
+        "mean_us": statistics.fmean(durations) * 1e6,
+        "p99_us": sorted(durations)[int(len(durations) * 0.99) - 1] * 1e6,
+        "api_calls_per_update": api_client.calls / updates,
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--updates", type=int, default=1000)
+    parser.add_argument("--latency-ms", type=float, default=2.0, help="simulated get_user_role latency")
+    args = parser.parse_args()
+    latency = args.latency_ms / 1000
+
+    print(f"updates per case: {args.updates}, stub latency: {args.latency_ms} ms\n")
+    header = f"{'mode':<8} {'cache':<5} {'role':<11} {'mean µs':>10} {'p99 µs':>10} {'API calls/update':>17}"
+    print(header)
+    print("-" * len(header))
+    for cold in (False, True):
+        for role in ROLES:
+            for mode in ("legacy", "filters", "direct"):
+                result = await run_case(mode, role, args.updates, latency, cold)
+                print(
+                    f"{mode:<8} {'cold' if cold else 'warm':<5} {role:<11} "
+                    f"{result['mean_us']:>10.1f} {result['p99_us']:>10.1f} "
+                    f"{result['api_calls_per_update']:>17.2f}"
+                )
+            print()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,72 @@
+# benchmarks/bench_text_shaping.py
+"""
+میکروبنچمارک شکل‌دهی متن فارسی: reshape + bidi بدون کش در برابر shape_persian (کش LRU).
+
+پیکره آزمون همان رشته‌هایی است که در فاکتورها تکرار می‌شوند: نام داروها، اطلاعات فروشنده/خریدار و برچسب‌ها.
+ترتیب رشته‌ها تصادفی با توزیع نامتوازن است (چند داروی پرفروش بیشتر تکرار می‌شوند)، مثل فاکتورهای واقعی.
+
+اجرا:
+    python -m benchmarks.bench_text_shaping --lookups 50000
+"""
+
+import argparse
+import random
+import time
+
+import arabic_reshaper
+from bidi.algorithm import get_display
+
+from app.utils.text_shaping import clear_shaping_cache, shape_persian, shaping_cache_stats
+from benchmarks.invoice_samples import DRUG_NAMES, sample_invoice_context
+
+
+def build_corpus(lookups: int, seed: int = 0) -> list:
+    ctx = sample_invoice_context(0)
+    fixed = [
+        f"نام: {ctx['seller_info']['name']}", f"آدرس: {ctx['seller_info']['address']}",
+        f"نام: {ctx['buyer_info']['name']}", f"آدرس: {ctx['buyer_info']['address']}",
+        f"مسئول پذیرش: {ctx['cashier_name']}", f"پزشک مشاور: {ctx['consultant_name']}",
+    ]
+    population = DRUG_NAMES + fixed
+    # وزن‌ها: توزیع شبه zipf روی رشته‌ها
+    weights = [1 / (rank + 1) for rank in range(len(population))]
+    rng = random.Random(seed)
+    return rng.choices(population, weights=weights, k=lookups)
+
+
+def shape_uncached(text: str) -> str:
+    return get_display(arabic_reshaper.reshape(text))
+
+
+def run_case(name: str, shape, corpus: list) -> float:
+    started = time.perf_counter()
+    for text in corpus:
+        shape(text)
+    elapsed = time.perf_counter() - started
+    print(f"{name:<9} {elapsed:>9.3f} {elapsed / len(corpus) * 1e6:>12.2f} {len(corpus) / elapsed:>14.0f}")
+    return elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lookups", type=int, default=50_000)
+    args = parser.parse_args()
+
+    corpus = build_corpus(args.lookups)
+    clear_shaping_cache()
+
+    mismatches = [t for t in set(corpus) if shape_persian(t) != shape_uncached(t)]
+    assert not mismatches, f"cached output differs for {mismatches[:3]}"
+    clear_shaping_cache()
+
+    print(f"lookups: {len(corpus)}, distinct strings: {len(set(corpus))}\n")
+    header = f"{'mode':<9} {'total s':>9} {'us/lookup':>12} {'lookups/s':>14}"
+    print(header)
+    print("-" * len(header))
+    uncached = run_case("uncached", shape_uncached, corpus)
+    cached = run_case("cached", shape_persian, corpus)
+    print(f"\nspeedup: {uncached / cached:.1f}x, cache: {shaping_cache_stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+# benchmarks/invoice_samples.py
+"""داده نمونه فاکتور برای بنچمارک‌های صدور PDF (همان ساختار invoice_context در process_approve_payment)."""
+
+import random
+
+# نام‌های واقعی‌نما از داروهای رایج داروخانه
+DRUG_NAMES = [
+    "استامینوفن ۵۰۰ میلی‌گرم", "ایبوپروفن ۴۰۰", "آموکسی‌سیلین ۵۰۰", "آزیترومایسین ۲۵۰",
+    "سفیکسیم ۴۰۰", "امپرازول ۲۰", "پنتوپرازول ۴۰", "متفورمین ۵۰۰", "گلی‌بن‌کلامید ۵",
+    "آتورواستاتین ۲۰", "لوزارتان ۲۵", "آملودیپین ۵", "متوپرولول ۵۰", "لووتیروکسین ۱۰۰",
+    "ویتامین د ۵۰۰۰۰", "قرص آهن", "اسید فولیک ۱", "کلسیم دی", "زینک ۵۰", "منیزیم ۲۵۰",
+    "شربت دیفن‌هیدرامین", "شربت اکسپکتورانت", "قطره سرماخوردگی اطفال", "پماد بتامتازون",
+    "کرم کلوتریمازول", "اسپری سالبوتامول", "سرم شستشوی بینی", "قرص سرماخوردگی بزرگسالان",
+    "دم‌نوش گیاهی آرام‌بخش", "کپسول امگا ۳", "ژل آلوئه‌ورا", "قرص مولتی‌ویتامین",
+]
+
+
+def sample_invoice_context(items: int = 10, seed: int = 0) -> dict:
+    rng = random.Random(seed)
+    invoice_items = []
+    for _ in range(items):
+        count = rng.randint(1, 5)
+        unit_price = rng.randrange(50_000, 2_500_000, 10_000)
+        invoice_items.append({
+            "name": rng.choice(DRUG_NAMES),
+            "count": count,
+            "unit_price": unit_price,
+            "total_price": count * unit_price,
+        })
+
+    return {
+        "invoice_date": "1403/07/15",
+        "invoice_number": str(1000 + seed),
+        "payment_date": "1403/07/15",
+        "seller_info": {"name": "داروخانه دکتر فاضل", "address": "مشهد", "phone": "021-00000000"},
+        "buyer_info": {"name": "مریم احمدی", "address": "مشهد، بلوار وکیل‌آباد، کوچه ۱۲", "phone": "09120000000"},
+        "consultant_name": "دکتر رضایی",
+        "cashier_name": "صندوق‌دار",
+        "items": invoice_items,
+        "final_total_price": sum(i["total_price"] for i in invoice_items),
+    }
@@ -0,0 +1,153 @@
+# benchmarks/webhook_load_test.py
+"""
+تست بار حالت وب‌هوک: آپدیت‌های مصنوعی تلگرام به سرور محلی aiohttp ارسال می‌شوند و
+تأخیر هر آپدیت (از لحظه ارسال تا پایان هندلر) اندازه گرفته می‌شود.
+
+درصدی از آپدیت‌ها "کند" هستند (شبیه صدور فاکتور PDF صندوق‌دار) تا اثر استخر worker روی
+بقیه کاربران دیده شود. با --workers 1 رفتار ترتیبی قبلی شبیه‌سازی می‌شود.
+
+اجرا:
+    python -m benchmarks.webhook_load_test --updates 2000 --users 200 --workers 16
+    python -m benchmarks.webhook_load_test --updates 2000 --users 200 --workers 1
+"""
+
+import argparse
+import asyncio
+import datetime
+import os
+import random
+import socket
+import statistics
+import time
+
+# تنظیمات حداقلی برای اینکه app.core.setting بدون فایل .env هم ایمپورت شود
+os.environ.setdefault("BOT_TOKEN", "42:BENCHMARK")
+os.environ.setdefault("API_BASE_URL", "http://127.0.0.1:9")
+os.environ.setdefault("API_USERNAME", "bench")
+os.environ.setdefault("API_PASSWORD", "bench")
+os.environ.setdefault("ACCESS_TOKEN_EXPIRE_MINUTES", "60")
+
+import aiohttp  # noqa: E402
+from aiogram import Bot, Dispatcher, Router  # noqa: E402
+from aiogram.types import Message  # noqa: E402
+
+from app.core.webhook import SECRET_HEADER, WebhookServer  # noqa: E402
+
+SECRET = "load-test-secret"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def make_update(update_id: int, user_id: int, slow: bool) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(datetime.datetime.now().timestamp()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "load"},
+            "text": "/invoice" if slow else "hello",
+        },
+    }
+
+
+def percentile(values: list, pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+async def run(args: argparse.Namespace) -> None:
+    sent_at: dict = {}
+    finished_at: dict = {}
+    slow_ids: set = set()
+
+    router = Router()
+
+    @router.message()
+    async def _handler(message: Message) -> None:
+        if message.text == "/invoice":
+            await asyncio.sleep(args.slow_ms / 1000)
+        else:
+            await asyncio.sleep(args.fast_ms / 1000)
+        finished_at[message.message_id] = time.perf_counter()
+
+    dp = Dispatcher()
+    dp.include_router(router)
+    bot = Bot("42:BENCHMARK")
+
+    port = free_port()
+    server = WebhookServer(
+        dp,
+        bot,
+        path="/webhook",
+        secret=SECRET,
+        host="127.0.0.1",
+        port=port,
+        workers=args.workers,
+        queue_size=args.queue_size,
+        drain_timeout=60,
+    )
+    await server.start()
+
+    rng = random.Random(42)
+    rejected = 0
+    semaphore = asyncio.Semaphore(args.concurrency)
+    url = f"http://127.0.0.1:{port}/webhook"
+
+    async with aiohttp.ClientSession(headers={SECRET_HEADER: SECRET}) as session:
+        async def post(update_id: int) -> None:
+            nonlocal rejected
+            slow = rng.random() < args.slow_ratio
+            if slow:
+                slow_ids.add(update_id)
+            payload = make_update(update_id, rng.randrange(args.users) + 1, slow)
+            async with semaphore:
+                sent_at[update_id] = time.perf_counter()
+                async with session.post(url, json=payload) as response:
+                    if response.status != 200:
+                        rejected += 1
+                        sent_at.pop(update_id, None)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(post(i + 1) for i in range(args.updates)))
+
+    # خاموشی تدریجی: همه آپدیت‌های پذیرفته‌شده باید قبل از بسته شدن پردازش شوند
+    await server.stop()
+    elapsed = time.perf_counter() - started
+    await bot.session.close()
+
+    fast = [finished_at[i] - sent_at[i] for i in sent_at if i not in slow_ids and i in finished_at]
+    slow = [finished_at[i] - sent_at[i] for i in sent_at if i in slow_ids and i in finished_at]
+    lost = len(sent_at) - len(fast) - len(slow)
+
+    print(f"workers={args.workers} updates={args.updates} users={args.users} "
+          f"slow_ratio={args.slow_ratio} slow={args.slow_ms}ms fast={args.fast_ms}ms")
+    print(f"total time: {elapsed:.2f}s, throughput: {len(finished_at) / elapsed:.0f} updates/s, "
+          f"rejected (503): {rejected}, lost after drain: {lost}")
+    for name, values in (("fast", fast), ("slow", slow)):
+        if not values:
+            continue
+        print(f"{name:<5} n={len(values):<6} mean={statistics.fmean(values) * 1000:8.1f}ms "
+              f"p50={percentile(values, 50) * 1000:8.1f}ms p99={percentile(values, 99) * 1000:8.1f}ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--queue-size", type=int, default=10_000)
+    parser.add_argument("--concurrency", type=int, default=100, help="concurrent HTTP posts")
+    parser.add_argument("--slow-ratio", type=float, default=0.05, help="share of slow (PDF-like) updates")
+    parser.add_argument("--slow-ms", type=float, default=300.0)
+    parser.add_argument("--fast-ms", type=float, default=2.0)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
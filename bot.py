@@ -7,14 +7,25 @@ from aiogram import Bot, Dispatcher
 from aiogram.enums import ParseMode
 from aiogram.client.default import DefaultBotProperties
 
-from app.middleware.middlewares import ThrottlingMiddleware # فرض بر اینکه فایل را ساختید
+from app.middleware.middlewares import ThrottlingMiddleware, RoleMiddleware # فرض بر اینکه فایل را ساختید
 
 
 from app.casher.handlers import casher_router
 from app.consultant.handlers import consultant_router
 from app.core.setting import settings
 from app.core.API_Client import APIClient
+from app.core.fsm_storage import build_fsm_storage
+from app.core.role_resolver import RoleResolver
+from app.core.role_router import register_role_routers
+from app.core.webhook import run_webhook
 from app.filters.role_filter import RoleFilter
+from app.storage import ContentStore, build_attachment_storage
+from app.utils.background import BackgroundTasks
+from app.utils.downloads import TelegramDownloader
+from app.utils.file_id_cache import FileIdCache
+from app.utils.image_service import ImageProcessingService
+from app.utils.invoice_cache import InvoiceCache
+from app.utils.invoice_service import InvoiceRenderService
 
 # ایمپورت کردن روترهای جدید از فایل‌هایشان
 from app.admin.handlers import admin_router
@@ -30,6 +41,61 @@ async def main() -> None:
     # این کلاینت به عنوان یک وابستگی به Dispatcher تزریق می‌شود تا در فیلترها در دسترس باشد
     api_client = APIClient(base_url=settings.API_BASE_URL)
 
+    # لایه تشخیص نقش با کش مشترک؛ نقش هر کاربر در هر آپدیت فقط یک بار بررسی می‌شود
+    role_resolver = RoleResolver(
+        api_client,
+        ttl=settings.ROLE_CACHE_TTL_SECONDS,
+        maxsize=settings.ROLE_CACHE_MAX_SIZE,
+    )
+
+    # صدور PDF فاکتور در پروسه‌های جداگانه تا حلقه رویداد ربات قفل نشود
+    invoice_service = InvoiceRenderService(
+        workers=settings.INVOICE_POOL_WORKERS,
+        max_pending=settings.INVOICE_MAX_PENDING,
+        timeout=settings.INVOICE_RENDER_TIMEOUT,
+    )
+    # فاکتورهای تکراری (تایید دوباره، ارسال مجدد) از دیسک یا با file_id تلگرام فرستاده می‌شوند
+    invoice_cache = InvoiceCache(
+        settings.INVOICE_CACHE_DIR,
+        max_bytes=settings.INVOICE_CACHE_MAX_MB * 1024 * 1024,
+        max_entries=settings.INVOICE_CACHE_MAX_ENTRIES,
+    )
+
+    # پیوست‌های تاریخچه چت بعد از اولین آپلود فقط با file_id فرستاده می‌شوند
+    file_id_cache = FileIdCache(
+        settings.FILE_ID_CACHE_PATH,
+        memory_size=settings.FILE_ID_CACHE_MEMORY_SIZE,
+    )
+
+    # پیوست‌های بیماران (عکس، ویس، رسید) روی دیسک محلی یا یک object store سازگار با S3
+    attachment_storage = build_attachment_storage()
+    # فایل‌های تکراری (رسید دوباره، آلبوم فوروارد شده) یک بار دانلود و با هش محتوا ذخیره می‌شوند
+    content_store = (
+        ContentStore(attachment_storage, settings.ATTACHMENT_INDEX_PATH) if settings.ATTACHMENT_DEDUP else None
+    )
+
+    # preview و thumb عکس‌ها در پروسه‌های جداگانه؛ دکمه «فایل اصلی» به شناسه فایل در content_store نیاز دارد
+    image_service = None
+    if settings.IMAGE_PREVIEWS and content_store is not None:
+        image_service = ImageProcessingService(
+            workers=settings.IMAGE_POOL_WORKERS,
+            max_pending=settings.IMAGE_MAX_PENDING,
+            timeout=settings.IMAGE_PROCESS_TIMEOUT,
+            preview_size=settings.IMAGE_PREVIEW_SIZE,
+            thumb_size=settings.IMAGE_THUMB_SIZE,
+            quality=settings.IMAGE_JPEG_QUALITY,
+            max_source_bytes=settings.IMAGE_MAX_SOURCE_MB * 1024 * 1024,
+        )
+
+    # دانلود همزمان فایل‌های کاربران (مثلاً عکس‌های ثبت‌نام) با سقف همزمانی
+    downloader = TelegramDownloader(
+        concurrency=settings.DOWNLOAD_CONCURRENCY,
+        timeout=settings.DOWNLOAD_TIMEOUT_SECONDS,
+    )
+
+    # کارهایی مثل آرشیو رسانه‌ها که پاسخ به کاربر نباید منتظرشان بماند
+    background_tasks = BackgroundTasks()
+
     # ۲. ساخت Bot و Dispatcher
     bot = Bot(
         token=settings.BOT_TOKEN.get_secret_value(),
@@ -37,34 +103,44 @@ async def main() -> None:
     )
     # پاس دادن نمونه api_client به dispatcher در زمان ساخت
     # حالا در تمام فیلترها و میدل‌ورها به متغیر 'api_client' دسترسی داریم
-    dp = Dispatcher(api_client=api_client)
+    # استوریج FSM از تنظیمات انتخاب می‌شود تا جلسات کاربران با ری‌استارت از بین نروند
+    dp = Dispatcher(
+        storage=build_fsm_storage(),
+        api_client=api_client,
+        role_resolver=role_resolver,
+        invoice_service=invoice_service,
+        invoice_cache=invoice_cache,
+        file_id_cache=file_id_cache,
+        background_tasks=background_tasks,
+        downloader=downloader,
+        attachment_storage=attachment_storage,
+        content_store=content_store,
+        image_service=image_service,
+    )
+
+    # تشخیص نقش یک بار برای کل آپدیت، قبل از اینکه فیلتر هیچ روتری اجرا شود
+    dp.update.outer_middleware(RoleMiddleware(role_resolver))
 
     # فعال کردن Throttling برای همه پیام‌ها (مثلا 0.7 ثانیه فاصله بین پیام‌ها)
     dp.message.middleware(ThrottlingMiddleware(limit=0.7))
     dp.callback_query.middleware(ThrottlingMiddleware(limit=0.7))
 
-    # ۳. ثبت روترها با فیلتر نقش
+    # ۳. ثبت روترها بر اساس نقش
     # این روتر فقط برای کاربرانی با نقش "Admin" فعال می‌شود
     # admin_router.message.filter(RoleFilter(allowed_roles=["Admin"]))
     # dp.include_router(admin_router)
 
-
-    # این روتر فقط برای کاربرانی با نقش "Patient" فعال می‌شود
-    patient_router.message.filter(RoleFilter(allowed_roles=["Patient"]))
-    patient_router.callback_query.filter(RoleFilter(allowed_roles=["Patient"]))
-
-    dp.include_router(patient_router)
-
-
-    # در آینده می‌توانید به همین ترتیب روترهای دیگر را اضافه کنید
-    consultant_router.message.filter(RoleFilter(allowed_roles=["Consultant"]))
-    consultant_router.callback_query.filter(RoleFilter(allowed_roles=["Consultant"]))
-    dp.include_router(consultant_router)
-
-
-    casher_router.message.filter(RoleFilter(allowed_roles=["Casher"]))
-    casher_router.callback_query.filter(RoleFilter(allowed_roles=["Casher"]))
-    dp.include_router(casher_router)
+    # در حالت direct هر آپدیت فقط به روتر نقش خود کاربر می‌رود و روترهای دیگر بررسی نمی‌شوند
+    # در حالت filters روترها مثل قبل به ترتیب و هر کدام با RoleFilter خودشان بررسی می‌شوند
+    register_role_routers(
+        dp,
+        {
+            "Patient": patient_router,
+            "Consultant": consultant_router,
+            "Casher": casher_router,
+        },
+        mode=settings.ROLE_DISPATCH_MODE,
+    )
 
     # ۴. اجرای ربات
     try:
@@ -72,8 +148,39 @@ async def main() -> None:
         await api_client.login_check()  # بیایید یک نام بهتر برای این تابع بگذاریم
         logging.info("API Health check passed. Starting bot...")
 
-        await dp.start_polling(bot)
+        # متن‌های CMS یک‌جا بارگذاری می‌شوند تا هندلرها برای هر متن درخواست جداگانه نزنند
+        await api_client.start_content_cache()
+        await invoice_service.start()
+        await invoice_cache.start()
+        if image_service is not None:
+            await image_service.start()
+
+        if settings.BOT_RUN_MODE == "webhook":
+            secret = settings.WEBHOOK_SECRET.get_secret_value() if settings.WEBHOOK_SECRET else None
+            await run_webhook(
+                dp,
+                bot,
+                base_url=settings.WEBHOOK_BASE_URL,
+                path=settings.WEBHOOK_PATH,
+                secret=secret,
+                host=settings.WEBAPP_HOST,
+                port=settings.WEBAPP_PORT,
+                workers=settings.UPDATE_WORKERS,
+                queue_size=settings.UPDATE_QUEUE_SIZE,
+                drain_timeout=settings.SHUTDOWN_DRAIN_TIMEOUT,
+            )
+        else:
+            await dp.start_polling(bot)
     finally:
+        # کارهای پس‌زمینه هنوز به API و Bot نیاز دارند، پس قبل از بستن آن‌ها تمام می‌شوند
+        await background_tasks.drain(timeout=settings.SHUTDOWN_DRAIN_TIMEOUT)
+        await invoice_service.shutdown()
+        if image_service is not None:
+            await image_service.shutdown(timeout=settings.SHUTDOWN_DRAIN_TIMEOUT)
+        await file_id_cache.close()
+        if content_store is not None:
+            await content_store.close()
+        await attachment_storage.close()
         await api_client.close()
         await bot.session.close()
         logging.info("Bot stopped and sessions closed.")
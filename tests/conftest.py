@@ -0,0 +1,12 @@
+# tests/conftest.py
+import os
+import sys
+
+# Settings در زمان import ساخته می‌شود و این مقادیر را اجباری می‌داند؛ تست‌ها به API واقعی وصل نمی‌شوند
+os.environ.setdefault("BOT_TOKEN", "42:TEST")
+os.environ.setdefault("API_BASE_URL", "http://127.0.0.1:1")
+os.environ.setdefault("API_USERNAME", "test")
+os.environ.setdefault("API_PASSWORD", "test")
+os.environ.setdefault("ACCESS_TOKEN_EXPIRE_MINUTES", "5")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,353 @@
+# tests/test_api_client.py
+import asyncio
+import base64
+import json
+import time
+
+import httpx
+import pytest
+
+from app.core.API_Client import APIClient, _BearerAuth
+from app.core.http_pool import build_http_client
+from app.core.resilience import APIError, CircuitBreaker, CircuitOpenError
+from app.core.setting import settings
+
+
+def make_token(name: str, lifetime: float = 3600) -> str:
+    payload = base64.urlsafe_b64encode(json.dumps({"sub": name, "exp": time.time() + lifetime}).encode())
+    return f"header.{payload.decode().rstrip('=')}.signature"
+
+
+class FakeBackend:
+    """بک‌اند ساختگی: لاگین توکن تازه می‌دهد و فقط آخرین توکن معتبر است."""
+
+    def __init__(self, lifetime: float = 3600):
+        self.lifetime = lifetime
+        self.logins = 0
+        self.valid_token = None
+        self.requests = []
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/login/access-token":
+            self.logins += 1
+            self.valid_token = make_token(f"t{self.logins}", self.lifetime)
+            return httpx.Response(200, json={"access_token": self.valid_token})
+        self.requests.append(request)
+        if request.headers.get("Authorization") != f"Bearer {self.valid_token}":
+            return httpx.Response(401, json={"detail": "Could not validate credentials"})
+        return httpx.Response(200, json={"role_name": "Consultant"})
+
+
+def make_client(handler) -> APIClient:
+    client = APIClient("http://api.test")
+    client._client = build_http_client(transport=httpx.MockTransport(handler))
+    client._client.auth = _BearerAuth(client)
+    return client
+
+
+def run(client: APIClient, coro_factory):
+    async def scenario():
+        try:
+            return await coro_factory()
+        finally:
+            await client.close()
+
+    return asyncio.run(scenario())
+
+
+def test_token_expiry_is_read_from_jwt():
+    token = make_token("x", lifetime=120)
+    assert abs(APIClient._read_token_expiry(token) - (time.time() + 120)) < 2
+    assert APIClient._read_token_expiry("not-a-jwt") > time.time()
+
+
+def test_401_refreshes_the_token_once():
+    backend = FakeBackend()
+    client = make_client(backend)
+
+    async def scenario():
+        await client.login_check()
+        # بک‌اند توکن را باطل کرده (مثلاً ری‌استارت شده)
+        backend.valid_token = "revoked"
+        return await client.get_user_role(1)
+
+    assert run(client, scenario) == "Consultant"
+    assert backend.logins == 2
+    assert len(backend.requests) == 2
+
+
+def test_concurrent_401s_share_one_login():
+    backend = FakeBackend()
+    client = make_client(backend)
+
+    async def scenario():
+        await client.login_check()
+        backend.valid_token = "revoked"
+        return await asyncio.gather(*(client.get_user_role(i) for i in range(5)))
+
+    assert run(client, scenario) == ["Consultant"] * 5
+    assert backend.logins == 2
+
+
+def test_token_is_renewed_in_background_before_expiry():
+    backend = FakeBackend(lifetime=2.4)
+    client = make_client(backend)
+
+    async def scenario():
+        first = await client.login_check()
+        await asyncio.sleep(1.5)
+        return first, client._token
+
+    first, renewed = run(client, scenario)
+    assert backend.logins == 2
+    assert renewed != first
+
+
+def test_login_check_does_not_wait_for_a_renewal():
+    backend = FakeBackend()
+    client = make_client(backend)
+
+    async def scenario():
+        token = await client.login_check()
+        async with client._lock:
+            # تمدید پس‌زمینه قفل را گرفته؛ توکن فعلی هنوز معتبر است و بدون انتظار برگردانده می‌شود
+            return token, await asyncio.wait_for(client.login_check(), timeout=0.1)
+
+    token, during_renewal = run(client, scenario)
+    assert during_renewal == token
+    assert backend.logins == 1
+
+
+def test_expired_token_triggers_login():
+    backend = FakeBackend()
+    client = make_client(backend)
+
+    async def scenario():
+        first = await client.login_check()
+        client._token_expires_at = time.time() - 1
+        return first, await client.login_check()
+
+    first, second = run(client, scenario)
+    assert first != second
+    assert backend.logins == 2
+
+
+def role_backend(handler):
+    """بک‌اند ساختگی با لاگین همیشه موفق؛ بقیه درخواست‌ها به handler سپرده می‌شوند."""
+
+    async def backend(request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/login/access-token":
+            return httpx.Response(200, json={"access_token": make_token("t")})
+        return await handler(request)
+
+    return backend
+
+
+def test_client_timeout_applies_without_endpoint_override(monkeypatch):
+    seen = []
+
+    async def handler(request):
+        seen.append(request.extensions["timeout"])
+        return httpx.Response(200, json={"role_name": "Patient"})
+
+    client = make_client(role_backend(handler))
+    monkeypatch.setattr(settings, "API_ENDPOINT_TIMEOUTS", {"get_user_role": 2.0})
+
+    async def scenario():
+        await client.get_user_role(1)
+        monkeypatch.setattr(settings, "API_ENDPOINT_TIMEOUTS", {})
+        await client.get_user_role(2)
+
+    run(client, scenario)
+    assert seen[0]["read"] == 2.0
+    assert seen[1]["read"] == settings.API_READ_TIMEOUT
+    assert seen[1]["connect"] == settings.API_CONNECT_TIMEOUT
+
+
+def test_get_is_retried_on_503(monkeypatch):
+    monkeypatch.setattr(settings, "API_RETRY_BACKOFF_BASE", 0)
+    statuses = [503, 200]
+
+    async def handler(request):
+        return httpx.Response(statuses.pop(0), json={"role_name": "Casher"})
+
+    client = make_client(role_backend(handler))
+    assert run(client, lambda: client.get_user_role(1)) == "Casher"
+    assert statuses == []
+
+
+def test_server_errors_open_the_circuit(monkeypatch):
+    monkeypatch.setattr(settings, "API_RETRY_ATTEMPTS", 0)
+    calls = []
+
+    async def handler(request):
+        calls.append(request)
+        return httpx.Response(500, json={"detail": "boom"})
+
+    client = make_client(role_backend(handler))
+    client._breaker = CircuitBreaker(failure_threshold=2, recovery_timeout=60)
+
+    async def scenario():
+        for _ in range(3):
+            with pytest.raises(APIError) as error:
+                await client.get_user_role(1)
+        return error.value
+
+    assert isinstance(run(client, scenario), CircuitOpenError)
+    assert len(calls) == 2
+
+
+def test_cancelled_probe_does_not_block_the_circuit():
+    gate = asyncio.Event()
+
+    async def handler(request):
+        if not gate.is_set():
+            await asyncio.sleep(0.3)
+        return httpx.Response(200, json={"role_name": "Patient"})
+
+    client = make_client(role_backend(handler))
+    client._breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=0)
+    client._breaker.record_failure()
+
+    async def scenario():
+        await client.login_check()
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(client.get_user_role(1), timeout=0.05)
+        gate.set()
+        return await client.get_user_role(1)
+
+    assert run(client, scenario) == "Patient"
+    assert client._breaker.state == CircuitBreaker.CLOSED
+
+
+def test_undecodable_response_counts_as_failure():
+    async def handler(request):
+        return httpx.Response(200, content=b"\x00garbage", headers={"Content-Encoding": "gzip"})
+
+    client = make_client(role_backend(handler))
+    client._breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=60)
+
+    async def scenario():
+        with pytest.raises(APIError):
+            await client.get_user_role(1)
+
+    run(client, scenario)
+    assert client._breaker.state == CircuitBreaker.OPEN
+    assert not client._breaker._probe_in_flight
+
+
+def test_catalog_is_cached_until_invalidated():
+    calls = []
+
+    async def handler(request):
+        calls.append(request.url.path)
+        return httpx.Response(200, json=[{"disease_type_id": 1}])
+
+    client = make_client(role_backend(handler))
+
+    async def scenario():
+        await client.get_all_disease_types()
+        await client.get_all_disease_types()
+        client.invalidate_catalog_cache()
+        return await client.get_all_disease_types()
+
+    assert run(client, scenario) == [{"disease_type_id": 1}]
+    assert calls == ["/disease/", "/disease/"]
+
+
+REVIEW_DATA = {
+    "/payment/9": {"payment_id": 9, "order_id": 4, "patient_id": 2},
+    "/order/4": {"order_id": 4, "patient_id": 2},
+    "/patient/by-id/2": {"patient_id": 2, "full_name": "x"},
+    "/payment/by-order/4": [{"payment_id": 9}],
+}
+
+
+def test_review_bundle_uses_one_request_when_available():
+    calls = []
+
+    async def handler(request):
+        calls.append(request.url.path)
+        return httpx.Response(200, json={"payment": REVIEW_DATA["/payment/9"], "order": REVIEW_DATA["/order/4"]})
+
+    client = make_client(role_backend(handler))
+    bundle = run(client, lambda: client.get_payment_review_bundle(9))
+    assert calls == ["/payment/review-bundle/9"]
+    assert bundle["order"] == REVIEW_DATA["/order/4"]
+    assert bundle["payments"] == []
+
+
+def test_review_bundle_falls_back_to_concurrent_calls():
+    calls = []
+    in_flight = 0
+    peak = 0
+
+    async def handler(request):
+        nonlocal in_flight, peak
+        path = request.url.path
+        calls.append(path)
+        if path not in REVIEW_DATA:
+            return httpx.Response(404, json={"detail": "Not Found"})
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return httpx.Response(200, json=REVIEW_DATA[path])
+
+    client = make_client(role_backend(handler))
+
+    async def scenario():
+        first = await client.get_payment_review_bundle(9, fallback_payment=REVIEW_DATA["/payment/9"])
+        calls.clear()
+        await client.get_payment_review_bundle(9)
+        return first
+
+    bundle = run(client, scenario)
+    assert bundle == {
+        "payment": REVIEW_DATA["/payment/9"],
+        "order": REVIEW_DATA["/order/4"],
+        "patient": REVIEW_DATA["/patient/by-id/2"],
+        "payments": [{"payment_id": 9}],
+    }
+    # با شناسه‌های نسخه state هر چهار منبع همزمان خوانده شدند
+    assert peak == 4
+    # اندپوینت ناموجود تا REVIEW_BUNDLE_RETRY_SECONDS دوباره امتحان نمی‌شود
+    assert "/payment/review-bundle/9" not in calls
+
+
+def test_identical_gets_share_one_request_and_get_own_copies():
+    calls = []
+
+    async def handler(request):
+        calls.append(request.url.path)
+        await asyncio.sleep(0.01)
+        return httpx.Response(200, json={"order_id": 4, "order_list": [{"drug_id": 1}]})
+
+    client = make_client(role_backend(handler))
+
+    async def scenario():
+        results = await asyncio.gather(*(client.get_order_by_id(4) for _ in range(3)))
+        results[0]["order_list"].append({"drug_id": 2})
+        return results
+
+    results = run(client, scenario)
+    assert calls == ["/order/4"]
+    assert [len(r["order_list"]) for r in results] == [2, 1, 1]
+    assert client.get_coalescing_stats()["coalesced"] == 2
+
+
+def test_cancelled_caller_does_not_cancel_the_shared_request():
+    async def handler(request):
+        await asyncio.sleep(0.02)
+        return httpx.Response(200, json={"order_id": 4})
+
+    client = make_client(role_backend(handler))
+
+    async def scenario():
+        first = asyncio.create_task(client.get_order_by_id(4))
+        second = asyncio.create_task(client.get_order_by_id(4))
+        await asyncio.sleep(0.005)
+        first.cancel()
+        return await second
+
+    assert run(client, scenario) == {"order_id": 4}
@@ -0,0 +1,137 @@
+# tests/test_attachments.py
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import InputFile
+
+from app.storage import ContentStore, LocalStorage, derivative_key
+from app.utils.attachments import (
+    ORIGINAL_CALLBACK_PREFIX,
+    attachment_kind,
+    blob_id,
+    hash_from_blob_id,
+    send_attachment,
+    send_original,
+)
+from app.utils.file_id_cache import FileIdCache
+
+
+class FakeBot:
+    """فقط send_photo لازم است؛ file_idهای رد شده مثل تلگرام خطای BadRequest می‌گیرند."""
+
+    def __init__(self, rejected=()):
+        self.rejected = set(rejected)
+        self.sent = []
+        self.reply_markup = None
+
+    async def send_photo(self, chat_id, photo, caption=None, reply_markup=None):
+        self.sent.append(photo)
+        self.reply_markup = reply_markup
+        if photo in self.rejected:
+            raise TelegramBadRequest(method=None, message="wrong file identifier")
+        return SimpleNamespace(photo=[SimpleNamespace(file_id=f"id-{len(self.sent)}")], voice=None, document=None)
+
+    async def send_document(self, chat_id, document, caption=None, reply_markup=None, thumbnail=None):
+        self.sent.append((document, thumbnail))
+        return SimpleNamespace(photo=None, voice=None, document=SimpleNamespace(file_id=f"doc-{len(self.sent)}"))
+
+
+class PreviewService:
+    """image_service ساختگی: فقط enabled و schedule لازم است."""
+
+    enabled = True
+
+    def __init__(self):
+        self.scheduled = []
+
+    def schedule(self, storage, key):
+        self.scheduled.append(key)
+
+
+def test_attachment_kind():
+    assert attachment_kind("patient_files/1/x.JPG") == "photo"
+    assert attachment_kind("patient_files/1/voice.ogg") == "voice"
+    assert attachment_kind("patient_files/1/voice.oga") == "document"
+
+
+def test_upload_once_then_send_by_file_id(tmp_path):
+    photo = tmp_path / "a.jpg"
+    photo.write_bytes(b"jpeg")
+    bot = FakeBot()
+
+    async def scenario():
+        cache = FileIdCache(str(tmp_path / "file_ids.db"))
+        try:
+            await send_attachment(bot, 1, str(photo), file_id_cache=cache)
+            await send_attachment(bot, 1, str(photo), file_id_cache=cache)
+        finally:
+            await cache.close()
+
+    asyncio.run(scenario())
+    assert isinstance(bot.sent[0], InputFile)
+    assert bot.sent[1] == "id-1"
+
+
+def test_rejected_file_id_is_uploaded_again(tmp_path):
+    photo = tmp_path / "a.jpg"
+    photo.write_bytes(b"jpeg")
+    bot = FakeBot(rejected={"stale"})
+
+    async def scenario():
+        cache = FileIdCache(str(tmp_path / "file_ids.db"))
+        try:
+            await cache.set(str(photo), "stale", "photo")
+            await send_attachment(bot, 1, str(photo), file_id_cache=cache)
+            return await cache.get(str(photo), "photo")
+        finally:
+            await cache.close()
+
+    assert asyncio.run(scenario()) == "id-2"
+    assert isinstance(bot.sent[1], InputFile)
+
+
+def test_missing_file_without_file_id_raises(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        asyncio.run(send_attachment(FakeBot(), 1, str(tmp_path / "gone.jpg")))
+
+
+def test_blob_id_round_trip():
+    content_hash = "ab" * 32
+    value = blob_id(content_hash)
+    assert len(f"{ORIGINAL_CALLBACK_PREFIX}{value}") <= 64
+    assert hash_from_blob_id(value) == content_hash
+    assert hash_from_blob_id("not-a-hash") is None
+
+
+def test_preview_is_sent_and_original_only_within_the_record(tmp_path):
+    storage = LocalStorage(str(tmp_path))
+    bot = FakeBot()
+
+    async def chunks():
+        yield b"full-size-jpeg"
+
+    async def scenario():
+        content_store = ContentStore(storage, str(tmp_path / "attachments.db"))
+        try:
+            key = await content_store.put_stream(chunks(), ".jpg")
+            await storage.write_bytes(derivative_key(key, "preview"), b"preview")
+            await storage.write_bytes(derivative_key(key, "thumb"), b"thumb")
+            await send_attachment(
+                bot, 1, key, storage=storage, content_store=content_store,
+                image_service=PreviewService(), owner_id=7,
+            )
+            value = blob_id((await content_store.blob_for(key))[0])
+            refused = await send_original(bot, 1, value, owner_id=8, storage=storage, content_store=content_store)
+            original = await send_original(bot, 1, value, owner_id=7, storage=storage, content_store=content_store)
+            return key, value, refused, original
+        finally:
+            await content_store.close()
+
+    key, value, refused, original = asyncio.run(scenario())
+    assert bot.reply_markup.inline_keyboard[0][0].callback_data == f"{ORIGINAL_CALLBACK_PREFIX}{value}"
+    preview, (document, thumbnail) = bot.sent
+    assert preview.ref == derivative_key(key, "preview")
+    assert refused is None and original.document.file_id == "doc-2"
+    assert document.ref == key and thumbnail.ref == derivative_key(key, "thumb")
@@ -0,0 +1,45 @@
+# tests/test_background.py
+import asyncio
+
+from app.utils.background import BackgroundTasks
+
+
+def test_failure_is_logged_and_isolated(caplog):
+    tasks = BackgroundTasks()
+    done = []
+
+    async def broken():
+        raise ValueError("boom")
+
+    async def ok():
+        await asyncio.sleep(0.01)
+        done.append(True)
+
+    async def scenario():
+        tasks.spawn(broken(), name="broken")
+        tasks.spawn(ok(), name="ok")
+        await tasks.drain()
+
+    asyncio.run(scenario())
+    assert done == [True]
+    assert len(tasks) == 0
+    assert "Background task 'broken' failed" in caplog.text
+
+
+def test_drain_cancels_tasks_after_timeout():
+    tasks = BackgroundTasks()
+    cancelled = []
+
+    async def hang():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    async def scenario():
+        tasks.spawn(hang())
+        await tasks.drain(timeout=0.01)
+
+    asyncio.run(scenario())
+    assert cancelled == [True]
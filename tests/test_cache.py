@@ -0,0 +1,94 @@
+# tests/test_cache.py
+import asyncio
+
+from app.core.cache import AsyncTTLCache
+
+
+def counting_loader(values):
+    calls = []
+
+    async def loader():
+        calls.append(1)
+        await asyncio.sleep(0)
+        return values.pop(0)
+
+    return loader, calls
+
+
+def test_fresh_value_is_served_from_memory():
+    cache = AsyncTTLCache(ttl=60)
+    loader, calls = counting_loader(["a"])
+
+    async def scenario():
+        return await cache.get_or_load("k", loader), await cache.get_or_load("k", loader)
+
+    assert asyncio.run(scenario()) == ("a", "a")
+    assert len(calls) == 1
+    assert cache.stats()["hits"] == 1
+
+
+def test_concurrent_misses_share_one_load():
+    cache = AsyncTTLCache(ttl=60)
+    loader, calls = counting_loader(["a"])
+
+    async def scenario():
+        return await asyncio.gather(*(cache.get_or_load("k", loader) for _ in range(5)))
+
+    assert asyncio.run(scenario()) == ["a"] * 5
+    assert len(calls) == 1
+
+
+def test_stale_value_is_returned_and_refreshed_in_background():
+    cache = AsyncTTLCache(ttl=0, stale_ttl=60)
+    loader, calls = counting_loader(["old", "new"])
+
+    async def scenario():
+        await cache.get_or_load("k", loader)
+        stale = await cache.get_or_load("k", loader)
+        await asyncio.sleep(0.01)
+        return stale, cache._entries["k"][0]
+
+    assert asyncio.run(scenario()) == ("old", "new")
+    assert len(calls) == 2
+
+
+def test_none_is_not_cached():
+    cache = AsyncTTLCache(ttl=60)
+    loader, calls = counting_loader([None, "a"])
+
+    async def scenario():
+        return await cache.get_or_load("k", loader), await cache.get_or_load("k", loader)
+
+    assert asyncio.run(scenario()) == (None, "a")
+    assert len(calls) == 2
+
+
+def test_lru_eviction_and_invalidate():
+    cache = AsyncTTLCache(ttl=60, maxsize=2)
+
+    async def scenario():
+        for key in ("a", "b", "c"):
+            await cache.get_or_load(key, lambda key=key: asyncio.sleep(0, key))
+        evicted = "a" not in cache._entries
+        cache.invalidate("b")
+        return evicted, list(cache._entries)
+
+    assert asyncio.run(scenario()) == (True, ["c"])
+
+
+def test_invalidate_during_load_drops_the_result():
+    cache = AsyncTTLCache(ttl=60)
+    started = asyncio.Event()
+
+    async def slow_loader():
+        started.set()
+        await asyncio.sleep(0.01)
+        return "old"
+
+    async def scenario():
+        load = asyncio.create_task(cache.get_or_load("k", slow_loader))
+        await started.wait()
+        cache.invalidate()
+        return await load, "k" in cache._entries
+
+    assert asyncio.run(scenario()) == ("old", False)
@@ -0,0 +1,92 @@
+# tests/test_casher_handlers.py
+import asyncio
+from types import SimpleNamespace
+
+from app.casher.handlers import process_approve_payment
+from app.utils.invoice_service import InvoiceRenderError
+
+
+class FakeMessage:
+    photo = None
+    document = None
+
+    def __init__(self):
+        self.sent = []
+
+    async def edit_text(self, text, **kwargs):
+        pass
+
+    async def delete(self):
+        pass
+
+    async def answer(self, text, **kwargs):
+        self.sent.append(("text", text))
+
+    async def answer_document(self, document, **kwargs):
+        self.sent.append(("document", document))
+
+
+class FakeState:
+    def __init__(self, data):
+        self.data = data
+
+    async def get_data(self):
+        return self.data
+
+
+class FakeAPIClient:
+    def __init__(self):
+        self.updates = []
+
+    async def get_user_details_by_telegram_id(self, telegram_id):
+        return {"user_id": 3, "full_name": "صندوق‌دار"}
+
+    async def get_order_by_id(self, order_id):
+        return {"order_id": order_id, "order_list": [{"drug": {"drug_pname": "آموکسی‌سیلین"}, "qty": 2, "price": "1.5E+5"}]}
+
+    async def get_patient_details_by_telegram_id(self, telegram_id):
+        return {"address": "مشهد", "mobile_number": "0912"}
+
+    async def update_payment(self, payment_id, payload):
+        return {"payment_id": payment_id}
+
+    async def update_patient_status(self, telegram_id, status):
+        self.updates.append(("patient", status))
+
+    async def update_order(self, order_id, order_status):
+        self.updates.append(("order", order_status))
+
+
+class FakeBot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent.append(chat_id)
+
+
+class FailingInvoiceService:
+    async def render(self, context):
+        raise InvoiceRenderError("Invoice rendering timed out after 30s")
+
+
+def test_render_failure_still_confirms_the_order():
+    message = FakeMessage()
+    api = FakeAPIClient()
+    bot = FakeBot()
+    callback = SimpleNamespace(
+        data="approve_payment_9",
+        message=message,
+        from_user=SimpleNamespace(id=1),
+        answer=lambda *args, **kwargs: asyncio.sleep(0),
+    )
+    state = FakeState({"current_payment": {
+        "telegram_id": 5, "order_id": 4, "full_name": "x", "payment_value": "300000",
+    }})
+
+    asyncio.run(process_approve_payment(callback, state, api, bot, FailingInvoiceService()))
+
+    assert sorted(kind for kind, _ in api.updates) == ["order", "patient"]
+    kind, text = message.sent[-1]
+    assert kind == "text" and "300,000" in text
+    assert bot.sent == [5, 5]
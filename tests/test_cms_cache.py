@@ -0,0 +1,66 @@
+# tests/test_cms_cache.py
+import asyncio
+
+from app.core.cms_cache import BotMessageCache
+
+
+def make_cache(bulk, texts, negative_ttl=60.0):
+    calls = []
+
+    async def bulk_loader():
+        return bulk
+
+    async def key_loader(key):
+        calls.append(key)
+        return texts.get(key)
+
+    return BotMessageCache(bulk_loader, key_loader, negative_ttl=negative_ttl), calls
+
+
+def test_snapshot_hit_does_not_fetch():
+    cache, calls = make_cache({"welcome": "سلام"}, {})
+
+    async def scenario():
+        await cache.refresh()
+        return await cache.get("welcome")
+
+    assert asyncio.run(scenario()) == "سلام"
+    assert calls == []
+
+
+def test_key_missing_from_snapshot_is_fetched():
+    cache, calls = make_cache({"welcome": "سلام"}, {"new_key": "متن جدید"})
+
+    async def scenario():
+        await cache.refresh()
+        first = await cache.get("new_key", "پیش‌فرض")
+        second = await cache.get("new_key", "پیش‌فرض")
+        return first, second
+
+    assert asyncio.run(scenario()) == ("متن جدید", "متن جدید")
+    assert calls == ["new_key"]
+
+
+def test_unknown_key_is_negatively_cached_until_refresh():
+    cache, calls = make_cache({}, {})
+
+    async def scenario():
+        await cache.refresh()
+        assert await cache.get("nope", "پیش‌فرض") == "پیش‌فرض"
+        assert await cache.get("nope", "پیش‌فرض") == "پیش‌فرض"
+        await cache.refresh()
+        assert await cache.get("nope", "پیش‌فرض") == "پیش‌فرض"
+
+    asyncio.run(scenario())
+    assert calls == ["nope", "nope"]
+
+
+def test_key_loader_error_returns_default():
+    async def bulk_loader():
+        return None
+
+    async def key_loader(key):
+        raise RuntimeError("API down")
+
+    cache = BotMessageCache(bulk_loader, key_loader)
+    assert asyncio.run(cache.get("welcome", "پیش‌فرض")) == "پیش‌فرض"
@@ -0,0 +1,50 @@
+# tests/test_concurrency.py
+import asyncio
+
+from app.utils.concurrency import fan_out
+
+
+def test_calls_run_concurrently_and_skip_none():
+    async def slow(value):
+        await asyncio.sleep(0.05)
+        return value
+
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        result = await fan_out({"a": slow(1), "b": slow(2), "c": None})
+        return result, loop.time() - started
+
+    result, elapsed = asyncio.run(scenario())
+    assert result.values == {"a": 1, "b": 2}
+    assert result.ok
+    assert elapsed < 0.09
+
+
+def test_failure_is_isolated():
+    async def ok():
+        return "ok"
+
+    async def broken():
+        raise ValueError("boom")
+
+    result = asyncio.run(fan_out({"ok": ok(), "broken": broken()}))
+    assert result.get("ok") == "ok"
+    assert result.get("broken", "default") == "default"
+    assert isinstance(result.errors["broken"], ValueError)
+    assert not result.ok
+
+
+def test_timeout_cancels_unfinished_calls():
+    cancelled = []
+
+    async def hang():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    result = asyncio.run(fan_out({"hang": hang()}, timeout=0.01))
+    assert isinstance(result.errors["hang"], asyncio.TimeoutError)
+    assert cancelled == [True]
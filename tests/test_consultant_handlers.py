@@ -0,0 +1,92 @@
+# tests/test_consultant_handlers.py
+import asyncio
+from types import SimpleNamespace
+
+from app.consultant.handlers import handle_consultant_chat_message
+from app.storage import LocalStorage
+from app.utils.background import BackgroundTasks
+
+
+class FakeState:
+    async def get_data(self):
+        return {"selected_patient_id": 2, "patient_telegram_id": 5}
+
+
+class FakeAPIClient:
+    def __init__(self):
+        self.messages = []
+
+    async def get_user_details_by_telegram_id(self, telegram_id):
+        return {"user_id": 3}
+
+    async def create_message(self, **kwargs):
+        self.messages.append(kwargs)
+        return {"message_id": 1}
+
+
+class FakeBot:
+    token = "42:TEST"
+
+    def __init__(self):
+        self.events = []
+        self.session = SimpleNamespace(
+            api=SimpleNamespace(is_local=False, file_url=lambda token, path: path),
+            stream_content=self._stream_content,
+        )
+
+    async def send_photo(self, chat_id, photo, caption=None):
+        self.events.append(("send_photo", chat_id, photo))
+
+    async def get_file(self, file_id):
+        return SimpleNamespace(file_path="photos/file_1.jpg")
+
+    async def _stream_content(self, url, **kwargs):
+        await asyncio.sleep(0.01)
+        self.events.append(("download", url))
+        yield b"jpeg"
+
+
+class FakeMessage:
+    text = None
+    voice = None
+    caption = None
+
+    def __init__(self, bot):
+        self.photo = [
+            SimpleNamespace(file_id="small", file_unique_id="U-small"),
+            SimpleNamespace(file_id="large", file_unique_id="U-large"),
+        ]
+        self.from_user = SimpleNamespace(id=9)
+        self.chat = SimpleNamespace(id=9)
+        self.message_id = 31
+        self.bot = bot
+        self.answers = []
+
+    async def answer(self, text, **kwargs):
+        self.answers.append(text)
+
+
+def test_media_is_relayed_by_file_id_and_archived_in_background(tmp_path):
+    storage = LocalStorage(str(tmp_path))
+    bot = FakeBot()
+    api = FakeAPIClient()
+    message = FakeMessage(bot)
+    tasks = BackgroundTasks()
+
+    async def scenario():
+        await handle_consultant_chat_message(
+            message, FakeState(), api, bot, background_tasks=tasks, attachment_storage=storage
+        )
+        # مشاور قبل از دانلود فایل تایید گرفته است
+        confirmed_before_archive = (list(message.answers), list(bot.events))
+        await tasks.drain()
+        return confirmed_before_archive
+
+    answers, events = asyncio.run(scenario())
+    assert events == [("send_photo", 5, "large")]
+    assert answers == ["✅ پیام (یا رسانه) شما ارسال شد."]
+    assert bot.events[-1] == ("download", "photos/file_1.jpg")
+    [archived] = api.messages
+    [key] = archived["attachments"]
+    assert key.startswith("patient_files/5/photo_")
+    assert (tmp_path / key).read_bytes() == b"jpeg"
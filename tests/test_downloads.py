@@ -0,0 +1,75 @@
+# tests/test_downloads.py
+import asyncio
+import os
+from types import SimpleNamespace
+
+from app.storage import LocalStorage
+from app.utils.downloads import TelegramDownloader
+
+
+class FakeBot:
+    """دانلود هر file_id به اندازه delays[file_id] طول می‌کشد؛ "broken" خطا می‌دهد."""
+
+    token = "42:TEST"
+
+    def __init__(self, delays):
+        self.delays = delays
+        self.in_flight = 0
+        self.peak = 0
+        self.session = SimpleNamespace(
+            api=SimpleNamespace(is_local=False, file_url=lambda token, path: path),
+            stream_content=self._stream_content,
+        )
+
+    async def get_file(self, file_id):
+        if file_id == "broken":
+            raise RuntimeError("file is too big")
+        return SimpleNamespace(file_path=f"photos/{file_id}.jpg")
+
+    async def _stream_content(self, url, **kwargs):
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        try:
+            yield b"partial"
+            await asyncio.sleep(self.delays[os.path.basename(url)[:-4]])
+            yield b"-done"
+        finally:
+            self.in_flight -= 1
+
+
+def stored_files(root) -> list:
+    return sorted(os.path.relpath(os.path.join(d, f), root) for d, _, files in os.walk(root) for f in files)
+
+
+def test_downloads_are_bounded_and_keep_their_order(tmp_path):
+    bot = FakeBot({"a": 0.03, "b": 0.01, "c": 0.02, "d": 0.01})
+    storage = LocalStorage(str(tmp_path))
+    downloader = TelegramDownloader(concurrency=2)
+    progress = []
+
+    async def on_progress(done, total):
+        progress.append((done, total))
+
+    report = asyncio.run(downloader.download_many(
+        bot, storage, ["a", "b", "c", "d"], lambda i, ext: f"patient_files/1/photo_{i}{ext}", on_progress
+    ))
+    assert report.ok
+    assert report.saved_keys == [f"patient_files/1/photo_{i}.jpg" for i in range(1, 5)]
+    assert (tmp_path / "patient_files/1/photo_1.jpg").read_bytes() == b"partial-done"
+    assert bot.peak == 2
+    assert progress == [(1, 4), (2, 4), (3, 4), (4, 4)]
+
+
+def test_failed_and_timed_out_files_do_not_stop_the_rest(tmp_path):
+    bot = FakeBot({"ok": 0.0, "slow": 10})
+    storage = LocalStorage(str(tmp_path))
+    downloader = TelegramDownloader(concurrency=3, timeout=0.05)
+
+    report = asyncio.run(downloader.download_many(
+        bot, storage, ["slow", "ok", "broken"], lambda i, ext: f"patient_files/1/photo_{i}{ext}"
+    ))
+    assert report.saved_keys == ["patient_files/1/photo_2.jpg"]
+    assert [r.file_id for r in report.failed] == ["slow", "broken"]
+    assert isinstance(report.failed[0].error, TimeoutError)
+    # نوشتن در storage اتمیک است؛ از دانلودی که timeout شد فایل نیمه‌کاره‌ای نمانده
+    assert stored_files(tmp_path) == [os.path.join("patient_files", "1", "photo_2.jpg")]
@@ -0,0 +1,51 @@
+# tests/test_file_id_cache.py
+import asyncio
+
+from app.utils.file_id_cache import FileIdCache
+
+
+def test_file_id_survives_restart(tmp_path):
+    path = str(tmp_path / "file_ids.db")
+
+    async def scenario():
+        cache = FileIdCache(path)
+        await cache.set(" patient_files/1/a.jpg ", "AgAD", "photo")
+        await cache.close()
+
+        reopened = FileIdCache(path)
+        try:
+            return await reopened.get("patient_files/1/a.jpg", "photo")
+        finally:
+            await reopened.close()
+
+    assert asyncio.run(scenario()) == "AgAD"
+
+
+def test_file_id_is_only_returned_for_the_same_kind(tmp_path):
+    async def scenario():
+        cache = FileIdCache(str(tmp_path / "file_ids.db"))
+        try:
+            await cache.set("a.jpg", "AgAD", "photo")
+            return await cache.get("a.jpg", "document"), cache.stats()
+        finally:
+            await cache.close()
+
+    file_id, stats = asyncio.run(scenario())
+    assert file_id is None
+    assert stats["misses"] == 1
+
+
+def test_forget_and_memory_limit(tmp_path):
+    async def scenario():
+        cache = FileIdCache(str(tmp_path / "file_ids.db"), memory_size=1)
+        try:
+            await cache.set("a.jpg", "A", "photo")
+            await cache.set("b.jpg", "B", "photo")
+            in_memory = cache.stats()["in_memory"]
+            from_disk = await cache.get("a.jpg", "photo")
+            await cache.forget("a.jpg")
+            return in_memory, from_disk, await cache.get("a.jpg", "photo")
+        finally:
+            await cache.close()
+
+    assert asyncio.run(scenario()) == (1, "A", None)
@@ -0,0 +1,134 @@
+# tests/test_fsm_storage.py
+import asyncio
+from decimal import Decimal
+
+from aiogram.fsm.storage.base import StorageKey
+
+from app.core import fsm_storage
+from app.core.fsm_storage import (
+    BatchedStorage,
+    SQLiteStorage,
+    build_fsm_storage,
+    decode_state_data,
+    encode_state_data,
+)
+from app.core.setting import settings
+
+
+class RecordingStorage(BatchedStorage):
+    def __init__(self, fail_writes: int = 0, **kwargs):
+        super().__init__(**kwargs)
+        self.rows = {}
+        self.batches = []
+        self.fail_writes = fail_writes
+
+    async def _read_field(self, key, field):
+        return self.rows.get(key, {}).get(field)
+
+    async def _write_batch(self, batch):
+        if self.fail_writes:
+            self.fail_writes -= 1
+            raise RuntimeError("backend down")
+        self.batches.append(batch)
+        for key, record in batch.items():
+            self.rows.setdefault(key, {}).update(record)
+
+
+def key(user_id: int) -> StorageKey:
+    return StorageKey(bot_id=1, chat_id=user_id, user_id=user_id)
+
+
+def test_state_data_round_trip():
+    data = {"prescription_cart": {12: 2, 7: 1}, "total": Decimal("1.50"), "ids": (1, 2), "tags": {"a"}}
+    assert decode_state_data(encode_state_data(data)) == data
+    large = {"text": "x" * 2000}
+    assert encode_state_data(large).startswith(b"z")
+    assert decode_state_data(encode_state_data(large)) == large
+
+
+def test_writes_are_batched_and_readable_before_flush():
+    storage = RecordingStorage(flush_interval=60, batch_size=3)
+
+    async def scenario():
+        await storage.set_state(key(1), "A:one")
+        await storage.set_data(key(1), {"x": 1})
+        await storage.set_state(key(2), "A:two")
+        before_flush = (await storage.get_state(key(1)), await storage.get_data(key(1)), len(storage.batches))
+        await storage.set_state(key(3), "A:three")
+        return before_flush
+
+    assert asyncio.run(scenario()) == ("A:one", {"x": 1}, 0)
+    assert len(storage.batches) == 1
+    assert len(storage.batches[0]) == 3
+
+
+def test_failed_flush_is_retried_without_losing_newer_changes():
+    storage = RecordingStorage(fail_writes=1, flush_interval=60)
+
+    async def scenario():
+        await storage.set_state(key(1), "A:old")
+        await storage.flush()
+        await storage.set_data(key(1), {"x": 2})
+        await storage.flush()
+        return await storage.get_state(key(1)), await storage.get_data(key(1))
+
+    assert asyncio.run(scenario()) == ("A:old", {"x": 2})
+    assert len(storage.batches) == 1
+
+
+def test_close_flushes_pending_changes():
+    storage = RecordingStorage(flush_interval=60)
+
+    async def scenario():
+        await storage.set_state(key(1), "A:one")
+        await storage.close()
+
+    asyncio.run(scenario())
+    assert storage.batches and not storage._pending
+
+
+def test_failed_flush_is_retried_without_new_writes(monkeypatch):
+    monkeypatch.setattr(fsm_storage, "FLUSH_RETRY_SECONDS", 0.01)
+    storage = RecordingStorage(fail_writes=1, flush_interval=0.01)
+
+    async def scenario():
+        await storage.set_state(key(1), "A:one")
+        await asyncio.sleep(0.1)
+
+    asyncio.run(scenario())
+    assert storage.rows[storage._key_builder.build(key(1))]["state"] == "A:one"
+    assert not storage._pending
+
+
+def test_sqlite_storage_survives_restart(tmp_path):
+    path = str(tmp_path / "fsm.db")
+
+    async def scenario():
+        storage = SQLiteStorage(path, flush_interval=60)
+        await storage.set_state(key(1), "A:one")
+        await storage.set_data(key(1), {"cart": {3: 1}})
+        await storage.close()
+
+        reopened = SQLiteStorage(path)
+        try:
+            return await reopened.get_state(key(1)), await reopened.get_data(key(1))
+        finally:
+            await reopened.close()
+
+    assert asyncio.run(scenario()) == ("A:one", {"cart": {3: 1}})
+
+
+def test_shared_backend_disables_write_behind(monkeypatch):
+    monkeypatch.setattr(settings, "FSM_STORAGE", "redis")
+    monkeypatch.setattr(settings, "FSM_REDIS_URL", "fakeredis://")
+    monkeypatch.setattr(settings, "FSM_SHARED_BACKEND", True)
+
+    async def scenario():
+        storage = build_fsm_storage()
+        try:
+            await storage.set_state(key(1), "A:one")
+            return storage._pending, await storage._read_field(storage._key_builder.build(key(1)), "state")
+        finally:
+            await storage.close()
+
+    assert asyncio.run(scenario()) == ({}, "A:one")
@@ -0,0 +1,62 @@
+# tests/test_http_pool.py
+import asyncio
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from app.core import http_pool
+from app.core.API_Client import APIClient
+from app.core.http_pool import MeteredTransport, build_http_client
+from app.core.setting import settings
+
+
+def test_client_uses_pool_settings():
+    client = build_http_client()
+    try:
+        assert client.timeout.read == settings.API_READ_TIMEOUT
+        assert client.timeout.pool == settings.API_POOL_TIMEOUT
+        assert isinstance(client._transport, MeteredTransport)
+    finally:
+        asyncio.run(client.aclose())
+
+
+def test_http2_falls_back_without_h2(monkeypatch):
+    monkeypatch.setattr(settings, "API_HTTP2", True)
+    monkeypatch.setattr(http_pool, "_http2_available", lambda: False)
+    client = build_http_client()
+    try:
+        assert client._transport._transport._pool._http2 is False
+    finally:
+        asyncio.run(client.aclose())
+
+
+def test_connections_are_reused():
+    async def hello(request):
+        return web.json_response({"ok": True})
+
+    async def scenario():
+        app = web.Application()
+        app.router.add_get("/", hello)
+        async with TestServer(app) as server:
+            client = build_http_client()
+            try:
+                for _ in range(3):
+                    response = await client.get(str(server.make_url("/")))
+                    assert response.json() == {"ok": True}
+                return client._transport.metrics()
+            finally:
+                await client.aclose()
+
+    metrics = asyncio.run(scenario())
+    assert metrics["requests_total"] == 3
+    assert metrics["connections_opened"] == 1
+    assert metrics["reuse_ratio"] == round(2 / 3, 4)
+
+
+def test_base_url_without_scheme_is_fixed():
+    client = APIClient("127.0.0.1:8000")
+    try:
+        assert client._base_url == "http://127.0.0.1:8000"
+        assert client.get_pool_metrics()["requests_total"] == 0
+    finally:
+        asyncio.run(client._client.aclose())
@@ -0,0 +1,64 @@
+# tests/test_image_service.py
+import asyncio
+import io
+
+import pytest
+from PIL import Image
+
+from app.storage import LocalStorage, derivative_key
+from app.utils.image_service import ImageProcessingError, ImageProcessingService
+
+
+def jpeg(size=(2000, 1500)) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", size, "teal").save(buffer, "JPEG", quality=95)
+    return buffer.getvalue()
+
+
+def test_preview_and_thumb_are_written_next_to_the_original(tmp_path):
+    storage = LocalStorage(str(tmp_path))
+    service = ImageProcessingService(workers=1, preview_size=640, thumb_size=64)
+
+    async def scenario():
+        await service.start()
+        try:
+            await storage.write_bytes("objects/ab/cd/photo.jpg", jpeg())
+            first = await service.process(storage, "objects/ab/cd/photo.jpg")
+            again = await service.process(storage, "objects/ab/cd/photo.jpg")
+            preview = await storage.read_bytes(derivative_key("objects/ab/cd/photo.jpg", "preview"))
+            thumb = await storage.read_bytes(derivative_key("objects/ab/cd/photo.jpg", "thumb"))
+            return first, again, preview, thumb
+        finally:
+            await service.shutdown()
+
+    first, again, preview, thumb = asyncio.run(scenario())
+    assert first and again
+    assert Image.open(io.BytesIO(preview)).size == (640, 480)
+    assert max(Image.open(io.BytesIO(thumb)).size) == 64
+    assert service.processed == 1
+
+
+def test_broken_image_is_retried_only_after_the_failure_ttl(tmp_path):
+    storage = LocalStorage(str(tmp_path))
+    service = ImageProcessingService(workers=1, failure_retry_seconds=0.2)
+
+    async def scenario():
+        await service.start()
+        try:
+            await storage.write_bytes("objects/ab/cd/broken.jpg", b"not a jpeg")
+            with pytest.raises(ImageProcessingError):
+                await service.process(storage, "objects/ab/cd/broken.jpg")
+
+            service.schedule(storage, "objects/ab/cd/broken.jpg")
+            await service._background.drain(timeout=10)
+            service.schedule(storage, "objects/ab/cd/broken.jpg")
+            skipped = len(service._background) == 0
+            await asyncio.sleep(0.3)
+            service.schedule(storage, "objects/ab/cd/broken.jpg")
+            await service._background.drain(timeout=10)
+            return skipped
+        finally:
+            await service.shutdown()
+
+    assert asyncio.run(scenario())
+    assert service.failed == 3
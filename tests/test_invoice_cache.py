@@ -0,0 +1,86 @@
+# tests/test_invoice_cache.py
+import asyncio
+import os
+
+from app.utils.invoice_cache import InvoiceCache
+
+
+class FakeRenderer:
+    def __init__(self, size: int = 100):
+        self.size = size
+        self.calls = 0
+
+    async def __call__(self, context: dict, path: str) -> str:
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        with open(path, "wb") as f:
+            f.write(b"%" * self.size)
+        return path
+
+
+def test_concurrent_requests_render_once(tmp_path):
+    cache = InvoiceCache(str(tmp_path))
+    render = FakeRenderer()
+
+    async def scenario():
+        await cache.start()
+        results = await asyncio.gather(*(cache.get_or_render({"invoice_number": "1"}, render) for _ in range(3)))
+        return results
+
+    results = asyncio.run(scenario())
+    assert render.calls == 1
+    assert len({path for _, _, path in results}) == 1
+    assert cache.stats()["hits"] == 2
+
+
+def test_file_id_survives_restart(tmp_path):
+    render = FakeRenderer()
+
+    async def scenario():
+        cache = InvoiceCache(str(tmp_path))
+        await cache.start()
+        key, _, _ = await cache.get_or_render({"invoice_number": "1"}, render)
+        await cache.remember_file_id(key, "file-1")
+
+        reopened = InvoiceCache(str(tmp_path))
+        await reopened.start()
+        return await reopened.get_or_render({"invoice_number": "1"}, render)
+
+    _, file_id, path = asyncio.run(scenario())
+    assert (file_id, render.calls) == ("file-1", 1)
+    assert os.path.exists(path)
+
+
+def test_least_recently_used_file_is_evicted(tmp_path):
+    cache = InvoiceCache(str(tmp_path), max_bytes=250)
+    render = FakeRenderer(size=100)
+
+    async def scenario():
+        await cache.start()
+        _, _, first = await cache.get_or_render({"invoice_number": "1"}, render)
+        _, _, second = await cache.get_or_render({"invoice_number": "2"}, render)
+        await asyncio.sleep(0.01)
+        cache.lookup(cache.key_for({"invoice_number": "1"}))
+        await cache.get_or_render({"invoice_number": "3"}, render)
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert os.path.exists(first)
+    assert not os.path.exists(second)
+    assert cache.total_bytes() == 200
+
+
+def test_file_being_sent_is_not_evicted(tmp_path):
+    cache = InvoiceCache(str(tmp_path), max_bytes=150)
+    render = FakeRenderer(size=100)
+
+    async def scenario():
+        await cache.start()
+        async with cache.checkout({"invoice_number": "1"}, render) as (_, _, path):
+            # فاکتور دیگری در همین فاصله ساخته می‌شود و کش از سقف حجم عبور می‌کند
+            await cache.get_or_render({"invoice_number": "2"}, render)
+            still_there = os.path.exists(path)
+        return still_there
+
+    assert asyncio.run(scenario())
+    assert not cache._pins
@@ -0,0 +1,42 @@
+# tests/test_invoice_generator.py
+from reportlab import rl_config
+
+from app.utils.invoice_generator import (
+    FIRST_PAGE_ITEM_ROWS,
+    NEXT_PAGE_ITEM_ROWS,
+    _paginate_items,
+    generate_complex_invoice,
+)
+from benchmarks.bench_invoice_template import legacy_generate_invoice
+from benchmarks.invoice_samples import sample_invoice_context
+
+
+def test_prebuilt_layout_renders_the_same_pdf(monkeypatch):
+    # در حالت invariant تاریخ و شناسه تصادفی در PDF نوشته نمی‌شود، پس خروجی‌ها بایت به بایت قابل مقایسه‌اند
+    monkeypatch.setattr(rl_config, "invariant", 1)
+    for seed in range(3):
+        context = sample_invoice_context(items=5, seed=seed)
+        assert generate_complex_invoice(context).getvalue() == legacy_generate_invoice(context).getvalue()
+
+
+def test_empty_invoice_has_one_page():
+    assert _paginate_items([]) == [[]]
+
+
+def test_items_fit_on_first_page():
+    items = list(range(FIRST_PAGE_ITEM_ROWS))
+    assert _paginate_items(items) == [items]
+
+
+def test_items_are_split_across_pages():
+    items = list(range(FIRST_PAGE_ITEM_ROWS + NEXT_PAGE_ITEM_ROWS + 1))
+    pages = _paginate_items(items)
+    assert [len(page) for page in pages] == [FIRST_PAGE_ITEM_ROWS, NEXT_PAGE_ITEM_ROWS, 1]
+    assert [item for page in pages for item in page] == items
+
+
+def test_large_invoice_is_written_to_the_given_path(tmp_path):
+    path = tmp_path / "invoice.pdf"
+    context = sample_invoice_context(items=FIRST_PAGE_ITEM_ROWS + NEXT_PAGE_ITEM_ROWS + 1)
+    generate_complex_invoice(context, str(path))
+    assert b"/Count 3" in path.read_bytes()
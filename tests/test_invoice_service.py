@@ -0,0 +1,59 @@
+# tests/test_invoice_service.py
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.utils import invoice_service
+from app.utils.invoice_service import InvoiceRenderError, InvoiceRenderService
+from benchmarks.invoice_samples import sample_invoice_context
+
+
+def test_render_runs_in_the_process_pool(tmp_path):
+    service = InvoiceRenderService(workers=1, timeout=60, output_dir=str(tmp_path))
+
+    async def scenario():
+        try:
+            await service.start()
+            return await service.render(sample_invoice_context(items=3))
+        finally:
+            await service.shutdown()
+
+    with open(asyncio.run(scenario()), "rb") as f:
+        assert f.read(4) == b"%PDF"
+
+
+def test_timed_out_render_keeps_its_slot_and_removes_its_output(monkeypatch, tmp_path):
+    release = threading.Event()
+
+    def slow_render(context, path):
+        release.wait(5)
+        with open(path, "wb") as f:
+            f.write(b"%PDF")
+        return path
+
+    monkeypatch.setattr(invoice_service, "_render_invoice", slow_render)
+    service = InvoiceRenderService(max_pending=1, timeout=0.05, output_dir=str(tmp_path))
+    executor = ThreadPoolExecutor(max_workers=2)
+    service._get_executor = lambda: executor
+
+    async def scenario():
+        with pytest.raises(InvoiceRenderError):
+            await service.render({"invoice_number": "1"})
+        # worker هنوز فاکتور قبلی را می‌سازد، پس فاکتور بعدی جایگاهی ندارد
+        with pytest.raises(InvoiceRenderError):
+            await service.render({"invoice_number": "2"})
+        release.set()
+        await asyncio.sleep(0.05)
+        return await service.render({"invoice_number": "3"})
+
+    try:
+        path = asyncio.run(scenario())
+    finally:
+        release.set()
+        executor.shutdown()
+    # فایل فاکتوری که بعد از timeout تمام شد حذف شده است
+    assert os.listdir(tmp_path) == [os.path.basename(path)]
+    assert os.path.basename(path).startswith("invoice_3_")
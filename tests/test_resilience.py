@@ -0,0 +1,58 @@
+# tests/test_resilience.py
+from app.core.resilience import APIError, CircuitBreaker, CircuitOpenError, backoff_delay
+
+
+def test_circuit_opens_after_threshold():
+    breaker = CircuitBreaker(failure_threshold=3, recovery_timeout=60)
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow_request()
+
+
+def test_success_resets_failure_count():
+    breaker = CircuitBreaker(failure_threshold=2, recovery_timeout=60)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_half_open_allows_a_single_probe():
+    breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=0)
+    breaker.record_failure()
+    assert breaker.allow_request()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow_request()
+
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.allow_request()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow_request()
+
+
+def test_backoff_delay_is_capped():
+    for attempt in range(10):
+        delay = backoff_delay(attempt, base=0.5, cap=4.0)
+        assert 0 <= delay <= min(4.0, 0.5 * 2 ** attempt)
+
+
+def test_api_error_details():
+    error = APIError("GET", "/patient/1", 404, {"detail": "Not Found"})
+    assert error.is_not_found
+    assert not APIError("GET", "/patient/1").is_not_found
+    assert CircuitOpenError("GET", "/patient/1").status_code is None
+
+
+def test_released_probe_lets_the_next_request_probe():
+    breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=0)
+    breaker.record_failure()
+    assert breaker.allow_request()
+    assert not breaker.allow_request()
+    breaker.release_probe()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow_request()
@@ -0,0 +1,106 @@
+# tests/test_role_resolver.py
+import asyncio
+
+from aiogram.types import Update
+
+from app.core.resilience import APIError, CircuitOpenError
+from app.core.role_resolver import DEFAULT_ROLE, RoleResolver
+from app.middleware.middlewares import RoleMiddleware
+
+
+class FakeAPIClient:
+    def __init__(self, *results):
+        self.results = list(results)
+        self.calls = 0
+
+    async def get_user_role(self, telegram_id: int) -> str:
+        self.calls += 1
+        result = self.results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+def backend_error() -> Exception:
+    return APIError("GET", "/user/role-by-telegram-id/1", 500, "boom")
+
+
+def test_role_is_cached():
+    api = FakeAPIClient("Consultant")
+    resolver = RoleResolver(api, ttl=60)
+
+    async def scenario():
+        assert await resolver.get_role(1) == "Consultant"
+        assert await resolver.get_role(1) == "Consultant"
+
+    asyncio.run(scenario())
+    assert api.calls == 1
+    assert resolver.peek(1) == "Consultant"
+
+
+def test_api_error_is_not_cached():
+    api = FakeAPIClient(backend_error(), "Consultant")
+    resolver = RoleResolver(api, ttl=60)
+
+    async def scenario():
+        assert await resolver.get_role(1) == DEFAULT_ROLE
+        assert resolver.peek(1) is None
+        assert await resolver.get_role(1) == "Consultant"
+
+    asyncio.run(scenario())
+    assert api.calls == 2
+
+
+def test_api_error_falls_back_to_last_known_role():
+    api = FakeAPIClient("Casher", CircuitOpenError("GET", "/user/role-by-telegram-id/1"))
+    resolver = RoleResolver(api, ttl=60)
+
+    async def scenario():
+        assert await resolver.get_role(1) == "Casher"
+        resolver.invalidate(1)
+        assert await resolver.get_role(1) == "Casher"
+
+    asyncio.run(scenario())
+    assert resolver.peek(1) is None
+
+
+def test_concurrent_lookups_share_one_request():
+    api = FakeAPIClient("Admin")
+    resolver = RoleResolver(api, ttl=60)
+
+    async def scenario():
+        return await asyncio.gather(*(resolver.get_role(7) for _ in range(5)))
+
+    assert asyncio.run(scenario()) == ["Admin"] * 5
+    assert api.calls == 1
+
+
+def message_update(text: str) -> Update:
+    return Update.model_validate({
+        "update_id": 1,
+        "message": {
+            "message_id": 1,
+            "date": 0,
+            "chat": {"id": 5, "type": "private"},
+            "from": {"id": 5, "is_bot": False, "first_name": "x"},
+            "text": text,
+        },
+    })
+
+
+def test_middleware_sets_role_and_refreshes_it_on_start():
+    api = FakeAPIClient("Patient", "Consultant")
+    middleware = RoleMiddleware(RoleResolver(api, ttl=60))
+    seen = []
+
+    async def handler(event, data):
+        seen.append(data["user_role"])
+
+    async def scenario():
+        for text in ("سلام", "سلام", "/start"):
+            update = message_update(text)
+            await middleware(handler, update, {"event_from_user": update.message.from_user})
+
+    asyncio.run(scenario())
+    assert seen == ["Patient", "Patient", "Consultant"]
+    assert api.calls == 2
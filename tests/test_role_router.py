@@ -0,0 +1,75 @@
+# tests/test_role_router.py
+import asyncio
+
+import pytest
+from aiogram import Bot, Dispatcher, Router
+from aiogram.types import Update
+
+from app.core.role_router import register_role_routers
+
+
+def message_update(user_id: int = 5) -> Update:
+    return Update.model_validate({
+        "update_id": 1,
+        "message": {
+            "message_id": 1,
+            "date": 0,
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "x"},
+            "text": "سلام",
+        },
+    })
+
+
+def build_dispatcher(mode: str, seen: list, **workflow_data) -> Dispatcher:
+    routes = {}
+    for role in ("Patient", "Consultant", "Casher"):
+        router = Router(name=role)
+
+        @router.message()
+        async def handler(message, role=role):
+            seen.append(role)
+            return role
+
+        routes[role] = router
+
+    dp = Dispatcher(**workflow_data)
+    register_role_routers(dp, routes, mode=mode)
+    return dp
+
+
+def feed(dp: Dispatcher, **kwargs):
+    async def scenario():
+        bot = Bot("42:TEST")
+        try:
+            return await dp.feed_update(bot, message_update(), **kwargs)
+        finally:
+            await bot.session.close()
+
+    return asyncio.run(scenario())
+
+
+def test_update_goes_only_to_the_users_role_router():
+    seen = []
+    dp = build_dispatcher("direct", seen)
+    assert feed(dp, user_role="Consultant") == "Consultant"
+    assert seen == ["Consultant"]
+
+
+def test_unknown_role_is_not_handled():
+    seen = []
+    dp = build_dispatcher("direct", seen)
+    feed(dp, user_role="Admin")
+    assert seen == []
+
+
+def test_filters_mode_checks_each_router():
+    seen = []
+    dp = build_dispatcher("filters", seen, api_client=None)
+    assert feed(dp, user_role="Casher") == "Casher"
+    assert seen == ["Casher"]
+
+
+def test_unknown_mode_is_rejected():
+    with pytest.raises(ValueError):
+        register_role_routers(Dispatcher(), {}, mode="chain")
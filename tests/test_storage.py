@@ -0,0 +1,274 @@
+# tests/test_storage.py
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app.storage import ContentStore, LocalStorage, ObjectNotFoundError, S3Storage, derivative_key
+from app.storage.base import StorageError, normalize_key, patient_file_key
+from app.storage.fake_s3 import FakeS3
+from app.storage.migrate import migrate
+from app.utils.attachments import release_attachments
+
+
+async def chunks(*parts: bytes):
+    for part in parts:
+        yield part
+
+
+def make_storage(kind: str, tmp_path):
+    if kind == "local":
+        return LocalStorage(str(tmp_path))
+    fake = FakeS3("key", "secret")
+    return S3Storage("http://fake-s3", "bucket", "key", "secret", transport=fake.transport(), chunk_size=4)
+
+
+@pytest.fixture
+def store(tmp_path):
+    storage = LocalStorage(str(tmp_path))
+    content_store = ContentStore(storage, str(tmp_path / "attachments.db"))
+    yield storage, content_store
+    asyncio.run(content_store.close())
+
+
+class TelegramFiles:
+    """ربات ساختگی که محتوای هر file_id را از files می‌دهد و دانلودها را می‌شمارد."""
+
+    token = "42:TEST"
+
+    def __init__(self, files):
+        self.files = files
+        self.downloads = 0
+        self.session = SimpleNamespace(
+            api=SimpleNamespace(is_local=False, file_url=lambda token, path: path),
+            stream_content=self._stream_content,
+        )
+
+    async def get_file(self, file_id):
+        unique_id, _ = self.files[file_id]
+        return SimpleNamespace(file_path=f"photos/{file_id}.jpg", file_unique_id=unique_id)
+
+    async def _stream_content(self, url, **kwargs):
+        self.downloads += 1
+        yield self.files[url[len("photos/"):-len(".jpg")]][1]
+
+
+def test_normalize_key():
+    assert normalize_key("\\patient_files\\1\\a.jpg") == "patient_files/1/a.jpg"
+    assert normalize_key("patient_files/./1//a.jpg") == "patient_files/1/a.jpg"
+    for bad in ("", "..", "../etc/passwd", "patient_files/../../x"):
+        with pytest.raises(StorageError):
+            normalize_key(bad)
+
+
+def test_patient_file_key():
+    assert patient_file_key(123, "receipt.jpg") == "patient_files/123/receipt.jpg"
+    with pytest.raises(StorageError):
+        patient_file_key(123, "../../../secret")
+
+
+@pytest.mark.parametrize("kind", ["local", "s3"])
+def test_stream_round_trip(kind, tmp_path):
+    storage = make_storage(kind, tmp_path)
+    key = patient_file_key(1, "a.jpg")
+
+    async def scenario():
+        try:
+            size = await storage.write_stream(key, chunks(b"jp", b"eg-", b"data"))
+            data = await storage.read_bytes(key)
+            await storage.delete(key)
+            return size, data, await storage.exists(key)
+        finally:
+            await storage.close()
+
+    assert asyncio.run(scenario()) == (9, b"jpeg-data", False)
+
+
+@pytest.mark.parametrize("kind", ["local", "s3"])
+def test_missing_object_raises(kind, tmp_path):
+    storage = make_storage(kind, tmp_path)
+
+    async def scenario():
+        try:
+            await storage.read_bytes("patient_files/1/gone.jpg")
+        finally:
+            await storage.close()
+
+    with pytest.raises(ObjectNotFoundError):
+        asyncio.run(scenario())
+
+
+def test_legacy_absolute_paths_are_read_from_disk(tmp_path):
+    legacy = tmp_path / "old.jpg"
+    legacy.write_bytes(b"old")
+    storage = make_storage("s3", tmp_path)
+
+    async def scenario():
+        try:
+            return await storage.read_bytes(f" {legacy} "), storage.local_path(str(legacy))
+        finally:
+            await storage.close()
+
+    assert asyncio.run(scenario()) == (b"old", str(legacy))
+
+
+def test_same_content_is_stored_once(store):
+    storage, content_store = store
+
+    async def scenario():
+        first = await content_store.put_stream(chunks(b"photo"), ".JPG")
+        second = await content_store.put_stream(chunks(b"ph", b"oto"), ".jpg")
+        return first, second, await storage.read_bytes(first), await content_store.stats()
+
+    first, second, data, stats = asyncio.run(scenario())
+    assert first == second
+    assert first.startswith(f"objects/{first[8:10]}/{first[11:13]}/") and first.endswith(".jpg")
+    assert data == b"photo"
+    assert stats["blobs"] == 1 and stats["references"] == 2 and stats["content_hits"] == 1
+
+
+def test_known_unique_id_is_not_downloaded_again(store):
+    _, content_store = store
+    bot = TelegramFiles({"a": ("U1", b"receipt"), "b": ("U2", b"receipt")})
+
+    async def scenario():
+        first = await content_store.put_telegram_file(bot, "a")
+        again = await content_store.put_telegram_file(bot, "a", "U1")
+        forwarded = await content_store.put_telegram_file(bot, "b", "U2")
+        return first, again, forwarded, await content_store.stats()
+
+    first, again, forwarded, stats = asyncio.run(scenario())
+    assert first == again == forwarded
+    assert bot.downloads == 2
+    assert stats["unique_id_hits"] == 1 and stats["blobs"] == 1
+
+
+def test_release_deletes_unreferenced_files(store):
+    storage, content_store = store
+
+    async def scenario():
+        key = await content_store.put_stream(chunks(b"photo"), ".jpg")
+        await content_store.put_stream(chunks(b"photo"), ".jpg")
+        await storage.write_bytes(derivative_key(key, "preview"), b"preview")
+
+        await content_store.release(key)
+        still_there = await storage.exists(key)
+        await content_store.release(key)
+        return key, still_there
+
+    key, still_there = asyncio.run(scenario())
+    assert still_there
+    assert not asyncio.run(storage.exists(key))
+    assert not asyncio.run(storage.exists(derivative_key(key, "preview")))
+    assert asyncio.run(content_store.stats())["blobs"] == 0
+
+
+def test_release_attachments_skips_empty_and_unknown_keys(store):
+    storage, content_store = store
+
+    async def scenario():
+        key = await content_store.put_stream(chunks(b"receipt"), ".jpg")
+        await release_attachments(content_store, [None, "", "patient_files/1/legacy.jpg", key])
+        await release_attachments(None, [key])
+        return key
+
+    key = asyncio.run(scenario())
+    assert not asyncio.run(storage.exists(key))
+
+
+def test_reprocessed_message_adds_no_reference(store):
+    _, content_store = store
+
+    async def scenario():
+        await content_store.put_stream(chunks(b"photo"), ".jpg", chat_id=1, message_id=10)
+        await content_store.put_stream(chunks(b"photo"), ".jpg", chat_id=1, message_id=10)
+        return (await content_store.stats())["references"]
+
+    assert asyncio.run(scenario()) == 1
+
+
+def test_redelivered_message_is_answered_from_the_index(store):
+    _, content_store = store
+    bot = TelegramFiles({"a": ("U1", b"receipt")})
+
+    async def scenario():
+        first = await content_store.put_telegram_file(bot, "a", chat_id=5, message_id=40)
+        bot.files.clear()  # get_file یا دانلود دوباره خطا می‌دهد
+        again = await content_store.put_telegram_file(bot, "a", chat_id=5, message_id=40)
+        return first, again, await content_store.stats()
+
+    first, again, stats = asyncio.run(scenario())
+    assert first == again
+    assert stats["message_hits"] == 1 and stats["references"] == 1
+
+
+def test_released_message_is_counted_again(store):
+    _, content_store = store
+
+    async def scenario():
+        key = await content_store.put_stream(chunks(b"photo"), ".jpg", chat_id=1, message_id=10)
+        await content_store.put_stream(chunks(b"photo"), ".jpg", chat_id=2, message_id=20)
+        await release_attachments(content_store, [key], chat_id=1, message_id=10)
+        listed = await content_store.files_for_message(1, 10)
+        await content_store.put_stream(chunks(b"photo"), ".jpg", chat_id=1, message_id=10)
+        return listed, (await content_store.stats())["references"]
+
+    assert asyncio.run(scenario()) == ([], 2)
+
+
+def test_reshard_moves_flat_objects(store):
+    storage, content_store = store
+
+    async def scenario():
+        key = await content_store.put_stream(chunks(b"legacy"), ".jpg")
+        content_hash, _ = await content_store.blob_for(key)
+        flat_key = f"objects/{content_hash}.jpg"
+        await storage.write_bytes(flat_key, await storage.read_bytes(key))
+        await storage.delete(key)
+        await content_store._run(content_store._move_blob_sync, content_hash, flat_key)
+
+        moved = await content_store.reshard()
+        return moved, key, flat_key, await content_store.resolve(flat_key)
+
+    moved, key, flat_key, resolved = asyncio.run(scenario())
+    assert moved == 1
+    assert resolved == key
+    assert asyncio.run(storage.exists(key)) and not asyncio.run(storage.exists(flat_key))
+    assert asyncio.run(content_store.reshard()) == 0
+
+
+def test_migrate_maps_legacy_paths_to_content_keys(store, tmp_path):
+    storage, content_store = store
+    legacy = tmp_path / "patient_files" / "7"
+    legacy.mkdir(parents=True)
+    (legacy / "a.jpg").write_bytes(b"same")
+    (legacy / "b.jpg").write_bytes(b"same")
+    (legacy / "c.jpg.part").write_bytes(b"partial")
+
+    async def scenario():
+        stats = await migrate(storage, content_store, str(tmp_path))
+        resolved = [
+            await content_store.resolve(ref)
+            for ref in ("patient_files/7/a.jpg", str(legacy / "b.jpg"))
+        ]
+        return stats, resolved, await content_store.exists("patient_files/7/a.jpg")
+
+    stats, resolved, exists = asyncio.run(scenario())
+    assert stats["files"] == 2 and stats["failed"] == 0
+    assert resolved[0] == resolved[1] and resolved[0].startswith("objects/")
+    assert exists
+    assert not (legacy / "a.jpg").exists() and (legacy / "c.jpg.part").exists()
+
+
+def test_owners_are_tracked_per_blob(store):
+    _, content_store = store
+
+    async def scenario():
+        key = await content_store.put_stream(chunks(b"photo"), ".jpg")
+        content_hash, _ = await content_store.blob_for(key)
+        await content_store.link_owner([content_hash], 7)
+        owners = await content_store.is_owner(content_hash, 7), await content_store.is_owner(content_hash, 8)
+        await content_store.release(key)
+        return owners, await content_store.is_owner(content_hash, 7)
+
+    assert asyncio.run(scenario()) == ((True, False), False)
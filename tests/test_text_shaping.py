@@ -0,0 +1,23 @@
+# tests/test_text_shaping.py
+import arabic_reshaper
+from bidi.algorithm import get_display
+
+from app.utils.text_shaping import clear_shaping_cache, shape_persian, shaping_cache_stats
+
+
+def test_cached_shaping_matches_uncached_output():
+    clear_shaping_cache()
+    text = "آموکسی‌سیلین ۵۰۰ میلی‌گرم"
+    expected = get_display(arabic_reshaper.reshape(text))
+    assert shape_persian(text) == expected
+    assert shape_persian(text) == expected
+
+    stats = shaping_cache_stats()
+    assert (stats["hits"], stats["misses"], stats["size"]) == (1, 1, 1)
+
+
+def test_non_text_values_are_not_cached():
+    clear_shaping_cache()
+    assert shape_persian(1200) == "1200"
+    assert shape_persian("") == ""
+    assert shaping_cache_stats()["size"] == 0
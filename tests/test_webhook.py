@@ -0,0 +1,126 @@
+# tests/test_webhook.py
+import asyncio
+
+from aiogram.types import Update
+from aiohttp.test_utils import TestClient, TestServer
+
+from app.core.webhook import SECRET_HEADER, UpdateWorkerPool, WebhookServer
+
+
+def message_payload(update_id: int, chat_id: int) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "x"},
+            "text": str(update_id),
+        },
+    }
+
+
+def message_update(update_id: int, chat_id: int) -> Update:
+    return Update.model_validate(message_payload(update_id, chat_id))
+
+
+class FakeDispatcher:
+    def __init__(self, delay: float = 0.0, slow_chat: int = None):
+        self.delay = delay
+        self.slow_chat = slow_chat
+        self.handled = []
+        self.running = 0
+        self.max_running = 0
+        self.release = asyncio.Event()
+
+    async def feed_update(self, bot, update, **kwargs):
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        try:
+            if update.message.chat.id == self.slow_chat:
+                await self.release.wait()
+            await asyncio.sleep(self.delay)
+            self.handled.append(update.update_id)
+        finally:
+            self.running -= 1
+
+
+def test_updates_of_one_chat_keep_their_order():
+    dp = FakeDispatcher(delay=0.001)
+
+    async def scenario():
+        pool = UpdateWorkerPool(dp, bot=None, workers=4)
+        pool.start()
+        for update_id in range(1, 11):
+            assert pool.submit(message_update(update_id, chat_id=1))
+        await pool.drain(timeout=5)
+
+    asyncio.run(scenario())
+    assert dp.handled == list(range(1, 11))
+    assert dp.max_running == 1
+
+
+def test_slow_chat_does_not_block_other_chats():
+    dp = FakeDispatcher(slow_chat=1)
+
+    async def scenario():
+        pool = UpdateWorkerPool(dp, bot=None, workers=4)
+        pool.start()
+        pool.submit(message_update(1, chat_id=1))
+        for update_id in range(2, 6):
+            pool.submit(message_update(update_id, chat_id=update_id))
+        await asyncio.sleep(0.05)
+        handled_while_blocked = list(dp.handled)
+        dp.release.set()
+        await pool.drain(timeout=5)
+        return handled_while_blocked
+
+    assert sorted(asyncio.run(scenario())) == [2, 3, 4, 5]
+    assert dp.handled[-1] == 1
+
+
+def test_concurrency_and_queue_limits():
+    dp = FakeDispatcher(delay=0.02)
+
+    async def scenario():
+        pool = UpdateWorkerPool(dp, bot=None, workers=2, queue_size=5)
+        pool.start()
+        accepted = [pool.submit(message_update(i, chat_id=i)) for i in range(1, 8)]
+        await pool.drain(timeout=5)
+        return accepted
+
+    assert asyncio.run(scenario()) == [True] * 5 + [False] * 2
+    assert dp.max_running == 2
+    assert len(dp.handled) == 5
+
+
+def test_drain_stops_accepting_and_cancels_after_timeout():
+    dp = FakeDispatcher(slow_chat=1)
+
+    async def scenario():
+        pool = UpdateWorkerPool(dp, bot=None)
+        pool.start()
+        pool.submit(message_update(1, chat_id=1))
+        await asyncio.sleep(0)
+        await pool.drain(timeout=0.05)
+        return pool.submit(message_update(2, chat_id=2))
+
+    assert asyncio.run(scenario()) is False
+    assert dp.handled == []
+
+
+def test_webhook_checks_secret_and_queues_updates():
+    dp = FakeDispatcher()
+
+    async def scenario():
+        server = WebhookServer(dp, bot=None, secret="s3cret")
+        server.pool.start()
+        async with TestClient(TestServer(server.build_app())) as client:
+            rejected = await client.post("/webhook", json=message_payload(1, 1))
+            invalid = await client.post("/webhook", data=b"{", headers={SECRET_HEADER: "s3cret"})
+            accepted = await client.post("/webhook", json=message_payload(2, 1), headers={SECRET_HEADER: "s3cret"})
+            await server.pool.drain(timeout=5)
+            return rejected.status, invalid.status, accepted.status
+
+    assert asyncio.run(scenario()) == (401, 400, 200)
+    assert dp.handled == [2]